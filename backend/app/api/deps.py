@@ -0,0 +1,50 @@
+"""
+FastAPI dependencies handing out the process-wide service instances.
+
+Tests can replace a service with ``app.dependency_overrides``.
+"""
+from typing import Optional
+import hmac
+
+from fastapi import Header, HTTPException, Query
+
+from app.core.config import settings
+from app.services.container import services
+from app.services.export import ExportService
+from app.services.mappings import MappingService
+from app.services.storage import StorageService
+
+
+def get_storage_service() -> StorageService:
+    """The shared StorageService."""
+    return services.storage
+
+
+def get_mapping_service() -> MappingService:
+    """The shared MappingService."""
+    return services.mappings
+
+
+def get_export_service() -> ExportService:
+    """The shared ExportService."""
+    return services.export
+
+
+def profiling_requested(
+    profile: bool = Query(False, description="Admin only: record a sampling profile of the work (needs X-Admin-Token)"),
+    x_admin_token: Optional[str] = Header(None)
+) -> bool:
+    """
+    Whether the request asks for a profile (see app.core.profiling).
+
+    Raises:
+        HTTPException: 403 if it does without the ADMIN_TOKEN, or no
+            ADMIN_TOKEN is configured
+    """
+    if not profile:
+        return False
+    if not settings.ADMIN_TOKEN or not hmac.compare_digest(
+        (x_admin_token or "").encode(), settings.ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="profile=true requires a valid X-Admin-Token")
+    return True
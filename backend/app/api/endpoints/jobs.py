@@ -0,0 +1,135 @@
+"""
+API endpoints for background job status and progress.
+"""
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import Any, AsyncIterator, Dict
+from pathlib import Path
+
+from app.core.config import settings
+from app.models.job import JobProgress, JobResponse
+from app.services.jobs import job_manager, TERMINAL_STATUSES
+
+
+router = APIRouter()
+
+
+def job_response(job: Dict[str, Any]) -> JobResponse:
+    """
+    Build a JobResponse from a jobs document.
+    
+    Args:
+        job: The jobs document
+        
+    Returns:
+        JobResponse: The response model
+    """
+    return JobResponse(
+        job_id=str(job["_id"]),
+        run_id=str(job["run_id"]),
+        kind=job["kind"],
+        status=job["status"],
+        progress=JobProgress(**(job.get("progress") or {})),
+        created_at=job["created_at"],
+        started_at=job.get("started_at"),
+        finished_at=job.get("finished_at"),
+        error=job.get("error"),
+        result=job.get("result"),
+    )
+
+
+async def _get_job_or_404(job_id: str) -> Dict[str, Any]:
+    """
+    Load a job document or raise 404.
+    
+    Args:
+        job_id: The job ID
+        
+    Returns:
+        Dict: The jobs document
+    """
+    job = await job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """
+    Get the status and progress of a job.
+    
+    Args:
+        job_id: The job ID
+        
+    Returns:
+        JobResponse: Job status, progress and result
+    """
+    job = await _get_job_or_404(job_id)
+    return job_response(job)
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Stream job progress as Server-Sent Events.
+    
+    A ``progress`` event is sent whenever the job changes; the stream ends
+    with a ``done`` event once the job completes or fails.
+    
+    Args:
+        job_id: The job ID
+        request: The incoming request, used to detect client disconnects
+        
+    Returns:
+        StreamingResponse: text/event-stream of JobResponse payloads
+    """
+    await _get_job_or_404(job_id)
+    
+    async def events() -> AsyncIterator[str]:
+        last_payload = None
+        while not await request.is_disconnected():
+            job = await job_manager.get_job(job_id)
+            if job is None:
+                break
+            payload = job_response(job).model_dump_json()
+            if payload != last_payload:
+                yield f"event: progress\ndata: {payload}\n\n"
+                last_payload = payload
+            if job["status"] in TERMINAL_STATUSES:
+                yield f"event: done\ndata: {payload}\n\n"
+                break
+            await job_manager.wait_for_update(job_id, settings.JOB_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{job_id}/result")
+async def download_job_result(job_id: str):
+    """
+    Download the file produced by a completed export job.
+    
+    Args:
+        job_id: The job ID
+        
+    Returns:
+        FileResponse: The exported data bundle
+    """
+    job = await _get_job_or_404(job_id)
+    if job["kind"] != "export":
+        raise HTTPException(status_code=400, detail="Only export jobs produce a downloadable result")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    
+    path = Path((job.get("result") or {}).get("path", ""))
+    if not path.is_file():
+        raise HTTPException(status_code=410, detail="Export file is no longer available")
+    return FileResponse(
+        path,
+        media_type="application/zip",
+        filename=f"run_{job['run_id']}_export.zip",
+    )
@@ -1,20 +1,168 @@
 """
 API endpoints for managing harmonization runs.
 """
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pathlib import Path as FilePath
 from datetime import datetime
+from bson import ObjectId
+import aiofiles
+import asyncio
 
+from app.core.config import settings
+from app.core.profiling import SamplingProfiler, save_profile
 from app.db.database import get_database, COLLECTIONS
-from app.models.run import Run, RunCreate, RunResponse, FileUploadResponse
-from app.services.harmonization import HarmonizationService
-from app.services.validation import ValidationService
+from app.models.run import (
+    Run,
+    RunCreate,
+    RunResponse,
+    FileUploadResponse,
+    UploadSessionCreate,
+    UploadSessionResponse,
+    UploadPartResponse,
+    MappingCreate,
+    MappingResponse,
+    RunMappingResponse,
+    ValidationErrorPage,
+    ValidationErrorResponse,
+    ValidationResultResponse,
+)
+from app.schemas.loader import template_exists
+from app.api.deps import get_export_service, get_mapping_service, get_storage_service, profiling_requested
+from app.api.endpoints.jobs import job_response
+from app.models.job import JobResponse
+from app.models.schema import SchemaDetectionResponse
+from app.services.mappings import MappingError, MappingService
+from app.services.jobs import JobConflictError, job_manager
+from app.services.validation_modes import ValidationOptions, ValidationOptionsError, VALIDATION_MODES
+from app.services.validation_store import list_errors
 from app.services.export import ExportService
+from app.services.export_cache import ExportCache
+from app.services.export_formats import ExportOptions, ExportFormatError, EXPORT_FORMATS
+from app.services.storage import (
+    MultipartFileUpload,
+    StorageService,
+    UnknownSchemaTemplateError,
+    UploadFormError,
+    UploadTooLargeError,
+    UploadSessionNotFoundError,
+    UploadSessionStateError,
+    open_uploaded_file,
+)
 
 
 router = APIRouter()
 
 
+def _parse_object_id(value: str, label: str = "run") -> ObjectId:
+    """
+    Convert a path parameter to an ObjectId.
+    
+    Args:
+        value: The raw ID string
+        label: Name of the resource, used in the error message
+        
+    Returns:
+        ObjectId: The parsed ID
+        
+    Raises:
+        HTTPException: 400 if the value is not a valid ObjectId
+    """
+    if not ObjectId.is_valid(value):
+        raise HTTPException(status_code=400, detail=f"Invalid {label} ID '{value}'")
+    return ObjectId(value)
+
+
+async def _get_run_or_404(run_id: str) -> Dict[str, Any]:
+    """
+    Load a run document or raise 404.
+    
+    Args:
+        run_id: The run ID
+        
+    Returns:
+        Dict: The run document
+    """
+    db = get_database()
+    run = await db[COLLECTIONS["runs"]].find_one({"_id": _parse_object_id(run_id)})
+    if not run:
+        raise HTTPException(status_code=404, detail=f"Run '{run_id}' not found")
+    return run
+
+
+def _file_upload_response(file_doc: Dict[str, Any]) -> FileUploadResponse:
+    """
+    Build a FileUploadResponse from an uploaded_files document.
+    
+    Args:
+        file_doc: The uploaded_files document
+        
+    Returns:
+        FileUploadResponse: The response model
+    """
+    return FileUploadResponse(
+        file_id=str(file_doc["_id"]),
+        filename=file_doc["filename"],
+        schema_template_id=file_doc["schema_template_id"],
+        created_at=file_doc["created_at"],
+        size_bytes=file_doc["size_bytes"],
+        sha256=file_doc.get("sha256"),
+        parts_sha256=file_doc.get("parts_sha256"),
+        row_count=file_doc["row_count"],
+        column_count=file_doc["column_count"],
+        columns=file_doc["columns"],
+        mapping_id=str(file_doc["mapping_id"]) if file_doc.get("mapping_id") else None,
+    )
+
+
+def _upload_session_response(session: Dict[str, Any]) -> UploadSessionResponse:
+    """
+    Build an UploadSessionResponse from an upload_sessions document.
+    
+    Args:
+        session: The upload_sessions document
+        
+    Returns:
+        UploadSessionResponse: The response model
+    """
+    return UploadSessionResponse(
+        session_id=str(session["_id"]),
+        filename=session["filename"],
+        schema_template_id=session["schema_template_id"],
+        status=session["status"],
+        total_parts=session["total_parts"],
+        received_parts=sorted(int(n) for n in session.get("parts", {})),
+        missing_parts=StorageService.missing_parts(session),
+        file_id=str(session["file_id"]) if session.get("file_id") else None,
+        created_at=session["created_at"],
+    )
+
+
+def _run_response(run_doc: Dict[str, Any]) -> RunResponse:
+    """
+    Build a RunResponse from a run document, stringifying ObjectIds.
+    
+    Args:
+        run_doc: The run document
+        
+    Returns:
+        RunResponse: The response model
+    """
+    return RunResponse(
+        _id=str(run_doc["_id"]),
+        user_id=run_doc["user_id"],
+        created_at=run_doc["created_at"],
+        status=run_doc["status"],
+        files=[str(f) for f in run_doc.get("files", [])],
+        mapping_id=str(run_doc["mapping_id"]) if run_doc.get("mapping_id") else None,
+        validation_result_id=(
+            str(run_doc["validation_result_id"]) if run_doc.get("validation_result_id") else None
+        ),
+        entity_revision=run_doc.get("entity_revision", 0),
+    )
+
+
 @router.post("/", response_model=RunResponse, status_code=201)
 async def create_run(run_data: RunCreate):
     """
@@ -36,12 +184,13 @@ async def create_run(run_data: RunCreate):
         "files": [],
         "mapping_id": None,
         "validation_result_id": None,
+        "entity_revision": 0,
     }
     
     result = await db[COLLECTIONS["runs"]].insert_one(run_doc)
     run_doc["_id"] = result.inserted_id
     
-    return RunResponse(**run_doc)
+    return _run_response(run_doc)
 
 
 @router.get("/{run_id}", response_model=RunResponse)
@@ -55,103 +204,771 @@ async def get_run(run_id: str):
     Returns:
         RunResponse: Run information
     """
-    db = get_database()
-    
-    # TODO: Implement ObjectId conversion and query
-    raise HTTPException(status_code=501, detail="Not implemented yet")
+    run = await _get_run_or_404(run_id)
+    return _run_response(run)
+
+
+# The upload body is parsed by hand (see upload_file), so describe it here
+_UPLOAD_FORM_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file", "schema_template_id"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "schema_template_id": {"type": "string"},
+                    },
+                },
+            },
+        },
+    },
+}
 
 
-@router.post("/{run_id}/files", response_model=FileUploadResponse)
+@router.post("/{run_id}/files", response_model=FileUploadResponse, openapi_extra=_UPLOAD_FORM_OPENAPI)
 async def upload_file(
     run_id: str,
-    file: UploadFile = File(...),
-    schema_template_id: str = Form(...)
+    request: Request,
+    storage: StorageService = Depends(get_storage_service)
 ):
     """
     Upload a file for a specific run.
     
+    The multipart/form-data body (fields ``file`` and
+    ``schema_template_id``) is parsed as it arrives and the file streamed
+    straight to disk in fixed-size chunks, so an upload over
+    MAX_UPLOAD_SIZE is refused as soon as it crosses the limit rather than
+    after the whole body has been received. Its SHA-256 digest and
+    row/column counts are computed on the way through and stored with the
+    file metadata.
+    
     Args:
         run_id: The run ID
-        file: The uploaded file
-        schema_template_id: The schema template to use for this file
+        request: The incoming request, whose body is streamed to disk
         
     Returns:
         FileUploadResponse: Upload confirmation with file metadata
     """
-    # TODO: Implement file upload logic
-    raise HTTPException(status_code=501, detail="Not implemented yet")
+    run = await _get_run_or_404(run_id)
+    
+    try:
+        form = MultipartFileUpload(request.headers, request.stream())
+        file_doc = await storage.save_upload(run_id, form, user_id=run.get("user_id"))
+    except UnknownSchemaTemplateError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadFormError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    return _file_upload_response(file_doc)
 
 
-@router.post("/{run_id}/mapping")
-async def set_mapping(run_id: str):
+@router.get("/{run_id}/files/{file_id}/detection", response_model=SchemaDetectionResponse)
+async def detect_file_schema(
+    run_id: str,
+    file_id: str,
+    schema_template_id: Optional[str] = Query(None, description="Template to suggest the mapping for"),
+    limit: int = Query(5, ge=1, le=50)
+):
+    """
+    Suggest schema templates and a column mapping for an uploaded file.
+    
+    Only the head of the file is read, so this is cheap for any file size.
+    
+    Args:
+        run_id: The run ID
+        file_id: The uploaded file ID
+        schema_template_id: Template to suggest the mapping for (default:
+            the best candidate)
+        limit: Number of candidates to return
+        
+    Returns:
+        SchemaDetectionResponse: Ranked candidates and suggested mappings
+    """
+    # The detection engine (NumPy) is loaded on first use, not at startup
+    from app.services.detection import detection_index, read_head
+    
+    run = await _get_run_or_404(run_id)
+    file_doc = await get_database()[COLLECTIONS["uploaded_files"]].find_one(
+        {"_id": _parse_object_id(file_id, "file"), "run_id": run["_id"]}
+    )
+    if not file_doc:
+        raise HTTPException(status_code=404, detail=f"File '{file_id}' not found")
+    if schema_template_id and not template_exists(schema_template_id):
+        raise HTTPException(status_code=404, detail=f"Schema '{schema_template_id}' not found")
+    
+    def read() -> Tuple[List[str], List[List[str]]]:
+        with open_uploaded_file(file_doc) as stream:
+            return read_head(stream, file_doc.get("delimiter", ","))
+    
+    header, rows = await asyncio.to_thread(read)
+    return detection_index().detect(header, rows, schema_template_id, limit)
+
+
+@router.post("/{run_id}/uploads", response_model=UploadSessionResponse, status_code=201)
+async def open_upload_session(
+    run_id: str,
+    session_data: UploadSessionCreate,
+    storage: StorageService = Depends(get_storage_service)
+):
+    """
+    Open a resumable, multi-part upload session.
+    
+    Parts are sent with PUT .../parts/{part_number} (in any order and in
+    parallel), progress is checked with GET, and the upload is finalized
+    with POST .../complete.
+    
+    Args:
+        run_id: The run ID
+        session_data: Filename, schema template and number of parts
+        
+    Returns:
+        UploadSessionResponse: The new session
+    """
+    run = await _get_run_or_404(run_id)
+    
+    if not template_exists(session_data.schema_template_id):
+        raise HTTPException(
+            status_code=404, detail=f"Schema '{session_data.schema_template_id}' not found"
+        )
+    
+    session = await storage.open_session(
+        run_id,
+        session_data.filename,
+        session_data.schema_template_id,
+        session_data.total_parts,
+        user_id=run.get("user_id"),
+    )
+    return _upload_session_response(session)
+
+
+@router.get("/{run_id}/uploads/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    run_id: str,
+    session_id: str,
+    storage: StorageService = Depends(get_storage_service)
+):
+    """
+    Get the status of an upload session, including missing parts.
+    
+    Args:
+        run_id: The run ID
+        session_id: The upload session ID
+        
+    Returns:
+        UploadSessionResponse: Session status
+    """
+    _parse_object_id(run_id)
+    try:
+        session = await storage.get_session(run_id, session_id)
+    except UploadSessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return _upload_session_response(session)
+
+
+@router.put("/{run_id}/uploads/{session_id}/parts/{part_number}", response_model=UploadPartResponse)
+async def upload_part(
+    run_id: str,
+    session_id: str,
+    request: Request,
+    part_number: int = Path(..., ge=1),
+    storage: StorageService = Depends(get_storage_service)
+):
+    """
+    Upload one part of a multi-part upload.
+    
+    The request body is the raw part content. Re-sending a part number
+    replaces the previous copy.
+    
+    Args:
+        run_id: The run ID
+        session_id: The upload session ID
+        request: The incoming request, whose body is streamed to disk
+        part_number: 1-based part number
+        
+    Returns:
+        UploadPartResponse: Size and digest of the stored part
+    """
+    _parse_object_id(run_id)
+    try:
+        part = await storage.save_part(run_id, session_id, part_number, request.stream())
+    except UploadSessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadSessionStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    return UploadPartResponse(
+        part_number=part["part_number"],
+        size_bytes=part["size_bytes"],
+        sha256=part["sha256"],
+    )
+
+
+@router.post("/{run_id}/uploads/{session_id}/complete", response_model=FileUploadResponse)
+async def complete_upload_session(
+    run_id: str,
+    session_id: str,
+    storage: StorageService = Depends(get_storage_service)
+):
+    """
+    Finalize a multi-part upload into an uploaded file.
+    
+    Args:
+        run_id: The run ID
+        session_id: The upload session ID
+        
+    Returns:
+        FileUploadResponse: Upload confirmation with file metadata
+    """
+    _parse_object_id(run_id)
+    try:
+        file_doc = await storage.complete_session(run_id, session_id)
+    except UploadSessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadSessionStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    return _file_upload_response(file_doc)
+
+
+@router.delete("/{run_id}/uploads/{session_id}", status_code=204)
+async def abort_upload_session(
+    run_id: str,
+    session_id: str,
+    storage: StorageService = Depends(get_storage_service)
+):
+    """
+    Abort an upload session and delete any received parts.
+    
+    Args:
+        run_id: The run ID
+        session_id: The upload session ID
+    """
+    _parse_object_id(run_id)
+    try:
+        await storage.abort_session(run_id, session_id)
+    except UploadSessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadSessionStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+def _mapping_response(doc: Dict[str, Any], file_ids: List[ObjectId]) -> MappingResponse:
+    """
+    Build a MappingResponse from a mappings document.
+    
+    Args:
+        doc: The mappings document
+        file_ids: Files of the run using the mapping
+        
+    Returns:
+        MappingResponse: The response model
+    """
+    return MappingResponse(
+        id=str(doc["_id"]),
+        name=doc.get("name", ""),
+        schema_template_id=doc["schema_template_id"],
+        mapping=doc.get("mapping", {}),
+        header_fingerprint=doc.get("header_fingerprint"),
+        columns=doc.get("columns", []),
+        file_ids=[str(file_id) for file_id in file_ids],
+        updated_at=doc.get("updated_at") or doc.get("created_at"),
+    )
+
+
+@router.post("/{run_id}/mapping", response_model=RunMappingResponse)
+async def set_mapping(
+    run_id: str,
+    mapping_data: MappingCreate,
+    mappings: MappingService = Depends(get_mapping_service)
+):
     """
     Set the column mapping for a run.
     
+    The mapping is applied to the run's files that use the template (or
+    to ``file_id`` only) and saved to the mapping library under each of
+    their headers, so later uploads with the same header use it
+    automatically.
+    
     Args:
         run_id: The run ID
+        mapping_data: The mapping
         
     Returns:
-        dict: Confirmation message
+        RunMappingResponse: The saved mappings and the files they apply to
     """
-    # TODO: Implement mapping logic
-    raise HTTPException(status_code=501, detail="Not implemented yet")
+    run = await _get_run_or_404(run_id)
+    file_id = _parse_object_id(mapping_data.file_id, "file") if mapping_data.file_id else None
+    
+    try:
+        applied = await mappings.set_run_mapping(
+            run,
+            mapping_data.name,
+            mapping_data.schema_template_id,
+            mapping_data.mapping,
+            file_id=file_id,
+        )
+    except MappingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return RunMappingResponse(mappings=[_mapping_response(doc, file_ids) for doc, file_ids in applied])
 
 
-@router.get("/{run_id}/mapping")
-async def get_mapping(run_id: str):
+@router.get("/{run_id}/mapping", response_model=RunMappingResponse)
+async def get_mapping(
+    run_id: str,
+    mappings: MappingService = Depends(get_mapping_service)
+):
     """
-    Get the column mapping for a run.
+    Get the column mappings in use by a run.
+    
+    Includes mappings applied automatically on upload.
     
     Args:
         run_id: The run ID
         
     Returns:
-        dict: Mapping information
+        RunMappingResponse: Each mapping and the run files using it
     """
-    # TODO: Implement get mapping logic
-    raise HTTPException(status_code=501, detail="Not implemented yet")
+    run = await _get_run_or_404(run_id)
+    applied = await mappings.run_mappings(run)
+    return RunMappingResponse(mappings=[_mapping_response(doc, file_ids) for doc, file_ids in applied])
+
+
+def _profile_params(profile: bool) -> Dict[str, Any]:
+    """Job parameters asking JobManager to profile the job."""
+    return {"profile": True} if profile else {}
 
 
-@router.post("/{run_id}/harmonize")
-async def harmonize_run(run_id: str):
+@router.post("/{run_id}/harmonize", response_model=JobResponse, status_code=202)
+async def harmonize_run(run_id: str, profile: bool = Depends(profiling_requested)):
     """
     Trigger the harmonization process for a run.
     
+    Harmonization (followed by validation) runs as a background job; poll
+    GET /jobs/{job_id} or stream GET /jobs/{job_id}/events for progress.
+    
     Args:
         run_id: The run ID
+        profile: Profile the job (admin only, see app.core.profiling)
         
     Returns:
-        dict: Harmonization status
+        JobResponse: The queued job
     """
-    # TODO: Implement harmonization logic using HarmonizationService
-    raise HTTPException(status_code=501, detail="Not implemented yet")
+    await _get_run_or_404(run_id)
+    
+    try:
+        job = await job_manager.enqueue("harmonize", run_id, params=_profile_params(profile))
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job_response(job)
 
 
-@router.get("/{run_id}/validation")
+@router.post("/{run_id}/validate", response_model=JobResponse, status_code=202)
+async def validate_run(
+    run_id: str,
+    mode: str = Query("full", description=f"One of {', '.join(VALIDATION_MODES)}"),
+    max_blockers: Optional[int] = Query(None, description="fail-fast: stop after this many Blocker errors"),
+    sample_size: Optional[int] = Query(None, description="sample: rows sampled per entity type"),
+    seed: Optional[int] = Query(None, description="sample: random seed, for a repeatable sample"),
+    profile: bool = Depends(profiling_requested)
+):
+    """
+    Re-run validation for a run as a background job.
+    
+    ``fail-fast`` and ``sample`` give a quick pass/fail answer before a
+    full validation; their results are reported on the job.
+    
+    Args:
+        run_id: The run ID
+        mode: Validation mode (full, fail-fast or sample)
+        max_blockers: Blocker threshold for fail-fast
+        sample_size: Sample size for sample
+        seed: Random seed for sample
+        profile: Profile the job (admin only, see app.core.profiling)
+        
+    Returns:
+        JobResponse: The queued job
+    """
+    try:
+        options = ValidationOptions(mode, max_blockers, sample_size, seed)
+    except ValidationOptionsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await _get_run_or_404(run_id)
+    
+    try:
+        job = await job_manager.enqueue(
+            "validate", run_id, params={"validation": options.describe(), **_profile_params(profile)}
+        )
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job_response(job)
+
+
+async def _get_validation_or_404(run: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Load a run's current validation result or raise 404.
+    
+    Args:
+        run: The run document
+        
+    Returns:
+        Dict: The validation_results document
+    """
+    db = get_database()
+    result = None
+    if run.get("validation_result_id"):
+        result = await db[COLLECTIONS["validation_results"]].find_one({"_id": run["validation_result_id"]})
+    if not result:
+        raise HTTPException(status_code=404, detail=f"Run '{run['_id']}' has not been validated")
+    return result
+
+
+@router.get("/{run_id}/validation", response_model=ValidationResultResponse)
 async def get_validation_results(run_id: str):
     """
     Get validation results for a run.
     
+    Returns the summary of the latest validation: counts per severity and
+    per rule/severity/column, plus a capped sample of errors per rule. The
+    full error list is paged through GET /{run_id}/validation/errors.
+    
+    Args:
+        run_id: The run ID
+        
+    Returns:
+        ValidationResultResponse: Validation result summary
+    """
+    run = await _get_run_or_404(run_id)
+    result = await _get_validation_or_404(run)
+    return ValidationResultResponse(
+        id=str(result["_id"]),
+        run_id=str(result["run_id"]),
+        status=result["status"],
+        blocker_count=result.get("blocker_count", 0),
+        warning_count=result.get("warning_count", 0),
+        info_count=result.get("info_count", 0),
+        error_count=result.get("error_count", 0),
+        rule_counts=result.get("rule_counts", []),
+        samples=result.get("samples", {}),
+        entity_revision=result.get("entity_revision", 0),
+        revalidated=result.get("revalidated"),
+        mode=result.get("mode", "full"),
+        complete=result.get("complete", True),
+        estimates=result.get("estimates"),
+    )
+
+
+@router.get("/{run_id}/validation/errors", response_model=ValidationErrorPage)
+async def list_validation_errors(
+    run_id: str,
+    severity: Optional[str] = Query(None, description="Only errors of this severity"),
+    rule_id: Optional[str] = Query(None, description="Only errors of this rule"),
+    column_name: Optional[str] = Query(None, description="Only errors in this column"),
+    file_id: Optional[str] = Query(None, description="Only errors in this uploaded file"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum errors per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
+):
+    """
+    List the errors of a run's latest validation, one page at a time.
+    
+    Pages follow insertion order and are keyed on the last error returned,
+    so fetching any page costs the same however many errors there are.
+    
+    Args:
+        run_id: The run ID
+        severity: Severity filter
+        rule_id: Rule filter
+        column_name: Column filter
+        file_id: File filter
+        limit: Page size
+        cursor: Opaque cursor from the previous page
+        
+    Returns:
+        ValidationErrorPage: The errors and the cursor of the next page
+    """
+    run = await _get_run_or_404(run_id)
+    result = await _get_validation_or_404(run)
+    
+    after = None
+    if cursor:
+        result_part, _, error_part = cursor.partition(".")
+        if not (ObjectId.is_valid(result_part) and ObjectId.is_valid(error_part)):
+            raise HTTPException(status_code=400, detail=f"Invalid cursor '{cursor}'")
+        if ObjectId(result_part) != result["_id"]:
+            raise HTTPException(
+                status_code=410, detail="The run has been re-validated; start again from the first page"
+            )
+        after = ObjectId(error_part)
+    
+    filters = {"severity": severity, "rule_id": rule_id, "column_name": column_name, "file_id": file_id}
+    docs, last = await list_errors(get_database(), result["_id"], filters, limit=limit, after=after)
+    return ValidationErrorPage(
+        errors=[
+            ValidationErrorResponse(
+                id=str(doc["_id"]),
+                file_id=doc["file_id"],
+                row_index=doc["row_index"],
+                column_name=doc["column_name"],
+                severity=doc["severity"],
+                rule_id=doc["rule_id"],
+                description=doc["description"],
+            )
+            for doc in docs
+        ],
+        next_cursor=f"{result['_id']}.{last}" if last is not None else None,
+    )
+
+
+def _export_options(
+    export_format: str,
+    codec: Optional[str],
+    level: Optional[int],
+    compact: bool = False
+) -> ExportOptions:
+    """
+    Validate export query parameters.
+    
+    Raises:
+        HTTPException: 400 if the format, codec or level is invalid or the
+            format's optional dependency is not installed
+    """
+    try:
+        return ExportOptions(export_format, codec, level, compact)
+    except ExportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/{run_id}/export", response_model=JobResponse, status_code=202)
+async def queue_export(
+    run_id: str,
+    export_format: str = Query("json", alias="format", description=f"One of {', '.join(EXPORT_FORMATS)}"),
+    codec: Optional[str] = Query(None, description="Compression codec (default depends on format)"),
+    level: Optional[int] = Query(None, description="Compression level for the codec"),
+    compact: bool = Query(False, description="Write the bundle's JSON files without indentation"),
+    profile: bool = Depends(profiling_requested)
+):
+    """
+    Build the export bundle for a run as a background job.
+    
+    The finished bundle is downloaded from GET /jobs/{job_id}/result.
+    
     Args:
         run_id: The run ID
+        export_format: Entity format (json, ndjson, parquet or arrow)
+        codec: Compression codec
+        level: Compression level
+        compact: Write the manifest and validation report without indentation
+        profile: Profile the job (admin only, see app.core.profiling)
         
     Returns:
-        dict: Validation results
+        JobResponse: The queued job
     """
-    # TODO: Implement validation results retrieval
-    raise HTTPException(status_code=501, detail="Not implemented yet")
+    options = _export_options(export_format, codec, level, compact)
+    await _get_run_or_404(run_id)
+    
+    job = await job_manager.enqueue("export", run_id, params={"export": options.describe(), **_profile_params(profile)})
+    return job_response(job)
+
+
+# Runs in these states are mid-rewrite; their bundles are not cached
+_UNSTABLE_STATUSES = ("harmonizing", "validating")
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=start-end" Range header.
+    
+    Args:
+        header: The Range header value
+        size: Size of the file in bytes
+        
+    Returns:
+        Inclusive (start, end) offsets, or None to send the whole file
+        (no header, multiple ranges or an unparseable value)
+        
+    Raises:
+        HTTPException: 416 if the range lies outside the file
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416, detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+async def _iter_file(path: FilePath, start: int, length: int) -> AsyncIterator[bytes]:
+    """Read ``length`` bytes of a file from ``start`` in UPLOAD_CHUNK_SIZE pieces."""
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        while length > 0:
+            chunk = await f.read(min(settings.UPLOAD_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag."""
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _cached_export_response(
+    request: Request,
+    path: FilePath,
+    size: int,
+    headers: Dict[str, str]
+) -> Response:
+    """
+    Serve a cached bundle, honouring If-None-Match, Range and If-Range.
+    
+    Args:
+        request: The incoming request
+        path: The cached bundle
+        size: Size of the bundle in bytes
+        headers: Headers to send (including ETag)
+        
+    Returns:
+        Response: 304, 206 or 200 response
+    """
+    etag = headers["ETag"]
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == etag:
+        byte_range = _parse_range(request.headers.get("range"), size)
+    
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(path, 0, size), media_type="application/zip", headers=headers)
+    
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_file(path, start, end - start + 1),
+        status_code=206, media_type="application/zip", headers=headers,
+    )
+
+
+async def _profiled_stream(chunks: AsyncIterator[bytes], run_id: str) -> AsyncIterator[bytes]:
+    """
+    Pass an export stream through while profiling it, then save the profile.
+    
+    Args:
+        chunks: The bundle stream
+        run_id: The run ID
+        
+    Yields:
+        bytes: The chunks, unchanged
+    """
+    profiler = SamplingProfiler()
+    with profiler.running():
+        async for chunk in chunks:
+            yield chunk
+    await save_profile(get_database(), run_id, profiler, "request.export", {})
 
 
 @router.get("/{run_id}/export")
-async def export_run(run_id: str):
+async def export_run(
+    run_id: str,
+    request: Request,
+    export_format: str = Query("json", alias="format", description=f"One of {', '.join(EXPORT_FORMATS)}"),
+    codec: Optional[str] = Query(None, description="Compression codec (default depends on format)"),
+    level: Optional[int] = Query(None, description="Compression level for the codec"),
+    compact: bool = Query(False, description="Write the bundle's JSON files without indentation"),
+    profile: bool = Depends(profiling_requested),
+    service: ExportService = Depends(get_export_service)
+):
     """
     Export the harmonized data bundle for a run.
     
+    The ZIP is streamed as it is built, so the response starts immediately
+    and memory use does not depend on the size of the run. With a columnar
+    or NDJSON format the bundle holds one entities/<Type> file per entity
+    type instead of entities.json.
+    
+    Built bundles are cached on disk (see ExportCache), so repeat downloads
+    of an unchanged run are served from the cached file, with an ETag naming
+    that file and If-None-Match and Range support. A bundle built for this
+    request has no ETag: its bytes (export date, ZIP timestamps) differ from
+    any other build's, so it cannot be revalidated or resumed against one.
+    
+    With ``profile`` the bundle is always rebuilt (and not cached) under a
+    sampling profiler, saved when the download finishes.
+    
     Args:
         run_id: The run ID
+        request: The incoming request
+        export_format: Entity format (json, ndjson, parquet or arrow)
+        codec: Compression codec
+        level: Compression level
+        compact: Write the manifest and validation report without indentation
+        profile: Profile building the bundle (admin only)
         
     Returns:
-        FileResponse: The exported data bundle
+        StreamingResponse: The exported data bundle
     """
-    # TODO: Implement export logic using ExportService
-    raise HTTPException(status_code=501, detail="Not implemented yet")
\ No newline at end of file
+    options = _export_options(export_format, codec, level, compact)
+    run = await _get_run_or_404(run_id)
+    
+    cache = ExportCache()
+    key = cache.key(run, options)
+    headers = {"Content-Disposition": f'attachment; filename="run_{run_id}.zip"'}
+    
+    if profile:
+        chunks = _profiled_stream(service.stream_run(run_id, options), run_id)
+        return StreamingResponse(chunks, media_type="application/zip", headers=headers)
+    
+    cached = await cache.lookup(run_id, key)
+    if cached is not None:
+        try:
+            size = cached.stat().st_size
+        except FileNotFoundError:
+            # Evicted between lookup and stat; rebuild
+            pass
+        else:
+            return _cached_export_response(request, cached, size, {**headers, "ETag": cache.etag(cached)})
+    
+    chunks = service.stream_run(run_id, options)
+    if run["status"] not in _UNSTABLE_STATUSES:
+        async def unchanged() -> bool:
+            current = await get_database()[COLLECTIONS["runs"]].find_one({"_id": run["_id"]})
+            return (
+                current is not None
+                and current["status"] not in _UNSTABLE_STATUSES
+                and cache.key(current, options) == key
+            )
+        
+        chunks = cache.store(run_id, key, chunks, commit=unchanged)
+    
+    return StreamingResponse(chunks, media_type="application/zip", headers=headers)
@@ -1,67 +1,140 @@
 """
 API endpoints for managing schema templates.
 """
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
-import json
-import os
-from pathlib import Path
+from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi.responses import Response
+from typing import List, Dict, Any, Optional
+
+from app.core.config import settings
+from app.api.responses import FastJSONResponse
+from app.models.schema import SchemaDetectionResponse
+from app.schemas.registry import schema_registry
+from app.services.storage import MultipartFileUpload, UploadFormError, UploadTooLargeError, detect_delimiter
 
 
 router = APIRouter()
 
+# The detection form is parsed by hand (see detect_schema), so describe it here
+_DETECT_FORM_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "schema_template_id": {"type": "string"},
+                    },
+                },
+            },
+        },
+    },
+}
+
+
+def _cached_response(request: Request, etag: str, content: Any) -> Response:
+    """
+    Answer with 304 Not Modified if the client already has this version.
+    
+    Args:
+        request: The incoming request
+        etag: ETag of the current version
+        content: JSON body to send otherwise
+    
+    Returns:
+        Response: A 304 or the JSON response, with the ETag header
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(content, headers=headers)
+
 
 @router.get("/", response_model=List[Dict[str, Any]])
-async def list_schemas():
+async def list_schemas(request: Request):
     """
     Get a list of available schema templates.
     
+    Served from the in-memory schema registry; clients can revalidate with
+    If-None-Match.
+    
     Returns:
         List[Dict]: List of available schema templates with metadata
     """
-    schemas_dir = Path(__file__).parent.parent.parent / "schemas" / "templates"
+    return _cached_response(
+        request,
+        schema_registry.etag,
+        [template.summary for template in schema_registry.list()],
+    )
+
+
+@router.post("/detect", response_model=SchemaDetectionResponse, openapi_extra=_DETECT_FORM_OPENAPI)
+async def detect_schema(
+    request: Request,
+    schema_template_id: Optional[str] = Query(None, description="Template to suggest the mapping for"),
+    limit: int = Query(5, ge=1, le=50)
+):
+    """
+    Suggest schema templates and a column mapping for a file before upload.
+    
+    The multipart/form-data body (field ``file``, and optionally
+    ``schema_template_id``) is parsed as it arrives and only the first
+    SCHEMA_DETECTION_SAMPLE_BYTES of the file are read; the rest of the
+    body is never received. A ``schema_template_id`` form field must
+    therefore come before the file, unless the file fits in the sample;
+    the query parameter works either way.
+    
+    Args:
+        request: The incoming request, whose body holds the file (or just
+            its head)
+        schema_template_id: Template to suggest the mapping for (default:
+            the form field, then the best candidate)
+        limit: Number of candidates to return
+        
+    Returns:
+        SchemaDetectionResponse: Ranked candidates and suggested mappings
+    """
+    # The detection engine (NumPy) is loaded on first use, not at startup
+    from app.services.detection import detection_index, parse_head
     
-    if not schemas_dir.exists():
-        return []
+    if schema_template_id and schema_registry.get(schema_template_id) is None:
+        raise HTTPException(status_code=404, detail=f"Schema '{schema_template_id}' not found")
+    try:
+        form = MultipartFileUpload(request.headers, request.stream())
+        head = await form.file_head(settings.SCHEMA_DETECTION_SAMPLE_BYTES)
+    except UploadFormError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    schemas = []
-    for schema_file in schemas_dir.glob("*.json"):
-        try:
-            with open(schema_file, "r") as f:
-                schema_data = json.load(f)
-                schemas.append({
-                    "id": schema_data.get("id"),
-                    "name": schema_data.get("name"),
-                    "version": schema_data.get("version"),
-                    "description": schema_data.get("description", ""),
-                })
-        except Exception as e:
-            print(f"Error loading schema {schema_file}: {e}")
-            continue
+    schema_template_id = schema_template_id or form.fields.get("schema_template_id") or None
+    if schema_template_id and schema_registry.get(schema_template_id) is None:
+        raise HTTPException(status_code=404, detail=f"Schema '{schema_template_id}' not found")
     
-    return schemas
+    header, rows = parse_head(head, detect_delimiter(form.filename or ""))
+    return detection_index().detect(header, rows, schema_template_id, limit)
 
 
 @router.get("/{schema_id}", response_model=Dict[str, Any])
-async def get_schema(schema_id: str):
+async def get_schema(schema_id: str, request: Request):
     """
     Get a specific schema template by ID.
     
     Args:
         schema_id: The schema template ID
-        
+    
     Returns:
         Dict: The complete schema template
     """
-    schemas_dir = Path(__file__).parent.parent.parent / "schemas" / "templates"
-    schema_file = schemas_dir / f"{schema_id}.json"
-    
-    if not schema_file.exists():
+    template = schema_registry.get(schema_id)
+    if template is None:
+        if schema_id in schema_registry.errors:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error loading schema: {schema_registry.errors[schema_id]}"
+            )
         raise HTTPException(status_code=404, detail=f"Schema '{schema_id}' not found")
     
-    try:
-        with open(schema_file, "r") as f:
-            schema_data = json.load(f)
-            return schema_data
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error loading schema: {str(e)}")
\ No newline at end of file
+    return _cached_response(request, template.etag, template.data)
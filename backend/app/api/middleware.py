@@ -0,0 +1,63 @@
+"""
+ASGI middleware for the API.
+"""
+from typing import Any, Awaitable, Callable, Dict
+import time
+
+from app.core.metrics import REGISTRY
+
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "mdo_http_request_duration_seconds",
+    "Latency of HTTP requests by method, route template and status",
+    ("method", "route", "status"),
+)
+
+# Route label of requests that matched no route (kept constant so that
+# scans of random paths cannot create unbounded label values)
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RequestMetricsMiddleware:
+    """
+    Record the latency of each HTTP request in REQUEST_SECONDS.
+
+    Requests are labelled with the path template of the matched route
+    (``/api/v1/runs/{run_id}``), not the raw path. For streamed responses
+    the latency runs until the last body chunk is sent.
+    """
+
+    def __init__(self, app: Callable[..., Awaitable[None]]):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_SECONDS.labels(scope["method"], _route_label(scope), status).observe(
+                time.perf_counter() - started
+            )
+
+
+def _route_label(scope: Dict[str, Any]) -> str:
+    """Path template of the route the router matched into the (shared) scope."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if "endpoint" in scope:
+        # Starlette routes without parameters (/docs, /openapi.json)
+        return scope["path"]
+    return UNMATCHED_ROUTE
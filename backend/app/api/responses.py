@@ -0,0 +1,21 @@
+"""
+Response classes for the API.
+"""
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from app.core.serialization import dumps
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with the configured encoder (see
+    app.core.serialization).
+
+    Used as the application's default response class, so route return
+    values and response models are encoded by dumps().
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -2,7 +2,9 @@
 Configuration management for the MDO backend.
 Uses pydantic-settings for environment variable management.
 """
-from typing import List
+from typing import Dict, List
+import logging
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -14,10 +16,24 @@ class Settings(BaseSettings):
     APP_NAME: str = "Multiomic Data Orchestrator"
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = False
+    LOG_LEVEL: str = "INFO"  # level of the app.* loggers, e.g. "DEBUG" or "WARNING"
     
     # MongoDB
     MONGODB_URL: str = "mongodb://localhost:27017"
     MONGODB_DB_NAME: str = "mdo_database"
+    ENSURE_INDEXES_ON_STARTUP: bool = True
+    MONGODB_MAX_POOL_SIZE: int = 100  # connections per process on the main client
+    MONGODB_MIN_POOL_SIZE: int = 0  # connections kept open when idle
+    MONGODB_MAX_CONNECTING: int = 2  # connections being established at once per server
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = 0  # max wait for a free connection; 0 = no limit
+    MONGODB_COMPRESSORS: str = ""  # wire compression, e.g. "zstd,zlib"; empty disables
+    MONGODB_CONNECT_TIMEOUT_MS: int = 10000  # TCP connect timeout
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 10000  # also bounds the startup connectivity check
+    MONGODB_SOCKET_TIMEOUT_MS: int = 0  # per network round trip; 0 = no limit
+    MONGODB_OPERATION_TIMEOUTS_MS: Dict[str, int] = {}  # {"collection.operation" | "collection" | "default": ms}
+    MONGODB_ANALYTICS_POOL_SIZE: int = 20  # separate pool for export/analytics reads; 0 = use the main client
+    MONGODB_ANALYTICS_READ_PREFERENCE: str = "secondaryPreferred"  # read preference of the analytics client
+    MONGODB_ANALYTICS_MAX_STALENESS_SECONDS: int = 0  # skip secondaries lagging more than this (>= 90); 0 = no limit
     
     # CORS
     CORS_ORIGINS: List[str] = [
@@ -27,11 +43,55 @@ class Settings(BaseSettings):
     ]
     
     # File Upload
-    MAX_UPLOAD_SIZE: int = 100 * 1024 * 1024  # 100MB
+    MAX_UPLOAD_SIZE: int = 20 * 1024 * 1024 * 1024  # 20GB
     UPLOAD_DIR: str = "./uploads"
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 1MB per read/write
+    
+    # Harmonization
+    HARMONIZATION_WORKERS: int = 0  # process pool size; 0 = one per CPU
+    
+    # Bulk writes
+    BULK_WRITE_BATCH_SIZE: int = 5000  # documents per insert_many
+    BULK_WRITE_MAX_IN_FLIGHT: int = 4  # concurrent batches before add() waits
+    
+    # Background jobs
+    JOB_BACKEND: str = "inprocess"  # "inprocess" or "mongo" (separate app.worker processes)
+    JOB_CONCURRENCY: int = 2  # jobs run at once per process
+    JOB_POLL_INTERVAL: float = 1.0  # seconds between queue polls / progress checks
+    JOB_LEASE_SECONDS: int = 300  # reclaim running jobs without a heartbeat for this long
+    
+    # Export
+    EXPORT_BATCH_SIZE: int = 1000  # entities fetched and compressed per cursor batch
+    EXPORT_CACHE_MAX_BYTES: int = 10 * 1024 * 1024 * 1024  # 10GB of cached bundles; 0 disables the cache
+    EXPORT_JOB_RETENTION_HOURS: float = 24.0  # export job bundles are deleted after this long; 0 keeps them
+    
+    # Schema templates
+    SCHEMA_RELOAD_INTERVAL: float = 5.0  # seconds between checks for edited template files; 0 disables reloading
+    SCHEMA_DETECTION_SAMPLE_BYTES: int = 64 * 1024  # bytes read from the head of a file for schema detection
+    SCHEMA_DETECTION_SAMPLE_ROWS: int = 200  # rows of that head used for schema detection
+    SCHEMA_MAPPING_MIN_CONFIDENCE: float = 0.5  # column-to-field confidence below which no mapping is suggested
+    
+    # Validation
+    VALIDATION_BATCH_SIZE: int = 50000  # entities evaluated per rules-engine batch
+    VALIDATION_RULESET: str = "default_v1"  # ruleset file in app/schemas/rules
+    VALIDATION_SAMPLE_SIZE: int = 20  # errors per rule kept on the result document
+    VALIDATION_FAIL_FAST_BLOCKERS: int = 100  # Blocker errors after which fail-fast validation stops
+    VALIDATION_SAMPLE_ROWS: int = 2000  # rows sampled per entity type by sample validation
+    VALIDATION_SAMPLE_CONFIDENCE: float = 0.95  # confidence level of sample error-rate intervals
+    VALIDATION_INCREMENTAL_MAX_CHANGED: float = 0.5  # changed-entity fraction above which a full pass runs; 0 disables
     
     # API
     API_V1_PREFIX: str = "/api/v1"
+    STARTUP_WARMUP: str = "background"  # preload engines, rules and schemas: "background", "blocking" or "off"
+    JSON_ENCODER: str = "auto"  # "auto" (orjson if installed), "orjson" or "json" for responses and exports
+    
+    # Metrics
+    METRICS_ENABLED: bool = True  # record request latencies and serve GET /metrics
+    WORKER_METRICS_PORT: int = 0  # first port of the workers' metrics listeners (one per process); 0 disables
+    
+    # Admin
+    ADMIN_TOKEN: str = ""  # X-Admin-Token value that unlocks admin options such as profile=true; empty disables them
+    PROFILE_INTERVAL_MS: float = 5.0  # sampling interval of opt-in profiles
     
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -42,4 +102,19 @@ class Settings(BaseSettings):
 
 
 # Create global settings instance
-settings = Settings()
\ No newline at end of file
+settings = Settings()
+
+
+def configure_logging() -> None:
+    """
+    Send the app.* loggers to stderr at LOG_LEVEL.
+
+    Loggers of other libraries (uvicorn, the MongoDB driver) keep their
+    own configuration.
+    """
+    logger = logging.getLogger("app")
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(settings.LOG_LEVEL.upper())
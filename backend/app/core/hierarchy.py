@@ -0,0 +1,39 @@
+"""
+Canonical entity hierarchy: Block -> Slide -> ROI/FOV -> Library -> Run.
+"""
+from typing import Dict, List, Optional
+
+
+# Entity types in hierarchy order (parents before children)
+ENTITY_TYPES: List[str] = ["Block", "Slide", "ROI", "Library", "Run"]
+
+# Natural key field for each entity type
+ENTITY_KEYS: Dict[str, str] = {
+    "Block": "Block_ID",
+    "Slide": "Slide_ID",
+    "ROI": "ROI_ID",
+    "Library": "Library_ID",
+    "Run": "Run_ID",
+}
+
+# Parent entity type for each child entity type
+PARENT_TYPES: Dict[str, str] = {
+    "Slide": "Block",
+    "ROI": "Slide",
+    "Library": "ROI",
+    "Run": "Library",
+}
+
+
+def parent_key(entity_type: str) -> Optional[str]:
+    """
+    Get the field on a child entity that references its parent.
+
+    Args:
+        entity_type: The child entity type
+
+    Returns:
+        The parent's natural key field name, or None for root entities
+    """
+    parent = PARENT_TYPES.get(entity_type)
+    return ENTITY_KEYS[parent] if parent else None
@@ -0,0 +1,398 @@
+"""
+Prometheus metrics for the API and worker processes.
+
+Metrics live in process memory and are rendered in the Prometheus text
+exposition format (version 0.0.4): by ``GET /metrics`` in the API, and by
+a small listener in each worker process started with ``--metrics-port``.
+
+Recording a value is a dict lookup for the label values plus a short
+locked update, so instrumentation stays on in production. Values that
+already exist elsewhere (connection pool state) are read by callbacks
+when the metrics are rendered instead of being recorded as they change.
+
+Usage:
+    REQUESTS = REGISTRY.counter("mdo_requests_total", "Requests", ("route",))
+    REQUESTS.labels("/api/v1/runs").inc()
+
+    with stage_timer("validate.field", rows=len(batch)):
+        errors = apply(batch)
+"""
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+import math
+import threading
+import time
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Pipeline stages run from milliseconds (a validation batch) to hours (a run)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0)
+
+# Label values -> sample value, for metrics read at render time
+Collector = Callable[[], Dict[Tuple[str, ...], float]]
+
+logger = logging.getLogger(__name__)
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Value:
+    """One labelled counter or gauge value."""
+
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+
+class _Buckets:
+    """One labelled histogram: per-bucket counts, sum and count."""
+
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        # A bucket counts values <= its bound; the last one is +Inf
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the duration of the block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Metric(ABC):
+    """
+    A named metric with a fixed set of label names.
+
+    Each distinct combination of label values gets its own child, created
+    on first use; metrics without labels record on the metric itself.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), collect: Optional[Collector] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _new_child(self):
+        """A new child to record one combination of label values on."""
+
+    def labels(self, *values: str):
+        """
+        The child for a combination of label values.
+
+        Args:
+            *values: One string per label name, in order
+
+        Returns:
+            The child to record on
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self) -> List[str]:
+        """The metric's HELP, TYPE and sample lines."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        if self.collect is not None:
+            return [
+                f"{self.name}{_label_text(self.labelnames, values)} {_format_value(value)}"
+                for values, value in self.collect().items()
+            ]
+        return [
+            f"{self.name}{_label_text(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increment the unlabelled counter."""
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """A value that goes up and down."""
+
+    kind = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        """Set the unlabelled gauge."""
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    """Counts of observations in cumulative buckets, with their sum."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _Buckets:
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """Observe a value on the unlabelled histogram."""
+        self.labels().observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(names, values + (_format_value(bound),))} {cumulative}")
+            labels = _label_text(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics of a process, rendered together.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (), collect: Optional[Collector] = None) -> Counter:
+        """
+        Register a counter.
+
+        Args:
+            name: Metric name, ending in ``_total``
+            documentation: HELP text
+            labelnames: Label names
+            collect: Read the values from this callback when rendering
+                instead of recording them
+
+        Returns:
+            Counter: The new metric
+        """
+        return self._register(Counter(name, documentation, labelnames, collect))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), collect: Optional[Collector] = None) -> Gauge:
+        """
+        Register a gauge.
+
+        Args:
+            name: Metric name
+            documentation: HELP text
+            labelnames: Label names
+            collect: Read the values from this callback when rendering
+                instead of recording them
+
+        Returns:
+            Gauge: The new metric
+        """
+        return self._register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """
+        Register a histogram.
+
+        Args:
+            name: Metric name
+            documentation: HELP text
+            labelnames: Label names
+            buckets: Upper bounds of the buckets; +Inf is added
+
+        Returns:
+            Histogram: The new metric
+        """
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        All metrics in the text exposition format.
+
+        A collect callback that fails is logged and its metric left
+        without samples, so one broken source does not hide the rest.
+        """
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                logger.exception("Collecting metric %s failed", metric.name)
+        return "\n".join(lines) + "\n"
+
+
+# Global registry of this process
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "mdo_pipeline_stage_duration_seconds",
+    "Duration of pipeline stages (parse, map, link, store, harmonize, validate.<level>, export)",
+    ("stage",),
+    buckets=STAGE_BUCKETS,
+)
+STAGE_ROWS = REGISTRY.counter(
+    "mdo_pipeline_stage_rows_total",
+    "Rows processed by each pipeline stage",
+    ("stage",),
+)
+STAGE_ROWS_PER_SECOND = REGISTRY.gauge(
+    "mdo_pipeline_stage_rows_per_second",
+    "Throughput of the most recent run of each pipeline stage",
+    ("stage",),
+)
+
+
+def record_stage(stage: str, seconds: float, rows: int = 0) -> None:
+    """
+    Record one run of a pipeline stage.
+
+    Args:
+        stage: Stage name, e.g. "parse" or "validate.field"
+        seconds: How long it took
+        rows: Rows it processed
+    """
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    if rows:
+        STAGE_ROWS.labels(stage).inc(rows)
+        if seconds > 0:
+            STAGE_ROWS_PER_SECOND.labels(stage).set(rows / seconds)
+
+
+@contextmanager
+def stage_timer(stage: str, rows: int = 0) -> Iterator[None]:
+    """
+    Record the block as one run of a pipeline stage, if it succeeds.
+
+    Args:
+        stage: Stage name
+        rows: Rows the block processes
+    """
+    started = time.perf_counter()
+    yield
+    record_stage(stage, time.perf_counter() - started, rows)
+
+
+async def serve_metrics(port: int, host: str = "0.0.0.0") -> asyncio.AbstractServer:
+    """
+    Serve the registry over plain HTTP, for processes without the API.
+
+    Every request is answered with the metrics, whatever its path.
+
+    Args:
+        port: TCP port to listen on
+        host: Interface to listen on
+
+    Returns:
+        The started server; close it on shutdown
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            # Request line and headers; the request itself is not needed
+            while (await reader.readline()).strip():
+                pass
+            body = REGISTRY.render().encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 200 OK\r\nContent-Type: {CONTENT_TYPE}; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
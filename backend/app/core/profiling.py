@@ -0,0 +1,245 @@
+"""
+Opt-in sampling profiler for single jobs and requests.
+
+An admin can ask for a profile of one harmonize, validate or export job,
+or of one export download (``profile=true`` with the admin token, see
+app.api.deps). While it runs, a SamplingProfiler thread records the Python
+stack of every thread in the process every PROFILE_INTERVAL_MS: the event
+loop, the MongoDB driver's I/O threads and the threads validation hands
+work to. Files parsed in the process pool are sampled in the pool process
+and merged in under a ``process-pool`` root frame.
+
+The result is saved as collapsed stacks (one ``frame;frame;frame count``
+line per distinct stack), which flamegraph.pl, speedscope and most
+flame graph viewers read, under UPLOAD_DIR/<run_id>/profiles, and an
+audit_logs entry of the run points to the file.
+
+Nothing is started unless a profile is requested, so unprofiled work pays
+only for one ContextVar lookup per parsed file.
+
+Samples cover the whole process, so other work running at the same time
+shows up too; profile on a quiet process for a clean picture.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import os
+import sys
+import threading
+import time
+
+from bson import ObjectId
+
+from app.core.config import settings
+from app.db.database import COLLECTIONS
+
+
+# Frames that, innermost or next to it, mark a thread waiting for work
+# rather than doing it (the event loop waiting in select() is kept: that
+# is time the job spends waiting on I/O)
+IDLE_FRAMES = (
+    ("concurrent/futures/thread.py", "_worker"),
+    ("multiprocessing/connection.py", "wait"),
+    ("threading.py", "wait"),
+    ("pymongo/periodic_executor.py", "_run"),
+)
+
+_active: ContextVar[Optional["SamplingProfiler"]] = ContextVar("active_profiler", default=None)
+
+
+def _short_path(filename: str) -> str:
+    """A filename relative to the sys.path entry it was imported from."""
+    best = ""
+    for entry in sys.path:
+        if entry and filename.startswith(entry) and len(entry) > len(best):
+            best = entry
+    return filename[len(best):].lstrip(os.sep) if best else filename
+
+
+class SamplingProfiler:
+    """
+    Counts the stacks of the process's threads (or of one thread, given
+    ``thread_id``), sampled from a daemon thread.
+
+    Usage:
+        profiler = SamplingProfiler()
+        with profiler.running():
+            await service.validate_run(run_id)
+        text = profiler.collapsed()
+    """
+
+    def __init__(self, interval: Optional[float] = None, thread_id: Optional[int] = None):
+        self.interval = interval if interval is not None else settings.PROFILE_INTERVAL_MS / 1000
+        self.thread_id = thread_id
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self.seconds = 0.0
+        self._started = 0.0
+        self._labels: Dict[CodeType, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            # ";" separates frames in the collapsed format
+            label = self._labels[code] = label.replace(";", ":")
+        return label
+
+    def _stack(self, frame: Optional[FrameType]) -> Optional[List[str]]:
+        """Frame labels from the outermost call in, or None if the thread is idle."""
+        codes: List[CodeType] = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        if not codes:
+            return None
+        for code in codes[:2]:
+            for suffix, name in IDLE_FRAMES:
+                if code.co_name == name and code.co_filename.endswith(suffix):
+                    return None
+        return [self._label(code) for code in reversed(codes)]
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()
+        with self._lock:
+            self.samples += 1
+            for ident, frame in frames.items():
+                if ident == own or (self.thread_id is not None and ident != self.thread_id):
+                    continue
+                stack = self._stack(frame)
+                if stack is None:
+                    continue
+                key = ";".join([names.get(ident, f"thread-{ident}").replace(";", ":")] + stack)
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        """Start sampling in a daemon thread."""
+        self._stop.clear()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampling thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self.seconds += time.perf_counter() - self._started
+
+    @contextmanager
+    def running(self) -> Iterator["SamplingProfiler"]:
+        """
+        Sample while the block runs, and make this the active profiler of
+        the block's context (see active_profiler()).
+        """
+        token = _active.set(self)
+        self.start()
+        try:
+            yield self
+        finally:
+            self.stop()
+            _active.reset(token)
+
+    def merge(self, stacks: Dict[str, int], root: str) -> None:
+        """
+        Add stacks sampled elsewhere, e.g. in a pool process.
+
+        Args:
+            stacks: Collapsed stacks and their counts
+            root: Frame to put them under
+        """
+        with self._lock:
+            for stack, count in stacks.items():
+                key = f"{root};{stack}"
+                self.stacks[key] = self.stacks.get(key, 0) + count
+
+    def collapsed(self) -> str:
+        """The samples in the collapsed stack format, busiest stack first."""
+        with self._lock:
+            ordered = sorted(self.stacks.items(), key=lambda item: -item[1])
+        return "".join(f"{stack} {count}\n" for stack, count in ordered)
+
+
+def active_profiler() -> Optional[SamplingProfiler]:
+    """The profiler of the current job or request, if it is being profiled."""
+    return _active.get()
+
+
+def profiled_call(interval: float, func: Callable[..., Any], *args: Any) -> Tuple[Any, Dict[str, int]]:
+    """
+    Call a function under a profiler of the calling thread.
+
+    Module-level so it can be sent to the process pool in place of func.
+
+    Args:
+        interval: Sampling interval in seconds
+        func: Function to call
+        *args: Its arguments
+
+    Returns:
+        Tuple of the function's return value and the collapsed stacks
+    """
+    profiler = SamplingProfiler(interval, thread_id=threading.get_ident())
+    with profiler.running():
+        result = func(*args)
+    return result, profiler.stacks
+
+
+def profile_path(run_id: str, name: str) -> Path:
+    """Where a profile of a run is saved."""
+    return Path(settings.UPLOAD_DIR) / str(run_id) / "profiles" / f"{name}.folded"
+
+
+def _write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+async def save_profile(db, run_id: str, profiler: SamplingProfiler, target: str, details: Dict[str, Any]) -> Path:
+    """
+    Write a profile next to the run and record it in audit_logs.
+
+    Args:
+        db: The database
+        run_id: The profiled run
+        profiler: The stopped profiler
+        target: What was profiled, e.g. "job.harmonize" or "request.export"
+        details: More fields for the audit entry, e.g. the job ID
+
+    Returns:
+        Path: The collapsed stack file, named after the audit entry
+    """
+    entry_id = ObjectId()
+    path = profile_path(run_id, f"{target}-{entry_id}")
+    await asyncio.to_thread(_write, path, profiler.collapsed())
+    await db[COLLECTIONS["audit_logs"]].insert_one({
+        "_id": entry_id,
+        "timestamp": datetime.utcnow(),
+        "user_id": "admin",
+        "run_id": ObjectId(run_id),
+        "action": "profile_recorded",
+        "details": {
+            "target": target,
+            "path": str(path),
+            "format": "collapsed",
+            "samples": profiler.samples,
+            "interval_ms": profiler.interval * 1000,
+            "seconds": profiler.seconds,
+            **details,
+        },
+    })
+    return path
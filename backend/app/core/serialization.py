@@ -0,0 +1,125 @@
+"""
+JSON serialization for API responses and export bundles.
+
+Uses orjson when it is installed and the standard library otherwise
+(JSON_ENCODER selects one explicitly). Both encoders produce the same
+JSON for the documents this backend handles: ObjectIds become strings,
+datetimes ISO 8601 strings, NumPy scalars plain numbers, and NaN and
+infinities (which JSON cannot represent) null.
+
+Output is compact (no whitespace) unless ``pretty`` is set, which indents
+by two spaces for files meant to be read by people.
+"""
+from datetime import date, datetime
+from typing import Any, Callable
+import importlib.util
+import json
+import math
+
+from bson import ObjectId
+
+from app.core.config import settings
+
+
+JSON_ENCODERS = ("auto", "orjson", "json")
+
+
+class SerializationError(Exception):
+    """
+    Raised when the configured JSON encoder is unknown or not installed.
+    """
+    pass
+
+
+def _default(value: Any) -> Any:
+    """Serialize types that neither encoder handles natively."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if type(value).__module__ == "numpy":
+        # Scalars and arrays; checked by module so NumPy is not imported here
+        return value.tolist()
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+
+def _finite(value: Any) -> Any:
+    """Copy a value with NaN and infinities replaced by None, as orjson writes them."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    if type(value).__module__ == "numpy":
+        return _finite(value.tolist())
+    return value
+
+
+def _stdlib_encoder() -> Callable[[Any, bool], bytes]:
+    compact = json.JSONEncoder(default=_default, separators=(",", ":"), ensure_ascii=False, allow_nan=False)
+    pretty = json.JSONEncoder(default=_default, indent=2, ensure_ascii=False, allow_nan=False)
+
+    def dumps(value: Any, indent: bool) -> bytes:
+        encoder = pretty if indent else compact
+        try:
+            return encoder.encode(value).encode("utf-8")
+        except ValueError:
+            # A non-finite float; only then is the value copied
+            return encoder.encode(_finite(value)).encode("utf-8")
+
+    return dumps
+
+
+def _orjson_encoder() -> Callable[[Any, bool], bytes]:
+    import orjson
+
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    pretty = options | orjson.OPT_INDENT_2
+
+    def dumps(value: Any, indent: bool) -> bytes:
+        return orjson.dumps(value, default=_default, option=pretty if indent else options)
+
+    return dumps
+
+
+def _select_encoder(name: str):
+    """
+    Pick the encoder for a JSON_ENCODER value.
+
+    Args:
+        name: "auto", "orjson" or "json"
+
+    Returns:
+        Tuple of the encoder's name and its dumps function
+
+    Raises:
+        SerializationError: If the name is unknown, or orjson was requested
+            but is not installed
+    """
+    if name not in JSON_ENCODERS:
+        raise SerializationError(f"Unknown JSON encoder '{name}'; expected one of {', '.join(JSON_ENCODERS)}")
+    if name == "auto":
+        name = "orjson" if importlib.util.find_spec("orjson") is not None else "json"
+    if name == "orjson":
+        if importlib.util.find_spec("orjson") is None:
+            raise SerializationError("JSON_ENCODER=orjson requires the 'orjson' package, which is not installed")
+        return name, _orjson_encoder()
+    return name, _stdlib_encoder()
+
+
+ENCODER, _dumps = _select_encoder(settings.JSON_ENCODER)
+
+
+def dumps(value: Any, pretty: bool = False) -> bytes:
+    """
+    Serialize a value to JSON bytes, converting ObjectIds and datetimes.
+
+    Args:
+        value: The value to serialize
+        pretty: Indent by two spaces instead of writing compact JSON
+
+    Returns:
+        bytes: UTF-8 encoded JSON
+    """
+    return _dumps(value, pretty)
@@ -0,0 +1,113 @@
+"""
+Startup timing for the API and worker processes.
+
+Import this module first: ``startup_report`` times the phases of startup
+from that point (imports of each subsystem, the MongoDB connection, index
+checks, warm-up steps) and records when the process became ready to serve.
+The report is printed at startup and served by ``GET /health/startup``.
+
+Heavy engines (the NumPy harmonization, validation and detection code)
+are not imported on the way to ready: they load on first use, or during
+warm-up (see app.services.container), which the API runs in the
+background by default.
+"""
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+import os
+import time
+
+
+def _process_age() -> Optional[float]:
+    """Seconds since the process was started, from /proc (Linux only)."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the command name, which is in parentheses
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupReport:
+    """
+    Durations of named startup phases.
+
+    Usage:
+        with startup_report.phase("import.api"):
+            from app.api.endpoints import runs
+        startup_report.mark_ready()
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.ready: Optional[float] = None
+        self.process_age_at_ready: Optional[float] = None
+
+    def restart(self) -> None:
+        """
+        Measure readiness from now, e.g. in a process forked from a parent
+        that already did part of the startup. Phases recorded so far are
+        kept.
+        """
+        self.started = time.perf_counter()
+        self.ready = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Time the block as the phase ``name``.
+
+        Args:
+            name: Phase name, "<subsystem>.<step>"
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def mark_ready(self) -> None:
+        """Record that the process is ready to serve."""
+        self.ready = time.perf_counter() - self.started
+        self.process_age_at_ready = _process_age()
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        The report, with durations in milliseconds.
+
+        Returns:
+            Dict with ``ready_ms`` (from the import of this module or the
+            last restart()), ``process_ready_ms`` (from process start, where
+            available), ``phases`` and ``subsystems`` (phases summed by
+            subsystem)
+        """
+        subsystems: Dict[str, float] = {}
+        for name, seconds in self.phases.items():
+            subsystem = name.split(".", 1)[0]
+            subsystems[subsystem] = subsystems.get(subsystem, 0.0) + seconds
+        return {
+            "ready_ms": _ms(self.ready),
+            "process_ready_ms": _ms(self.process_age_at_ready),
+            "phases": {name: _ms(seconds) for name, seconds in self.phases.items()},
+            "subsystems": {name: _ms(seconds) for name, seconds in subsystems.items()},
+        }
+
+    def format(self) -> str:
+        """One line for the startup log."""
+        summary = self.summary()
+        phases = ", ".join(f"{name} {ms:.0f} ms" for name, ms in summary["phases"].items())
+        ready = f"ready in {summary['ready_ms']:.0f} ms" if self.ready is not None else "not ready"
+        if summary["process_ready_ms"] is not None:
+            ready += f" ({summary['process_ready_ms']:.0f} ms since process start)"
+        return f"Startup: {ready}; {phases}"
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(1000 * seconds, 1)
+
+
+# Global startup report of this process
+startup_report = StartupReport()
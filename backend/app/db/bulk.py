@@ -0,0 +1,287 @@
+"""
+Batched cursor reads and unordered bulk inserts with bounded memory.
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+import asyncio
+import logging
+import time
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure, NetworkTimeout
+
+from app.core.config import settings
+from app.core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+# Duplicate key: the document is already stored (e.g. a retried batch whose
+# first attempt partly succeeded), so it is not treated as a failure.
+DUPLICATE_KEY_ERROR = 11000
+
+TRANSIENT_ERRORS = (AutoReconnect, ConnectionFailure, NetworkTimeout)
+
+# writeErrors codes worth resending: elections, shutdowns, time limits and
+# write conflicts. Anything else (e.g. 121 document validation failure,
+# 10334 document too large) fails the same way every time.
+TRANSIENT_WRITE_ERROR_CODES = frozenset({
+    6,      # HostUnreachable
+    7,      # HostNotFound
+    50,     # MaxTimeMSExpired
+    89,     # NetworkTimeout
+    91,     # ShutdownInProgress
+    112,    # WriteConflict
+    189,    # PrimarySteppedDown
+    262,    # ExceededTimeLimit
+    9001,   # SocketException
+    10107,  # NotWritablePrimary
+    11600,  # InterruptedAtShutdown
+    11602,  # InterruptedDueToReplStateChange
+    13435,  # NotPrimaryNoSecondaryOk
+    13436,  # NotPrimaryOrSecondary
+})
+
+BATCHES_IN_FLIGHT = REGISTRY.gauge(
+    "mdo_bulk_write_batches_in_flight",
+    "Bulk insert batches being written by BulkWriters of this process",
+)
+
+
+async def iter_batches(cursor, batch_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Group a Motor cursor's documents into lists.
+
+    The cursor's server batch size is set to match, so each list is
+    roughly one round trip.
+
+    Args:
+        cursor: Motor cursor to read
+        batch_size: Documents per list
+
+    Yields:
+        Lists of at most ``batch_size`` documents
+    """
+    cursor.batch_size(batch_size)
+    batch: List[Dict[str, Any]] = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BulkWriteFailed(Exception):
+    """
+    Raised when documents could not be written after all retries.
+    """
+
+    def __init__(self, message: str, failed: List[Dict[str, Any]]):
+        super().__init__(message)
+        self.failed = failed
+
+
+class BulkWriter:
+    """
+    Buffers documents and inserts them in unordered batches.
+
+    Up to ``max_in_flight`` batches are written concurrently; once that many
+    are pending, add() waits for one to finish. Memory use is therefore
+    bounded by roughly ``(max_in_flight + 1) * batch_size`` documents
+    regardless of how many are written.
+
+    Failed batches are retried with exponential backoff. After a
+    BulkWriteError only the documents that failed with a transient error
+    are resent; permanent failures (validation, document size) are reported
+    by flush() without a retry, and documents rejected as duplicates count
+    as written, because their _id is assigned client-side and a duplicate
+    means an earlier attempt already stored them.
+
+    ``on_batch`` is awaited with the number of documents each insert
+    stored. Errors it raises are logged; they do not fail the documents,
+    which are already written.
+
+    Usage:
+        async with BulkWriter(collection) as writer:
+            for doc in docs:
+                await writer.add(doc)
+        print(writer.stats())
+    """
+
+    def __init__(
+        self,
+        collection: AsyncIOMotorCollection,
+        batch_size: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        max_retries: int = 3,
+        on_batch: Optional[Callable[[int], Awaitable[None]]] = None
+    ):
+        self.collection = collection
+        self.batch_size = batch_size or settings.BULK_WRITE_BATCH_SIZE
+        self.max_in_flight = max_in_flight or settings.BULK_WRITE_MAX_IN_FLIGHT
+        self.max_retries = max_retries
+        self.on_batch = on_batch
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._pending: Set[asyncio.Task] = set()
+        self._failed: List[Dict[str, Any]] = []
+        self._errors: List[BaseException] = []
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+
+        self.docs_written = 0
+        self.docs_failed = 0
+        self.batches_written = 0
+        self.retries = 0
+
+    async def __aenter__(self) -> "BulkWriter":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.flush()
+        else:
+            await self._drain()
+
+    async def add(self, doc: Dict[str, Any]) -> None:
+        """
+        Buffer one document, sending a batch when the buffer is full.
+
+        Args:
+            doc: Document to insert
+        """
+        if self._started is None:
+            self._started = time.perf_counter()
+        self._buffer.append(doc)
+        if len(self._buffer) >= self.batch_size:
+            await self._send()
+
+    async def add_many(self, docs: Iterable[Dict[str, Any]]) -> None:
+        """
+        Buffer several documents.
+
+        Args:
+            docs: Documents to insert
+        """
+        for doc in docs:
+            await self.add(doc)
+
+    async def flush(self) -> None:
+        """
+        Send any buffered documents and wait for all batches to finish.
+
+        Raises:
+            BulkWriteFailed: If any documents could not be written
+        """
+        if self._buffer:
+            await self._send()
+        await self._drain()
+        self._finished = time.perf_counter()
+        if self._failed or self._errors:
+            failed, self._failed = self._failed, []
+            errors, self._errors = self._errors, []
+            message = f"{len(failed)} documents could not be written"
+            if errors:
+                message += f": {errors[0]}"
+            raise BulkWriteFailed(message, failed) from (errors[0] if errors else None)
+
+    async def _drain(self) -> None:
+        """Wait for in-flight batches."""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    async def _send(self) -> None:
+        """Hand the current buffer to a background write, waiting for a free slot."""
+        batch, self._buffer = self._buffer, []
+        await self._slots.acquire()
+        in_flight = BATCHES_IN_FLIGHT.labels()
+        in_flight.inc()
+        task = asyncio.create_task(self._write(batch))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        task.add_done_callback(lambda _: self._slots.release())
+        task.add_done_callback(lambda _: in_flight.dec())
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        """Insert one batch, recording non-retryable errors for flush()."""
+        try:
+            await self._write_batch(batch)
+        except Exception as e:
+            # Not retryable; report the whole batch, some of which may have
+            # been stored before the error
+            self._errors.append(e)
+            self._fail(batch)
+
+    def _fail(self, docs: List[Dict[str, Any]]) -> None:
+        """Record documents that will not be written, for flush() and stats()."""
+        self._failed.extend(docs)
+        self.docs_failed += len(docs)
+
+    async def _report(self, written: int) -> None:
+        """Pass a written count to on_batch; its errors are not write failures."""
+        try:
+            await self.on_batch(written)
+        except Exception:
+            logger.exception("on_batch callback failed after %d documents were written", written)
+
+    async def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        """Insert one batch, retrying only the documents that failed."""
+        remaining = batch
+        attempt = 0
+        while remaining:
+            try:
+                await self.collection.insert_many(remaining, ordered=False)
+                written, remaining = len(remaining), []
+            except BulkWriteError as e:
+                retry_indexes, permanent = set(), []
+                for err in e.details.get("writeErrors", []):
+                    if err.get("code") in TRANSIENT_WRITE_ERROR_CODES:
+                        retry_indexes.add(err["index"])
+                    elif err.get("code") != DUPLICATE_KEY_ERROR:
+                        permanent.append(err)
+                if permanent:
+                    # Without the offending documents ("op"), which flush() returns
+                    self._errors.append(BulkWriteError({"writeErrors": [
+                        {key: err.get(key) for key in ("index", "code", "errmsg")} for err in permanent
+                    ]}))
+                    self._fail([remaining[err["index"]] for err in permanent])
+                written = len(remaining) - len(retry_indexes) - len(permanent)
+                remaining = [doc for i, doc in enumerate(remaining) if i in retry_indexes]
+            except TRANSIENT_ERRORS:
+                written = 0
+
+            self.docs_written += written
+            if written and self.on_batch:
+                await self._report(written)
+            if not remaining:
+                break
+
+            attempt += 1
+            if attempt > self.max_retries:
+                self._fail(remaining)
+                break
+            self.retries += 1
+            await asyncio.sleep(min(0.1 * 2 ** attempt, 5.0))
+        self.batches_written += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get write throughput statistics.
+
+        Returns:
+            Dict with documents and batches written, retries, documents
+            that failed, elapsed seconds and documents per second
+        """
+        elapsed = 0.0
+        if self._started is not None:
+            elapsed = (self._finished or time.perf_counter()) - self._started
+        return {
+            "docs_written": self.docs_written,
+            "batches": self.batches_written,
+            "retries": self.retries,
+            "failed": self.docs_failed,
+            "seconds": elapsed,
+            "docs_per_sec": self.docs_written / elapsed if elapsed > 0 else float(self.docs_written),
+        }
@@ -1,10 +1,35 @@
 """
 MongoDB database connection and utilities using Motor (async driver).
+
+Two clients are kept per process. The main client serves writes and
+reads that must see them. The analytics client has its own, smaller
+connection pool and prefers secondaries; export streams and reporting
+queries use it, so a long export cannot take the connections a
+harmonization burst needs (MONGODB_ANALYTICS_POOL_SIZE=0 shares the main
+client instead).
+
+Both clients report command latencies and connection pool state to the
+metrics registry (see app.db.monitoring).
 """
+from contextlib import nullcontext
+from functools import lru_cache
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from typing import Optional
+from typing import Any, ContextManager, Dict, Optional, Tuple
+import importlib.util
+import logging
+
+import pymongo
+from pymongo.errors import PyMongoError
 
 from app.core.config import settings
+from app.core.metrics import REGISTRY
+from app.db.monitoring import CommandMetrics, PoolMetrics
+
+
+# Python package each wire compressor needs (zlib is in the standard library)
+COMPRESSOR_PACKAGES = {"zstd": "zstandard", "snappy": "snappy", "zlib": None}
+
+logger = logging.getLogger(__name__)
 
 
 class Database:
@@ -13,19 +38,95 @@ class Database:
     """
     client: Optional[AsyncIOMotorClient] = None
     db: Optional[AsyncIOMotorDatabase] = None
+    analytics_client: Optional[AsyncIOMotorClient] = None
+    analytics_db: Optional[AsyncIOMotorDatabase] = None
+    pools: Dict[str, PoolMetrics] = {}
 
 
 db = Database()
 
 
+@lru_cache(maxsize=1)
+def _compressors() -> Tuple[str, ...]:
+    """MONGODB_COMPRESSORS without the ones whose package is not installed."""
+    available = []
+    for name in (c.strip() for c in settings.MONGODB_COMPRESSORS.split(",")):
+        if not name:
+            continue
+        if name not in COMPRESSOR_PACKAGES:
+            raise ValueError(f"Unknown MongoDB compressor '{name}'; expected one of {', '.join(COMPRESSOR_PACKAGES)}")
+        package = COMPRESSOR_PACKAGES[name]
+        if package and importlib.util.find_spec(package) is None:
+            logger.warning("MongoDB compressor '%s' skipped: the '%s' package is not installed", name, package)
+            continue
+        available.append(name)
+    return tuple(available)
+
+
+def client_options(analytics: bool = False) -> Dict[str, Any]:
+    """
+    Keyword arguments for AsyncIOMotorClient from the settings.
+
+    Args:
+        analytics: Options for the analytics client instead of the main one
+
+    Returns:
+        Dict of pymongo client options
+    """
+    options: Dict[str, Any] = {
+        "maxPoolSize": settings.MONGODB_ANALYTICS_POOL_SIZE if analytics else settings.MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": 0 if analytics else settings.MONGODB_MIN_POOL_SIZE,
+        "maxConnecting": settings.MONGODB_MAX_CONNECTING,
+        "connectTimeoutMS": settings.MONGODB_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "appname": f"{settings.APP_NAME} ({'analytics' if analytics else 'main'})",
+    }
+    if settings.MONGODB_SOCKET_TIMEOUT_MS:
+        options["socketTimeoutMS"] = settings.MONGODB_SOCKET_TIMEOUT_MS
+    if settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS
+    compressors = _compressors()
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    if analytics:
+        options["readPreference"] = settings.MONGODB_ANALYTICS_READ_PREFERENCE
+        if settings.MONGODB_ANALYTICS_MAX_STALENESS_SECONDS:
+            options["maxStalenessSeconds"] = settings.MONGODB_ANALYTICS_MAX_STALENESS_SECONDS
+    return options
+
+
+def _create_client(name: str, options: Dict[str, Any]) -> AsyncIOMotorClient:
+    metrics = PoolMetrics(name, options["maxPoolSize"])
+    db.pools[name] = metrics
+    return AsyncIOMotorClient(settings.MONGODB_URL, event_listeners=[metrics, CommandMetrics(name)], **options)
+
+
 async def connect_to_mongo() -> None:
     """
     Connect to MongoDB on application startup.
+
+    Raises:
+        RuntimeError: If the server cannot be reached within
+            MONGODB_SERVER_SELECTION_TIMEOUT_MS, so the process fails at
+            startup rather than on its first request
     """
-    print(f"Connecting to MongoDB at {settings.MONGODB_URL}...")
-    db.client = AsyncIOMotorClient(settings.MONGODB_URL)
+    logger.info("Connecting to MongoDB at %s...", settings.MONGODB_URL)
+    db.pools = {}
+    db.client = _create_client("main", client_options())
     db.db = db.client[settings.MONGODB_DB_NAME]
-    print(f"Connected to MongoDB database: {settings.MONGODB_DB_NAME}")
+    if settings.MONGODB_ANALYTICS_POOL_SIZE > 0:
+        db.analytics_client = _create_client("analytics", client_options(analytics=True))
+        db.analytics_db = db.analytics_client[settings.MONGODB_DB_NAME]
+    else:
+        db.analytics_client = None
+        db.analytics_db = None
+
+    try:
+        await db.client.admin.command("ping")
+    except PyMongoError as e:
+        await close_mongo_connection()
+        raise RuntimeError(f"MongoDB at {settings.MONGODB_URL} is not reachable: {e}") from e
+    logger.info("Connected to MongoDB database: %s", settings.MONGODB_DB_NAME)
 
 
 async def close_mongo_connection() -> None:
@@ -33,29 +134,124 @@ async def close_mongo_connection() -> None:
     Close MongoDB connection on application shutdown.
     """
     if db.client:
-        print("Closing MongoDB connection...")
+        logger.info("Closing MongoDB connection...")
         db.client.close()
-        print("MongoDB connection closed")
+        if db.analytics_client:
+            db.analytics_client.close()
+        logger.info("MongoDB connection closed")
 
 
-def get_database() -> AsyncIOMotorDatabase:
+def get_database(analytics: bool = False) -> AsyncIOMotorDatabase:
     """
     Get the database instance.
-    
+
+    Args:
+        analytics: Get the analytics connection (own pool, secondary reads)
+            for export and reporting reads that may lag the primary slightly
+
     Returns:
         AsyncIOMotorDatabase: The MongoDB database instance
     """
     if db.db is None:
         raise RuntimeError("Database not initialized. Call connect_to_mongo() first.")
+    if analytics and db.analytics_db is not None:
+        return db.analytics_db
     return db.db
 
 
+def operation_timeout(collection: str, operation: Optional[str] = None) -> ContextManager:
+    """
+    Time limit for the MongoDB operations run inside the block.
+
+    Looks up "collection.operation", then "collection", then "default" in
+    MONGODB_OPERATION_TIMEOUTS_MS. Operations that exceed the limit raise
+    pymongo.errors.ExecutionTimeout (or another PyMongoError whose
+    ``timeout`` is true).
+
+    Usage:
+        with operation_timeout(COLLECTIONS["canonical_entities"], "count_documents"):
+            total = await collection.count_documents(query)
+
+    Args:
+        collection: Collection name
+        operation: Operation name, e.g. "count_documents"
+
+    Returns:
+        A context manager; a no-op when no limit is configured
+    """
+    timeouts = settings.MONGODB_OPERATION_TIMEOUTS_MS
+    ms = timeouts.get(f"{collection}.{operation}") if operation else None
+    if ms is None:
+        ms = timeouts.get(collection, timeouts.get("default"))
+    if not ms:
+        return nullcontext()
+    return pymongo.timeout(ms / 1000)
+
+
+def pool_metrics() -> Dict[str, Dict[str, Any]]:
+    """
+    Connection pool state of each client.
+
+    Returns:
+        Dict mapping "main" (and "analytics") to PoolMetrics snapshots
+    """
+    return {name: metrics.snapshot() for name, metrics in db.pools.items()}
+
+
+# Pool state is read from the PoolMetrics listeners when metrics are rendered
+REGISTRY.gauge(
+    "mdo_mongo_pool_connections",
+    "Connections of each MongoDB client by state (open, checked_out)",
+    ("client", "state"),
+    collect=lambda: {
+        (name, state): getattr(metrics, state)
+        for name, metrics in db.pools.items() for state in ("open", "checked_out")
+    },
+)
+REGISTRY.gauge(
+    "mdo_mongo_pool_max_size",
+    "maxPoolSize of each MongoDB client",
+    ("client",),
+    collect=lambda: {(name,): metrics.max_pool_size for name, metrics in db.pools.items()},
+)
+REGISTRY.gauge(
+    "mdo_mongo_pool_wait_queue",
+    "Operations waiting for a connection from each MongoDB client's pool",
+    ("client",),
+    collect=lambda: {(name,): metrics.waiting for name, metrics in db.pools.items()},
+)
+REGISTRY.counter(
+    "mdo_mongo_pool_checkouts_total",
+    "Connections checked out of each MongoDB client's pool",
+    ("client",),
+    collect=lambda: {(name,): metrics.checkouts for name, metrics in db.pools.items()},
+)
+REGISTRY.counter(
+    "mdo_mongo_pool_checkout_wait_seconds_total",
+    "Time spent waiting for connections from each MongoDB client's pool",
+    ("client",),
+    collect=lambda: {(name,): metrics.wait_seconds for name, metrics in db.pools.items()},
+)
+REGISTRY.counter(
+    "mdo_mongo_pool_checkout_failures_total",
+    "Failed connection checkouts of each MongoDB client, by reason",
+    ("client", "reason"),
+    collect=lambda: {
+        (name, str(reason)): count
+        for name, metrics in db.pools.items() for reason, count in dict(metrics.failures).items()
+    },
+)
+
+
 # Collection names
 COLLECTIONS = {
     "runs": "runs",
     "uploaded_files": "uploaded_files",
+    "upload_sessions": "upload_sessions",
     "mappings": "mappings",
     "validation_results": "validation_results",
+    "validation_errors": "validation_errors",
     "audit_logs": "audit_logs",
     "canonical_entities": "canonical_entities",
-}
\ No newline at end of file
+    "jobs": "jobs",
+}
@@ -0,0 +1,140 @@
+"""
+Index declarations and startup index management for MongoDB collections.
+"""
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.core.hierarchy import ENTITY_KEYS
+from app.db.database import get_database, COLLECTIONS
+
+
+# Indexes every collection is expected to have, keyed by collection name.
+# Names are explicit so they can be compared against what exists.
+INDEXES: Dict[str, List[IndexModel]] = {
+    COLLECTIONS["runs"]: [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created"),
+    ],
+    COLLECTIONS["uploaded_files"]: [
+        IndexModel([("run_id", ASCENDING)], name="run"),
+    ],
+    COLLECTIONS["mappings"]: [
+        # One saved mapping per header and template, found on every upload
+        IndexModel(
+            [("header_fingerprint", ASCENDING), ("schema_template_id", ASCENDING)],
+            name="header_template",
+            unique=True,
+            partialFilterExpression={"header_fingerprint": {"$exists": True}},
+        ),
+    ],
+    COLLECTIONS["upload_sessions"]: [
+        IndexModel([("run_id", ASCENDING), ("status", ASCENDING)], name="run_status"),
+    ],
+    COLLECTIONS["validation_results"]: [
+        IndexModel([("run_id", ASCENDING), ("_id", DESCENDING)], name="run_latest"),
+    ],
+    COLLECTIONS["validation_errors"]: [
+        # Pages of a result's errors, unfiltered or filtered by severity,
+        # rule, column or file (see validation_store.ERROR_FILTERS)
+        IndexModel([("validation_result_id", ASCENDING), ("_id", ASCENDING)], name="result_order"),
+        IndexModel(
+            [("validation_result_id", ASCENDING), ("severity", ASCENDING), ("_id", ASCENDING)],
+            name="result_severity",
+        ),
+        IndexModel(
+            [("validation_result_id", ASCENDING), ("rule_id", ASCENDING), ("_id", ASCENDING)],
+            name="result_rule",
+        ),
+        IndexModel(
+            [("validation_result_id", ASCENDING), ("column_name", ASCENDING), ("_id", ASCENDING)],
+            name="result_column",
+        ),
+        IndexModel(
+            [("validation_result_id", ASCENDING), ("file_id", ASCENDING), ("_id", ASCENDING)],
+            name="result_file",
+        ),
+        IndexModel([("run_id", ASCENDING), ("validation_result_id", ASCENDING)], name="run_result"),
+    ],
+    COLLECTIONS["audit_logs"]: [
+        IndexModel([("run_id", ASCENDING), ("timestamp", ASCENDING)], name="run_timestamp"),
+    ],
+    COLLECTIONS["canonical_entities"]: [
+        IndexModel([("run_id", ASCENDING), ("entity_type", ASCENDING)], name="run_entity_type"),
+        *[
+            IndexModel([("run_id", ASCENDING), (f"data.{key}", ASCENDING)], name=f"run_{key.lower()}")
+            for key in dict.fromkeys(ENTITY_KEYS.values())
+        ],
+    ],
+    COLLECTIONS["jobs"]: [
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created"),
+        IndexModel([("run_id", ASCENDING), ("created_at", DESCENDING)], name="run_created"),
+        # One active harmonize/validate job per run (see app.services.jobs);
+        # sparse, as the field is unset rather than nulled on other jobs
+        IndexModel([("exclusive_run_id", ASCENDING)], name="exclusive_run", unique=True, sparse=True),
+    ],
+}
+
+
+async def ensure_indexes() -> Dict[str, List[str]]:
+    """
+    Create any declared indexes that do not exist yet.
+
+    Safe to call on every startup: existing indexes are left alone and only
+    missing ones are built.
+
+    Returns:
+        Dict with the names of indexes that were ``created`` and those that
+        already ``existed``, as "collection.index"
+    """
+    db = get_database()
+    report: Dict[str, List[str]] = {"created": [], "existed": []}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        missing = [m for m in models if m.document["name"] not in existing]
+        for model in models:
+            if model.document["name"] in existing:
+                report["existed"].append(f"{collection_name}.{model.document['name']}")
+        if missing:
+            await collection.create_indexes(missing)
+            report["created"].extend(f"{collection_name}.{m.document['name']}" for m in missing)
+    return report
+
+
+async def index_report() -> Dict[str, Any]:
+    """
+    Compare declared indexes with what the database has and uses.
+
+    Usage counts come from the ``$indexStats`` aggregation stage and reset
+    when the server restarts, so a zero count right after a restart does not
+    mean the index is unneeded.
+
+    Returns:
+        Dict listing ``missing`` declared indexes, ``unused`` indexes with no
+        recorded accesses, ``undeclared`` indexes that exist but are not in
+        INDEXES, and per-index ``usage`` counts where available
+    """
+    db = get_database()
+    report: Dict[str, Any] = {"missing": [], "unused": [], "undeclared": [], "usage": {}}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        declared = {m.document["name"] for m in models}
+        existing = set(await collection.index_information()) - {"_id_"}
+
+        report["missing"].extend(f"{collection_name}.{name}" for name in sorted(declared - existing))
+        report["undeclared"].extend(f"{collection_name}.{name}" for name in sorted(existing - declared))
+
+        try:
+            stats = await collection.aggregate([{"$indexStats": {}}]).to_list(length=None)
+        except OperationFailure:
+            continue
+        for stat in stats:
+            name = stat["name"]
+            if name == "_id_":
+                continue
+            ops = int(stat.get("accesses", {}).get("ops", 0))
+            report["usage"][f"{collection_name}.{name}"] = ops
+            if ops == 0:
+                report["unused"].append(f"{collection_name}.{name}")
+    return report
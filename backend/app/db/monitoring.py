@@ -0,0 +1,151 @@
+"""
+Connection pool and command metrics for the MongoDB clients.
+
+A PoolMetrics listener is registered on each client (see
+app.db.database) and keeps running totals of the driver's connection pool
+events: connections open and checked out, requests waiting for a
+connection, checkout failures and how long checkouts waited. Snapshots are
+served by ``GET /health/mongo``.
+
+A CommandMetrics listener records the count and latency of every command
+the client sends, by command and collection, in COMMAND_SECONDS; both
+are exported by ``GET /metrics``.
+"""
+from typing import Any, Dict
+import threading
+import time
+
+from pymongo import monitoring
+
+from app.core.metrics import REGISTRY
+
+
+COMMAND_SECONDS = REGISTRY.histogram(
+    "mdo_mongo_command_duration_seconds",
+    "Latency of MongoDB commands by client, command and collection",
+    ("client", "command", "collection"),
+)
+COMMAND_FAILURES = REGISTRY.counter(
+    "mdo_mongo_command_failures_total",
+    "MongoDB commands that returned an error, by client, command and collection",
+    ("client", "command", "collection"),
+)
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool events for one client, across all its servers.
+
+    Events arrive on the driver's executor threads, so counters are updated
+    under a lock.
+    """
+
+    def __init__(self, name: str, max_pool_size: int):
+        self.name = name
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self._started = threading.local()
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.failures: Dict[str, int] = {}
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.cleared = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Current pool state and totals since the client was created.
+
+        Returns:
+            Dict of gauges (open, checked_out, waiting), counters and the
+            mean and maximum checkout wait in milliseconds
+        """
+        with self._lock:
+            return {
+                "max_pool_size": self.max_pool_size,
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.failures),
+                "mean_wait_ms": round(1000 * self.wait_seconds / self.checkouts, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait_seconds, 3),
+                "pool_cleared": self.cleared,
+            }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        self._started.at = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.failures[event.reason] = self.failures.get(event.reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        waited = time.perf_counter() - getattr(self._started, "at", time.perf_counter())
+        with self._lock:
+            self.waiting -= 1
+            self.checked_out += 1
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Records the latency of each command sent by one client.
+
+    The collection is only named in the started event, so it is kept by
+    request ID until the command finishes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[int, str] = {}
+
+    def started(self, event):
+        command = event.command_name
+        # getMore names the cursor ID first and the collection separately
+        target = event.command.get("collection" if command == "getMore" else command)
+        self._collections[event.request_id] = target if isinstance(target, str) else ""
+
+    def succeeded(self, event):
+        collection = self._collections.pop(event.request_id, "")
+        COMMAND_SECONDS.labels(self.name, event.command_name, collection).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop(event.request_id, "")
+        COMMAND_SECONDS.labels(self.name, event.command_name, collection).observe(event.duration_micros / 1e6)
+        COMMAND_FAILURES.labels(self.name, event.command_name, collection).inc()
@@ -1,13 +1,39 @@
 """
 Main FastAPI application for Multiomic Data Orchestrator (MDO).
 """
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import logging
 
-from app.core.config import settings
-from app.db.database import connect_to_mongo, close_mongo_connection
-from app.api.endpoints import runs, schemas
+from app.core.startup import startup_report
+
+with startup_report.phase("import.fastapi"):
+    from fastapi import FastAPI, HTTPException
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import Response
+
+with startup_report.phase("import.config"):
+    from app.core.config import configure_logging, settings
+    from app.core.metrics import CONTENT_TYPE, REGISTRY
+
+with startup_report.phase("import.db"):
+    from pymongo.errors import PyMongoError
+
+    from app.db.database import connect_to_mongo, close_mongo_connection, pool_metrics
+    from app.db.indexes import ensure_indexes, index_report
+
+with startup_report.phase("import.api"):
+    from app.api.middleware import RequestMetricsMiddleware
+    from app.api.responses import FastJSONResponse
+    from app.api.endpoints import jobs, runs, schemas
+
+with startup_report.phase("import.services"):
+    from app.schemas.registry import schema_registry
+    from app.services.container import services
+    from app.services.jobs import job_manager
+    from app.services.scheduler import shutdown_process_pool
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -16,9 +42,25 @@ async def lifespan(app: FastAPI):
     Lifespan context manager for startup and shutdown events.
     """
     # Startup
-    await connect_to_mongo()
+    with startup_report.phase("mongo.connect"):
+        await connect_to_mongo()
+    if settings.ENSURE_INDEXES_ON_STARTUP:
+        with startup_report.phase("mongo.indexes"):
+            indexes = await ensure_indexes()
+        logger.info("Indexes: %d created, %d already present", len(indexes["created"]), len(indexes["existed"]))
+    if settings.STARTUP_WARMUP in ("background", "blocking"):
+        await services.start(background=settings.STARTUP_WARMUP == "background")
+    await schema_registry.start_watching()
+    with startup_report.phase("jobs.start"):
+        await job_manager.start()
+    startup_report.mark_ready()
+    logger.info(startup_report.format())
     yield
     # Shutdown
+    await services.stop()
+    await schema_registry.stop_watching()
+    await job_manager.stop()
+    shutdown_process_pool()
     await close_mongo_connection()
 
 
@@ -28,6 +70,7 @@ app = FastAPI(
     description="Backend API for harmonizing and validating multiomic data",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 # Configure CORS
@@ -38,10 +81,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.METRICS_ENABLED:
+    # Outermost, so the latency includes the other middleware
+    app.add_middleware(RequestMetricsMiddleware)
 
 # Include routers
 app.include_router(runs.router, prefix="/api/v1/runs", tags=["runs"])
 app.include_router(schemas.router, prefix="/api/v1/schemas", tags=["schemas"])
+app.include_router(jobs.router, prefix="/api/v1/jobs", tags=["jobs"])
 
 
 @app.get("/")
@@ -61,4 +108,44 @@ async def health_check():
     """
     Health check endpoint.
     """
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+
+@app.get("/health/indexes")
+async def index_health():
+    """
+    Report declared indexes that are missing, unused or undeclared.
+    """
+    return await index_report()
+
+
+@app.get("/health/mongo")
+async def mongo_health():
+    """
+    Report connection pool usage of the MongoDB clients.
+    """
+    return {"pools": pool_metrics()}
+
+
+@app.get("/health/startup")
+async def startup_health():
+    """
+    Report how long each phase of startup took.
+    """
+    return startup_report.summary()
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Serve request, pipeline, MongoDB and queue metrics in the Prometheus
+    text exposition format.
+    """
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    try:
+        await job_manager.queued_counts()
+    except PyMongoError as e:
+        # Serve the rest; mdo_jobs_queued keeps its last value
+        logger.warning("Counting queued jobs failed: %s", e)
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
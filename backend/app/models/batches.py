@@ -0,0 +1,165 @@
+"""
+Compact column-wise containers for bulk data.
+
+The Pydantic models in run.py validate every field of every instance,
+which is fine for requests and responses but dominates the cost when a
+validation pass produces millions of errors. Errors therefore travel
+through the rules engine and the error writer as an ErrorBatch: one
+list per field. Strings that are the same for every error of a rule are
+shared, not copied. Pydantic models are only built for what is returned
+through the API (samples and pages of errors).
+
+Entities already travel as ColumnTable / ColumnBatch arrays (see
+app.services.columnar and app.services.rules) and are written as plain
+documents; CanonicalEntity only describes the stored shape.
+"""
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Sequence
+
+from app.models.run import ValidationError
+
+if TYPE_CHECKING:
+    # Imported in for_rule so that reading stored errors does not need NumPy
+    import numpy as np
+
+
+ERROR_FIELDS = ("file_id", "row_index", "column_name", "severity", "rule_id", "description")
+
+
+class ErrorBatch:
+    """
+    Validation errors stored as parallel lists, one per field.
+
+    Usage:
+        errors = ErrorBatch.for_rule(rule.id, rule.severity, rule.column, file_ids, rows, messages)
+        docs = errors.documents(run_id=run_oid)
+    """
+
+    __slots__ = ERROR_FIELDS
+
+    def __init__(
+        self,
+        file_id: List[str],
+        row_index: List[int],
+        column_name: List[str],
+        severity: List[str],
+        rule_id: List[str],
+        description: List[str]
+    ):
+        self.file_id = file_id
+        self.row_index = row_index
+        self.column_name = column_name
+        self.severity = severity
+        self.rule_id = rule_id
+        self.description = description
+
+    @classmethod
+    def empty(cls) -> "ErrorBatch":
+        """A batch without errors."""
+        return cls([], [], [], [], [], [])
+
+    @classmethod
+    def for_rule(
+        cls,
+        rule_id: str,
+        severity: str,
+        column_name: str,
+        file_ids: "np.ndarray",
+        row_index: "np.ndarray",
+        descriptions: List[str]
+    ) -> "ErrorBatch":
+        """
+        Errors of one rule, from the failing rows' locations.
+
+        Args:
+            rule_id: The rule ID
+            severity: The rule's severity
+            column_name: The rule's column
+            file_ids: Source file of each failing row
+            row_index: Source row of each failing row
+            descriptions: Message for each failing row
+
+        Returns:
+            ErrorBatch: The errors
+        """
+        import numpy as np
+
+        n = len(descriptions)
+        return cls(
+            np.asarray(file_ids).astype(str).tolist(),
+            np.asarray(row_index, dtype=np.int64).tolist(),
+            [column_name] * n,
+            [severity] * n,
+            [rule_id] * n,
+            descriptions,
+        )
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[Dict[str, Any]]) -> "ErrorBatch":
+        """
+        Errors from stored validation_errors documents.
+
+        Args:
+            docs: Documents with the ERROR_FIELDS keys
+
+        Returns:
+            ErrorBatch: The errors
+        """
+        docs = list(docs)
+        return cls(*([doc[name] for doc in docs] for name in ERROR_FIELDS))
+
+    def extend(self, other: "ErrorBatch") -> None:
+        """Append another batch's errors to this one."""
+        for name in ERROR_FIELDS:
+            getattr(self, name).extend(getattr(other, name))
+
+    def take(self, positions: Sequence[int]) -> "ErrorBatch":
+        """
+        Select errors by position.
+
+        Args:
+            positions: Positions to keep, in output order
+
+        Returns:
+            ErrorBatch: The selected errors
+        """
+        return ErrorBatch(*([getattr(self, name)[p] for p in positions] for name in ERROR_FIELDS))
+
+    def __len__(self) -> int:
+        return len(self.rule_id)
+
+    def documents(self, **fields: Any) -> List[Dict[str, Any]]:
+        """
+        The errors as validation_errors documents, ready for insert_many.
+
+        Args:
+            **fields: Values shared by every document (e.g. run_id)
+
+        Returns:
+            List of documents
+        """
+        return [
+            {
+                **fields,
+                "file_id": file_id,
+                "row_index": row_index,
+                "column_name": column_name,
+                "severity": severity,
+                "rule_id": rule_id,
+                "description": description,
+            }
+            for file_id, row_index, column_name, severity, rule_id, description in zip(
+                self.file_id, self.row_index, self.column_name, self.severity, self.rule_id, self.description
+            )
+        ]
+
+    def model(self, position: int) -> ValidationError:
+        """
+        One error as a Pydantic model, for API responses.
+
+        Args:
+            position: Position of the error
+
+        Returns:
+            ValidationError: The error
+        """
+        return ValidationError.model_construct(**{name: getattr(self, name)[position] for name in ERROR_FIELDS})
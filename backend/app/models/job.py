@@ -0,0 +1,33 @@
+"""
+Pydantic models for background jobs.
+"""
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
+from datetime import datetime
+
+
+class JobProgress(BaseModel):
+    """
+    Model for job progress.
+    """
+    stage: Optional[str] = Field(None, description="Current pipeline stage")
+    rows_processed: int = Field(0, description="Rows processed in the current stage")
+    rows_total: Optional[int] = Field(None, description="Rows expected in the current stage, if known")
+    percent: Optional[float] = Field(None, description="Completion of the current stage (0-100)")
+    eta_seconds: Optional[float] = Field(None, description="Estimated seconds left in the current stage")
+
+
+class JobResponse(BaseModel):
+    """
+    Model for job status response data.
+    """
+    job_id: str = Field(..., description="Job ID")
+    run_id: str = Field(..., description="Run the job operates on")
+    kind: str = Field(..., description="Job kind: harmonize, validate or export")
+    status: str = Field(..., description="queued, running, completed or failed")
+    progress: JobProgress = Field(default_factory=JobProgress, description="Progress of the job")
+    created_at: datetime = Field(..., description="Enqueue timestamp")
+    started_at: Optional[datetime] = Field(None, description="Start timestamp")
+    finished_at: Optional[datetime] = Field(None, description="Completion timestamp")
+    error: Optional[str] = Field(None, description="Error message if the job failed")
+    result: Optional[Dict[str, Any]] = Field(None, description="Job result once completed")
@@ -2,7 +2,8 @@
 Pydantic models for Run entities.
 """
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic_core import core_schema
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 from bson import ObjectId
 
@@ -12,8 +13,11 @@ class PyObjectId(ObjectId):
     Custom type for MongoDB ObjectId that works with Pydantic.
     """
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(str, when_used="json"),
+        )
 
     @classmethod
     def validate(cls, v):
@@ -22,8 +26,8 @@ class PyObjectId(ObjectId):
         return ObjectId(v)
 
     @classmethod
-    def __get_pydantic_json_schema__(cls, field_schema):
-        field_schema.update(type="string")
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "string"}
 
 
 class RunCreate(BaseModel):
@@ -44,6 +48,7 @@ class RunResponse(BaseModel):
     files: List[str] = Field(default_factory=list, description="List of file IDs")
     mapping_id: Optional[str] = Field(None, description="Mapping ID if set")
     validation_result_id: Optional[str] = Field(None, description="Validation result ID if available")
+    entity_revision: int = Field(0, description="Incremented each time the run is harmonized")
 
     class Config:
         populate_by_name = True
@@ -61,6 +66,7 @@ class Run(BaseModel):
     files: List[PyObjectId] = Field(default_factory=list)
     mapping_id: Optional[PyObjectId] = None
     validation_result_id: Optional[PyObjectId] = None
+    entity_revision: int = 0
 
     class Config:
         populate_by_name = True
@@ -76,6 +82,48 @@ class FileUploadResponse(BaseModel):
     filename: str = Field(..., description="Original filename")
     schema_template_id: str = Field(..., description="Schema template used")
     created_at: datetime = Field(..., description="Upload timestamp")
+    size_bytes: int = Field(0, description="File size in bytes")
+    sha256: Optional[str] = Field(None, description="SHA-256 digest of the file contents")
+    parts_sha256: Optional[str] = Field(
+        None, description="Composite digest of part digests for multi-part uploads ('<hex>-<parts>')"
+    )
+    row_count: int = Field(0, description="Number of data rows, excluding the header")
+    column_count: int = Field(0, description="Number of columns in the header")
+    columns: List[str] = Field(default_factory=list, description="Header column names")
+    mapping_id: Optional[str] = Field(None, description="Saved mapping applied to the file, if its header matched one")
+
+
+class UploadSessionCreate(BaseModel):
+    """
+    Model for opening a resumable, multi-part upload session.
+    """
+    filename: str = Field(..., description="Original filename")
+    schema_template_id: str = Field(..., description="Schema template to use for this file")
+    total_parts: int = Field(..., ge=1, le=10000, description="Number of parts that will be uploaded")
+
+
+class UploadSessionResponse(BaseModel):
+    """
+    Model for upload session status.
+    """
+    session_id: str = Field(..., description="Upload session ID")
+    filename: str = Field(..., description="Original filename")
+    schema_template_id: str = Field(..., description="Schema template used")
+    status: str = Field(..., description="Session status: open, completing, completed or aborted")
+    total_parts: int = Field(..., description="Number of parts expected")
+    received_parts: List[int] = Field(default_factory=list, description="Part numbers received")
+    missing_parts: List[int] = Field(default_factory=list, description="Part numbers still missing")
+    file_id: Optional[str] = Field(None, description="Uploaded file ID once completed")
+    created_at: datetime = Field(..., description="Session creation timestamp")
+
+
+class UploadPartResponse(BaseModel):
+    """
+    Model for a received upload part.
+    """
+    part_number: int = Field(..., description="1-based part number")
+    size_bytes: int = Field(..., description="Part size in bytes")
+    sha256: str = Field(..., description="SHA-256 digest of the part")
 
 
 class UploadedFile(BaseModel):
@@ -88,6 +136,16 @@ class UploadedFile(BaseModel):
     s3_path: str  # or local path for MVP
     schema_template_id: str
     created_at: datetime
+    size_bytes: int = 0
+    sha256: Optional[str] = None
+    parts: List[str] = Field(default_factory=list)  # ordered part paths for multi-part uploads
+    parts_sha256: Optional[str] = None
+    delimiter: str = ","
+    row_count: int = 0  # data rows, excluding the header
+    column_count: int = 0
+    columns: List[str] = Field(default_factory=list)
+    header_fingerprint: Optional[str] = None  # see app.services.mappings.header_fingerprint
+    mapping_id: Optional[PyObjectId] = None  # mapping applied to this file
 
     class Config:
         populate_by_name = True
@@ -104,7 +162,10 @@ class Mapping(BaseModel):
     name: str
     schema_template_id: str
     mapping: dict  # {"canonical_field": "csv_column"}
+    header_fingerprint: Optional[str] = None  # header the mapping was saved for
+    columns: List[str] = Field(default_factory=list)
     created_at: datetime
+    updated_at: Optional[datetime] = None
 
     class Config:
         populate_by_name = True
@@ -112,6 +173,37 @@ class Mapping(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+class MappingCreate(BaseModel):
+    """
+    Model for setting a run's column mapping.
+    """
+    name: str = Field(..., description="Name of the mapping in the library")
+    schema_template_id: str = Field(..., description="Schema template the mapping targets")
+    mapping: Dict[str, str] = Field(..., description='Column mapping ({"canonical_field": "csv_column"})')
+    file_id: Optional[str] = Field(None, description="Only apply to this file (default: every file using the template)")
+
+
+class MappingResponse(BaseModel):
+    """
+    Model for a saved mapping and the run files it applies to.
+    """
+    id: str = Field(..., description="Mapping ID")
+    name: str = Field(..., description="Mapping name")
+    schema_template_id: str = Field(..., description="Schema template the mapping targets")
+    mapping: Dict[str, str] = Field(..., description='Column mapping ({"canonical_field": "csv_column"})')
+    header_fingerprint: Optional[str] = Field(None, description="Fingerprint of the header the mapping is for")
+    columns: List[str] = Field(default_factory=list, description="Header the mapping is for")
+    file_ids: List[str] = Field(default_factory=list, description="Files of the run using the mapping")
+    updated_at: Optional[datetime] = Field(None, description="Last update timestamp")
+
+
+class RunMappingResponse(BaseModel):
+    """
+    Model for the mappings applied to a run.
+    """
+    mappings: List[MappingResponse] = Field(default_factory=list, description="Mappings in use by the run")
+
+
 class ValidationError(BaseModel):
     """
     Model for a single validation error.
@@ -124,9 +216,23 @@ class ValidationError(BaseModel):
     description: str
 
 
+class ValidationRuleCount(BaseModel):
+    """
+    Model for the number of errors of one rule, severity and column.
+    """
+    rule_id: str
+    severity: str
+    column_name: str
+    count: int
+
+
 class ValidationResult(BaseModel):
     """
     Internal model for validation result document.
+
+    Errors themselves are stored in the validation_errors collection (see
+    app.services.validation_store); the result keeps counts and a capped
+    sample of errors per rule.
     """
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
     run_id: PyObjectId
@@ -134,7 +240,15 @@ class ValidationResult(BaseModel):
     blocker_count: int = 0
     warning_count: int = 0
     info_count: int = 0
-    errors: List[ValidationError] = Field(default_factory=list)
+    error_count: int = 0
+    rule_counts: List[ValidationRuleCount] = Field(default_factory=list)
+    samples: Dict[str, List[ValidationError]] = Field(default_factory=dict)  # first errors per rule ID
+    mode: str = "full"  # 'full', 'fail-fast' or 'sample'
+    complete: bool = True  # False if not every entity was checked (sample, or fail-fast that stopped)
+    estimates: Optional[Dict[str, Dict[str, Any]]] = None  # Sample error-rate estimates per entity type
+    entity_revision: int = 0  # Run entity revision that was validated
+    ruleset_fingerprint: Optional[str] = None  # Hash of the compiled rules' definitions
+    revalidated: Optional[Dict[str, int]] = None  # Entities re-checked per type when merged from a previous result
 
     class Config:
         populate_by_name = True
@@ -142,6 +256,49 @@ class ValidationResult(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+class ValidationResultResponse(BaseModel):
+    """
+    Model for validation result summary response.
+    """
+    id: str = Field(..., description="Validation result ID")
+    run_id: str = Field(..., description="Run ID")
+    status: str = Field(..., description="passed or failed")
+    blocker_count: int = Field(0, description="Number of Blocker errors")
+    warning_count: int = Field(0, description="Number of Warning errors")
+    info_count: int = Field(0, description="Number of Info errors")
+    error_count: int = Field(0, description="Total number of errors")
+    rule_counts: List[ValidationRuleCount] = Field(
+        default_factory=list, description="Error counts per rule, severity and column"
+    )
+    samples: Dict[str, List[ValidationError]] = Field(
+        default_factory=dict, description="First errors of each rule, up to VALIDATION_SAMPLE_SIZE"
+    )
+    entity_revision: int = Field(0, description="Run entity revision that was validated")
+    revalidated: Optional[Dict[str, int]] = Field(
+        None, description="Entities re-checked per type if the result was merged from a previous one"
+    )
+    mode: str = Field("full", description="Validation mode: full, fail-fast or sample")
+    complete: bool = Field(True, description="Whether every entity was checked")
+    estimates: Optional[Dict[str, Dict[str, Any]]] = Field(
+        None, description="Sample mode: error-rate estimates and confidence intervals per entity type"
+    )
+
+
+class ValidationErrorResponse(ValidationError):
+    """
+    Model for a stored validation error.
+    """
+    id: str = Field(..., description="Error ID")
+
+
+class ValidationErrorPage(BaseModel):
+    """
+    Model for one page of validation errors.
+    """
+    errors: List[ValidationErrorResponse] = Field(default_factory=list, description="Errors on this page")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page; null on the last page")
+
+
 class CanonicalEntity(BaseModel):
     """
     Internal model for canonical entity document.
@@ -149,7 +306,12 @@ class CanonicalEntity(BaseModel):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
     run_id: PyObjectId
     entity_type: str  # 'Block', 'Slide', 'ROI', 'Library', 'Run'
+    file_id: Optional[PyObjectId] = None  # Source uploaded file
+    row_index: Optional[int] = None  # 0-based data row in the source file
+    parent_id: Optional[PyObjectId] = None  # Parent entity in the hierarchy
+    content_hash: Optional[str] = None  # Hash of data and invalid, for incremental validation
     data: dict  # The harmonized data for the entity
+    invalid: Optional[dict] = None  # Source text of values that failed type coercion
 
     class Config:
         populate_by_name = True
@@ -0,0 +1,53 @@
+"""
+Pydantic models for schema detection.
+
+Field names follow the frontend's SchemaCandidate and FieldMapping types
+(camelCase aliases).
+"""
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class SchemaCandidate(BaseModel):
+    """
+    Model for a template suggested for a file.
+    """
+    id: str = Field(..., description="Schema template ID")
+    name: str = Field(..., description="Template name")
+    version: str = Field(..., description="Template version")
+    entity_type: str = Field(..., alias="entityType", description="Entity type the template describes")
+    confidence: float = Field(..., description="How well the file matches the template (0-1)")
+    rationale: str = Field(..., description="Why the template was suggested")
+
+    class Config:
+        populate_by_name = True
+
+
+class FieldMapping(BaseModel):
+    """
+    Model for a suggested source column for a template field.
+    """
+    source_field: str = Field(..., alias="sourceField", description="File column, empty if none matched")
+    target_field: str = Field(..., alias="targetField", description="Template field")
+    confidence: float = Field(..., description="Confidence of the suggestion (0-1)")
+    required: bool = Field(..., description="Whether the template requires the field")
+    mapped: bool = Field(..., description="Whether a column was matched to the field")
+
+    class Config:
+        populate_by_name = True
+
+
+class SchemaDetectionResponse(BaseModel):
+    """
+    Model for schema detection results.
+    """
+    candidates: List[SchemaCandidate] = Field(default_factory=list, description="Templates, best match first")
+    schema_template_id: Optional[str] = Field(
+        None, alias="schemaTemplateId", description="Template the mappings are for"
+    )
+    mappings: List[FieldMapping] = Field(default_factory=list, description="Suggested mapping per template field")
+    columns: List[str] = Field(default_factory=list, description="Header columns of the file")
+    sampled_rows: int = Field(0, alias="sampledRows", description="Rows read from the head of the file")
+
+    class Config:
+        populate_by_name = True
@@ -0,0 +1,95 @@
+"""
+Helpers for locating and loading schema template and ruleset JSON files.
+
+Templates are served from the in-memory schema registry; see registry.py.
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+
+from app.schemas.registry import schema_registry
+
+
+TEMPLATES_DIR = Path(__file__).parent / "templates"
+RULES_DIR = Path(__file__).parent / "rules"
+
+
+def template_path(schema_id: str) -> Path:
+    """
+    Get the path of a schema template file.
+    
+    Args:
+        schema_id: The schema template ID
+        
+    Returns:
+        Path: Location of the template JSON file
+    """
+    return TEMPLATES_DIR / f"{Path(schema_id).name}.json"
+
+
+def template_exists(schema_id: str) -> bool:
+    """
+    Check whether a schema template is available.
+    
+    Args:
+        schema_id: The schema template ID
+        
+    Returns:
+        bool: True if a valid template with that ID is loaded
+    """
+    return schema_registry.get(schema_id) is not None
+
+
+def load_template(schema_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Load a schema template by ID.
+    
+    Args:
+        schema_id: The schema template ID
+        
+    Returns:
+        The parsed template (shared, do not modify), or None if it does not
+        exist
+    """
+    template = schema_registry.get(schema_id)
+    return template.data if template else None
+
+
+def list_templates() -> List[Dict[str, Any]]:
+    """
+    Load every schema template.
+    
+    Returns:
+        List of parsed templates (shared, do not modify), ordered by ID
+    """
+    return [template.data for template in schema_registry.list()]
+
+
+def ruleset_path(ruleset_id: str) -> Path:
+    """
+    Get the path of a validation ruleset file.
+    
+    Args:
+        ruleset_id: The ruleset ID
+        
+    Returns:
+        Path: Location of the ruleset JSON file
+    """
+    return RULES_DIR / f"{Path(ruleset_id).name}.json"
+
+
+def load_ruleset(ruleset_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Load a validation ruleset by ID.
+    
+    Args:
+        ruleset_id: The ruleset ID
+        
+    Returns:
+        The parsed ruleset, or None if it does not exist
+    """
+    path = ruleset_path(ruleset_id)
+    if not path.is_file():
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
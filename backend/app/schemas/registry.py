@@ -0,0 +1,277 @@
+"""
+In-memory registry of schema templates.
+
+Templates are read, validated and indexed once, then served from memory:
+the schema endpoints, upload checks and harmonization all look templates up
+here instead of reading JSON files per request. The registry notices edits
+to the templates directory by comparing file mtimes and sizes, either when
+refresh() is called or from the watcher task started with the application,
+and swaps in a new snapshot so readers never see a half-loaded state.
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+from app.core.config import settings
+from app.core.hierarchy import ENTITY_TYPES
+
+logger = logging.getLogger(__name__)
+
+
+FIELD_TYPES = ("string", "integer", "float", "number", "date", "boolean")
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+class SchemaTemplateError(Exception):
+    """
+    Raised when a schema template file cannot be parsed or is invalid.
+    """
+    pass
+
+
+def field_key(name: str) -> str:
+    """
+    Normalise a field or column name for lookups.
+
+    Case, spaces and punctuation are ignored, so ``Block ID``,
+    ``block_id`` and ``BLOCK-ID`` share the key ``blockid``.
+
+    Args:
+        name: Field or column name
+
+    Returns:
+        str: Lookup key
+    """
+    return _NON_ALNUM.sub("", str(name).lower())
+
+
+class SchemaTemplate:
+    """
+    A parsed, validated schema template and its lookup tables.
+
+    ``data`` is the template as stored and is shared by every caller, so
+    it must be treated as read-only.
+    """
+
+    def __init__(self, data: Dict[str, Any], content: bytes, mtime_ns: int = 0, size: int = 0):
+        self.data = data
+        self.id: str = data["id"]
+        self.entity_type: str = data["entity_type"]
+        self.fields: List[Dict[str, Any]] = data["fields"]
+        self.field_by_name: Dict[str, Dict[str, Any]] = {field["name"]: field for field in self.fields}
+        self.field_by_key: Dict[str, Dict[str, Any]] = {field_key(field["name"]): field for field in self.fields}
+        self.required: Tuple[str, ...] = tuple(field["name"] for field in self.fields if field.get("required"))
+        self.patterns: Dict[str, Pattern] = {
+            field["name"]: re.compile(field["pattern"]) for field in self.fields if field.get("pattern")
+        }
+        self.summary: Dict[str, Any] = {
+            "id": self.id,
+            "name": data.get("name"),
+            "version": data.get("version"),
+            "description": data.get("description", ""),
+        }
+        self.etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+        self.mtime_ns = mtime_ns
+        self.size = size
+
+    @classmethod
+    def parse(cls, content: bytes, schema_id: str, mtime_ns: int = 0, size: int = 0) -> "SchemaTemplate":
+        """
+        Parse and validate a template file's content.
+
+        Args:
+            content: Raw JSON
+            schema_id: Expected template ID (the file name without .json)
+            mtime_ns: File modification time
+            size: File size
+
+        Returns:
+            SchemaTemplate: The template
+
+        Raises:
+            SchemaTemplateError: If the JSON or the template is invalid
+        """
+        try:
+            data = json.loads(content)
+        except ValueError as e:
+            raise SchemaTemplateError(f"Schema '{schema_id}' is not valid JSON: {e}")
+        if not isinstance(data, dict):
+            raise SchemaTemplateError(f"Schema '{schema_id}' must be a JSON object")
+        if data.get("id") != schema_id:
+            raise SchemaTemplateError(f"Schema '{schema_id}' declares id '{data.get('id')}'")
+        if data.get("entity_type") not in ENTITY_TYPES:
+            raise SchemaTemplateError(
+                f"Schema '{schema_id}' has unknown entity_type '{data.get('entity_type')}'"
+            )
+        fields = data.get("fields")
+        if not isinstance(fields, list) or not fields:
+            raise SchemaTemplateError(f"Schema '{schema_id}' must declare a non-empty list of fields")
+
+        names = set()
+        for field in fields:
+            if not isinstance(field, dict) or not isinstance(field.get("name"), str) or not field["name"]:
+                raise SchemaTemplateError(f"Schema '{schema_id}' has a field without a name")
+            name = field["name"]
+            if name in names:
+                raise SchemaTemplateError(f"Schema '{schema_id}' declares field '{name}' twice")
+            names.add(name)
+            if field.get("type", "string") not in FIELD_TYPES:
+                raise SchemaTemplateError(f"Schema '{schema_id}' field '{name}' has unknown type '{field.get('type')}'")
+            if field.get("pattern"):
+                try:
+                    re.compile(field["pattern"])
+                except re.error as e:
+                    raise SchemaTemplateError(f"Schema '{schema_id}' field '{name}' has an invalid pattern: {e}")
+            if "enum" in field and not isinstance(field["enum"], list):
+                raise SchemaTemplateError(f"Schema '{schema_id}' field '{name}' enum must be a list")
+
+        return cls(data, content, mtime_ns, size)
+
+
+class SchemaRegistry:
+    """
+    Schema templates of a directory, held in memory.
+
+    Usage:
+        template = schema_registry.get("block_v1")
+        schema_registry.refresh()  # pick up edited files
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._failed: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._templates: Optional[Dict[str, SchemaTemplate]] = None
+        self._etag = '""'
+        self._lock = threading.Lock()
+        self._watcher: Optional[asyncio.Task] = None
+
+    @property
+    def templates(self) -> Dict[str, SchemaTemplate]:
+        """Current templates by ID, loading them on first use."""
+        if self._templates is None:
+            self.refresh()
+        return self._templates
+
+    @property
+    def etag(self) -> str:
+        """ETag of the template list; changes whenever any template changes."""
+        self.templates
+        return self._etag
+
+    def get(self, schema_id: str) -> Optional[SchemaTemplate]:
+        """
+        Look up a template.
+
+        Args:
+            schema_id: The schema template ID
+
+        Returns:
+            The template, or None if there is no valid template with that ID
+        """
+        return self.templates.get(schema_id)
+
+    def list(self) -> List[SchemaTemplate]:
+        """Every valid template, ordered by ID."""
+        return list(self.templates.values())
+
+    def refresh(self) -> bool:
+        """
+        Reload templates whose files were added, changed or removed.
+
+        Only files whose mtime or size differ from the loaded version are
+        read again. A file that fails to parse or validate is reported in
+        ``errors``; if an earlier version of it loaded, that version stays
+        in service. Rejected files are not read again until they change.
+
+        Returns:
+            bool: True if the set of templates changed
+        """
+        with self._lock:
+            current = self._templates or {}
+            try:
+                entries = sorted(
+                    (entry for entry in os.scandir(self.directory)
+                     if entry.name.endswith(".json") and entry.is_file()),
+                    key=lambda entry: entry.name,
+                )
+            except FileNotFoundError:
+                entries = []
+
+            templates: Dict[str, SchemaTemplate] = {}
+            failed: Dict[str, Tuple[Tuple[int, int], str]] = {}
+            for entry in entries:
+                schema_id = entry.name[:-len(".json")]
+                stat = entry.stat()
+                loaded = current.get(schema_id)
+                if loaded and (loaded.mtime_ns, loaded.size) == (stat.st_mtime_ns, stat.st_size):
+                    templates[schema_id] = loaded
+                    continue
+                if schema_id in self._failed and self._failed[schema_id][0] == (stat.st_mtime_ns, stat.st_size):
+                    failed[schema_id] = self._failed[schema_id]
+                    if loaded:
+                        templates[schema_id] = loaded
+                    continue
+                try:
+                    with open(entry.path, "rb") as f:
+                        content = f.read()
+                    templates[schema_id] = SchemaTemplate.parse(content, schema_id, stat.st_mtime_ns, stat.st_size)
+                except (OSError, SchemaTemplateError) as e:
+                    logger.warning("Error loading schema %s: %s", entry.path, e)
+                    failed[schema_id] = ((stat.st_mtime_ns, stat.st_size), str(e))
+                    if loaded:
+                        templates[schema_id] = loaded
+
+            changed = self._templates is None or [
+                (t.id, t.etag) for t in templates.values()
+            ] != [(t.id, t.etag) for t in current.values()]
+            self._failed = failed
+            if changed:
+                digest = hashlib.sha256("\n".join(t.etag for t in templates.values()).encode())
+                self._etag = f'"{digest.hexdigest()[:32]}"'
+                self._templates = templates
+            return changed
+
+    @property
+    def errors(self) -> Dict[str, str]:
+        """Why each template file that failed to load was rejected, by ID."""
+        return {schema_id: message for schema_id, (_, message) in self._failed.items()}
+
+    async def start_watching(self, interval: Optional[float] = None) -> None:
+        """
+        Load templates and reload them in the background as files change.
+
+        Args:
+            interval: Seconds between checks (default SCHEMA_RELOAD_INTERVAL;
+                0 loads once without watching)
+        """
+        interval = settings.SCHEMA_RELOAD_INTERVAL if interval is None else interval
+        await asyncio.to_thread(self.refresh)
+        if self.errors:
+            logger.warning("Schemas: %d loaded, %d rejected", len(self._templates), len(self.errors))
+        if interval > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch(interval))
+
+    async def stop_watching(self) -> None:
+        """Stop the background watcher."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    async def _watch(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                logger.exception("Error reloading schemas")
+
+
+schema_registry = SchemaRegistry(Path(__file__).parent / "templates")
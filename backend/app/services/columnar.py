@@ -0,0 +1,426 @@
+"""
+Columnar engine for harmonization.
+
+Files are parsed into NumPy column arrays and every transformation
+(column renames, type coercion, ID normalisation, parent linking) is
+applied to whole columns at once rather than row by row.
+"""
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
+from itertools import islice, zip_longest
+import csv
+import hashlib
+import io
+import time
+
+import numpy as np
+
+
+# Rows parsed per batch before being transposed into column arrays
+DEFAULT_BATCH_SIZE = 65536
+
+_TRUE_VALUES = np.array(["TRUE", "T", "YES", "Y", "1"])
+_FALSE_VALUES = np.array(["FALSE", "F", "NO", "N", "0"])
+
+
+class ColumnTable:
+    """
+    A table stored as one NumPy array per column.
+
+    Each column has a matching boolean null mask. ``row_index`` holds the
+    0-based data row each entry came from in the source file, so errors
+    can be reported against the original rows after filtering.
+    ``invalid`` keeps, for columns where type coercion failed, the source
+    text of the failing cells ("" elsewhere) so validation can report it.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, np.ndarray],
+        nulls: Optional[Dict[str, np.ndarray]] = None,
+        row_index: Optional[np.ndarray] = None
+    ):
+        self.columns = columns
+        self.nulls = nulls or {}
+        num_rows = len(next(iter(columns.values()))) if columns else 0
+        if row_index is None:
+            row_index = np.arange(num_rows, dtype=np.int64)
+        self.row_index = row_index
+        self.stats: Dict[str, Any] = {}
+        self.invalid: Dict[str, np.ndarray] = {}
+        # Entity and parent ObjectIds, assigned when tables are linked
+        self.ids: Optional[np.ndarray] = None
+        self.parent_ids: Optional[np.ndarray] = None
+        # Per-row content hashes (see row_hashes), set after harmonization
+        self.hashes: Optional[np.ndarray] = None
+
+    @property
+    def num_rows(self) -> int:
+        """Number of rows in the table."""
+        return len(self.row_index)
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    @property
+    def column_names(self) -> List[str]:
+        """Column names in insertion order."""
+        return list(self.columns)
+
+    def column(self, name: str) -> np.ndarray:
+        """Get a column array by name."""
+        return self.columns[name]
+
+    def null_mask(self, name: str) -> np.ndarray:
+        """Get the null mask of a column (all False if none recorded)."""
+        mask = self.nulls.get(name)
+        if mask is None:
+            mask = np.zeros(self.num_rows, dtype=bool)
+        return mask
+
+    def take(self, indices: np.ndarray) -> "ColumnTable":
+        """
+        Select rows by position or boolean mask.
+
+        Args:
+            indices: Integer positions or a boolean mask
+
+        Returns:
+            ColumnTable: A new table with the selected rows
+        """
+        table = ColumnTable(
+            {name: col[indices] for name, col in self.columns.items()},
+            {name: mask[indices] for name, mask in self.nulls.items()},
+            self.row_index[indices],
+        )
+        table.stats = dict(self.stats)
+        table.invalid = {name: raw[indices] for name, raw in self.invalid.items()}
+        if self.ids is not None:
+            table.ids = self.ids[indices]
+        if self.parent_ids is not None:
+            table.parent_ids = self.parent_ids[indices]
+        if self.hashes is not None:
+            table.hashes = self.hashes[indices]
+        return table
+
+    def iter_records(self, chunk_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+        """
+        Yield one dict per row with nulls as None.
+
+        Columns are converted to Python lists a chunk at a time, so the
+        conversion itself stays in C.
+
+        Args:
+            chunk_size: Rows converted per chunk
+
+        Yields:
+            Dict mapping column names to Python values
+        """
+        names = self.column_names
+        for start in range(0, self.num_rows, chunk_size):
+            stop = start + chunk_size
+            lists = [
+                to_python_list(self.columns[name][start:stop], self.null_mask(name)[start:stop])
+                for name in names
+            ]
+            for values in zip(*lists):
+                yield dict(zip(names, values))
+
+
+def to_python_list(values: np.ndarray, nulls: np.ndarray) -> List[Any]:
+    """
+    Convert a column to a list of Python values with nulls as None.
+
+    Dates become datetime.datetime so they can be stored as BSON dates.
+
+    Args:
+        values: Column values
+        nulls: Null mask
+
+    Returns:
+        List of Python values
+    """
+    if values.dtype.kind == "M":
+        values = values.astype("datetime64[ms]")
+    out = values.astype(object)
+    if nulls.any():
+        out[nulls] = None
+    return out.tolist()
+
+
+def read_csv_columns(
+    stream: BinaryIO,
+    delimiter: str = ",",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    encoding: str = "utf-8-sig",
+    usecols: Optional[Sequence[int]] = None
+) -> ColumnTable:
+    """
+    Parse a delimited file into string column arrays.
+
+    Rows are parsed by the C csv reader in batches and each batch is
+    transposed into per-column arrays; rows shorter than the header are
+    padded with empty strings and extra trailing cells are dropped.
+
+    Args:
+        stream: Binary file object positioned at the header
+        delimiter: Field delimiter
+        batch_size: Rows parsed per batch
+        encoding: Text encoding of the file
+        usecols: Header positions to keep (default: all); other columns
+            are never converted to arrays
+
+    Returns:
+        ColumnTable: One unicode array per kept header column
+    """
+    text = io.TextIOWrapper(stream, encoding=encoding, errors="replace", newline="")
+    reader = csv.reader(text, delimiter=delimiter)
+    header = next(reader, [])
+    width = len(header)
+    keep = list(range(width)) if usecols is None else sorted({i for i in usecols if 0 <= i < width})
+    slot = {position: k for k, position in enumerate(keep)}
+    chunks: List[List[np.ndarray]] = [[] for _ in keep]
+
+    while True:
+        batch = [row for _, row in zip(range(batch_size), reader)]
+        if not batch:
+            break
+        transposed = islice(zip_longest(*batch, fillvalue=""), keep[-1] + 1 if keep else 0)
+        filled = 0
+        for i, values in enumerate(transposed):
+            if i in slot:
+                chunks[slot[i]].append(np.array(values, dtype=str))
+            filled += 1
+        # Columns that no row in the batch reached
+        for i in keep:
+            if i >= filled:
+                chunks[slot[i]].append(np.full(len(batch), "", dtype=str))
+
+    text.detach()
+    columns = {}
+    for position, parts in zip(keep, chunks):
+        columns[header[position]] = np.concatenate(parts) if parts else np.array([], dtype=str)
+    return ColumnTable(columns)
+
+
+def coerce_column(values: np.ndarray, field_type: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Coerce a string column to a schema field type in one batch operation.
+
+    Args:
+        values: Unicode column array
+        field_type: Template field type (string, integer, float, number,
+            boolean or date)
+
+    Returns:
+        Tuple of (coerced values, null mask, invalid mask). Empty cells are
+        null; non-empty cells that cannot be converted are both null and
+        invalid.
+    """
+    stripped = np.char.strip(values.astype(str))
+    empty = stripped == ""
+    invalid = np.zeros(len(stripped), dtype=bool)
+
+    if field_type == "integer":
+        digits = np.char.lstrip(stripped, "+-")
+        ok = ~empty & np.char.isdigit(digits) & (np.char.str_len(stripped) - np.char.str_len(digits) <= 1)
+        out = np.zeros(len(stripped), dtype=np.int64)
+        if ok.any():
+            try:
+                out[ok] = stripped[ok].astype(np.int64)
+            except OverflowError:
+                parsed = np.frompyfunc(_parse_int64, 1, 2)(stripped[ok])
+                out[ok] = parsed[0].astype(np.int64)
+                ok[ok] = parsed[1].astype(bool)
+        invalid = ~empty & ~ok
+    elif field_type in ("float", "number"):
+        out = np.full(len(stripped), np.nan, dtype=np.float64)
+        present = ~empty
+        try:
+            out[present] = stripped[present].astype(np.float64)
+        except ValueError:
+            # Fall back to cell-wise parsing only when the fast path fails
+            parsed = np.frompyfunc(_parse_float, 1, 1)(stripped[present]).astype(np.float64)
+            out[present] = parsed
+            invalid[present] = np.isnan(parsed) & (np.char.upper(stripped[present]) != "NAN")
+    elif field_type == "boolean":
+        upper = np.char.upper(stripped)
+        is_true = np.isin(upper, _TRUE_VALUES)
+        is_false = np.isin(upper, _FALSE_VALUES)
+        out = is_true
+        invalid = ~empty & ~is_true & ~is_false
+    elif field_type == "date":
+        out = np.full(len(stripped), np.datetime64("NaT"), dtype="datetime64[D]")
+        present = ~empty
+        try:
+            out[present] = stripped[present].astype("datetime64[D]")
+        except ValueError:
+            parsed = np.frompyfunc(_parse_date, 1, 1)(stripped[present]).astype("datetime64[D]")
+            out[present] = parsed
+            invalid[present] = np.isnat(parsed)
+    else:
+        out = stripped
+
+    return out, empty | invalid, invalid
+
+
+def _parse_int64(value: str) -> Tuple[int, bool]:
+    number = int(value)
+    if -2**63 <= number < 2**63:
+        return number, True
+    return 0, False
+
+
+def _parse_float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return float("nan")
+
+
+def _parse_date(value: str) -> np.datetime64:
+    try:
+        return np.datetime64(value, "D")
+    except ValueError:
+        return np.datetime64("NaT")
+
+
+def normalise_ids(values: np.ndarray) -> np.ndarray:
+    """
+    Normalise an identifier column: trim whitespace and upper-case.
+
+    Args:
+        values: Unicode column array
+
+    Returns:
+        np.ndarray: Normalised identifiers
+    """
+    return np.char.upper(np.char.strip(values.astype(str)))
+
+
+def is_id_field(name: str) -> bool:
+    """Whether a canonical field holds an identifier."""
+    return name.upper().endswith("_ID")
+
+
+def harmonize_table(
+    table: ColumnTable,
+    template: Dict[str, Any],
+    mapping: Optional[Dict[str, str]] = None
+) -> ColumnTable:
+    """
+    Map a raw string table onto a schema template.
+
+    Applies the ``{"canonical_field": "csv_column"}`` mapping as column
+    renames (fields without a mapping entry are matched by name), coerces
+    each column to its template type and normalises identifier columns.
+    Source columns that are not part of the template are dropped.
+
+    Args:
+        table: Raw table from read_csv_columns()
+        template: Schema template
+        mapping: Column mapping
+
+    Returns:
+        ColumnTable: Canonical columns, with ``stats`` holding row count,
+        invalid cell counts per field, elapsed seconds and rows/sec
+    """
+    started = time.perf_counter()
+    mapping = mapping or {}
+    columns: Dict[str, np.ndarray] = {}
+    nulls: Dict[str, np.ndarray] = {}
+    invalid_counts: Dict[str, int] = {}
+    invalid_values: Dict[str, np.ndarray] = {}
+    missing_fields: List[str] = []
+
+    for field in template.get("fields", []):
+        name = field["name"]
+        source = mapping.get(name, name)
+        if source not in table.columns:
+            missing_fields.append(name)
+            columns[name] = np.full(table.num_rows, "", dtype=str)
+            nulls[name] = np.ones(table.num_rows, dtype=bool)
+            continue
+
+        raw = table.columns[source]
+        if field.get("type", "string") == "string" and is_id_field(name):
+            values = normalise_ids(raw)
+            null, invalid = values == "", np.zeros(len(values), dtype=bool)
+        else:
+            values, null, invalid = coerce_column(raw, field.get("type", "string"))
+        columns[name] = values
+        nulls[name] = null
+        if invalid.any():
+            invalid_counts[name] = int(invalid.sum())
+            invalid_values[name] = np.where(invalid, raw, "")
+
+    result = ColumnTable(columns, nulls, table.row_index)
+    result.invalid = invalid_values
+    elapsed = time.perf_counter() - started
+    result.stats = {
+        "rows": result.num_rows,
+        "invalid_cells": invalid_counts,
+        "missing_fields": missing_fields,
+        "seconds": elapsed,
+        "rows_per_sec": result.num_rows / elapsed if elapsed > 0 else float(result.num_rows),
+    }
+    return result
+
+
+def row_hashes(table: ColumnTable) -> np.ndarray:
+    """
+    Hash the content of each row of a harmonized table.
+
+    The hash covers the column names, every value (nulls distinguished from
+    empty strings) and the source text of values that failed coercion, so
+    two rows hash equally exactly when validation would see the same
+    entity. Incremental validation uses it to find entities that changed
+    between harmonizations.
+
+    Args:
+        table: Harmonized table
+
+    Returns:
+        np.ndarray: 32-character hex digest per row
+    """
+    names = sorted(table.columns)
+    seed = hashlib.blake2b("\x1f".join(names).encode("utf-8"), digest_size=16)
+    cells = []
+    for name in names:
+        text = table.columns[name].astype(str)
+        # NumPy strings drop trailing NULs, so "\x00" would hash like ""
+        text = np.where(table.null_mask(name), "\x1d", text)
+        if name in table.invalid:
+            raw = table.invalid[name]
+            text = np.where(raw != "", np.char.add(np.char.add(text, "\x1e"), raw), text)
+        cells.append(text.tolist())
+
+    digests = []
+    for row in zip(*cells):
+        hasher = seed.copy()
+        hasher.update("\x1f".join(row).encode("utf-8"))
+        digests.append(hasher.hexdigest())
+    return np.array(digests, dtype="U32") if digests else np.array([], dtype="U32")
+
+
+def lookup_keys(keys: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """
+    Find the position of each key in a candidate key array.
+
+    Uses a sort plus binary search so matching is O((n + m) log m) over
+    whole arrays instead of a per-row dictionary lookup.
+
+    Args:
+        keys: Keys to look up
+        candidates: Keys to search (e.g. parent natural keys)
+
+    Returns:
+        np.ndarray: Index into ``candidates`` for each key, or -1 if absent
+    """
+    if len(candidates) == 0 or len(keys) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    order = np.argsort(candidates, kind="stable")
+    sorted_candidates = candidates[order]
+    pos = np.searchsorted(sorted_candidates, keys)
+    pos = np.clip(pos, 0, len(sorted_candidates) - 1)
+    found = sorted_candidates[pos] == keys
+    return np.where(found, order[pos], -1)
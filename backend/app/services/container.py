@@ -0,0 +1,170 @@
+"""
+Process-wide service instances.
+
+The services keep no per-request state, so one instance of each serves
+every request and job in a process. Each is built on first use; the
+harmonization and validation services, whose modules pull in NumPy and
+the rules engine, are imported only then.
+
+warm() loads ahead of time what would otherwise be loaded by the first
+request or job: the engine modules, the schema templates, the compiled
+validation ruleset and the schema detection index. The API runs it in
+the background after startup (STARTUP_WARMUP), and ``app.worker`` runs
+it in the parent process before forking, so the workers share it
+copy-on-write. Each step is timed in the startup report.
+
+Endpoints receive the instances through the FastAPI dependencies in
+app.api.deps; background jobs read them from ``services``.
+"""
+from typing import TYPE_CHECKING, Optional
+import asyncio
+import importlib
+import logging
+
+from app.core.startup import startup_report
+from app.schemas.registry import schema_registry
+from app.services.export import ExportService
+from app.services.mappings import MappingService
+from app.services.storage import StorageService
+
+if TYPE_CHECKING:
+    from app.services.harmonization import HarmonizationService
+    from app.services.validation import ValidationService
+
+
+# Modules imported by warm(); the rest of app.services is light
+ENGINE_MODULES = (
+    "app.services.harmonization",
+    "app.services.validation",
+    "app.services.detection",
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """
+    Holds the shared service instances of the process.
+
+    Usage:
+        await services.start(background=True)
+        await services.validation.validate_run(run_id)
+    """
+
+    def __init__(self):
+        self._storage: Optional[StorageService] = None
+        self._mappings: Optional[MappingService] = None
+        self._export: Optional[ExportService] = None
+        self._harmonization: Optional["HarmonizationService"] = None
+        self._validation: Optional["ValidationService"] = None
+        self._warming: Optional[asyncio.Task] = None
+
+    def warm(self) -> None:
+        """
+        Import the engines and preload their data, timing each step.
+
+        Safe to call from a worker thread while requests are served.
+        """
+        with startup_report.phase("warmup.engines"):
+            for module in ENGINE_MODULES:
+                importlib.import_module(module)
+        from app.services.detection import detection_index
+        from app.services.validation import load_rules
+
+        with startup_report.phase("warmup.schemas"):
+            schema_registry.templates
+        with startup_report.phase("warmup.rules"):
+            load_rules()
+        with startup_report.phase("warmup.detection"):
+            detection_index()
+
+    async def start(self, background: bool = False) -> None:
+        """
+        Run warm() in a worker thread.
+
+        Args:
+            background: Return at once and let warm-up finish while the
+                process serves requests
+        """
+        if background:
+            self._warming = asyncio.create_task(self._warm_in_background())
+        else:
+            await asyncio.to_thread(self.warm)
+
+    async def _warm_in_background(self) -> None:
+        try:
+            await asyncio.to_thread(self.warm)
+        except Exception:
+            # Nothing awaits this task; whatever did not load is loaded on first use
+            logger.exception("Warm-up failed")
+            return
+        phases = startup_report.summary()["phases"]
+        logger.info("Warm-up finished: " + ", ".join(
+            f"{name} {ms:.0f} ms" for name, ms in phases.items() if name.startswith("warmup.")
+        ))
+
+    async def ready(self) -> None:
+        """
+        Wait for a background warm-up to finish.
+
+        Call before forking (e.g. starting the harmonization process pool):
+        a child forked while the warm-up thread holds an import lock would
+        deadlock on its first import.
+        """
+        if self._warming is not None:
+            await asyncio.gather(self._warming, return_exceptions=True)
+
+    async def stop(self) -> None:
+        """Wait for a background warm-up to finish."""
+        await self.ready()
+        self._warming = None
+
+    @property
+    def storage(self) -> StorageService:
+        """The shared StorageService."""
+        if self._storage is None:
+            self._storage = StorageService()
+        return self._storage
+
+    @property
+    def mappings(self) -> MappingService:
+        """The shared MappingService."""
+        if self._mappings is None:
+            self._mappings = MappingService()
+        return self._mappings
+
+    @property
+    def export(self) -> ExportService:
+        """The shared ExportService."""
+        if self._export is None:
+            self._export = ExportService()
+        return self._export
+
+    @property
+    def harmonization(self) -> "HarmonizationService":
+        """The shared HarmonizationService."""
+        if self._harmonization is None:
+            from app.services.harmonization import HarmonizationService
+
+            self._harmonization = HarmonizationService()
+        return self._harmonization
+
+    @property
+    def validation(self) -> "ValidationService":
+        """
+        The shared ValidationService for the current ruleset.
+
+        When a template or the ruleset file changes, a new instance with the
+        recompiled rules replaces it; validations already running keep the
+        instance (and rules) they started with.
+        """
+        from app.services.validation import ValidationService, load_rules
+
+        rules = load_rules()
+        if self._validation is None or self._validation.rules is not rules:
+            self._validation = ValidationService(rules)
+        return self._validation
+
+
+# Global service container
+services = ServiceContainer()
@@ -0,0 +1,389 @@
+"""
+Schema detection: suggest a template and column mapping for a file.
+
+Only the head of the file is read (SCHEMA_DETECTION_SAMPLE_BYTES, at most
+SCHEMA_DETECTION_SAMPLE_ROWS rows). Each column gets a name key and tokens
+and a value shape: the share of values that parse as each field type, how
+distinct the values are, and how many match a given pattern, enum or range.
+
+Columns are scored against template fields through a DetectionIndex built
+once per version of the schema registry. The index maps normalised field
+names and name tokens to fields, so a column is only compared with fields
+that share a word with it, not with every field of every template.
+"""
+from typing import Any, BinaryIO, Dict, FrozenSet, List, Optional, Tuple
+import csv
+import io
+import re
+import threading
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.hierarchy import ENTITY_KEYS
+from app.schemas.registry import SchemaTemplate, field_key, schema_registry
+from app.services.columnar import coerce_column, is_id_field, normalise_ids
+
+
+# Words that mark a column as an identifier; they all count as "id"
+ID_TOKENS = frozenset({"id", "ids", "identifier", "number", "num", "no", "nr", "barcode", "name", "code"})
+
+SHAPE_TYPES = ("integer", "float", "date", "boolean")
+
+_WORDS = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+# Weight of the name score in a column-to-field confidence; the rest is shape
+NAME_WEIGHT = 0.6
+
+
+def name_tokens(name: str) -> FrozenSet[str]:
+    """
+    Split a field or column name into lower-case words.
+
+    Underscores, punctuation and camelCase boundaries separate words, and
+    identifier words (ID, Number, Barcode, ...) are folded into ``id``, so
+    ``SlideBarcode`` and ``Slide_ID`` have the same tokens.
+
+    Args:
+        name: Field or column name
+
+    Returns:
+        FrozenSet[str]: Tokens
+    """
+    return frozenset(
+        "id" if word.lower() in ID_TOKENS else word.lower()
+        for word in _WORDS.findall(str(name))
+    )
+
+
+def read_head(stream: BinaryIO, delimiter: str = ",", max_bytes: Optional[int] = None,
+              max_rows: Optional[int] = None) -> Tuple[List[str], List[List[str]]]:
+    """
+    Read the header and first rows of a delimited file.
+
+    Args:
+        stream: Binary file object positioned at the start of the file
+        delimiter: Field delimiter
+        max_bytes: Bytes to read at most (default SCHEMA_DETECTION_SAMPLE_BYTES)
+        max_rows: Data rows to return at most (default SCHEMA_DETECTION_SAMPLE_ROWS)
+
+    Returns:
+        Tuple of (header columns, rows padded or cut to the header width)
+    """
+    max_bytes = max_bytes or settings.SCHEMA_DETECTION_SAMPLE_BYTES
+    max_rows = max_rows or settings.SCHEMA_DETECTION_SAMPLE_ROWS
+    return parse_head(stream.read(max_bytes), delimiter, max_bytes, max_rows)
+
+
+def parse_head(data: bytes, delimiter: str = ",", max_bytes: Optional[int] = None,
+               max_rows: Optional[int] = None) -> Tuple[List[str], List[List[str]]]:
+    """
+    Parse the header and first rows from the first bytes of a file.
+
+    When ``data`` fills ``max_bytes`` the last, probably partial, line is
+    dropped.
+
+    Args:
+        data: Leading bytes of the file
+        delimiter: Field delimiter
+        max_bytes: Size of the read that produced ``data``
+        max_rows: Data rows to return at most
+
+    Returns:
+        Tuple of (header columns, rows padded or cut to the header width)
+    """
+    max_bytes = max_bytes or settings.SCHEMA_DETECTION_SAMPLE_BYTES
+    max_rows = max_rows or settings.SCHEMA_DETECTION_SAMPLE_ROWS
+    if len(data) >= max_bytes and b"\n" in data:
+        data = data[:data.rindex(b"\n") + 1]
+    reader = csv.reader(io.StringIO(data.decode("utf-8-sig", errors="replace"), newline=""), delimiter=delimiter)
+    header = [column.strip() for column in next(reader, [])]
+    rows: List[List[str]] = []
+    for row in reader:
+        if len(rows) >= max_rows:
+            break
+        if not any(cell.strip() for cell in row):
+            continue
+        rows.append((row + [""] * len(header))[:len(header)])
+    return header, rows
+
+
+class ColumnShape:
+    """
+    Name tokens and value shape of one sampled column.
+
+    Pattern, enum and range fractions are computed on demand and cached,
+    since many fields can ask about the same column.
+    """
+
+    def __init__(self, name: str, values: List[str]):
+        self.name = name
+        self.key = field_key(name)
+        self.tokens = name_tokens(name)
+        stripped = np.char.strip(np.array(values, dtype=str)) if values else np.array([], dtype=str)
+        self.values = stripped[stripped != ""]
+        self.present = len(self.values)
+        self.distinct = len(np.unique(self.values)) / self.present if self.present else 0.0
+        self.types: Dict[str, float] = {}
+        for field_type in SHAPE_TYPES:
+            invalid = coerce_column(self.values, field_type)[2]
+            self.types[field_type] = 1.0 - invalid.mean() if self.present else 0.0
+        self._numbers: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+        self._cache: Dict[Any, float] = {}
+
+    def type_fraction(self, field_type: str) -> float:
+        """Share of values that parse as a field type."""
+        if field_type in ("float", "number"):
+            return self.types["float"]
+        return self.types.get(field_type, 1.0)
+
+    def pattern_fraction(self, pattern: re.Pattern, id_field: bool) -> float:
+        """Share of values (normalised like identifiers for ID fields) matching a pattern."""
+        key = ("pattern", pattern.pattern, id_field)
+        if key not in self._cache:
+            if self._ids is None:
+                self._ids = normalise_ids(self.values)
+            values = self._ids if id_field else self.values
+            self._cache[key] = sum(pattern.fullmatch(value) is not None for value in values) / self.present
+        return self._cache[key]
+
+    def enum_fraction(self, allowed: FrozenSet[str]) -> float:
+        """Share of values in an enum, ignoring case."""
+        key = ("enum", allowed)
+        if key not in self._cache:
+            self._cache[key] = float(np.isin(np.char.lower(self.values), list(allowed)).mean())
+        return self._cache[key]
+
+    def range_fraction(self, low: Optional[float], high: Optional[float]) -> float:
+        """Share of values that are numbers within [low, high]."""
+        key = ("range", low, high)
+        if key not in self._cache:
+            if self._numbers is None:
+                self._numbers = coerce_column(self.values, "float")[0]
+            ok = ~np.isnan(self._numbers)
+            if low is not None:
+                ok &= self._numbers >= low
+            if high is not None:
+                ok &= self._numbers <= high
+            self._cache[key] = float(ok.mean())
+        return self._cache[key]
+
+
+class IndexedField:
+    """
+    A template field with everything detection compares columns against.
+    """
+
+    def __init__(self, template: SchemaTemplate, field: Dict[str, Any]):
+        self.template_id = template.id
+        self.name: str = field["name"]
+        self.key = field_key(self.name)
+        self.tokens = name_tokens(self.name)
+        self.type: str = field.get("type", "string")
+        self.required = bool(field.get("required"))
+        self.pattern = template.patterns.get(self.name)
+        self.enum = frozenset(str(value).lower() for value in field["enum"]) if field.get("enum") else None
+        self.min = field.get("min")
+        self.max = field.get("max")
+        self.id_field = is_id_field(self.name)
+        self.natural_key = ENTITY_KEYS.get(template.entity_type) == self.name
+        # Fields with the same signature score the same against any column
+        self.signature = (
+            self.name, self.type, self.pattern.pattern if self.pattern else None,
+            self.enum, self.min, self.max, self.natural_key,
+        )
+
+    def name_score(self, column: ColumnShape) -> float:
+        """How closely a column's name matches this field's (0-1)."""
+        if column.key == self.key:
+            return 1.0
+        if column.tokens == self.tokens:
+            return 0.9
+        union = column.tokens | self.tokens
+        return 0.8 * len(column.tokens & self.tokens) / len(union) if union else 0.0
+
+    def shape_score(self, column: ColumnShape) -> float:
+        """How well a column's values fit this field's type and constraints (0-1)."""
+        if not column.present:
+            return 0.5
+        scores = [column.type_fraction(self.type)]
+        if self.pattern is not None:
+            scores.append(column.pattern_fraction(self.pattern, self.id_field))
+        if self.enum:
+            scores.append(column.enum_fraction(self.enum))
+        if self.min is not None or self.max is not None:
+            scores.append(column.range_fraction(self.min, self.max))
+        if self.natural_key:
+            scores.append(column.distinct)
+        return sum(scores) / len(scores)
+
+
+class DetectionIndex:
+    """
+    Lookup tables over the fields of every template.
+    """
+
+    def __init__(self, templates: List[SchemaTemplate], etag: str = ""):
+        self.etag = etag
+        self.templates: Dict[str, SchemaTemplate] = {template.id: template for template in templates}
+        self.fields: List[IndexedField] = []
+        self.template_fields: Dict[str, List[int]] = {}
+        self.by_key: Dict[str, List[int]] = {}
+        self.by_token: Dict[str, List[int]] = {}
+        for template in templates:
+            positions = self.template_fields.setdefault(template.id, [])
+            for field in template.fields:
+                position = len(self.fields)
+                indexed = IndexedField(template, field)
+                self.fields.append(indexed)
+                positions.append(position)
+                self.by_key.setdefault(indexed.key, []).append(position)
+                for token in indexed.tokens:
+                    self.by_token.setdefault(token, []).append(position)
+
+    def candidate_fields(self, column: ColumnShape) -> List[int]:
+        """Fields whose normalised name or any name token matches the column's."""
+        positions = set(self.by_key.get(column.key, ()))
+        for token in column.tokens:
+            positions.update(self.by_token.get(token, ()))
+        return sorted(positions)
+
+    def detect(
+        self,
+        header: List[str],
+        rows: List[List[str]],
+        schema_template_id: Optional[str] = None,
+        limit: int = 5
+    ) -> Dict[str, Any]:
+        """
+        Rank templates for a sample and suggest a column mapping.
+
+        Args:
+            header: Column names
+            rows: Sampled rows
+            schema_template_id: Template to suggest the mapping for
+                (default: the best candidate)
+            limit: Number of candidates to return
+
+        Returns:
+            Dict with ``candidates`` (best first), the chosen
+            ``schema_template_id``, its field ``mappings``, the header
+            ``columns`` and the number of ``sampled_rows``
+        """
+        min_confidence = settings.SCHEMA_MAPPING_MIN_CONFIDENCE
+        columns = [ColumnShape(name, [row[i] for row in rows]) for i, name in enumerate(header) if name]
+
+        pairs: Dict[str, List[Tuple[float, int, int]]] = {}
+        for c, column in enumerate(columns):
+            scores: Dict[Tuple, float] = {}
+            for position in self.candidate_fields(column):
+                field = self.fields[position]
+                confidence = scores.get(field.signature)
+                if confidence is None:
+                    name_score = field.name_score(column)
+                    confidence = scores[field.signature] = (
+                        NAME_WEIGHT * name_score + (1 - NAME_WEIGHT) * field.shape_score(column)
+                        if name_score else 0.0
+                    )
+                if confidence >= min_confidence:
+                    pairs.setdefault(field.template_id, []).append((confidence, c, position))
+
+        scored = []
+        assignments: Dict[str, Dict[int, Tuple[int, float]]] = {}
+        for template_id, template_pairs in pairs.items():
+            assigned = _assign(template_pairs)
+            assignments[template_id] = assigned
+            scored.append((self._score(template_id, assigned, len(columns)), template_id))
+        scored.sort(key=lambda item: (-item[0][0], item[1]))
+
+        candidates = []
+        for (confidence, rationale), template_id in scored[:limit]:
+            template = self.templates[template_id]
+            candidates.append({
+                "id": template_id,
+                "name": template.data.get("name") or template_id,
+                "version": str(template.data.get("version", "")),
+                "entity_type": template.entity_type,
+                "confidence": round(confidence, 3),
+                "rationale": rationale,
+            })
+
+        chosen = schema_template_id or (candidates[0]["id"] if candidates else None)
+        mappings = []
+        if chosen in self.template_fields:
+            assigned = assignments.get(chosen, {})
+            for position in self.template_fields[chosen]:
+                field = self.fields[position]
+                column, confidence = assigned.get(position, (None, 0.0))
+                mappings.append({
+                    "source_field": columns[column].name if column is not None else "",
+                    "target_field": field.name,
+                    "confidence": round(confidence, 3),
+                    "required": field.required,
+                    "mapped": column is not None,
+                })
+        return {
+            "candidates": candidates,
+            "schema_template_id": chosen,
+            "mappings": mappings,
+            "columns": header,
+            "sampled_rows": len(rows),
+        }
+
+    def _score(self, template_id: str, assigned: Dict[int, Tuple[int, float]], column_count: int) -> Tuple[float, str]:
+        """Template confidence and a one-line explanation."""
+        fields = [self.fields[position] for position in self.template_fields[template_id]]
+        required = [field for field in fields if field.required]
+        position_of = {field.name: position for field, position in zip(fields, self.template_fields[template_id])}
+        required_found = [field for field in required if position_of[field.name] in assigned]
+        required_score = (
+            sum(assigned[position_of[field.name]][1] for field in required_found) / len(required)
+            if required else 1.0
+        )
+        column_score = len(assigned) / column_count if column_count else 0.0
+        field_score = len(assigned) / len(fields)
+        confidence = 0.5 * required_score + 0.3 * column_score + 0.2 * field_score
+
+        rationale = (
+            f"{len(assigned)} of {column_count} columns match fields; "
+            f"{len(required_found)} of {len(required)} required fields found"
+        )
+        missing = [field.name for field in required if field not in required_found]
+        if missing:
+            rationale += f" (missing {', '.join(missing)})"
+        return confidence, rationale
+
+
+def _assign(pairs: List[Tuple[float, int, int]]) -> Dict[int, Tuple[int, float]]:
+    """One-to-one column/field assignment, most confident pairs first."""
+    assigned: Dict[int, Tuple[int, float]] = {}
+    used_columns = set()
+    for confidence, column, position in sorted(pairs, key=lambda pair: (-pair[0], pair[1], pair[2])):
+        if column in used_columns or position in assigned:
+            continue
+        assigned[position] = (column, confidence)
+        used_columns.add(column)
+    return assigned
+
+
+_index: Optional[DetectionIndex] = None
+_index_lock = threading.Lock()
+
+
+def detection_index() -> DetectionIndex:
+    """
+    The detection index for the current schema registry contents.
+
+    Rebuilt only when the registry's ETag changes.
+
+    Returns:
+        DetectionIndex: The index
+    """
+    global _index
+    etag = schema_registry.etag
+    if _index is None or _index.etag != etag:
+        with _index_lock:
+            if _index is None or _index.etag != etag:
+                _index = DetectionIndex(schema_registry.list(), etag)
+    return _index
@@ -1,202 +1,359 @@
 """
 Export service for generating data bundles from harmonized data.
 """
-from typing import Dict, List, Any, BinaryIO
-import json
+from typing import TYPE_CHECKING, Dict, List, Any, AsyncIterator, Optional
+import io
+import time
 import zipfile
-from io import BytesIO
 from datetime import datetime
 from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from app.db.database import get_database, COLLECTIONS
+from app.core.config import settings
+from app.core.hierarchy import ENTITY_TYPES
+from app.core.metrics import record_stage
+from app.core.serialization import dumps
+from app.db.bulk import iter_batches
+from app.db.database import get_database, operation_timeout, COLLECTIONS
+from app.schemas.loader import load_template
+from app.services.export_formats import ExportOptions, open_entity_writer
+
+if TYPE_CHECKING:
+    # The harmonization engine (NumPy) is not needed to export
+    from app.services.harmonization import ProgressCallback
+
+
+class ZipStreamBuffer(io.RawIOBase):
+    """
+    Write-only, unseekable sink for zipfile.ZipFile.
+
+    ZipFile writes compressed bytes here as members are written; drain()
+    hands them to the caller and empties the buffer, so only the bytes
+    produced since the last drain are held in memory. Because the sink is
+    not seekable, ZipFile writes sizes and CRCs in data descriptors after
+    each member instead of seeking back to the local header.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        """
+        Take everything written since the last drain.
+
+        Returns:
+            bytes: The buffered ZIP bytes
+        """
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
 
 
 class ExportService:
     """
     Service for exporting harmonized data bundles.
-    
+
     Exports include:
-    - Canonical entity data (JSON)
+    - Canonical entity data (JSON, or one Parquet / Arrow IPC / NDJSON
+      file per entity type, see ExportOptions)
     - Validation report
     - Metadata and audit trail
+
+    Bundles are produced as a stream of ZIP bytes: entities and audit logs
+    are read from MongoDB in batches of EXPORT_BATCH_SIZE and compressed as
+    they arrive, so memory use does not grow with the size of the run.
+
+    Those streams are read through the analytics connection (see
+    app.db.database) once its copy of the run has caught up with the
+    primary, so exports do not compete with harmonization for connections.
     """
-    
+
     def __init__(self):
         self.db = None
-    
+
     async def initialize(self):
         """Initialize database connection."""
         self.db = get_database()
-    
-    async def export_run(self, run_id: str) -> BytesIO:
+
+    async def _read_database(self, run_oid: ObjectId):
         """
-        Export a complete data bundle for a run.
-        
+        Pick the connection to stream a run's entities, errors and logs from.
+
+        The analytics connection may read from a secondary. It is used only
+        if its copy of the run document matches the primary's, which means
+        the entity and validation writes that preceded it have replicated.
+
         Args:
-            run_id: The run ID to export
-            
+            run_oid: The run ObjectId
+
         Returns:
-            BytesIO: ZIP file containing the data bundle
+            The analytics database, or the main one if the secondary lags
+        """
+        reads = get_database(analytics=True)
+        if reads is self.db:
+            return self.db
+        fields = {"status": 1, "entity_revision": 1, "validation_result_id": 1, "updated_at": 1}
+        primary = await self.db[COLLECTIONS["runs"]].find_one({"_id": run_oid}, fields)
+        replica = await reads[COLLECTIONS["runs"]].find_one({"_id": run_oid}, fields)
+        return reads if replica == primary else self.db
+
+    async def stream_run(
+        self,
+        run_id: str,
+        options: Optional[ExportOptions] = None,
+        progress: Optional["ProgressCallback"] = None
+    ) -> AsyncIterator[bytes]:
         """
-        if not self.db:
+        Stream a complete data bundle for a run as ZIP bytes.
+
+        Args:
+            run_id: The run ID to export
+            options: Entity format, codec and level (default: entities.json)
+            progress: Optional callback receiving (stage, rows, total)
+
+        Yields:
+            bytes: Consecutive chunks of the ZIP file
+        """
+        options = options or ExportOptions()
+        async for chunk in self._build_bundle(run_id, options, progress):
+            # Deflate buffers internally, so a batch may not produce output yet
+            if chunk:
+                yield chunk
+
+    async def _build_bundle(
+        self,
+        run_id: str,
+        options: ExportOptions,
+        progress: Optional["ProgressCallback"]
+    ) -> AsyncIterator[bytes]:
+        """Write the bundle members, yielding the buffered ZIP bytes after each batch."""
+        if self.db is None:
             await self.initialize()
-        
-        # Create in-memory ZIP file
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # TODO: Implement export logic
-            # 1. Load run metadata
-            # 2. Load all canonical entities
-            # 3. Load validation results
-            # 4. Generate manifest
-            # 5. Add all files to ZIP
-            
-            # Add placeholder manifest
-            manifest = {
-                "run_id": run_id,
-                "export_date": datetime.utcnow().isoformat(),
-                "version": "1.0.0",
-                "status": "not_implemented"
-            }
-            zip_file.writestr("manifest.json", json.dumps(manifest, indent=2))
-        
-        zip_buffer.seek(0)
-        return zip_buffer
-    
-    async def export_entities(self, run_id: str) -> Dict[str, List[Dict[str, Any]]]:
+        started = time.perf_counter()
+
+        run_oid = ObjectId(run_id)
+        reads = await self._read_database(run_oid)
+        with operation_timeout(COLLECTIONS["canonical_entities"], "count_documents"):
+            total = await self.db[COLLECTIONS["canonical_entities"]].count_documents({"run_id": run_oid})
+        if progress:
+            await progress("exporting", 0, total)
+
+        buffer = ZipStreamBuffer()
+        compresslevel = options.level if options.format == "json" else None
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zip_file:
+            entity_counts = {entity_type: 0 for entity_type in ENTITY_TYPES}
+            if options.columnar:
+                entity_fields = await self._entity_fields(run_oid)
+                for entity_type in ENTITY_TYPES:
+                    # Members are already compressed by their format
+                    info = zipfile.ZipInfo(options.member_name(entity_type), datetime.now().timetuple()[:6])
+                    with zip_file.open(info, "w", force_zip64=True) as member:
+                        writer = open_entity_writer(options, member, entity_fields.get(entity_type, []), dumps)
+                        async for batch in self.iter_entities(run_id, entity_type, reads):
+                            writer.write_batch(batch)
+                            entity_counts[entity_type] += len(batch)
+                            if progress:
+                                await progress("exporting", len(batch), total)
+                            yield buffer.drain()
+                        writer.close()
+                    yield buffer.drain()
+            else:
+                with zip_file.open("entities.json", "w", force_zip64=True) as member:
+                    member.write(b"{")
+                    for position, entity_type in enumerate(ENTITY_TYPES):
+                        if position:
+                            member.write(b",")
+                        member.write(dumps(entity_type) + b": [")
+                        async for batch in self.iter_entities(run_id, entity_type, reads):
+                            if entity_counts[entity_type]:
+                                member.write(b",")
+                            # One call per batch; drop the list brackets to continue the array
+                            member.write(dumps(batch)[1:-1])
+                            entity_counts[entity_type] += len(batch)
+                            if progress:
+                                await progress("exporting", len(batch), total)
+                            yield buffer.drain()
+                        member.write(b"]")
+                    member.write(b"}")
+
+            validation = await self.export_validation_report(run_id)
+            with zip_file.open("validation_report.json", "w", force_zip64=True) as member:
+                if "_id" not in validation:
+                    member.write(dumps(validation, pretty=not options.compact))
+                else:
+                    # The result's summary followed by every stored error
+                    member.write(dumps(validation)[:-1] + b', "errors": [')
+                    first = True
+                    async for batch in iter_batches(
+                        reads[COLLECTIONS["validation_errors"]].find(
+                            {"validation_result_id": ObjectId(validation["_id"])},
+                            {"_id": 0, "run_id": 0, "validation_result_id": 0},
+                        ).sort("_id", 1),
+                        settings.EXPORT_BATCH_SIZE,
+                    ):
+                        if not first:
+                            member.write(b",")
+                        member.write(dumps(batch)[1:-1])
+                        first = False
+                        yield buffer.drain()
+                    member.write(b"]}")
+            yield buffer.drain()
+
+            with zip_file.open("metadata.json", "w", force_zip64=True) as member:
+                run = await self.db[COLLECTIONS["runs"]].find_one({"_id": run_oid})
+                member.write(b'{"run": ' + dumps(run) + b', "audit_logs": [')
+                first = True
+                async for batch in iter_batches(
+                    reads[COLLECTIONS["audit_logs"]].find({"run_id": run_oid}).sort("timestamp", 1),
+                    settings.EXPORT_BATCH_SIZE,
+                ):
+                    if not first:
+                        member.write(b",")
+                    member.write(dumps(batch)[1:-1])
+                    first = False
+                    yield buffer.drain()
+                member.write(b"]}")
+
+            manifest = self._generate_manifest(run_id, entity_counts, validation, options)
+            zip_file.writestr("manifest.json", dumps(manifest, pretty=not options.compact))
+
+        # Closing the archive writes the central directory
+        yield buffer.drain()
+        # Includes time the consumer took to take the chunks
+        record_stage("export", time.perf_counter() - started, sum(entity_counts.values()))
+
+    async def iter_entities(
+        self,
+        run_id: str,
+        entity_type: str,
+        database: Optional[AsyncIOMotorDatabase] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
         """
-        Export canonical entities organized by type.
-        
+        Iterate a run's canonical entities of one type in batches.
+
         Args:
             run_id: The run ID
-            
-        Returns:
-            Dict mapping entity types to lists of entities
+            entity_type: Entity type to export
+            database: Database to read from (default: the main connection)
+
+        Yields:
+            Lists of at most EXPORT_BATCH_SIZE entity documents
         """
-        if not self.db:
+        if self.db is None:
             await self.initialize()
-        
-        # Query all entities for the run
-        entities = await self.db[COLLECTIONS["canonical_entities"]].find(
-            {"run_id": ObjectId(run_id)}
-        ).to_list(length=None)
-        
-        # Organize by entity type
-        organized = {
-            "Block": [],
-            "Slide": [],
-            "ROI": [],
-            "Library": [],
-            "Run": []
-        }
-        
-        for entity in entities:
-            entity_type = entity.get("entity_type")
-            if entity_type in organized:
-                # Convert ObjectId to string for JSON serialization
-                entity["_id"] = str(entity["_id"])
-                entity["run_id"] = str(entity["run_id"])
-                organized[entity_type].append(entity)
-        
-        return organized
-    
+
+        database = self.db if database is None else database
+        cursor = database[COLLECTIONS["canonical_entities"]].find(
+            {"run_id": ObjectId(run_id), "entity_type": entity_type}
+        )
+        async for batch in iter_batches(cursor, settings.EXPORT_BATCH_SIZE):
+            yield batch
+
+    async def _entity_fields(self, run_oid: ObjectId) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Collect the template fields of each entity type in a run.
+
+        Columnar files need one schema per entity type up front; it is the
+        union of the fields of every template the run's files were
+        uploaded with, in template order. A field that templates give
+        different types is exported as a string column.
+
+        Args:
+            run_oid: The run ObjectId
+
+        Returns:
+            Dict mapping entity type to field definitions
+        """
+        fields: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        with operation_timeout(COLLECTIONS["uploaded_files"], "distinct"):
+            template_ids = await self.db[COLLECTIONS["uploaded_files"]].distinct(
+                "schema_template_id", {"run_id": run_oid}
+            )
+        for template_id in sorted(template_ids):
+            template = load_template(template_id)
+            if not template or template.get("entity_type") not in ENTITY_TYPES:
+                continue
+            entity_fields = fields.setdefault(template["entity_type"], {})
+            for field in template.get("fields", []):
+                merged = entity_fields.setdefault(field["name"], field)
+                if merged.get("type", "string") != field.get("type", "string"):
+                    # Template data is shared, so replace rather than edit it
+                    entity_fields[field["name"]] = {**merged, "type": "string"}
+        return {entity_type: list(by_name.values()) for entity_type, by_name in fields.items()}
+
     async def export_validation_report(self, run_id: str) -> Dict[str, Any]:
         """
         Export validation report for a run.
-        
+
         Args:
             run_id: The run ID
-            
+
         Returns:
-            Dict containing validation report
+            Dict containing the run's current validation result summary
+            (not a later sample result); the errors themselves are in
+            validation_errors
         """
-        if not self.db:
+        if self.db is None:
             await self.initialize()
-        
-        # Load validation results
-        validation = await self.db[COLLECTIONS["validation_results"]].find_one(
-            {"run_id": ObjectId(run_id)}
-        )
-        
+
+        # Load the result the run points to, which ExportCache keys on too
+        run = await self.db[COLLECTIONS["runs"]].find_one({"_id": ObjectId(run_id)}, {"validation_result_id": 1})
+        validation = None
+        if run and run.get("validation_result_id"):
+            validation = await self.db[COLLECTIONS["validation_results"]].find_one(
+                {"_id": run["validation_result_id"]}
+            )
+
         if not validation:
             return {
                 "status": "no_validation",
                 "message": "No validation results found for this run"
             }
-        
+
         # Convert ObjectIds to strings
         validation["_id"] = str(validation["_id"])
         validation["run_id"] = str(validation["run_id"])
-        
+
         return validation
-    
-    async def export_metadata(self, run_id: str) -> Dict[str, Any]:
-        """
-        Export run metadata and audit trail.
-        
-        Args:
-            run_id: The run ID
-            
-        Returns:
-            Dict containing metadata
-        """
-        if not self.db:
-            await self.initialize()
-        
-        # Load run
-        run = await self.db[COLLECTIONS["runs"]].find_one({"_id": ObjectId(run_id)})
-        
-        if not run:
-            return {"error": "Run not found"}
-        
-        # Load audit logs
-        audit_logs = await self.db[COLLECTIONS["audit_logs"]].find(
-            {"run_id": ObjectId(run_id)}
-        ).to_list(length=None)
-        
-        # Convert ObjectIds to strings
-        run["_id"] = str(run["_id"])
-        if run.get("mapping_id"):
-            run["mapping_id"] = str(run["mapping_id"])
-        if run.get("validation_result_id"):
-            run["validation_result_id"] = str(run["validation_result_id"])
-        run["files"] = [str(f) for f in run.get("files", [])]
-        
-        for log in audit_logs:
-            log["_id"] = str(log["_id"])
-            log["run_id"] = str(log["run_id"])
-        
-        return {
-            "run": run,
-            "audit_logs": audit_logs
-        }
-    
-    def _generate_manifest(self, run_id: str, entities: Dict, validation: Dict, metadata: Dict) -> Dict[str, Any]:
+
+    def _generate_manifest(
+        self,
+        run_id: str,
+        entity_counts: Dict[str, int],
+        validation: Dict,
+        options: ExportOptions
+    ) -> Dict[str, Any]:
         """
         Generate export manifest.
-        
+
         Args:
             run_id: The run ID
-            entities: Exported entities
+            entity_counts: Number of exported entities per type
             validation: Validation report
-            metadata: Run metadata
-            
+            options: Format the entities were written in
+
         Returns:
             Dict containing manifest information
         """
-        entity_counts = {k: len(v) for k, v in entities.items()}
-        
         return {
             "run_id": run_id,
             "export_date": datetime.utcnow().isoformat(),
             "version": "1.0.0",
             "entity_counts": entity_counts,
             "validation_status": validation.get("status"),
+            "entities": options.describe(),
             "files": [
                 "manifest.json",
-                "entities.json",
+                *dict.fromkeys(options.member_name(entity_type) for entity_type in ENTITY_TYPES),
                 "validation_report.json",
                 "metadata.json"
             ]
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,210 @@
+"""
+On-disk cache of built export bundles.
+
+Bundles are stored under UPLOAD_DIR/export_cache/<run_id>/<key>.<build>.zip,
+where the key is a hash of everything the bundle's content depends on: the
+run ID, the run's entity revision (bumped on every harmonization), its
+validation result ID and the export format, codec and level. A repeat
+export of an unchanged run is then served straight from the file.
+
+Two builds of the same key hold the same data but not the same bytes (the
+manifest's export date and the ZIP timestamps differ), so each committed
+build gets its own ID and the ETag names the build (see etag()). A client
+resuming a download with If-Range therefore never gets bytes spliced from
+two builds, and a committed file is never replaced, only evicted.
+
+The cache is bounded by EXPORT_CACHE_MAX_BYTES. Entries are evicted least
+recently used first, using file mtimes (refreshed on every hit) so the
+order is shared by all API processes.
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+
+import aiofiles
+import aiofiles.os
+from bson import ObjectId
+
+from app.core.config import settings
+from app.services.export_formats import ExportOptions
+
+
+class ExportCache:
+    """
+    Content-addressed store of export bundles with LRU eviction.
+    """
+
+    def __init__(self, root: Optional[Path] = None, max_bytes: Optional[int] = None):
+        self.root = root or Path(settings.UPLOAD_DIR) / "export_cache"
+        self.max_bytes = settings.EXPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        """Whether bundles are cached at all (EXPORT_CACHE_MAX_BYTES > 0)."""
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(run: Dict[str, Any], options: ExportOptions) -> str:
+        """
+        Compute the cache key of a run's bundle in a given format.
+
+        Args:
+            run: The run document
+            options: Export format, codec and level
+
+        Returns:
+            str: Hex SHA-256 of the key components
+        """
+        components = {
+            "run_id": str(run["_id"]),
+            "entity_revision": run.get("entity_revision", 0),
+            "validation_result_id": str(run.get("validation_result_id") or ""),
+            **options.describe(),
+        }
+        return hashlib.sha256(json.dumps(components, sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def etag(path: Path) -> str:
+        """
+        Get the strong ETag of a cached bundle.
+
+        Args:
+            path: A bundle returned by lookup()
+
+        Returns:
+            str: The quoted key and build ID, unique to the file's bytes
+        """
+        return f'"{path.name[:-len(".zip")]}"'
+
+    def run_dir(self, run_id: str) -> Path:
+        """
+        Get the directory holding a run's cached bundles.
+
+        Args:
+            run_id: The run ID
+
+        Returns:
+            Path: The directory (which may not exist)
+        """
+        return self.root / str(ObjectId(run_id))
+
+    async def lookup(self, run_id: str, key: str) -> Optional[Path]:
+        """
+        Find a cached bundle and mark it as recently used.
+
+        If concurrent builds committed more than one copy, the oldest is
+        served, so every process hands out the same ETag.
+
+        Args:
+            run_id: The run ID
+            key: The cache key
+
+        Returns:
+            Path of the cached bundle, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self._touch_oldest, run_id, key)
+
+    def _touch_oldest(self, run_id: str, key: str) -> Optional[Path]:
+        for path in sorted(self.run_dir(run_id).glob(f"{key}.*.zip")):
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted since the listing
+                continue
+            return path
+        return None
+
+    async def store(
+        self,
+        run_id: str,
+        key: str,
+        chunks: AsyncIterator[bytes],
+        commit: Callable[[], Awaitable[bool]]
+    ) -> AsyncIterator[bytes]:
+        """
+        Pass a bundle stream through while writing it to the cache.
+
+        The entry only becomes visible once the stream is complete and
+        ``commit`` confirms the run has not changed while the bundle was
+        being built; an interrupted or stale build leaves nothing behind,
+        and neither does one that finds another build of the key already
+        committed.
+
+        Args:
+            run_id: The run ID
+            key: The cache key
+            chunks: The bundle being built
+            commit: Called after the last chunk; return False to discard
+
+        Yields:
+            bytes: The chunks from ``chunks``, unchanged
+        """
+        if not self.enabled:
+            async for chunk in chunks:
+                yield chunk
+            return
+
+        run_dir = self.run_dir(run_id)
+        await aiofiles.os.makedirs(run_dir, exist_ok=True)
+        # ObjectIds sort by creation, so lookup() prefers the oldest build
+        path = run_dir / f"{key}.{ObjectId()}.zip"
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        completed = False
+        try:
+            async with aiofiles.open(tmp_path, "wb") as out:
+                async for chunk in chunks:
+                    await out.write(chunk)
+                    yield chunk
+            completed = await commit() and await self.lookup(run_id, key) is None
+            if completed:
+                await aiofiles.os.rename(tmp_path, path)
+        finally:
+            if not completed:
+                try:
+                    await aiofiles.os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+        await asyncio.to_thread(self.evict)
+
+    async def invalidate(self, run_id: str) -> None:
+        """
+        Drop every cached bundle of a run.
+
+        Args:
+            run_id: The run ID
+        """
+        await asyncio.to_thread(shutil.rmtree, self.run_dir(run_id), ignore_errors=True)
+
+    def evict(self) -> int:
+        """
+        Delete least recently used bundles until the cache fits its budget.
+
+        Returns:
+            int: Number of bytes freed
+        """
+        entries = []
+        for path in self.root.glob("*/*.zip"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in sorted(entries):
+            if total - freed <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                # Another process evicted it first
+                pass
+            freed += size
+        return freed
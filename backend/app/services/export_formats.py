@@ -0,0 +1,338 @@
+"""
+Entity serialization formats for export bundles.
+
+Besides the default ``entities.json``, entities can be exported as one
+file per entity type in a columnar format (Parquet or Arrow IPC) or as
+compressed newline-delimited JSON. Columnar files let downstream loaders
+read only the columns they need.
+
+pyarrow (Parquet, Arrow IPC) and zstandard (zstd-compressed NDJSON) are
+optional dependencies; requesting a format whose package is missing
+raises ExportFormatError before any output is produced.
+"""
+from abc import ABC, abstractmethod
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+import importlib.util
+import zlib
+
+from bson import ObjectId
+
+
+EXPORT_FORMATS = ("json", "ndjson", "parquet", "arrow")
+
+# Supported codecs per format; the first is the default
+FORMAT_CODECS: Dict[str, Tuple[str, ...]] = {
+    "json": ("deflate",),
+    "ndjson": ("gzip", "zstd", "none"),
+    "parquet": ("zstd", "gzip", "snappy", "none"),
+    "arrow": ("zstd", "lz4", "none"),
+}
+
+# Valid compression levels per codec; codecs not listed take no level
+CODEC_LEVELS: Dict[str, Tuple[int, int]] = {
+    "deflate": (0, 9),
+    "gzip": (1, 9),
+    "zstd": (1, 22),
+}
+
+FORMAT_EXTENSIONS = {"ndjson": "ndjson", "parquet": "parquet", "arrow": "arrow"}
+CODEC_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+# Rows buffered (as Arrow record batches) before a Parquet row group is written
+ROW_GROUP_SIZE = 65536
+
+# Columns written ahead of the template fields in columnar exports
+META_COLUMNS = (("_id", "string"), ("parent_id", "string"), ("file_id", "string"), ("row_index", "integer"))
+
+
+class ExportFormatError(Exception):
+    """
+    Raised when an export format, codec or level is invalid or its
+    optional dependency is not installed.
+    """
+    pass
+
+
+def _require(module: str, purpose: str) -> None:
+    """Fail early when an optional dependency is missing."""
+    if importlib.util.find_spec(module) is None:
+        raise ExportFormatError(f"{purpose} requires the '{module}' package, which is not installed")
+
+
+class ExportOptions:
+    """
+    Validated export format, compression codec and level.
+
+    ``compact`` writes the bundle's JSON files (manifest, validation report)
+    without indentation, for machine consumers.
+    """
+
+    def __init__(
+        self,
+        format: str = "json",
+        codec: Optional[str] = None,
+        level: Optional[int] = None,
+        compact: bool = False
+    ):
+        if format not in EXPORT_FORMATS:
+            raise ExportFormatError(f"Unknown export format '{format}'; expected one of {', '.join(EXPORT_FORMATS)}")
+        codecs = FORMAT_CODECS[format]
+        codec = codec or codecs[0]
+        if codec not in codecs:
+            raise ExportFormatError(f"Codec '{codec}' is not supported for {format}; expected one of {', '.join(codecs)}")
+        if level is not None:
+            if codec not in CODEC_LEVELS:
+                raise ExportFormatError(f"Codec '{codec}' does not take a compression level")
+            low, high = CODEC_LEVELS[codec]
+            if not low <= level <= high:
+                raise ExportFormatError(f"Level for {codec} must be between {low} and {high}")
+
+        if format in ("parquet", "arrow"):
+            _require("pyarrow", f"{format.capitalize()} export")
+        elif format == "ndjson" and codec == "zstd":
+            _require("zstandard", "zstd-compressed NDJSON export")
+
+        self.format = format
+        self.codec = codec
+        self.level = level
+        self.compact = compact
+
+    @property
+    def columnar(self) -> bool:
+        """Whether entities are written as one file per entity type."""
+        return self.format != "json"
+
+    def member_name(self, entity_type: str) -> str:
+        """
+        Get the bundle path of an entity type's file.
+
+        Args:
+            entity_type: The entity type
+
+        Returns:
+            str: Path inside the ZIP, e.g. "entities/Block.ndjson.zst"
+        """
+        if not self.columnar:
+            return "entities.json"
+        name = f"entities/{entity_type}.{FORMAT_EXTENSIONS[self.format]}"
+        if self.format == "ndjson":
+            name += CODEC_EXTENSIONS.get(self.codec, "")
+        return name
+
+    def describe(self) -> Dict[str, Any]:
+        """Format, codec, level and compactness as recorded in the manifest."""
+        return {"format": self.format, "codec": self.codec, "level": self.level, "compact": self.compact}
+
+
+class EntityWriter(ABC):
+    """
+    Incrementally writes one entity type's documents to a binary sink.
+    """
+
+    def __init__(self, sink: BinaryIO):
+        self.sink = sink
+
+    @abstractmethod
+    def write_batch(self, docs: List[Dict[str, Any]]) -> None:
+        """
+        Append a batch of canonical entity documents.
+
+        Args:
+            docs: Entity documents from MongoDB
+        """
+
+    def close(self) -> None:
+        """Write any buffered data and trailers."""
+        pass
+
+
+class NdjsonWriter(EntityWriter):
+    """
+    One JSON document per line, optionally gzip- or zstd-compressed.
+    """
+
+    def __init__(self, sink: BinaryIO, codec: str, level: Optional[int], dumps):
+        super().__init__(sink)
+        self.dumps = dumps
+        self._compressor = None
+        if codec == "gzip":
+            # wbits=31 produces a gzip container rather than a raw zlib stream
+            self._compressor = zlib.compressobj(level if level is not None else 6, zlib.DEFLATED, 31)
+        elif codec == "zstd":
+            import zstandard
+            self._compressor = zstandard.ZstdCompressor(level=level if level is not None else 3).compressobj()
+
+    def write_batch(self, docs: List[Dict[str, Any]]) -> None:
+        data = b"".join(self.dumps(doc) + b"\n" for doc in docs)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        if data:
+            self.sink.write(data)
+
+    def close(self) -> None:
+        if self._compressor is not None:
+            self.sink.write(self._compressor.flush())
+
+
+class _PositionTrackingSink:
+    """
+    Wraps an unseekable sink (e.g. a ZIP member) so Arrow writers can ask
+    for the current offset, which Parquet needs for its footer.
+    """
+
+    def __init__(self, sink: BinaryIO):
+        self.sink = sink
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.sink.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def readable(self) -> bool:
+        return False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def arrow_schema(fields: List[Dict[str, Any]]):
+    """
+    Build the Arrow schema for an entity type.
+
+    Args:
+        fields: Template field definitions (name and type) for the entity type
+
+    Returns:
+        pyarrow.Schema: Meta columns followed by the template fields
+    """
+    import pyarrow as pa
+
+    types = {
+        "string": pa.string(),
+        "integer": pa.int64(),
+        "float": pa.float64(),
+        "number": pa.float64(),
+        "boolean": pa.bool_(),
+        "date": pa.timestamp("ms"),
+    }
+    columns = [(name, field_type) for name, field_type in META_COLUMNS]
+    columns += [(field["name"], field.get("type", "string")) for field in fields]
+    return pa.schema([(name, types.get(field_type, pa.string())) for name, field_type in columns])
+
+
+def _column_value(doc: Dict[str, Any], name: str) -> Any:
+    """Read a column from an entity document, stringifying ObjectIds."""
+    if name in ("_id", "parent_id", "file_id", "row_index"):
+        value = doc.get(name)
+    else:
+        value = (doc.get("data") or {}).get(name)
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+class ArrowWriter(EntityWriter):
+    """
+    Parquet or Arrow IPC file with a fixed per-entity-type schema.
+
+    Each incoming batch is converted to an Arrow record batch straight
+    away; Parquet row groups are written once ROW_GROUP_SIZE rows have
+    accumulated, so memory stays bounded while row groups stay large
+    enough for efficient column scans.
+    """
+
+    def __init__(self, sink: BinaryIO, format: str, codec: str, level: Optional[int], fields: List[Dict[str, Any]]):
+        import pyarrow as pa
+
+        super().__init__(sink)
+        self.schema = arrow_schema(fields)
+        self.format = format
+        self._pending: List[Any] = []
+        self._pending_rows = 0
+        target = _PositionTrackingSink(sink)
+        compression = None if codec == "none" else codec
+        if format == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(
+                target, self.schema, compression=compression or "none", compression_level=level
+            )
+        else:
+            options = pa.ipc.IpcWriteOptions(
+                compression=pa.Codec(compression, compression_level=level) if compression else None
+            )
+            self._writer = pa.ipc.new_file(target, self.schema, options=options)
+
+    def _record_batch(self, docs: List[Dict[str, Any]]):
+        """Convert entity documents into a record batch matching the schema."""
+        import pyarrow as pa
+
+        arrays = []
+        for field in self.schema:
+            values = [_column_value(doc, field.name) for doc in docs]
+            if pa.types.is_string(field.type):
+                values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def write_batch(self, docs: List[Dict[str, Any]]) -> None:
+        batch = self._record_batch(docs)
+        if self.format == "arrow":
+            self._writer.write_batch(batch)
+            return
+        self._pending.append(batch)
+        self._pending_rows += batch.num_rows
+        if self._pending_rows >= ROW_GROUP_SIZE:
+            self._flush_row_group()
+
+    def _flush_row_group(self) -> None:
+        import pyarrow as pa
+
+        if self._pending:
+            table = pa.Table.from_batches(self._pending, schema=self.schema)
+            self._writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        self._pending = []
+        self._pending_rows = 0
+
+    def close(self) -> None:
+        if self.format == "parquet":
+            self._flush_row_group()
+        self._writer.close()
+
+
+def open_entity_writer(
+    options: ExportOptions,
+    sink: BinaryIO,
+    fields: List[Dict[str, Any]],
+    dumps
+) -> EntityWriter:
+    """
+    Create the writer for one entity type's export file.
+
+    Args:
+        options: Export format, codec and level
+        sink: Binary stream to write to (the ZIP member)
+        fields: Template field definitions for the entity type
+        dumps: Function serializing a document to JSON bytes
+
+    Returns:
+        EntityWriter: Writer for the requested format
+    """
+    if options.format == "ndjson":
+        return NdjsonWriter(sink, options.codec, options.level, dumps)
+    if options.format in ("parquet", "arrow"):
+        return ArrowWriter(sink, options.format, options.codec, options.level, fields)
+    raise ExportFormatError(f"Format '{options.format}' is not written per entity type")
@@ -2,133 +2,588 @@
 Harmonization service for processing and transforming uploaded data
 into canonical entity format.
 """
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Awaitable, Callable, Iterator, Optional, Tuple, Union
+from datetime import datetime
+import asyncio
+import os
+import time
+
+import numpy as np
 from bson import ObjectId
+from pymongo import ReturnDocument
 
+from app.core.hierarchy import ENTITY_TYPES, ENTITY_KEYS, PARENT_TYPES, parent_key
+from app.core.metrics import record_stage, stage_timer
+from app.core.profiling import active_profiler, profiled_call
+from app.db.bulk import BulkWriter
 from app.db.database import get_database, COLLECTIONS
+from app.schemas.loader import load_template
+from app.services.columnar import ColumnTable, harmonize_table, lookup_keys, read_csv_columns, row_hashes
+from app.services.export_cache import ExportCache
+from app.services.mappings import CompiledMapping, compile_mapping, compiled_mapping
+from app.services.relationships import RelationshipIndex, index_path
+from app.services.scheduler import TaskGraph, run_in_process
+from app.services.storage import open_uploaded_file
+
+
+# Progress callback: (stage, rows processed since last call, rows total)
+ProgressCallback = Callable[[str, int, Optional[int]], Awaitable[None]]
+
+
+def normalise_file(
+    file_doc: Dict[str, Any],
+    template: Dict[str, Any],
+    mapping: Union[CompiledMapping, Dict[str, str], None] = None
+) -> ColumnTable:
+    """
+    Parse an uploaded file and map it onto its schema template.
+
+    This is a plain synchronous function so it can run in a worker thread
+    or process without touching the event loop or the database.
+
+    Args:
+        file_doc: The uploaded_files document
+        template: The file's schema template
+        mapping: Column mapping ({"canonical_field": "csv_column"}), or
+            its compiled form for the file's header
+
+    Returns:
+        ColumnTable: Canonical columns with row content hashes and
+        parse/harmonize timings in ``stats``
+    """
+    started = time.perf_counter()
+    compiled = mapping if isinstance(mapping, CompiledMapping) else None
+    if compiled is None and file_doc.get("columns"):
+        compiled = compile_mapping(template, mapping, file_doc["columns"])
+    with open_uploaded_file(file_doc) as stream:
+        # Only the template's source columns are materialised
+        raw = read_csv_columns(
+            stream,
+            delimiter=file_doc.get("delimiter", ","),
+            usecols=compiled.source_indices if compiled else None,
+        )
+    parse_seconds = time.perf_counter() - started
+
+    table = harmonize_table(raw, template, compiled.renames if compiled else mapping)
+    table.hashes = row_hashes(table)
+    elapsed = time.perf_counter() - started
+    table.stats.update({
+        "file_id": str(file_doc["_id"]),
+        "entity_type": template.get("entity_type"),
+        "parse_seconds": parse_seconds,
+        "harmonize_seconds": table.stats["seconds"],
+        "seconds": elapsed,
+        "rows_per_sec": table.num_rows / elapsed if elapsed > 0 else float(table.num_rows),
+    })
+    return table
+
+
+def new_object_ids(count: int) -> np.ndarray:
+    """
+    Generate ObjectIds for a whole table at once.
+
+    The IDs have the layout of ObjectId() (4-byte timestamp, 5 random
+    bytes, 3-byte counter), but are assembled as one byte array instead of
+    one ObjectId() call, lock and counter increment per row. Each block of
+    up to 2**24 IDs draws its own random bytes and counts from zero.
+
+    Args:
+        count: Number of IDs
+
+    Returns:
+        np.ndarray: Object array of distinct, ascending ObjectIds
+    """
+    ids = np.empty(count, dtype=object)
+    timestamp = int(time.time()).to_bytes(4, "big")
+    block = 1 << 24
+    for start in range(0, count, block):
+        n = min(block, count - start)
+        raw = np.empty((n, 12), dtype=np.uint8)
+        raw[:, :9] = np.frombuffer(timestamp + os.urandom(5), dtype=np.uint8)
+        raw[:, 9:] = np.arange(n, dtype=">u4").view(np.uint8).reshape(n, 4)[:, 1:]
+        data = raw.tobytes()
+        ids[start:start + n] = [ObjectId(data[i:i + 12]) for i in range(0, n * 12, 12)]
+    return ids
+
+
+def link_to_parents(child: ColumnTable, child_type: str, parents: List[ColumnTable]) -> np.ndarray:
+    """
+    Resolve each child row's parent entity ID by natural key.
+
+    Args:
+        child: Harmonized child table
+        child_type: The child entity type
+        parents: Harmonized tables of the parent entity type, each with
+            ``ids`` assigned
+
+    Returns:
+        np.ndarray: Object array of parent ObjectIds, None where the parent
+        key is missing or does not match any parent
+    """
+    key_field = parent_key(child_type)
+    if key_field is None or key_field not in child.columns or not parents:
+        return np.full(child.num_rows, None, dtype=object)
+
+    parent_type = PARENT_TYPES[child_type]
+    parent_keys = np.concatenate([p.column(ENTITY_KEYS[parent_type]) for p in parents])
+    parent_ids = np.concatenate([p.ids for p in parents])
+
+    positions = lookup_keys(child.column(key_field), parent_keys)
+    found = (positions >= 0) & ~child.null_mask(key_field)
+    linked = np.full(child.num_rows, None, dtype=object)
+    linked[found] = parent_ids[positions[found]]
+    return linked
+
+
+def iter_entity_documents(run_id: ObjectId, entity_type: str, table: ColumnTable) -> Iterator[Dict[str, Any]]:
+    """
+    Build canonical_entities documents from a harmonized table.
+
+    Args:
+        run_id: The run ID
+        entity_type: Entity type of the table
+        table: Harmonized table with ``ids`` and ``parent_ids`` assigned
+
+    Yields:
+        Dict: One canonical_entities document per row. Rows with values
+        that could not be coerced to their field type also get an
+        ``invalid`` dict of field name to source text.
+    """
+    file_id = ObjectId(table.stats["file_id"])
+    ids = table.ids.tolist()
+    parent_ids = table.parent_ids.tolist()
+    row_index = table.row_index.tolist()
+    hashes = table.hashes.tolist() if table.hashes is not None else [None] * table.num_rows
+
+    invalid: Dict[int, Dict[str, str]] = {}
+    for name, raw in table.invalid.items():
+        for position in np.flatnonzero(raw != "").tolist():
+            invalid.setdefault(position, {})[name] = str(raw[position])
+
+    for i, data in enumerate(table.iter_records()):
+        doc = {
+            "_id": ids[i],
+            "run_id": run_id,
+            "entity_type": entity_type,
+            "file_id": file_id,
+            "row_index": row_index[i],
+            "parent_id": parent_ids[i],
+            "content_hash": hashes[i],
+            "data": data,
+        }
+        if i in invalid:
+            doc["invalid"] = invalid[i]
+        yield doc
 
 
 class HarmonizationService:
     """
     Service for harmonizing uploaded data into canonical entities.
-    
+
     The harmonization process follows the entity hierarchy:
     Block -> Slide -> ROI/FOV -> Library -> Run
+
+    Each file is parsed into column arrays and mapped onto its schema
+    template with whole-column operations (see app.services.columnar).
+    Files are parsed concurrently in a process pool; only the linking
+    steps follow the hierarchy (see app.services.scheduler).
     """
-    
+
     def __init__(self):
         self.db = None
-    
+
     async def initialize(self):
         """Initialize database connection."""
         self.db = get_database()
-    
-    async def harmonize_run(self, run_id: str) -> Dict[str, Any]:
+
+    async def harmonize_run(self, run_id: str, progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
         """
         Harmonize all files in a run.
-        
+
         Args:
             run_id: The run ID to harmonize
-            
+            progress: Optional callback receiving (stage, rows, total) as
+                entities are stored
+
         Returns:
-            Dict containing harmonization results and statistics
+            Dict containing harmonization results and statistics, including
+            the run's RelationshipIndex under ``relationship_index`` so the
+            caller can validate without rebuilding it
         """
-        if not self.db:
+        if self.db is None:
             await self.initialize()
-        
-        # TODO: Implement harmonization logic
-        # 1. Load run and associated files
-        # 2. Load mapping configuration
-        # 3. Process files in order: Blocks -> Slides -> ROI -> Library -> Run
-        # 4. Create canonical entities
-        # 5. Validate relationships
-        # 6. Store in canonical_entities collection
-        # 7. Update run status
-        
-        return {
-            "status": "not_implemented",
-            "message": "Harmonization logic to be implemented"
-        }
-    
-    async def process_blocks(self, file_id: str, mapping: Dict[str, str]) -> List[Dict[str, Any]]:
+
+        run_oid = ObjectId(run_id)
+        run = await self.db[COLLECTIONS["runs"]].find_one({"_id": run_oid})
+        if not run:
+            raise ValueError(f"Run '{run_id}' not found")
+
+        # Entities are about to change: bump the revision so cached exports
+        # and relationship indexes of the previous entities are never used again
+        run = await self.db[COLLECTIONS["runs"]].find_one_and_update(
+            {"_id": run_oid},
+            {"$set": {"status": "harmonizing"}, "$inc": {"entity_revision": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        started = time.perf_counter()
+        try:
+            await ExportCache().invalidate(run_id)
+            files = await self.db[COLLECTIONS["uploaded_files"]].find(
+                {"run_id": run_oid}
+            ).to_list(length=None)
+            mappings = await self._load_mappings(run, files)
+            total_rows = sum(f.get("row_count", 0) for f in files)
+            if progress:
+                await progress("harmonizing", 0, total_rows)
+            graph = self._build_graph(run_oid, files, mappings, progress)
+            results = await graph.run()
+            tables = {t: results[f"link:{t}"][0] for t in ENTITY_TYPES}
+            orphan_counts = {t: results[f"link:{t}"][1] for t in ENTITY_TYPES if t in PARENT_TYPES}
+            entity_counts = {t: results[f"store:{t}"]["count"] for t in ENTITY_TYPES}
+
+            # Index the linked keys once; validation reuses the saved index
+            relationship_index = RelationshipIndex.from_tables(tables, run["entity_revision"])
+            relationships = await self.validate_relationships(relationship_index)
+            await asyncio.to_thread(relationship_index.save, index_path(run_id, run["entity_revision"]))
+
+            elapsed = time.perf_counter() - started
+            total_rows = sum(entity_counts.values())
+            file_stats = [t.stats for ts in tables.values() for t in ts]
+            record_stage("harmonize", elapsed, total_rows)
+            result = {
+                "status": "completed",
+                "run_id": run_id,
+                "entity_counts": entity_counts,
+                "orphan_counts": orphan_counts,
+                "relationships": relationships,
+                "relationship_index": relationship_index,
+                "throughput": {
+                    "rows": total_rows,
+                    "seconds": elapsed,
+                    "rows_per_sec": total_rows / elapsed if elapsed > 0 else float(total_rows),
+                },
+                "write_throughput": {t: results[f"store:{t}"]["write"] for t in ENTITY_TYPES},
+                "files": file_stats,
+            }
+
+            await self._set_status(run_oid, "harmonized")
+            await self.db[COLLECTIONS["audit_logs"]].insert_one({
+                "timestamp": datetime.utcnow(),
+                "user_id": run.get("user_id"),
+                "run_id": run_oid,
+                "action": "harmonization_completed",
+                "details": {
+                    "entity_counts": entity_counts,
+                    "orphan_counts": orphan_counts,
+                    "relationships": relationships,
+                    "throughput": result["throughput"],
+                },
+            })
+        except Exception:
+            # Anything that fails after the revision bump leaves the run unusable
+            await self._set_status(run_oid, "error")
+            raise
+        return result
+
+    async def _set_status(self, run_oid: ObjectId, status: str) -> None:
+        """Update the run status."""
+        await self.db[COLLECTIONS["runs"]].update_one({"_id": run_oid}, {"$set": {"status": status}})
+
+    async def _load_mappings(self, run: Dict[str, Any], files: List[Dict[str, Any]]) -> Dict[ObjectId, Dict[str, str]]:
+        """
+        Pick the column mapping that applies to each of a run's files.
+
+        A file's own mapping (saved for its header) comes first, then the
+        run mapping; either applies only to files using the same schema
+        template. Files without one are matched by column name.
+
+        Returns:
+            Dict mapping file ID to ``{"canonical_field": "csv_column"}``
+        """
+        mapping_ids = {f["mapping_id"] for f in files if f.get("mapping_id")}
+        if run.get("mapping_id"):
+            mapping_ids.add(run["mapping_id"])
+        docs = {}
+        if mapping_ids:
+            docs = {
+                doc["_id"]: doc
+                for doc in await self.db[COLLECTIONS["mappings"]].find(
+                    {"_id": {"$in": list(mapping_ids)}}
+                ).to_list(length=None)
+            }
+
+        mappings = {}
+        for file_doc in files:
+            mappings[file_doc["_id"]] = {}
+            for mapping_id in (file_doc.get("mapping_id"), run.get("mapping_id")):
+                doc = docs.get(mapping_id)
+                if doc and doc.get("schema_template_id") == file_doc["schema_template_id"]:
+                    mappings[file_doc["_id"]] = doc.get("mapping", {})
+                    break
+        return mappings
+
+    async def _process_file(self, file_id: str, mapping: Dict[str, str], entity_type: str) -> ColumnTable:
+        """
+        Parse and harmonize one uploaded file off the event loop.
+
+        Args:
+            file_id: The uploaded file ID
+            mapping: Column mapping configuration
+            entity_type: Entity type the file's template must declare
+
+        Returns:
+            ColumnTable: Harmonized entity columns
+        """
+        if self.db is None:
+            await self.initialize()
+
+        file_doc = await self.db[COLLECTIONS["uploaded_files"]].find_one({"_id": ObjectId(file_id)})
+        if not file_doc:
+            raise ValueError(f"File '{file_id}' not found")
+
+        template = load_template(file_doc["schema_template_id"])
+        if not template:
+            raise ValueError(f"Schema '{file_doc['schema_template_id']}' not found")
+        if template.get("entity_type") != entity_type:
+            raise ValueError(
+                f"File '{file_id}' uses a {template.get('entity_type')} template, expected {entity_type}"
+            )
+
+        return await run_in_process(normalise_file, file_doc, template, mapping)
+
+    async def process_blocks(self, file_id: str, mapping: Dict[str, str]) -> ColumnTable:
         """
         Process Block entities from uploaded file.
-        
+
         Args:
             file_id: The uploaded file ID
             mapping: Column mapping configuration
-            
+
         Returns:
-            List of processed Block entities
+            ColumnTable: Processed Block entities
         """
-        # TODO: Implement block processing
-        pass
-    
-    async def process_slides(self, file_id: str, mapping: Dict[str, str]) -> List[Dict[str, Any]]:
+        return await self._process_file(file_id, mapping, "Block")
+
+    async def process_slides(self, file_id: str, mapping: Dict[str, str]) -> ColumnTable:
         """
         Process Slide entities from uploaded file.
-        
+
         Args:
             file_id: The uploaded file ID
             mapping: Column mapping configuration
-            
+
         Returns:
-            List of processed Slide entities
+            ColumnTable: Processed Slide entities
         """
-        # TODO: Implement slide processing
-        pass
-    
-    async def process_roi(self, file_id: str, mapping: Dict[str, str]) -> List[Dict[str, Any]]:
+        return await self._process_file(file_id, mapping, "Slide")
+
+    async def process_roi(self, file_id: str, mapping: Dict[str, str]) -> ColumnTable:
         """
         Process ROI/FOV entities from uploaded file.
-        
+
         Args:
             file_id: The uploaded file ID
             mapping: Column mapping configuration
-            
+
         Returns:
-            List of processed ROI entities
+            ColumnTable: Processed ROI entities
         """
-        # TODO: Implement ROI processing
-        pass
-    
-    async def process_libraries(self, file_id: str, mapping: Dict[str, str]) -> List[Dict[str, Any]]:
+        return await self._process_file(file_id, mapping, "ROI")
+
+    async def process_libraries(self, file_id: str, mapping: Dict[str, str]) -> ColumnTable:
         """
         Process Library entities from uploaded file.
-        
+
         Args:
             file_id: The uploaded file ID
             mapping: Column mapping configuration
-            
+
         Returns:
-            List of processed Library entities
+            ColumnTable: Processed Library entities
         """
-        # TODO: Implement library processing
-        pass
-    
-    async def process_runs(self, file_id: str, mapping: Dict[str, str]) -> List[Dict[str, Any]]:
+        return await self._process_file(file_id, mapping, "Library")
+
+    async def process_runs(self, file_id: str, mapping: Dict[str, str]) -> ColumnTable:
         """
         Process Run entities from uploaded file.
-        
+
         Args:
             file_id: The uploaded file ID
             mapping: Column mapping configuration
-            
+
         Returns:
-            List of processed Run entities
+            ColumnTable: Processed Run entities
         """
-        # TODO: Implement run processing
-        pass
-    
-    async def validate_relationships(self, entities: List[Dict[str, Any]]) -> bool:
+        return await self._process_file(file_id, mapping, "Run")
+
+    def _build_graph(
+        self,
+        run_oid: ObjectId,
+        files: List[Dict[str, Any]],
+        mappings: Dict[ObjectId, Dict[str, str]],
+        progress: Optional[ProgressCallback] = None
+    ) -> TaskGraph:
         """
-        Validate relationships between entities.
-        
+        Lay out the harmonization DAG for a run.
+
+        Every file gets an independent ``parse:<file_id>`` task that runs in
+        the process pool. ``link:<type>`` waits for its own files and for the
+        parent type's link step; ``store:<type>`` writes the linked entities
+        as soon as that type is linked.
+
         Args:
-            entities: List of entities to validate
-            
+            run_oid: The run ID
+            files: The run's uploaded_files documents
+            mappings: Column mapping of each file, by file ID
+            progress: Optional progress callback for stored rows
+
+        Returns:
+            TaskGraph: The pipeline, ready to run
+        """
+        graph = TaskGraph()
+
+        async def clear(_: Dict[str, Any]) -> None:
+            await self.db[COLLECTIONS["canonical_entities"]].delete_many({"run_id": run_oid})
+
+        graph.add("clear", clear)
+
+        parse_tasks: Dict[str, List[str]] = {t: [] for t in ENTITY_TYPES}
+        for file_doc in files:
+            template = load_template(file_doc["schema_template_id"]) or {}
+            entity_type = template.get("entity_type")
+            if entity_type not in parse_tasks:
+                continue
+            name = f"parse:{file_doc['_id']}"
+            mapping = mappings.get(file_doc["_id"], {})
+            compiled = compiled_mapping(file_doc["schema_template_id"], mapping, file_doc.get("columns"))
+            graph.add(name, self._parse_task(file_doc, template, compiled or mapping))
+            parse_tasks[entity_type].append(name)
+
+        for entity_type in ENTITY_TYPES:
+            parent_type = PARENT_TYPES.get(entity_type)
+            deps = parse_tasks[entity_type] + ([f"link:{parent_type}"] if parent_type else [])
+            graph.add(f"link:{entity_type}", self._link_task(entity_type), deps)
+            graph.add(
+                f"store:{entity_type}",
+                self._store_task(run_oid, entity_type, progress),
+                [f"link:{entity_type}", "clear"]
+            )
+        return graph
+
+    def _parse_task(
+        self,
+        file_doc: Dict[str, Any],
+        template: Dict[str, Any],
+        mapping: Union[CompiledMapping, Dict[str, str]]
+    ) -> Callable[[Dict[str, Any]], Awaitable[ColumnTable]]:
+        """Build the DAG task that parses and normalises one file."""
+        async def parse(_: Dict[str, Any]) -> ColumnTable:
+            profiler = active_profiler()
+            if profiler is None:
+                table = await run_in_process(normalise_file, file_doc, template, mapping)
+            else:
+                # The pool process samples itself; its stacks join this profile
+                table, stacks = await run_in_process(
+                    profiled_call, profiler.interval, normalise_file, file_doc, template, mapping
+                )
+                profiler.merge(stacks, "process-pool")
+            # Timed in the pool process; recorded here, where the metrics are served
+            record_stage("parse", table.stats["parse_seconds"], table.num_rows)
+            record_stage("map", table.stats["harmonize_seconds"], table.num_rows)
+            return table
+        return parse
+
+    def _link_task(self, entity_type: str) -> Callable[[Dict[str, Any]], Awaitable[Tuple[List[ColumnTable], int]]]:
+        """Build the DAG task that links one entity type to its parent."""
+        async def link(results: Dict[str, Any]) -> Tuple[List[ColumnTable], int]:
+            tables = [r for name, r in results.items() if name.startswith("parse:")]
+            parent_type = PARENT_TYPES.get(entity_type)
+            parents = results[f"link:{parent_type}"][0] if parent_type else []
+            with stage_timer("link", sum(table.num_rows for table in tables)):
+                # Whole-column work; off the event loop so requests, progress
+                # events and job heartbeats keep flowing on large runs
+                orphans = await asyncio.to_thread(self.link_type, entity_type, tables, parents)
+            return tables, orphans
+        return link
+
+    def _store_task(
+        self,
+        run_oid: ObjectId,
+        entity_type: str,
+        progress: Optional[ProgressCallback] = None
+    ) -> Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]:
+        """Build the DAG task that stores one entity type."""
+        async def store(results: Dict[str, Any]) -> Dict[str, Any]:
+            tables, _ = results[f"link:{entity_type}"]
+            return await self._store_entities(run_oid, entity_type, tables, progress)
+        return store
+
+    def link_type(self, entity_type: str, tables: List[ColumnTable], parents: List[ColumnTable]) -> int:
+        """
+        Assign entity IDs to one entity type and link it to its parents.
+
+        Synchronous and CPU-bound; the harmonization DAG runs it in a
+        worker thread.
+
+        Args:
+            entity_type: The entity type being linked
+            tables: Harmonized tables of that type
+            parents: Linked tables of the parent type
+
+        Returns:
+            int: Number of rows whose parent could not be resolved
+        """
+        orphans = 0
+        for table in tables:
+            table.ids = new_object_ids(table.num_rows)
+            table.parent_ids = link_to_parents(table, entity_type, parents)
+            if entity_type in PARENT_TYPES:
+                orphans += int(np.count_nonzero(table.parent_ids == None))  # noqa: E711
+        return orphans
+
+    async def _store_entities(
+        self,
+        run_oid: ObjectId,
+        entity_type: str,
+        tables: List[ColumnTable],
+        progress: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Insert linked entities of one type into canonical_entities.
+
+        Documents are written through a BulkWriter: unordered batches,
+        several in flight at once, with bounded buffering.
+
+        Args:
+            run_oid: The run ID
+            entity_type: Entity type of the tables
+            tables: Linked tables
+            progress: Optional callback notified after each batch
+
+        Returns:
+            Dict with the number of entities stored and write throughput
+        """
+        async def on_batch(rows: int) -> None:
+            if progress:
+                await progress("harmonizing", rows, None)
+
+        writer = BulkWriter(self.db[COLLECTIONS["canonical_entities"]], on_batch=on_batch)
+        async with writer:
+            for table in tables:
+                await writer.add_many(iter_entity_documents(run_oid, entity_type, table))
+        stats = writer.stats()
+        record_stage("store", stats["seconds"], writer.docs_written)
+        return {"count": writer.docs_written, "write": stats}
+
+    async def validate_relationships(self, index: RelationshipIndex) -> Dict[str, Dict[str, int]]:
+        """
+        Check referential integrity of the linked entities.
+
+        Args:
+            index: Relationship index built from the linked tables
+
         Returns:
-            bool: True if all relationships are valid
+            Dict mapping entity type to entity, duplicate, orphan and
+            dangling-reference counts
         """
-        # TODO: Implement relationship validation
-        pass
\ No newline at end of file
+        return await asyncio.to_thread(index.summary)
@@ -0,0 +1,651 @@
+"""
+Background job subsystem for long-running run operations.
+
+Harmonize, validate and export requests are recorded in the ``jobs``
+collection and return a job ID immediately. Jobs are executed either by
+the API process itself (JOB_BACKEND="inprocess") or by separate worker
+processes that claim queued jobs from MongoDB (JOB_BACKEND="mongo", see
+app.worker). Progress is written back to the job document, so it can be
+polled or streamed from any API process.
+"""
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+from datetime import datetime, timedelta
+from pathlib import Path
+import asyncio
+import logging
+import os
+import socket
+import time
+
+import aiofiles
+import aiofiles.os
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import settings
+from app.core.metrics import REGISTRY, STAGE_BUCKETS
+from app.core.profiling import SamplingProfiler, save_profile
+from app.db.database import get_database, operation_timeout, COLLECTIONS
+
+
+JOB_KINDS = ("harmonize", "validate", "export")
+TERMINAL_STATUSES = ("completed", "failed")
+ACTIVE_STATUSES = ("queued", "running")
+
+# Job kinds that rewrite a run's entities or validation result: at most one
+# of them may be queued or running per run. Such jobs carry
+# ``exclusive_run_id`` while active, which a unique index enforces.
+EXCLUSIVE_KINDS = ("harmonize", "validate")
+
+# Run statuses an export job may replace with "exported"; exports run
+# alongside other jobs and must not hide a harmonization in progress
+EXPORTABLE_STATUSES = ("ready", "remediation", "exported")
+
+# Minimum seconds between progress writes within the same stage
+PROGRESS_WRITE_INTERVAL = 0.5
+
+logger = logging.getLogger(__name__)
+
+JOBS_QUEUED = REGISTRY.gauge(
+    "mdo_jobs_queued",
+    "Jobs waiting in the jobs collection for any process, by kind (read when metrics are served)",
+    ("kind",),
+)
+JOBS_LOCAL = REGISTRY.gauge(
+    "mdo_jobs_local",
+    "Jobs of this process by kind and state (waiting for a JOB_CONCURRENCY slot, running)",
+    ("kind", "state"),
+)
+JOB_SECONDS = REGISTRY.histogram(
+    "mdo_job_duration_seconds",
+    "Duration of jobs run by this process, by kind and final status",
+    ("kind", "status"),
+    buckets=STAGE_BUCKETS,
+)
+
+
+class JobConflictError(Exception):
+    """
+    Raised when a job cannot be queued because a conflicting job is
+    already queued or running for the run.
+    """
+    pass
+
+
+class JobContext:
+    """
+    Progress reporter handed to job handlers.
+
+    Progress is tracked per stage. Writes to MongoDB are throttled to one
+    every PROGRESS_WRITE_INTERVAL seconds unless the stage changes.
+    """
+
+    def __init__(self, job: Dict[str, Any], manager: "JobManager"):
+        self.job = job
+        self.manager = manager
+        self.stage: Optional[str] = None
+        self.rows_processed = 0
+        self.rows_total: Optional[int] = None
+        self._stage_started = time.monotonic()
+        self._last_write = 0.0
+
+    @property
+    def run_id(self) -> str:
+        """The run the job operates on."""
+        return str(self.job["run_id"])
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        """Parameters the job was enqueued with."""
+        return self.job.get("params") or {}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the current progress, including percent and ETA.
+
+        Returns:
+            Dict matching the JobProgress model
+        """
+        percent = None
+        eta = None
+        if self.rows_total:
+            percent = min(100.0, 100.0 * self.rows_processed / self.rows_total)
+            elapsed = time.monotonic() - self._stage_started
+            if self.rows_processed and elapsed > 0:
+                rate = self.rows_processed / elapsed
+                eta = max(self.rows_total - self.rows_processed, 0) / rate
+        return {
+            "stage": self.stage,
+            "rows_processed": self.rows_processed,
+            "rows_total": self.rows_total,
+            "percent": percent,
+            "eta_seconds": eta,
+        }
+
+    async def report(self, stage: str, rows: int = 0, total: Optional[int] = None) -> None:
+        """
+        Record progress.
+
+        Args:
+            stage: Current stage name; a new name resets the row counters
+            rows: Rows processed since the last report
+            total: Rows expected in this stage, if known
+        """
+        stage_changed = stage != self.stage
+        if stage_changed:
+            self.stage = stage
+            self.rows_processed = 0
+            self.rows_total = None
+            self._stage_started = time.monotonic()
+        self.rows_processed += rows
+        if total is not None:
+            self.rows_total = total
+
+        now = time.monotonic()
+        if stage_changed or now - self._last_write >= PROGRESS_WRITE_INTERVAL:
+            self._last_write = now
+            await self.manager.update_job(self.job["_id"], {"progress": self.snapshot()})
+
+    async def set_run_status(self, status: str, only_from: Optional[Iterable[str]] = None) -> None:
+        """
+        Update the status field of the job's run.
+
+        Args:
+            status: New run status
+            only_from: Change the status only if it is currently one of these
+        """
+        query: Dict[str, Any] = {"_id": self.job["run_id"]}
+        if only_from is not None:
+            query["status"] = {"$in": list(only_from)}
+        await self.manager.db[COLLECTIONS["runs"]].update_one(query, {"$set": {"status": status}})
+
+
+JobHandler = Callable[[JobContext], Awaitable[Dict[str, Any]]]
+
+
+async def _harmonize_job(ctx: JobContext) -> Dict[str, Any]:
+    """Harmonize a run, then validate it."""
+    from app.services.container import services
+
+    # Harmonization forks its process pool, which must not happen mid warm-up
+    await services.ready()
+    harmonization = await services.harmonization.harmonize_run(ctx.run_id, progress=ctx.report)
+    await ctx.set_run_status("validating")
+    await ctx.report("validating")
+    validation = await services.validation.validate_run(
+        ctx.run_id, relationships=harmonization["relationship_index"]
+    )
+    return {
+        "entity_counts": harmonization["entity_counts"],
+        "orphan_counts": harmonization["orphan_counts"],
+        "relationships": harmonization["relationships"],
+        "throughput": harmonization["throughput"],
+        "validation_result_id": str(validation.id),
+        "validation_status": validation.status,
+        "revalidated": validation.revalidated,
+    }
+
+
+async def _validate_job(ctx: JobContext) -> Dict[str, Any]:
+    """Validate a run's harmonized entities."""
+    from app.services.container import services
+    from app.services.validation_modes import ValidationOptions
+
+    options = ValidationOptions(**ctx.params.get("validation", {}))
+    if options.mode != "sample":
+        # Sample results never replace the run's result, so its status stays
+        await ctx.set_run_status("validating")
+    await ctx.report("validating")
+    validation = await services.validation.validate_run(ctx.run_id, options=options)
+    return {
+        "validation_result_id": str(validation.id),
+        "validation_status": validation.status,
+        "revalidated": validation.revalidated,
+        "blocker_count": validation.blocker_count,
+        "warning_count": validation.warning_count,
+        "info_count": validation.info_count,
+        "mode": validation.mode,
+        "complete": validation.complete,
+        "estimates": validation.estimates,
+    }
+
+
+def prune_export_bundles(max_age: float) -> int:
+    """
+    Delete export job bundles older than ``max_age`` seconds.
+
+    Args:
+        max_age: Age in seconds, by modification time
+
+    Returns:
+        int: Number of bundles deleted
+    """
+    cutoff = time.time() - max_age
+    deleted = 0
+    for path in (Path(settings.UPLOAD_DIR) / "exports").glob("*/*.zip"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                deleted += 1
+        except FileNotFoundError:
+            continue
+    return deleted
+
+
+async def _export_job(ctx: JobContext) -> Dict[str, Any]:
+    """
+    Stream a run's export bundle to a file under UPLOAD_DIR/exports.
+
+    Bundles of earlier export jobs older than EXPORT_JOB_RETENTION_HOURS
+    are deleted first. The run's status only becomes "exported" if it was
+    ready, remediation or exported, since a harmonize or validate job may
+    be running at the same time.
+    """
+    from app.services.container import services
+    from app.services.export_formats import ExportOptions
+
+    options = ExportOptions(**ctx.params.get("export", {}))
+    if settings.EXPORT_JOB_RETENTION_HOURS > 0:
+        await asyncio.to_thread(prune_export_bundles, settings.EXPORT_JOB_RETENTION_HOURS * 3600)
+    export_dir = Path(settings.UPLOAD_DIR) / "exports" / ctx.run_id
+    await aiofiles.os.makedirs(export_dir, exist_ok=True)
+    path = export_dir / f"{ctx.job['_id']}.zip"
+    size = 0
+    try:
+        async with aiofiles.open(path, "wb") as out:
+            async for chunk in services.export.stream_run(ctx.run_id, options, progress=ctx.report):
+                await out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        # No one can download a partial bundle
+        await asyncio.to_thread(path.unlink, missing_ok=True)
+        raise
+
+    await ctx.set_run_status("exported", only_from=EXPORTABLE_STATUSES)
+    return {"path": str(path), "size_bytes": size, **options.describe()}
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {
+    "harmonize": _harmonize_job,
+    "validate": _validate_job,
+    "export": _export_job,
+}
+
+
+def _profiled(handler: JobHandler) -> JobHandler:
+    """
+    Run a handler under a SamplingProfiler and save the profile, also when
+    the job fails. The result gains ``profile_path``.
+    """
+    async def run(ctx: JobContext) -> Dict[str, Any]:
+        profiler = SamplingProfiler()
+        try:
+            with profiler.running():
+                result = await handler(ctx)
+        finally:
+            path = await save_profile(
+                ctx.manager.db, ctx.run_id, profiler, f"job.{ctx.job['kind']}", {"job_id": str(ctx.job["_id"])}
+            )
+        return {**result, "profile_path": str(path)}
+    return run
+
+
+class JobManager:
+    """
+    Enqueues, claims and executes background jobs.
+    """
+
+    def __init__(self):
+        self.db = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._events: Dict[str, asyncio.Event] = {}
+        self._listeners: Dict[str, int] = {}
+
+    async def initialize(self):
+        """Initialize database connection."""
+        self.db = get_database()
+
+    @property
+    def worker_id(self) -> str:
+        """Identifier of this process, recorded on claimed jobs."""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    async def start(self) -> None:
+        """
+        Prepare the manager on application startup.
+
+        With the in-process backend, queued jobs whose process stopped
+        without running them (see _abandoned_query) are marked failed, so
+        they no longer hold their run's harmonize or validate slot.
+        """
+        await self.initialize()
+        if settings.JOB_BACKEND == "inprocess":
+            await self._fail_jobs(self._abandoned_query(statuses=("queued",)), "Job abandoned by a stopped process")
+
+    async def stop(self) -> None:
+        """
+        Cancel jobs of this process on shutdown.
+
+        Running jobs are marked failed as they are cancelled; jobs still
+        waiting for a JOB_CONCURRENCY slot were never claimed and are
+        marked failed here.
+        """
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.db is not None:
+            await self._fail_jobs({"status": "queued", "queued_by": self.worker_id}, "Job cancelled before it started")
+
+    async def _fail_jobs(self, query: Dict[str, Any], error: str) -> None:
+        """Mark matching jobs failed and release their run."""
+        await self.db[COLLECTIONS["jobs"]].update_many(query, {
+            "$set": {"status": "failed", "error": error, "finished_at": datetime.utcnow()},
+            "$unset": {"exclusive_run_id": ""},
+        })
+
+    def _abandoned_query(self, statuses: Iterable[str] = ACTIVE_STATUSES) -> Dict[str, Any]:
+        """
+        Filter for jobs whose process is gone.
+
+        Running jobs and the in-process backend's queued jobs (which carry
+        ``queued_by`` and send heartbeats while they wait for a slot) are
+        abandoned once their heartbeat is older than JOB_LEASE_SECONDS.
+        Jobs queued for workers have no owner until claimed and never are.
+        """
+        expired = datetime.utcnow() - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        clauses = {
+            "running": {"status": "running", "heartbeat_at": {"$lt": expired}},
+            "queued": {"status": "queued", "queued_by": {"$ne": None}, "heartbeat_at": {"$lt": expired}},
+        }
+        return {"$or": [clauses[status] for status in statuses]}
+
+    async def enqueue(self, kind: str, run_id: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Queue a job for a run.
+
+        With the in-process backend the job starts right away (subject to
+        JOB_CONCURRENCY); with the MongoDB backend it waits for a worker.
+
+        Args:
+            kind: Job kind (harmonize, validate or export)
+            run_id: The run ID
+            params: Extra parameters for the handler
+
+        Returns:
+            Dict: The inserted jobs document
+
+        Raises:
+            JobConflictError: If a harmonize or validate job is requested
+                while one of either is queued or running for the run
+        """
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        if self.db is None:
+            await self.initialize()
+
+        exclusive = kind in EXCLUSIVE_KINDS
+        if exclusive:
+            await self._check_exclusive(run_id)
+
+        job = {
+            "_id": ObjectId(),
+            "run_id": ObjectId(run_id),
+            "kind": kind,
+            "params": params or {},
+            "status": "queued",
+            "progress": {"stage": "queued", "rows_processed": 0},
+            "created_at": datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None,
+            "heartbeat_at": None,
+            "worker_id": None,
+            "error": None,
+            "result": None,
+        }
+        if exclusive:
+            job["exclusive_run_id"] = job["run_id"]
+        if settings.JOB_BACKEND == "inprocess":
+            # Only this process will run it
+            job["queued_by"] = self.worker_id
+            job["heartbeat_at"] = job["created_at"]
+        try:
+            await self.db[COLLECTIONS["jobs"]].insert_one(job)
+        except DuplicateKeyError:
+            # Another request queued one between the check and the insert
+            raise JobConflictError(f"Run '{run_id}' already has a harmonize or validate job in progress")
+
+        if settings.JOB_BACKEND == "inprocess":
+            task = asyncio.create_task(self._run_local(job["_id"], kind))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _check_exclusive(self, run_id: str) -> None:
+        """
+        Refuse a harmonize or validate job while one is active for the run.
+
+        A running job, or a job queued in a process's own queue, whose
+        heartbeat is older than JOB_LEASE_SECONDS belongs to a process that
+        died; it is marked failed instead.
+
+        Raises:
+            JobConflictError: If a live harmonize or validate job exists
+        """
+        active = await self.db[COLLECTIONS["jobs"]].find_one({
+            "run_id": ObjectId(run_id),
+            "kind": {"$in": list(EXCLUSIVE_KINDS)},
+            "status": {"$in": list(ACTIVE_STATUSES)},
+        })
+        if not active:
+            return
+        abandoned = await self.db[COLLECTIONS["jobs"]].find_one_and_update(
+            {"_id": active["_id"], **self._abandoned_query()},
+            {
+                "$set": {"status": "failed", "error": "Job lease expired", "finished_at": datetime.utcnow()},
+                "$unset": {"exclusive_run_id": ""},
+            },
+        )
+        if not abandoned:
+            raise JobConflictError(
+                f"Run '{run_id}' already has a {active['kind']} job {active['status']} ({active['_id']})"
+            )
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Load a job document.
+
+        Args:
+            job_id: The job ID
+
+        Returns:
+            The jobs document, or None if it does not exist
+        """
+        if self.db is None:
+            await self.initialize()
+        if not ObjectId.is_valid(job_id):
+            return None
+        return await self.db[COLLECTIONS["jobs"]].find_one({"_id": ObjectId(job_id)})
+
+    async def update_job(self, job_id: ObjectId, fields: Dict[str, Any]) -> None:
+        """
+        Update a job document and wake any local progress listeners.
+
+        Args:
+            job_id: The job ID
+            fields: Fields to set
+        """
+        fields = {**fields, "heartbeat_at": datetime.utcnow()}
+        update: Dict[str, Any] = {"$set": fields}
+        if fields.get("status") in TERMINAL_STATUSES:
+            # Lets the run take its next harmonize or validate job
+            update["$unset"] = {"exclusive_run_id": ""}
+        await self.db[COLLECTIONS["jobs"]].update_one({"_id": job_id}, update)
+        event = self._events.get(str(job_id))
+        if event is not None:
+            event.set()
+
+    async def wait_for_update(self, job_id: str, timeout: float) -> None:
+        """
+        Wait until the job is updated in this process or the timeout passes.
+
+        Updates made by other processes are picked up when the caller
+        re-reads the job after the timeout. The job's event is dropped when
+        its last listener stops waiting, so API processes that never run
+        jobs (JOB_BACKEND="mongo") do not accumulate them.
+
+        Args:
+            job_id: The job ID
+            timeout: Maximum seconds to wait
+        """
+        event = self._events.setdefault(job_id, asyncio.Event())
+        self._listeners[job_id] = self._listeners.get(job_id, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            event.clear()
+            self._listeners[job_id] -= 1
+            if not self._listeners[job_id]:
+                del self._listeners[job_id]
+                del self._events[job_id]
+
+    async def queued_counts(self) -> Dict[str, int]:
+        """
+        Count queued jobs by kind and publish them as JOBS_QUEUED.
+
+        Returns:
+            Dict mapping each job kind to its number of queued jobs
+        """
+        if self.db is None:
+            await self.initialize()
+        counts = {kind: 0 for kind in JOB_KINDS}
+        with operation_timeout(COLLECTIONS["jobs"], "aggregate"):
+            async for row in self.db[COLLECTIONS["jobs"]].aggregate([
+                {"$match": {"status": "queued"}},
+                {"$group": {"_id": "$kind", "count": {"$sum": 1}}},
+            ]):
+                counts[row["_id"]] = row["count"]
+        for kind, count in counts.items():
+            JOBS_QUEUED.labels(kind).set(count)
+        return counts
+
+    async def _run_local(self, job_id: ObjectId, kind: str) -> None:
+        """Claim and execute a specific job in this process."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(settings.JOB_CONCURRENCY, 1))
+        waiting = JOBS_LOCAL.labels(kind, "waiting")
+        waiting.inc()
+        # Shows the job is still held by a live process while it waits
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await self._semaphore.acquire()
+        finally:
+            heartbeat.cancel()
+            waiting.dec()
+        try:
+            job = await self.db[COLLECTIONS["jobs"]].find_one_and_update(
+                {"_id": job_id, "status": "queued"},
+                {"$set": self._claim_fields()},
+                return_document=ReturnDocument.AFTER,
+            )
+            if job:
+                await self.execute(job)
+        finally:
+            self._semaphore.release()
+
+    def _claim_fields(self) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        return {"status": "running", "started_at": now, "heartbeat_at": now, "worker_id": self.worker_id}
+
+    async def claim_next(self) -> Optional[Dict[str, Any]]:
+        """
+        Atomically claim the oldest runnable job.
+
+        Jobs whose worker stopped sending heartbeats for longer than
+        JOB_LEASE_SECONDS are reclaimed.
+
+        Returns:
+            The claimed jobs document, or None if the queue is empty
+        """
+        if self.db is None:
+            await self.initialize()
+        expired = datetime.utcnow() - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        return await self.db[COLLECTIONS["jobs"]].find_one_and_update(
+            {"$or": [
+                {"status": "queued"},
+                {"status": "running", "heartbeat_at": {"$lt": expired}},
+            ]},
+            {"$set": self._claim_fields()},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def execute(self, job: Dict[str, Any]) -> None:
+        """
+        Run a claimed job to completion and record the outcome.
+
+        A heartbeat is written periodically while the handler runs so other
+        workers do not reclaim the job.
+
+        Args:
+            job: The claimed jobs document
+        """
+        ctx = JobContext(job, self)
+        heartbeat = asyncio.create_task(self._heartbeat(job["_id"]))
+        running = JOBS_LOCAL.labels(job["kind"], "running")
+        running.inc()
+        started = time.perf_counter()
+        status = "failed"
+        handler = JOB_HANDLERS[job["kind"]]
+        if job["params"].get("profile"):
+            handler = _profiled(handler)
+        try:
+            result = await handler(ctx)
+        except asyncio.CancelledError:
+            status = "cancelled"
+            await self.update_job(job["_id"], {
+                "status": "failed",
+                "error": "Job cancelled",
+                "finished_at": datetime.utcnow(),
+            })
+            raise
+        except Exception as e:
+            logger.exception("%s job %s of run %s failed", job["kind"], job["_id"], job["run_id"])
+            if job["kind"] in EXCLUSIVE_KINDS:
+                # A failed export leaves the run's data as it was
+                await ctx.set_run_status("error")
+            await self.update_job(job["_id"], {
+                "status": "failed",
+                "error": str(e) or e.__class__.__name__,
+                "finished_at": datetime.utcnow(),
+            })
+        else:
+            progress = ctx.snapshot()
+            progress.update(stage="completed", eta_seconds=0.0)
+            await self.update_job(job["_id"], {
+                "status": "completed",
+                "result": result,
+                "progress": progress,
+                "finished_at": datetime.utcnow(),
+            })
+            status = "completed"
+        finally:
+            heartbeat.cancel()
+            running.dec()
+            JOB_SECONDS.labels(job["kind"], status).observe(time.perf_counter() - started)
+
+    async def _heartbeat(self, job_id: ObjectId) -> None:
+        """Refresh a running job's heartbeat until cancelled."""
+        interval = max(settings.JOB_LEASE_SECONDS / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            await self.db[COLLECTIONS["jobs"]].update_one(
+                {"_id": job_id}, {"$set": {"heartbeat_at": datetime.utcnow()}}
+            )
+
+
+job_manager = JobManager()
@@ -0,0 +1,344 @@
+"""
+Reusable column mappings, looked up by header fingerprint.
+
+Instruments produce the same headers run after run, so a mapping saved for
+one file applies to every later file with the same header. Mappings are
+stored in the mappings collection keyed by (header_fingerprint,
+schema_template_id): a fingerprint of the file's normalised column names.
+Uploads look up their header with one indexed query and pick up the saved
+mapping automatically.
+
+Harmonization uses a CompiledMapping: for each template field, the index
+of its source column in the file header. The CSV reader materialises only
+those columns, and field names are resolved once per header, not per file
+or row. Compiled mappings are cached per template version, mapping and header.
+"""
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import hashlib
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.db.database import get_database, COLLECTIONS
+from app.schemas.registry import field_key, schema_registry
+
+
+class MappingError(Exception):
+    """
+    Raised when a mapping does not fit its template or files.
+    """
+    pass
+
+
+def header_fingerprint(columns: Iterable[str]) -> str:
+    """
+    Fingerprint a file header for mapping lookups.
+
+    Column order, case, spacing and punctuation do not change the
+    fingerprint, so ``Block ID,Fixation`` and ``fixation,block_id`` match.
+
+    Args:
+        columns: Header column names
+
+    Returns:
+        str: SHA-256 hex digest of the sorted normalised names
+    """
+    keys = sorted({field_key(column) for column in columns})
+    return hashlib.sha256("\x1f".join(keys).encode("utf-8")).hexdigest()
+
+
+class CompiledMapping:
+    """
+    A mapping resolved against one file header.
+
+    ``sources[i]`` is the header position of template field ``fields[i]``,
+    or -1 when the file has no column for it.
+    """
+
+    def __init__(self, fields: Tuple[str, ...], sources: Tuple[int, ...], columns: Tuple[str, ...]):
+        self.fields = fields
+        self.sources = sources
+        self.columns = columns
+
+    @property
+    def source_indices(self) -> List[int]:
+        """Header positions the mapping reads, in file order."""
+        return sorted({source for source in self.sources if source >= 0})
+
+    @property
+    def renames(self) -> Dict[str, str]:
+        """``{"canonical_field": "csv_column"}`` for the fields that have a column."""
+        return {
+            field: self.columns[source]
+            for field, source in zip(self.fields, self.sources)
+            if source >= 0
+        }
+
+    @property
+    def missing(self) -> List[str]:
+        """Template fields with no column in the file."""
+        return [field for field, source in zip(self.fields, self.sources) if source < 0]
+
+
+def compile_mapping(
+    template: Dict[str, Any],
+    mapping: Optional[Dict[str, str]],
+    columns: Iterable[str]
+) -> CompiledMapping:
+    """
+    Resolve a mapping against a file header.
+
+    Fields without a mapping entry are matched by name, as in
+    harmonize_table(). A source that is not in the header verbatim is
+    matched by its normalised name, since headers with the same
+    fingerprint can differ in case and punctuation.
+
+    Args:
+        template: The schema template
+        mapping: ``{"canonical_field": "csv_column"}``
+        columns: The file's header columns
+
+    Returns:
+        CompiledMapping: The projection
+    """
+    mapping = mapping or {}
+    columns = tuple(columns)
+    position: Dict[str, int] = {}
+    position_by_key: Dict[str, int] = {}
+    for i, column in enumerate(columns):
+        position.setdefault(column, i)
+        position_by_key.setdefault(field_key(column), i)
+    fields = tuple(field["name"] for field in template.get("fields", []))
+    sources = []
+    for name in fields:
+        source = mapping.get(name, name)
+        index = position.get(source, -1)
+        if index < 0 and name in mapping:
+            index = position_by_key.get(field_key(source), -1)
+        sources.append(index)
+    return CompiledMapping(fields, tuple(sources), columns)
+
+
+@lru_cache(maxsize=256)
+def _compiled(template_id: str, etag: str, mapping: Tuple[Tuple[str, str], ...], columns: Tuple[str, ...]) -> CompiledMapping:
+    return compile_mapping(schema_registry.get(template_id).data, dict(mapping), columns)
+
+
+def compiled_mapping(
+    template_id: str,
+    mapping: Optional[Dict[str, str]],
+    columns: Iterable[str]
+) -> Optional[CompiledMapping]:
+    """
+    Compiled form of a mapping for a header, from the cache when possible.
+
+    Args:
+        template_id: The schema template ID
+        mapping: ``{"canonical_field": "csv_column"}``
+        columns: The file's header columns
+
+    Returns:
+        The compiled mapping, or None if the template is unknown or the
+        header was not recorded
+    """
+    template = schema_registry.get(template_id)
+    columns = tuple(columns or ())
+    if template is None or not columns:
+        return None
+    return _compiled(template_id, template.etag, tuple(sorted((mapping or {}).items())), columns)
+
+
+def check_mapping(template: Dict[str, Any], mapping: Dict[str, str], columns: Iterable[str]) -> None:
+    """
+    Check that a mapping fits a template and a file header.
+
+    Args:
+        template: The schema template
+        mapping: ``{"canonical_field": "csv_column"}``
+        columns: The file's header columns
+
+    Raises:
+        MappingError: If a target is not a template field or a source is
+            not a header column
+    """
+    fields = {field["name"] for field in template.get("fields", [])}
+    unknown = sorted(set(mapping) - fields)
+    if unknown:
+        raise MappingError(f"Unknown fields for schema '{template['id']}': {', '.join(unknown)}")
+    header = set(columns)
+    absent = sorted(source for source in set(mapping.values()) if source not in header)
+    if absent:
+        raise MappingError(f"Columns not in the file header: {', '.join(absent)}")
+
+
+class MappingService:
+    """
+    Service for the mapping library and the mappings applied to runs.
+    """
+
+    def __init__(self, db=None):
+        self.db = db
+
+    async def initialize(self):
+        """Initialize database connection."""
+        self.db = get_database()
+
+    async def find_for_header(self, columns: Iterable[str], schema_template_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the saved mapping for a header and template.
+
+        Args:
+            columns: Header columns
+            schema_template_id: The schema template ID
+
+        Returns:
+            The mapping document, or None
+        """
+        if self.db is None:
+            await self.initialize()
+        return await self.db[COLLECTIONS["mappings"]].find_one({
+            "header_fingerprint": header_fingerprint(columns),
+            "schema_template_id": schema_template_id,
+        })
+
+    async def save(
+        self,
+        name: str,
+        schema_template_id: str,
+        mapping: Dict[str, str],
+        columns: List[str],
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Save a mapping to the library, replacing the one for the same header.
+
+        Args:
+            name: Display name
+            schema_template_id: The schema template ID
+            mapping: ``{"canonical_field": "csv_column"}``
+            columns: Header the mapping was made for
+            user_id: User saving the mapping
+
+        Returns:
+            Dict: The stored mapping document
+        """
+        if self.db is None:
+            await self.initialize()
+        now = datetime.utcnow()
+        return await self.db[COLLECTIONS["mappings"]].find_one_and_update(
+            {"header_fingerprint": header_fingerprint(columns), "schema_template_id": schema_template_id},
+            {
+                "$set": {
+                    "name": name,
+                    "mapping": mapping,
+                    "columns": list(columns),
+                    "user_id": user_id,
+                    "updated_at": now,
+                },
+                "$setOnInsert": {"created_at": now},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def set_run_mapping(
+        self,
+        run: Dict[str, Any],
+        name: str,
+        schema_template_id: str,
+        mapping: Dict[str, str],
+        file_id: Optional[ObjectId] = None
+    ) -> List[Tuple[Dict[str, Any], List[ObjectId]]]:
+        """
+        Save a mapping for a run's files and apply it to them.
+
+        The mapping is saved once per distinct header among the run's files
+        using the template (or just ``file_id``), so later uploads with any
+        of those headers pick it up.
+
+        Args:
+            run: The run document
+            name: Display name
+            schema_template_id: The schema template ID
+            mapping: ``{"canonical_field": "csv_column"}``
+            file_id: Only apply to this file
+
+        Returns:
+            Each stored mapping document with the files it was applied to
+
+        Raises:
+            MappingError: If the template is unknown, no file matches or the
+                mapping does not fit a file's header
+        """
+        if self.db is None:
+            await self.initialize()
+        template = schema_registry.get(schema_template_id)
+        if template is None:
+            raise MappingError(f"Schema '{schema_template_id}' not found")
+
+        query: Dict[str, Any] = {"run_id": run["_id"], "schema_template_id": schema_template_id}
+        if file_id is not None:
+            query["_id"] = file_id
+        files = await self.db[COLLECTIONS["uploaded_files"]].find(
+            query, {"columns": 1}
+        ).to_list(length=None)
+        if not files:
+            raise MappingError(f"No file of the run uses schema '{schema_template_id}'")
+
+        headers: Dict[str, Tuple[List[str], List[ObjectId]]] = {}
+        for file_doc in files:
+            columns = file_doc.get("columns", [])
+            check_mapping(template.data, mapping, columns)
+            headers.setdefault(header_fingerprint(columns), (columns, []))[1].append(file_doc["_id"])
+
+        applied = []
+        for columns, file_ids in headers.values():
+            doc = await self.save(name, schema_template_id, mapping, columns, run.get("user_id"))
+            await self.db[COLLECTIONS["uploaded_files"]].update_many(
+                {"_id": {"$in": file_ids}}, {"$set": {"mapping_id": doc["_id"]}}
+            )
+            applied.append((doc, file_ids))
+
+        await self.db[COLLECTIONS["runs"]].update_one(
+            {"_id": run["_id"]}, {"$set": {"mapping_id": applied[0][0]["_id"]}}
+        )
+        await self.db[COLLECTIONS["audit_logs"]].insert_one({
+            "timestamp": datetime.utcnow(),
+            "user_id": run.get("user_id"),
+            "run_id": run["_id"],
+            "action": "mapping_set",
+            "details": {
+                "schema_template_id": schema_template_id,
+                "mapping_ids": [str(doc["_id"]) for doc, _ in applied],
+                "file_ids": [str(f) for _, file_ids in applied for f in file_ids],
+            },
+        })
+        return applied
+
+    async def run_mappings(self, run: Dict[str, Any]) -> List[Tuple[Dict[str, Any], List[ObjectId]]]:
+        """
+        The mappings applied to a run's files.
+
+        Args:
+            run: The run document
+
+        Returns:
+            Each mapping document with the run's files it applies to; the
+            run-level mapping is included even if no file points at it
+        """
+        if self.db is None:
+            await self.initialize()
+        files = await self.db[COLLECTIONS["uploaded_files"]].find(
+            {"run_id": run["_id"], "mapping_id": {"$ne": None}}, {"mapping_id": 1}
+        ).to_list(length=None)
+        file_ids: Dict[ObjectId, List[ObjectId]] = {}
+        if run.get("mapping_id"):
+            file_ids[run["mapping_id"]] = []
+        for file_doc in files:
+            file_ids.setdefault(file_doc["mapping_id"], []).append(file_doc["_id"])
+        docs = await self.db[COLLECTIONS["mappings"]].find(
+            {"_id": {"$in": list(file_ids)}}
+        ).to_list(length=None)
+        return [(doc, file_ids[doc["_id"]]) for doc in sorted(docs, key=lambda doc: doc["_id"])]
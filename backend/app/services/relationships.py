@@ -0,0 +1,469 @@
+"""
+Relationship index for referential-integrity checks on the entity hierarchy.
+
+The index holds, per entity type, the natural keys of a run's entities and
+the parent key each one references, as NumPy string arrays. Duplicate,
+orphan and dangling-reference checks along Block -> Slide -> ROI ->
+Library -> Run are then sort/search operations over whole arrays instead
+of a lookup per child.
+
+Harmonization builds the index from the tables it has just linked and
+saves it next to the run's files, keyed by the run's entity revision, so
+validation loads it instead of reading every entity back from MongoDB.
+The index also records each entity's ID and content hash, which lets
+incremental validation match entities across revisions (see
+match_entities).
+"""
+from typing import Dict, List, Optional
+from pathlib import Path
+
+import numpy as np
+from bson import ObjectId
+
+from app.core.config import settings
+from app.core.hierarchy import ENTITY_TYPES, ENTITY_KEYS, PARENT_TYPES, parent_key
+from app.db.bulk import iter_batches
+from app.db.database import COLLECTIONS
+from app.services.columnar import ColumnTable, lookup_keys
+
+
+# Entity types whose natural key identifies a single entity. Run rows repeat
+# Run_ID once per library, so Run_ID is not expected to be unique.
+UNIQUE_KEY_TYPES = ("Block", "Slide", "ROI", "Library")
+
+
+def index_path(run_id: str, revision: int) -> Path:
+    """
+    Get the file a run's relationship index is saved to.
+
+    Args:
+        run_id: The run ID
+        revision: The run's entity revision
+
+    Returns:
+        Path: Location of the .npz file
+    """
+    return Path(settings.UPLOAD_DIR) / str(run_id) / "relationships" / f"r{revision}.npz"
+
+
+class RelationshipIndex:
+    """
+    Natural and parent keys of a run's entities, per entity type.
+
+    For each type the index stores equal-length arrays: ``keys`` (the
+    entity's natural key, "" if missing), ``parent_keys`` (the referenced
+    parent's key, "" if missing), ``file_ids`` and ``row_index`` (to report
+    problems against the source rows), ``ids`` (entity ObjectIds as hex)
+    and ``hashes`` (content hashes, "" if unknown).
+    """
+
+    def __init__(self, revision: Optional[int] = None):
+        self.revision = revision
+        self.entities: Dict[str, Dict[str, np.ndarray]] = {}
+        self._sorted: Dict[str, np.ndarray] = {}
+
+    def add(
+        self,
+        entity_type: str,
+        keys: np.ndarray,
+        file_ids: np.ndarray,
+        row_index: np.ndarray,
+        parent_keys: Optional[np.ndarray] = None,
+        ids: Optional[np.ndarray] = None,
+        hashes: Optional[np.ndarray] = None
+    ) -> None:
+        """
+        Append entities of one type.
+
+        Args:
+            entity_type: The entity type
+            keys: Natural keys ("" for missing)
+            file_ids: Source file ID of each entity, as hex strings
+            row_index: Source row of each entity
+            parent_keys: Parent natural keys ("" for missing)
+            ids: Entity IDs, as hex strings
+            hashes: Content hashes ("" for unknown)
+        """
+        empty = np.full(len(keys), "", dtype=str)
+        new = {
+            "keys": np.asarray(keys, dtype=str),
+            "parent_keys": empty if parent_keys is None else np.asarray(parent_keys, dtype=str),
+            "file_ids": np.asarray(file_ids, dtype=str),
+            "row_index": np.asarray(row_index, dtype=np.int64),
+            "ids": empty if ids is None else np.asarray(ids, dtype=str),
+            "hashes": empty if hashes is None else np.asarray(hashes, dtype=str),
+        }
+        current = self.entities.get(entity_type)
+        if current is not None:
+            new = {name: np.concatenate([current[name], new[name]]) for name in new}
+        self.entities[entity_type] = new
+        self._sorted.pop(entity_type, None)
+
+    @classmethod
+    def from_tables(cls, tables: Dict[str, List[ColumnTable]], revision: Optional[int] = None) -> "RelationshipIndex":
+        """
+        Build the index from harmonized tables.
+
+        Args:
+            tables: Harmonized tables per entity type
+            revision: The run's entity revision
+
+        Returns:
+            RelationshipIndex: The index
+        """
+        index = cls(revision)
+        for entity_type in ENTITY_TYPES:
+            key_field = ENTITY_KEYS[entity_type]
+            parent_field = parent_key(entity_type)
+            for table in tables.get(entity_type, []):
+                index.add(
+                    entity_type,
+                    _table_keys(table, key_field),
+                    np.full(table.num_rows, table.stats.get("file_id", "")),
+                    table.row_index,
+                    _table_keys(table, parent_field) if parent_field else None,
+                    [str(oid) for oid in table.ids] if table.ids is not None else None,
+                    table.hashes,
+                )
+        return index
+
+    @classmethod
+    async def from_database(cls, db, run_oid: ObjectId, revision: Optional[int] = None) -> "RelationshipIndex":
+        """
+        Build the index by reading only key fields from canonical_entities.
+
+        Args:
+            db: The database
+            run_oid: The run ObjectId
+            revision: The run's entity revision
+
+        Returns:
+            RelationshipIndex: The index
+        """
+        index = cls(revision)
+        for entity_type in ENTITY_TYPES:
+            key_field = ENTITY_KEYS[entity_type]
+            parent_field = parent_key(entity_type)
+            projection = {"file_id": 1, "row_index": 1, "content_hash": 1, f"data.{key_field}": 1}
+            if parent_field:
+                projection[f"data.{parent_field}"] = 1
+            cursor = db[COLLECTIONS["canonical_entities"]].find(
+                {"run_id": run_oid, "entity_type": entity_type}, projection
+            )
+            async for docs in iter_batches(cursor, settings.VALIDATION_BATCH_SIZE):
+                data = [doc.get("data") or {} for doc in docs]
+                index.add(
+                    entity_type,
+                    [row.get(key_field) or "" for row in data],
+                    [str(doc.get("file_id") or "") for doc in docs],
+                    [doc.get("row_index", -1) for doc in docs],
+                    [row.get(parent_field) or "" for row in data] if parent_field else None,
+                    [str(doc["_id"]) for doc in docs],
+                    [doc.get("content_hash") or "" for doc in docs],
+                )
+        return index
+
+    def save(self, path: Path) -> None:
+        """
+        Write the index to an .npz file.
+
+        Args:
+            path: Destination file
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {
+            f"{entity_type}.{name}": array
+            for entity_type, columns in self.entities.items()
+            for name, array in columns.items()
+        }
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Path, revision: Optional[int] = None) -> Optional["RelationshipIndex"]:
+        """
+        Read an index written by save().
+
+        Args:
+            path: The .npz file
+            revision: The entity revision the file belongs to
+
+        Returns:
+            The index, or None if the file does not exist
+        """
+        if not path.is_file():
+            return None
+        index = cls(revision)
+        with np.load(path, allow_pickle=False) as data:
+            for name in data.files:
+                entity_type, column = name.split(".", 1)
+                index.entities.setdefault(entity_type, {})[column] = data[name]
+        return index
+
+    def count(self, entity_type: str) -> int:
+        """Number of indexed entities of a type."""
+        columns = self.entities.get(entity_type)
+        return 0 if columns is None else len(columns["keys"])
+
+    def column(self, entity_type: str, name: str) -> np.ndarray:
+        """Get one of an entity type's arrays (empty if the type has none)."""
+        columns = self.entities.get(entity_type)
+        if columns is None:
+            return np.array([], dtype=np.int64 if name == "row_index" else str)
+        if name not in columns:
+            # Indexes saved before a column existed
+            return np.full(len(columns["keys"]), "", dtype=str)
+        return columns[name]
+
+    def key_set(self, entity_type: str) -> np.ndarray:
+        """Sorted distinct non-empty keys of an entity type."""
+        keys = self._sorted.get(entity_type)
+        if keys is None:
+            keys = np.unique(self.column(entity_type, "keys"))
+            keys = keys[keys != ""]
+            self._sorted[entity_type] = keys
+        return keys
+
+    def contains(self, entity_type: str, keys: np.ndarray) -> np.ndarray:
+        """
+        Check which keys exist among an entity type's keys.
+
+        Args:
+            entity_type: Entity type to search
+            keys: Keys to look up
+
+        Returns:
+            np.ndarray: Boolean mask, True where the key exists
+        """
+        candidates = self.key_set(entity_type)
+        if len(candidates) == 0 or len(keys) == 0:
+            return np.zeros(len(keys), dtype=bool)
+        positions = np.clip(np.searchsorted(candidates, keys), 0, len(candidates) - 1)
+        return candidates[positions] == keys
+
+    def duplicates(self, entity_type: str) -> np.ndarray:
+        """
+        Find entities whose natural key repeats an earlier entity's.
+
+        Args:
+            entity_type: The entity type
+
+        Returns:
+            np.ndarray: Positions of the second and later occurrences
+        """
+        if entity_type not in UNIQUE_KEY_TYPES:
+            return np.array([], dtype=np.int64)
+        keys = self.column(entity_type, "keys")
+        present = np.flatnonzero(keys != "")
+        if len(present) < 2:
+            return np.array([], dtype=np.int64)
+        order = np.argsort(keys[present], kind="stable")
+        sorted_keys = keys[present][order]
+        repeated = sorted_keys[1:] == sorted_keys[:-1]
+        return np.sort(present[order[1:][repeated]])
+
+    def orphans(self, entity_type: str) -> np.ndarray:
+        """
+        Find entities that do not reference a parent at all.
+
+        Args:
+            entity_type: The entity type
+
+        Returns:
+            np.ndarray: Positions of entities with an empty parent key
+        """
+        if entity_type not in PARENT_TYPES:
+            return np.array([], dtype=np.int64)
+        return np.flatnonzero(self.column(entity_type, "parent_keys") == "")
+
+    def dangling(self, entity_type: str) -> np.ndarray:
+        """
+        Find entities referencing a parent key that does not exist.
+
+        Args:
+            entity_type: The entity type
+
+        Returns:
+            np.ndarray: Positions of entities with an unknown parent key
+        """
+        if entity_type not in PARENT_TYPES:
+            return np.array([], dtype=np.int64)
+        parent_keys = self.column(entity_type, "parent_keys")
+        referenced = parent_keys != ""
+        found = self.contains(PARENT_TYPES[entity_type], parent_keys)
+        return np.flatnonzero(referenced & ~found)
+
+    def flat(self, name: str) -> np.ndarray:
+        """
+        Concatenate one array over all entity types, in hierarchy order.
+
+        Positions in the result are "flat positions"; offsets() gives where
+        each entity type starts.
+        """
+        return np.concatenate([self.column(entity_type, name) for entity_type in ENTITY_TYPES])
+
+    def offsets(self) -> Dict[str, int]:
+        """Flat position of the first entity of each type."""
+        offsets, start = {}, 0
+        for entity_type in ENTITY_TYPES:
+            offsets[entity_type] = start
+            start += self.count(entity_type)
+        return offsets
+
+    @property
+    def has_hashes(self) -> bool:
+        """Whether every indexed entity has a content hash."""
+        return all(
+            self.count(entity_type) == 0 or bool((self.column(entity_type, "hashes") != "").all())
+            for entity_type in self.entities
+        )
+
+    def content_keys(self) -> np.ndarray:
+        """
+        Identify entities by content rather than by ID, in flat order.
+
+        The key is the entity type, the content hash and the occurrence of
+        that hash within the type, so identical rows still get distinct
+        keys and are matched one to one across revisions.
+
+        Returns:
+            np.ndarray: One string key per entity
+        """
+        keys = []
+        for entity_type in ENTITY_TYPES:
+            hashes = self.column(entity_type, "hashes")
+            order = np.argsort(hashes, kind="stable")
+            sorted_hashes = hashes[order]
+            # Rank within each run of equal hashes
+            first = np.searchsorted(sorted_hashes, sorted_hashes, side="left")
+            occurrence = np.empty(len(hashes), dtype=np.int64)
+            occurrence[order] = np.arange(len(hashes)) - first
+            keys.append(np.char.add(np.char.add(f"{entity_type}:", hashes), np.char.add("#", occurrence.astype(str))))
+        return np.concatenate(keys)
+
+    def locations(self) -> np.ndarray:
+        """"<file_id>:<row_index>" of each entity, in flat order."""
+        return np.char.add(np.char.add(self.flat("file_ids"), ":"), self.flat("row_index").astype(str))
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """
+        Count entities and integrity problems per entity type.
+
+        Returns:
+            Dict mapping entity type to entity, duplicate, orphan and
+            dangling counts
+        """
+        return {
+            entity_type: {
+                "entities": self.count(entity_type),
+                "duplicates": len(self.duplicates(entity_type)),
+                "orphans": len(self.orphans(entity_type)),
+                "dangling": len(self.dangling(entity_type)),
+            }
+            for entity_type in ENTITY_TYPES
+        }
+
+
+def match_entities(previous: RelationshipIndex, current: RelationshipIndex) -> np.ndarray:
+    """
+    Pair each current entity with the previous entity of identical content.
+
+    Args:
+        previous: Index of an earlier revision of the run
+        current: Index of the current revision
+
+    Returns:
+        np.ndarray: For each flat position in ``current``, the flat position
+        of the matching entity in ``previous``, or -1 if it is new or changed
+    """
+    return lookup_keys(current.content_keys(), previous.content_keys())
+
+
+class EntityRemap:
+    """
+    Maps entity locations of a previous revision to the current revision.
+
+    Built once from match_entities(); targets() then translates any number
+    of previous (file_id, row_index) locations with a binary search.
+    """
+
+    def __init__(self, previous: RelationshipIndex, current: RelationshipIndex, matches: np.ndarray):
+        locations = previous.locations()
+        self._order = np.argsort(locations, kind="stable")
+        self._sorted = locations[self._order]
+        matched = np.flatnonzero(matches >= 0)
+        self._to_current = np.full(len(locations), -1, dtype=np.int64)
+        self._to_current[matches[matched]] = matched
+        self.file_ids = current.flat("file_ids")
+        self.row_index = current.flat("row_index")
+
+    def targets(self, file_ids: List[str], row_index: List[int]) -> np.ndarray:
+        """
+        Find where previously located entities are now.
+
+        Args:
+            file_ids: Previous file IDs, as hex strings
+            row_index: Previous row indexes
+
+        Returns:
+            np.ndarray: Current flat position of each entity, or -1 if it
+            changed or no longer exists
+        """
+        if len(self._sorted) == 0 or not file_ids:
+            return np.full(len(file_ids), -1, dtype=np.int64)
+        keys = np.array([f"{file_id}:{row}" for file_id, row in zip(file_ids, row_index)])
+        positions = np.clip(np.searchsorted(self._sorted, keys), 0, len(self._sorted) - 1)
+        found = self._sorted[positions] == keys
+        return np.where(found, self._to_current[self._order[positions]], -1)
+
+
+def prune_indexes(run_id: str, before: int) -> None:
+    """
+    Delete a run's saved indexes of revisions older than ``before``.
+
+    Args:
+        run_id: The run ID
+        before: Oldest entity revision whose index is still needed
+    """
+    for path in index_path(run_id, before).parent.glob("r*.npz"):
+        try:
+            revision = int(path.stem[1:])
+        except ValueError:
+            continue
+        if revision < before:
+            path.unlink(missing_ok=True)
+
+
+def _table_keys(table: ColumnTable, field: str) -> np.ndarray:
+    """Read a key column from a harmonized table, "" where null or absent."""
+    if field not in table.columns:
+        return np.full(table.num_rows, "", dtype=str)
+    keys = table.column(field).astype(str)
+    return np.where(table.null_mask(field), "", keys)
+
+
+async def load_relationship_index(db, run_id: str) -> RelationshipIndex:
+    """
+    Get a run's relationship index for its current entity revision.
+
+    The index saved by harmonization is used when it matches the run's
+    entity revision; otherwise it is rebuilt from canonical_entities (and
+    saved for next time).
+
+    Args:
+        db: The database
+        run_id: The run ID
+
+    Returns:
+        RelationshipIndex: The index
+    """
+    run = await db[COLLECTIONS["runs"]].find_one({"_id": ObjectId(run_id)}, {"entity_revision": 1})
+    revision = (run or {}).get("entity_revision", 0)
+    path = index_path(run_id, revision)
+    index = RelationshipIndex.load(path, revision)
+    if index is None:
+        index = await RelationshipIndex.from_database(db, ObjectId(run_id), revision)
+        index.save(path)
+    return index
@@ -0,0 +1,628 @@
+"""
+Compiled, column-level validation rules.
+
+Rules come from two places: checks implied by schema template fields
+(required, type, pattern, enum, min/max) and cross-field rules from a
+ruleset file in app/schemas/rules. Every rule is compiled once into a
+predicate over a ColumnBatch that returns a boolean mask of failing rows,
+so evaluating a batch costs a few NumPy operations per rule and column
+instead of a Python call per cell. Natural-key uniqueness and parent
+references are checked on the relationship index instead (see
+app.services.relationships).
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from datetime import datetime
+import hashlib
+import json
+import operator
+import re
+
+import numpy as np
+
+from app.core.hierarchy import ENTITY_TYPES
+
+
+SEVERITIES = ("Blocker", "Warning", "Info")
+RULE_LEVELS = ("field", "row", "table", "relationship")
+
+COMPARISONS: Dict[str, Callable[[Any, Any], Any]] = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+NUMERIC_TYPES = ("integer", "float", "number")
+
+
+class RuleError(Exception):
+    """
+    Raised when a rule definition is invalid, e.g. it names an unknown
+    check, severity or field.
+    """
+    pass
+
+
+class ColumnBatch:
+    """
+    Columns of a batch of canonical entity documents.
+
+    Columns are extracted from the documents' ``data`` the first time a
+    rule asks for them, and typed views (numeric, dates, strings) are
+    computed once per column and shared by all rules.
+    """
+
+    def __init__(
+        self,
+        field_types: Dict[str, str],
+        ids: np.ndarray,
+        file_ids: np.ndarray,
+        row_index: np.ndarray,
+        columns: Optional[Dict[str, np.ndarray]] = None,
+        invalid: Optional[Dict[str, np.ndarray]] = None,
+        data: Optional[List[Dict[str, Any]]] = None,
+        invalid_rows: Optional[List[Any]] = None
+    ):
+        self.field_types = field_types
+        self.ids = ids
+        self.file_ids = file_ids
+        self.row_index = row_index
+        self._columns: Dict[str, np.ndarray] = columns or {}
+        self._invalid: Dict[str, np.ndarray] = invalid or {}
+        self._data = data
+        self._invalid_rows = invalid_rows or []
+        self._views: Dict[Any, np.ndarray] = {}
+
+    @classmethod
+    def from_documents(cls, docs: List[Dict[str, Any]], field_types: Dict[str, str]) -> "ColumnBatch":
+        """
+        Build a batch from canonical_entities documents.
+
+        Args:
+            docs: Entity documents
+            field_types: Template type of each field
+
+        Returns:
+            ColumnBatch: The batch
+        """
+        row_index = [doc.get("row_index") for doc in docs]
+        return cls(
+            field_types,
+            ids=np.array([doc["_id"] for doc in docs], dtype=object),
+            file_ids=np.array([doc.get("file_id") for doc in docs], dtype=object),
+            row_index=np.array([-1 if i is None else i for i in row_index], dtype=np.int64),
+            data=[doc.get("data") or {} for doc in docs],
+            invalid_rows=[(i, doc["invalid"]) for i, doc in enumerate(docs) if doc.get("invalid")],
+        )
+
+    @classmethod
+    def concat(cls, batches: List["ColumnBatch"], field_types: Dict[str, str]) -> "ColumnBatch":
+        """
+        Join batches (typically reduced with select()) into one.
+
+        Args:
+            batches: Batches holding the same columns
+            field_types: Template type of each field
+
+        Returns:
+            ColumnBatch: The combined batch
+        """
+        if not batches:
+            empty = np.array([], dtype=object)
+            return cls(field_types, empty, empty, np.array([], dtype=np.int64))
+        names = set(batches[0]._columns)
+        return cls(
+            field_types,
+            ids=np.concatenate([b.ids for b in batches]),
+            file_ids=np.concatenate([b.file_ids for b in batches]),
+            row_index=np.concatenate([b.row_index for b in batches]),
+            columns={name: np.concatenate([b.values(name) for b in batches]) for name in names},
+            invalid={name: np.concatenate([b.invalid_values(name) for b in batches]) for name in names},
+        )
+
+    def select(self, names: Iterable[str]) -> "ColumnBatch":
+        """
+        Keep only some columns, releasing the source documents.
+
+        Args:
+            names: Columns to keep
+
+        Returns:
+            ColumnBatch: A batch with just those columns materialized
+        """
+        names = list(names)
+        return ColumnBatch(
+            self.field_types, self.ids, self.file_ids, self.row_index,
+            columns={name: self.values(name) for name in names},
+            invalid={name: self.invalid_values(name) for name in names},
+        )
+
+    def __len__(self) -> int:
+        return len(self.row_index)
+
+    def values(self, name: str) -> np.ndarray:
+        """Raw column values as an object array (None for null)."""
+        column = self._columns.get(name)
+        if column is None:
+            data = self._data or []
+            column = np.empty(len(data), dtype=object)
+            column[:] = [row.get(name) for row in data]
+            self._columns[name] = column
+        return column
+
+    def invalid_values(self, name: str) -> np.ndarray:
+        """Source text of cells that failed type coercion (None elsewhere)."""
+        column = self._invalid.get(name)
+        if column is None:
+            column = np.full(len(self), None, dtype=object)
+            for position, fields in self._invalid_rows:
+                if name in fields:
+                    column[position] = fields[name]
+            self._invalid[name] = column
+        return column
+
+    def _view(self, kind: str, name: str, build: Callable[[], np.ndarray]) -> np.ndarray:
+        key = (kind, name)
+        view = self._views.get(key)
+        if view is None:
+            view = self._views[key] = build()
+        return view
+
+    def null_mask(self, name: str) -> np.ndarray:
+        """Rows where the column is null."""
+        return self._view("null", name, lambda: np.equal(self.values(name), None))
+
+    def invalid_mask(self, name: str) -> np.ndarray:
+        """Rows whose source value could not be coerced to the field type."""
+        return self._view("invalid", name, lambda: ~np.equal(self.invalid_values(name), None))
+
+    def numeric(self, name: str) -> np.ndarray:
+        """Column as float64, NaN where null or not a number."""
+        def build() -> np.ndarray:
+            values = self.values(name)
+            out = np.full(len(values), np.nan, dtype=np.float64)
+            present = ~self.null_mask(name)
+            try:
+                out[present] = values[present].astype(np.float64)
+            except (TypeError, ValueError):
+                out[present] = np.frompyfunc(_as_float, 1, 1)(values[present]).astype(np.float64)
+            return out
+        return self._view("numeric", name, build)
+
+    def dates(self, name: str) -> np.ndarray:
+        """Column as datetime64[ms], NaT where null or not a date."""
+        def build() -> np.ndarray:
+            values = self.values(name)
+            out = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[ms]")
+            present = ~self.null_mask(name)
+            try:
+                out[present] = values[present].astype("datetime64[ms]")
+            except (TypeError, ValueError):
+                out[present] = np.frompyfunc(_as_datetime64, 1, 1)(values[present]).astype("datetime64[ms]")
+            return out
+        return self._view("dates", name, build)
+
+    def strings(self, name: str) -> np.ndarray:
+        """Column as a unicode array, "" where null."""
+        def build() -> np.ndarray:
+            values = self.values(name)
+            out = values.copy()
+            out[self.null_mask(name)] = ""
+            return out.astype(str) if len(out) else np.array([], dtype=str)
+        return self._view("strings", name, build)
+
+
+def _as_float(value: Any) -> float:
+    if isinstance(value, bool):
+        return float("nan")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _as_datetime64(value: Any) -> np.datetime64:
+    if isinstance(value, datetime):
+        return np.datetime64(value, "ms")
+    try:
+        return np.datetime64(value, "ms")
+    except (TypeError, ValueError):
+        return np.datetime64("NaT")
+
+
+def _is_bool(value: Any) -> bool:
+    return isinstance(value, (bool, np.bool_))
+
+
+Predicate = Callable[[ColumnBatch], np.ndarray]
+
+
+class CompiledRule:
+    """
+    A validation rule compiled to a batch predicate.
+    """
+
+    def __init__(self, spec: Dict[str, Any], predicate: Predicate, columns: List[str]):
+        self.spec = spec
+        self.id: str = spec["id"]
+        self.level: str = spec["level"]
+        self.entity_type: str = spec["entity_type"]
+        self.check: str = spec["check"]
+        self.column: str = spec["column"]
+        self.severity: str = spec["severity"]
+        self.description: str = spec["description"]
+        self.columns = columns
+        self._predicate = predicate
+
+    def evaluate(self, batch: ColumnBatch) -> np.ndarray:
+        """
+        Find the rows of a batch that fail the rule.
+
+        Args:
+            batch: Entity columns
+
+        Returns:
+            np.ndarray: Positions of failing rows within the batch
+        """
+        if len(batch) == 0:
+            return np.array([], dtype=np.int64)
+        return np.flatnonzero(self._predicate(batch))
+
+    def message(self, batch: ColumnBatch, position: int) -> str:
+        """
+        Describe a failure, including the offending value where there is one.
+
+        Args:
+            batch: The batch the rule was evaluated on
+            position: Position of the failing row
+
+        Returns:
+            str: Human-readable description
+        """
+        value = batch.invalid_values(self.column)[position]
+        if value is None:
+            value = batch.values(self.column)[position]
+        if value is None:
+            return self.description
+        return f"{self.description} (value: {value!r})"
+
+    def __repr__(self) -> str:
+        return f"CompiledRule({self.id!r})"
+
+
+def _compile_required(spec, field_types) -> Predicate:
+    column = spec["column"]
+    # Values that failed coercion are reported by the type rule instead
+    return lambda b: b.null_mask(column) & ~b.invalid_mask(column)
+
+
+def _compile_type(spec, field_types) -> Predicate:
+    column = spec["column"]
+    field_type = spec.get("type") or field_types[column]
+
+    if field_type in NUMERIC_TYPES:
+        def mismatch(b):
+            numbers = b.numeric(column)
+            bad = ~b.null_mask(column) & np.isnan(numbers)
+            if field_type == "integer":
+                with np.errstate(invalid="ignore"):
+                    bad |= ~np.isnan(numbers) & (np.mod(numbers, 1) != 0)
+            return bad
+    elif field_type == "date":
+        def mismatch(b):
+            return ~b.null_mask(column) & np.isnat(b.dates(column))
+    elif field_type == "boolean":
+        is_bool = np.frompyfunc(_is_bool, 1, 1)
+
+        def mismatch(b):
+            present = ~b.null_mask(column)
+            bad = np.zeros(len(b), dtype=bool)
+            bad[present] = ~is_bool(b.values(column)[present]).astype(bool)
+            return bad
+    else:
+        def mismatch(b):
+            return np.zeros(len(b), dtype=bool)
+
+    return lambda b: b.invalid_mask(column) | mismatch(b)
+
+
+def _compile_pattern(spec, field_types) -> Predicate:
+    column = spec["column"]
+    try:
+        pattern = re.compile(spec["pattern"])
+    except re.error as e:
+        raise RuleError(f"Rule '{spec['id']}' has an invalid pattern: {e}")
+
+    def predicate(b):
+        present = ~b.null_mask(column) & ~b.invalid_mask(column)
+        failed = np.zeros(len(b), dtype=bool)
+        if present.any():
+            # Match each distinct value once and broadcast the result back
+            unique, inverse = np.unique(b.strings(column)[present], return_inverse=True)
+            matches = np.fromiter((pattern.fullmatch(value) is not None for value in unique), bool, len(unique))
+            failed[present] = ~matches[inverse]
+        return failed
+    return predicate
+
+
+def _compile_enum(spec, field_types) -> Predicate:
+    column = spec["column"]
+    ignore_case = spec.get("ignore_case", True)
+    allowed = np.array([str(v) for v in spec["values"]])
+    if ignore_case:
+        allowed = np.char.upper(allowed)
+
+    def predicate(b):
+        values = b.strings(column)
+        if ignore_case:
+            values = np.char.upper(values)
+        return ~b.null_mask(column) & ~np.isin(values, allowed)
+    return predicate
+
+
+def _typed_getter(column: str, field_type: str) -> Callable[[ColumnBatch], np.ndarray]:
+    """Pick the typed view used for comparisons on a column."""
+    if field_type in NUMERIC_TYPES:
+        return lambda b: b.numeric(column)
+    if field_type == "date":
+        return lambda b: b.dates(column)
+    return lambda b: b.strings(column)
+
+
+def _typed_constant(value: Any, field_type: str) -> Any:
+    if field_type in NUMERIC_TYPES:
+        return float(value)
+    if field_type == "date":
+        return np.datetime64(value, "ms")
+    return str(value)
+
+
+def _compile_range(spec, field_types) -> Predicate:
+    column = spec["column"]
+    field_type = field_types[column]
+    get = _typed_getter(column, field_type)
+    low = None if spec.get("min") is None else _typed_constant(spec["min"], field_type)
+    high = None if spec.get("max") is None else _typed_constant(spec["max"], field_type)
+
+    def predicate(b):
+        values = get(b)
+        failed = np.zeros(len(b), dtype=bool)
+        present = ~b.null_mask(column)
+        if low is not None:
+            failed |= present & (values < low)
+        if high is not None:
+            failed |= present & (values > high)
+        return failed
+    return predicate
+
+
+def _compile_required_with(spec, field_types) -> Predicate:
+    column = spec["column"]
+    others = spec["fields"]
+
+    def predicate(b):
+        missing = np.zeros(len(b), dtype=bool)
+        for other in others:
+            missing |= b.null_mask(other)
+        return ~b.null_mask(column) & missing
+    return predicate
+
+
+def _compile_compare(spec, field_types) -> Predicate:
+    column = spec["column"]
+    field_type = field_types[column]
+    compare = COMPARISONS.get(spec.get("op"))
+    if compare is None:
+        raise RuleError(f"Rule '{spec['id']}' has unknown operator '{spec.get('op')}'")
+    left = _typed_getter(column, field_type)
+
+    if "field" in spec:
+        other = spec["field"]
+        right = _typed_getter(other, field_type)
+
+        def predicate(b):
+            both = ~b.null_mask(column) & ~b.null_mask(other)
+            return both & ~compare(left(b), right(b))
+    else:
+        constant = _typed_constant(spec["value"], field_type)
+
+        def predicate(b):
+            return ~b.null_mask(column) & ~compare(left(b), constant)
+    return predicate
+
+
+def _compile_unique(spec, field_types) -> Predicate:
+    column = spec["column"]
+
+    def predicate(b):
+        failed = np.zeros(len(b), dtype=bool)
+        present = np.flatnonzero(~b.null_mask(column))
+        if len(present) < 2:
+            return failed
+        keys = b.strings(column)[present]
+        order = np.argsort(keys, kind="stable")
+        repeated = keys[order][1:] == keys[order][:-1]
+        # Stable sort keeps the first occurrence first, so only later
+        # occurrences are flagged
+        failed[present[order[1:][repeated]]] = True
+        return failed
+    return predicate
+
+
+RULE_CHECKS: Dict[str, Callable[[Dict[str, Any], Dict[str, str]], Predicate]] = {
+    "required": _compile_required,
+    "type": _compile_type,
+    "pattern": _compile_pattern,
+    "enum": _compile_enum,
+    "range": _compile_range,
+    "required_with": _compile_required_with,
+    "compare": _compile_compare,
+    "unique": _compile_unique,
+}
+
+
+def compile_rule(spec: Dict[str, Any], field_types: Dict[str, str]) -> CompiledRule:
+    """
+    Validate a rule definition and compile it.
+
+    Args:
+        spec: Rule definition with id, level, entity_type, check, column,
+            severity, description and check-specific parameters
+        field_types: Template type of each field of the entity type
+
+    Returns:
+        CompiledRule: The compiled rule
+
+    Raises:
+        RuleError: If the definition is invalid
+    """
+    for key in ("id", "level", "entity_type", "check", "column", "severity", "description"):
+        if key not in spec:
+            raise RuleError(f"Rule {spec.get('id', '?')!r} is missing '{key}'")
+    if spec["check"] not in RULE_CHECKS:
+        raise RuleError(f"Rule '{spec['id']}' has unknown check '{spec['check']}'")
+    if spec["severity"] not in SEVERITIES:
+        raise RuleError(f"Rule '{spec['id']}' has unknown severity '{spec['severity']}'")
+    if spec["level"] not in RULE_LEVELS:
+        raise RuleError(f"Rule '{spec['id']}' has unknown level '{spec['level']}'")
+
+    columns = [spec["column"], *spec.get("fields", [])]
+    if "field" in spec:
+        columns.append(spec["field"])
+    unknown = [c for c in columns if c not in field_types]
+    if unknown:
+        raise RuleError(f"Rule '{spec['id']}' refers to unknown fields for {spec['entity_type']}: {', '.join(unknown)}")
+
+    predicate = RULE_CHECKS[spec["check"]](spec, field_types)
+    return CompiledRule(spec, predicate, columns)
+
+
+def template_rules(template: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Derive rule definitions from a schema template's field definitions.
+
+    Args:
+        template: The schema template
+
+    Returns:
+        List of rule definitions
+    """
+    entity_type = template.get("entity_type")
+    rules: List[Dict[str, Any]] = []
+
+    def add(check: str, field: Dict[str, Any], level: str, severity: str, description: str, **params) -> None:
+        rules.append({
+            "id": f"{check}.{entity_type}.{field['name']}",
+            "level": level,
+            "entity_type": entity_type,
+            "check": check,
+            "column": field["name"],
+            "severity": severity,
+            "description": description,
+            **params,
+        })
+
+    for field in template.get("fields", []):
+        name = field["name"]
+        field_type = field.get("type", "string")
+        if field.get("required"):
+            add("required", field, "field", "Blocker", f"{name} is required")
+        if field_type != "string":
+            add("type", field, "field", "Blocker", f"{name} must be a valid {field_type}", type=field_type)
+        if field.get("pattern"):
+            add("pattern", field, "field", "Warning", f"{name} does not match the expected format",
+                pattern=field["pattern"])
+        if field.get("enum"):
+            add("enum", field, "field", "Warning", f"{name} must be one of: {', '.join(map(str, field['enum']))}",
+                values=field["enum"])
+        if field.get("min") is not None or field.get("max") is not None:
+            bounds = [f">= {field['min']}" if field.get("min") is not None else None,
+                      f"<= {field['max']}" if field.get("max") is not None else None]
+            add("range", field, "field", "Warning", f"{name} must be {' and '.join(b for b in bounds if b)}",
+                min=field.get("min"), max=field.get("max"))
+    return rules
+
+
+class RuleSet:
+    """
+    All compiled rules, indexed by entity type and level.
+    """
+
+    def __init__(self, rules: List[CompiledRule], field_types: Dict[str, Dict[str, str]], version: Optional[str] = None):
+        self.rules = rules
+        self.version = version
+        self._field_types = field_types
+        self._index: Dict[Any, List[CompiledRule]] = {}
+        self._by_id = {rule.id: rule for rule in rules}
+        for rule in rules:
+            self._index.setdefault((rule.entity_type, rule.level), []).append(rule)
+        specs = sorted((rule.spec for rule in rules), key=lambda spec: spec["id"])
+        self.fingerprint = hashlib.sha256(json.dumps(specs, sort_keys=True, default=str).encode()).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def get(self, rule_id: str) -> Optional[CompiledRule]:
+        """Look up a rule by ID."""
+        return self._by_id.get(rule_id)
+
+    def for_entity(self, entity_type: str, level: str) -> List[CompiledRule]:
+        """
+        Get the rules of one level for an entity type.
+
+        Args:
+            entity_type: The entity type
+            level: field, row, table or relationship
+
+        Returns:
+            List of compiled rules
+        """
+        return self._index.get((entity_type, level), [])
+
+    def field_types(self, entity_type: str) -> Dict[str, str]:
+        """Template type of each field of an entity type."""
+        return self._field_types.get(entity_type, {})
+
+    def columns(self, entity_type: str, level: str) -> Set[str]:
+        """Columns read by the rules of one level for an entity type."""
+        return {column for rule in self.for_entity(entity_type, level) for column in rule.columns}
+
+
+def build_ruleset(templates: List[Dict[str, Any]], ruleset: Optional[Dict[str, Any]] = None) -> RuleSet:
+    """
+    Compile template-derived rules and a ruleset's rules.
+
+    Fields of all templates for the same entity type are combined. A rule
+    ID derived from more than one template is compiled once.
+
+    Args:
+        templates: Schema templates
+        ruleset: Parsed ruleset file with a ``rules`` list, if any
+
+    Returns:
+        RuleSet: The compiled rules
+
+    Raises:
+        RuleError: If any rule definition is invalid
+    """
+    field_types: Dict[str, Dict[str, str]] = {}
+    specs: Dict[str, Dict[str, Any]] = {}
+    for template in templates:
+        entity_type = template.get("entity_type")
+        if entity_type not in ENTITY_TYPES:
+            continue
+        types = field_types.setdefault(entity_type, {})
+        for field in template.get("fields", []):
+            types.setdefault(field["name"], field.get("type", "string"))
+        for spec in template_rules(template):
+            specs.setdefault(spec["id"], spec)
+
+    for spec in (ruleset or {}).get("rules", []):
+        if spec.get("id") in specs:
+            raise RuleError(f"Duplicate rule ID '{spec.get('id')}'")
+        specs[spec.get("id")] = spec
+
+    rules = [compile_rule(spec, field_types.get(spec.get("entity_type"), {})) for spec in specs.values()]
+    return RuleSet(rules, field_types, version=(ruleset or {}).get("version"))
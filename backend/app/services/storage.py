@@ -0,0 +1,991 @@
+"""
+Storage service for streaming uploaded files to disk.
+
+Uploads are written in fixed-size chunks so memory use does not depend on
+file size. The SHA-256 digest and the CSV shape (rows and columns) are
+computed on the same pass, so later stages never need to re-scan a file
+just to learn its size.
+"""
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Mapping, Optional, Tuple
+from pathlib import Path
+from datetime import datetime
+import asyncio
+import csv
+import hashlib
+import io
+import re
+import uuid
+
+import aiofiles
+import aiofiles.os
+from bson import ObjectId
+from multipart.exceptions import FormParserError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.config import settings
+from app.db.database import get_database, COLLECTIONS
+from app.schemas.loader import template_exists
+from app.services.mappings import MappingService, header_fingerprint
+
+
+# Upper bound on how much of the file is buffered while looking for the
+# end of the header line.
+MAX_HEADER_BYTES = 1024 * 1024
+
+# Upper bound on the size of a (non-file) form field, and on everything a
+# multipart upload body may carry besides the file itself.
+MAX_FORM_FIELD_BYTES = 64 * 1024
+MAX_FORM_OVERHEAD_BYTES = 1024 * 1024
+
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class UploadTooLargeError(Exception):
+    """
+    Raised when an upload exceeds the configured maximum size.
+    """
+    pass
+
+
+class UploadFormError(Exception):
+    """
+    Raised when a multipart upload body is malformed or incomplete.
+    """
+    pass
+
+
+class UnknownSchemaTemplateError(UploadFormError):
+    """
+    Raised when an upload names a schema template that does not exist.
+    """
+    pass
+
+
+class UploadSessionNotFoundError(Exception):
+    """
+    Raised when a resumable upload session does not exist.
+    """
+    pass
+
+
+class UploadSessionStateError(Exception):
+    """
+    Raised when an upload session cannot accept the requested operation,
+    e.g. finalizing with parts still missing.
+    """
+    pass
+
+
+def detect_delimiter(filename: str) -> str:
+    """
+    Pick the field delimiter for a file from its extension.
+
+    Args:
+        filename: Original filename
+
+    Returns:
+        str: Tab for .tsv/.tab files, comma otherwise
+    """
+    suffix = Path(filename).suffix.lower()
+    return "\t" if suffix in (".tsv", ".tab") else ","
+
+
+def safe_filename(filename: str) -> str:
+    """
+    Strip path components and unsafe characters from a client filename.
+
+    Args:
+        filename: Original filename
+
+    Returns:
+        str: Filename that is safe to use on disk
+    """
+    name = _UNSAFE_FILENAME_CHARS.sub("_", Path(filename or "upload").name)
+    return name.strip("._") or "upload"
+
+
+def split_newline_counts(chunk: bytes) -> Tuple[int, int, int]:
+    """
+    Count the newlines in a chunk for both possible starting quote states.
+
+    Args:
+        chunk: Raw bytes
+
+    Returns:
+        Tuple of (newlines if the chunk starts outside quotes,
+        newlines if it starts inside quotes, number of quote characters)
+    """
+    segments = chunk.split(b'"')
+    even = sum(segment.count(b"\n") for segment in segments[0::2])
+    odd = sum(segment.count(b"\n") for segment in segments[1::2])
+    return even, odd, len(segments) - 1
+
+
+class CsvShapeCounter:
+    """
+    Incrementally counts the rows and columns of a delimited text file.
+
+    Chunks are fed in order. Newlines inside quoted fields are not counted
+    as row breaks; quote state is tracked across chunk boundaries by
+    splitting each chunk on the quote character, so the work happens in
+    C-level bytes operations rather than a per-byte Python loop.
+    """
+
+    def __init__(self, delimiter: str = ","):
+        self.delimiter = delimiter
+        self.bytes_seen = 0
+        self._newlines = 0
+        self._in_quotes = False
+        self._last_byte = b""
+        self._header = bytearray()
+        self._header_done = False
+
+    def feed(self, chunk: bytes) -> None:
+        """
+        Consume the next chunk of the file.
+
+        Args:
+            chunk: Raw bytes following the previously fed chunk
+        """
+        if not chunk:
+            return
+        if not self._header_done:
+            self._capture_header(chunk)
+        self._consume(*split_newline_counts(chunk))
+        self.bytes_seen += len(chunk)
+        self._last_byte = chunk[-1:]
+
+    def _consume(self, unquoted: int, quoted: int, quote_count: int) -> None:
+        """Advance the row count and quote state past one chunk."""
+        self._newlines += quoted if self._in_quotes else unquoted
+        if quote_count % 2:
+            self._in_quotes = not self._in_quotes
+
+    def _capture_header(self, chunk: bytes) -> None:
+        """Buffer bytes until the first unquoted newline ends the header."""
+        start = len(self._header)
+        self._header.extend(chunk)
+        in_quotes = self._in_quotes
+        for i in range(start, len(self._header)):
+            byte = self._header[i]
+            if byte == 0x22:  # '"'
+                in_quotes = not in_quotes
+            elif byte == 0x0A and not in_quotes:  # '\n'
+                del self._header[i:]
+                self._header_done = True
+                return
+        if len(self._header) >= MAX_HEADER_BYTES:
+            self._header_done = True
+
+    @property
+    def line_count(self) -> int:
+        """Number of logical lines, including the header."""
+        if self.bytes_seen == 0:
+            return 0
+        trailing = 0 if self._last_byte == b"\n" else 1
+        return self._newlines + trailing
+
+    @property
+    def columns(self) -> List[str]:
+        """Column names parsed from the header line."""
+        text = bytes(self._header).decode("utf-8-sig", errors="replace").rstrip("\r\n")
+        if not text:
+            return []
+        try:
+            return next(csv.reader([text], delimiter=self.delimiter), [])
+        except csv.Error:
+            # Not a header: a later part of a multi-part upload that
+            # starts inside a quoted field
+            return []
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Get the shape of everything fed so far.
+
+        Returns:
+            Dict with row_count (excluding header), column_count and columns
+        """
+        columns = self.columns
+        return {
+            "row_count": max(self.line_count - 1, 0),
+            "column_count": len(columns),
+            "columns": columns,
+        }
+
+
+class PartShapeCounter(CsvShapeCounter):
+    """
+    Shape counter for one part of a multi-part upload.
+
+    A part may begin inside a quoted field that started in an earlier
+    part, which is not known until the parts are assembled. The counter
+    therefore tracks newline counts for both starting states, and
+    compose_part_shapes() chains the parts together in order at finalize
+    time without reading them again.
+    """
+
+    def __init__(self, delimiter: str = ","):
+        super().__init__(delimiter=delimiter)
+        self._newlines_from_quoted = 0
+        self._in_quotes_from_quoted = True
+
+    def _consume(self, unquoted: int, quoted: int, quote_count: int) -> None:
+        super()._consume(unquoted, quoted, quote_count)
+        self._newlines_from_quoted += quoted if self._in_quotes_from_quoted else unquoted
+        if quote_count % 2:
+            self._in_quotes_from_quoted = not self._in_quotes_from_quoted
+
+    def part_summary(self) -> Dict[str, Any]:
+        """
+        Get the composable shape of this part.
+
+        Returns:
+            Dict with newline counts for both starting states, quote parity,
+            whether the part ends in a newline and the header columns
+            (meaningful for the first part only)
+        """
+        return {
+            "newlines": [self._newlines, self._newlines_from_quoted],
+            "odd_quotes": self._in_quotes,
+            "ends_with_newline": self._last_byte == b"\n",
+            "header_complete": self._header_done,
+            "columns": self.columns,
+        }
+
+
+def read_header_columns(paths: List[str], delimiter: str = ",") -> List[str]:
+    """
+    Parse the header of a multi-part file whose header spans parts.
+
+    Only reads until the header line ends (at most MAX_HEADER_BYTES).
+
+    Args:
+        paths: Part paths in order
+        delimiter: Field delimiter
+
+    Returns:
+        List[str]: Header column names
+    """
+    counter = CsvShapeCounter(delimiter=delimiter)
+    with io.BufferedReader(ConcatenatedReader(paths)) as reader:
+        while not counter._header_done:
+            chunk = reader.read(64 * 1024)
+            if not chunk:
+                break
+            counter._capture_header(chunk)
+    return counter.columns
+
+
+def compose_part_shapes(parts: List[Dict[str, Any]], columns: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Combine per-part shapes into the shape of the assembled file.
+
+    Args:
+        parts: Part metadata in part-number order, each holding size_bytes
+            and the fields produced by PartShapeCounter.part_summary()
+        columns: Header columns, if already known; defaults to those parsed
+            from the first part
+
+    Returns:
+        Dict with row_count (excluding header), column_count and columns
+    """
+    in_quotes = False
+    newlines = 0
+    last_part = None
+    for part in parts:
+        if not part["size_bytes"]:
+            continue
+        newlines += part["newlines"][1 if in_quotes else 0]
+        if part["odd_quotes"]:
+            in_quotes = not in_quotes
+        last_part = part
+
+    line_count = 0
+    if last_part is not None:
+        line_count = newlines + (0 if last_part["ends_with_newline"] else 1)
+
+    if columns is None:
+        columns = parts[0]["columns"] if parts else []
+    return {
+        "row_count": max(line_count - 1, 0),
+        "column_count": len(columns),
+        "columns": columns,
+    }
+
+
+class ConcatenatedReader(io.RawIOBase):
+    """
+    Read-only file object presenting several part files as one stream.
+    """
+
+    def __init__(self, paths: List[str]):
+        self._paths = list(paths)
+        self._current: Optional[BinaryIO] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while True:
+            if self._current is None:
+                if not self._paths:
+                    return 0
+                self._current = open(self._paths.pop(0), "rb")
+            n = self._current.readinto(buffer)
+            if n:
+                return n
+            self._current.close()
+            self._current = None
+
+    def close(self) -> None:
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+        super().close()
+
+
+class MultipartFileUpload:
+    """
+    Streams the file out of a multipart/form-data request body.
+
+    The body is parsed as it arrives, so the file is written straight to
+    its destination instead of being spooled to a temporary file first,
+    and an oversized upload is refused as soon as the limit is crossed.
+    Form fields (before or after the file) are collected in ``fields``;
+    only the first file part is kept.
+
+    Usage:
+        form = MultipartFileUpload(request.headers, request.stream())
+        filename = await form.open_file()
+        async for chunk in form.file_chunks():
+            out.write(chunk)
+        template_id = form.fields["schema_template_id"]
+    """
+
+    def __init__(self, headers: Mapping[str, str], body: AsyncIterator[bytes]):
+        content_type, params = parse_options_header(headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise UploadFormError("Expected a multipart/form-data body")
+        self.max_body_bytes = settings.MAX_UPLOAD_SIZE + MAX_FORM_OVERHEAD_BYTES
+        # Refuse before reading anything when the client declares the size
+        length = headers.get("content-length", "")
+        if length.isdigit() and int(length) > self.max_body_bytes:
+            raise UploadTooLargeError(
+                f"File exceeds maximum upload size of {settings.MAX_UPLOAD_SIZE} bytes"
+            )
+
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.bytes_read = 0
+        self._body = body.__aiter__()
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._part: Optional[str] = None  # "file", "field" or None (skipped)
+        self._field_name = ""
+        self._field_data = bytearray()
+        self._file_data: List[bytes] = []
+        self._file_done = False
+        self._finished = False
+
+    def _on_part_begin(self) -> None:
+        self._disposition = b""
+        self._part = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        if b"name" not in options:
+            raise UploadFormError('Form part without a Content-Disposition "name"')
+        if b"filename" not in options:
+            self._part = "field"
+            self._field_name = options[b"name"].decode("utf-8", "replace")
+            self._field_data = bytearray()
+        elif self.filename is None:
+            self._part = "file"
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part == "file":
+            self._file_data.append(data[start:end])
+        elif self._part == "field":
+            self._field_data += data[start:end]
+            if len(self._field_data) > MAX_FORM_FIELD_BYTES:
+                raise UploadFormError(f"Form field '{self._field_name}' is too large")
+
+    def _on_part_end(self) -> None:
+        if self._part == "file":
+            self._file_done = True
+        elif self._part == "field":
+            self.fields[self._field_name] = self._field_data.decode("utf-8", "replace")
+
+    async def _feed(self) -> bool:
+        """Parse the next chunk of the body; False once it is exhausted."""
+        if self._finished:
+            return False
+        try:
+            chunk = await self._body.__anext__()
+        except StopAsyncIteration:
+            self._finished = True
+            self._parser.finalize()
+            return False
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self.max_body_bytes:
+            raise UploadTooLargeError(
+                f"File exceeds maximum upload size of {settings.MAX_UPLOAD_SIZE} bytes"
+            )
+        try:
+            self._parser.write(chunk)
+        except FormParserError as e:
+            raise UploadFormError(f"Malformed multipart body: {e}")
+        return True
+
+    async def open_file(self) -> str:
+        """
+        Read the body up to the start of the file.
+
+        Returns:
+            str: The client's filename
+
+        Raises:
+            UploadFormError: If the body holds no file
+        """
+        while self.filename is None:
+            if not await self._feed():
+                raise UploadFormError("The upload form contains no file")
+        return self.filename
+
+    async def file_chunks(self) -> AsyncIterator[bytes]:
+        """
+        Yield the file's content as it arrives, then read the rest of the
+        body so that fields sent after the file are collected too.
+
+        Yields:
+            bytes: The next piece of the file
+
+        Raises:
+            UploadFormError: If the body ends inside the file
+        """
+        await self.open_file()
+        while True:
+            if self._file_data:
+                data = b"".join(self._file_data)
+                self._file_data = []
+                yield data
+            if self._file_done:
+                break
+            if not await self._feed():
+                raise UploadFormError("The upload body ended inside the file")
+        while await self._feed():
+            pass
+
+    async def file_head(self, size: int) -> bytes:
+        """
+        Read the first bytes of the file and stop.
+
+        The body is read only as far as needed, so fields sent after the
+        file are collected only when the whole file fits in ``size``.
+
+        Args:
+            size: Bytes of the file to read at most
+
+        Returns:
+            bytes: The head of the file
+
+        Raises:
+            UploadFormError: If the body holds no file
+        """
+        await self.open_file()
+        head = bytearray()
+        while len(head) < size:
+            if self._file_data:
+                head += b"".join(self._file_data)
+                self._file_data = []
+            elif self._file_done or not await self._feed():
+                break
+        if self._file_done and len(head) <= size:
+            while await self._feed():
+                pass
+        return bytes(head[:size])
+
+
+async def _remove_quietly(path: Path) -> None:
+    """Delete a file that another request may have deleted already."""
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def open_uploaded_file(file_doc: Dict[str, Any]) -> BinaryIO:
+    """
+    Open an uploaded file for reading, whether stored whole or in parts.
+
+    Args:
+        file_doc: The uploaded_files document
+
+    Returns:
+        BinaryIO: Buffered binary reader over the file contents
+    """
+    if file_doc.get("parts"):
+        return io.BufferedReader(ConcatenatedReader(file_doc["parts"]), buffer_size=settings.UPLOAD_CHUNK_SIZE)
+    return open(file_doc["s3_path"], "rb")
+
+
+class StorageService:
+    """
+    Service for persisting uploaded files and their metadata.
+    """
+
+    def __init__(self):
+        self.db = None
+
+    async def initialize(self):
+        """Initialize database connection."""
+        self.db = get_database()
+
+    def run_upload_dir(self, run_id: str) -> Path:
+        """
+        Get the directory holding a run's uploads.
+
+        Args:
+            run_id: The run ID
+
+        Returns:
+            Path: Upload directory for the run
+        """
+        return Path(settings.UPLOAD_DIR) / run_id
+
+    async def save_upload(
+        self,
+        run_id: str,
+        form: MultipartFileUpload,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Stream an uploaded file to disk and record its metadata.
+
+        The schema template is taken from the form's ``schema_template_id``
+        field, which may come before or after the file.
+
+        Args:
+            run_id: The run ID the file belongs to
+            form: The incoming upload form
+            user_id: User performing the upload, for the audit log
+
+        Returns:
+            Dict: The inserted uploaded_files document
+
+        Raises:
+            UploadTooLargeError: If the file exceeds MAX_UPLOAD_SIZE
+            UploadFormError: If the form is malformed or has no
+                schema_template_id
+            UnknownSchemaTemplateError: If the schema template does not exist
+        """
+        if self.db is None:
+            await self.initialize()
+
+        filename = await form.open_file() or "upload"
+        # Fail before the transfer when the template is sent first
+        if "schema_template_id" in form.fields:
+            self._check_template(form.fields["schema_template_id"])
+
+        file_id = ObjectId()
+        run_dir = self.run_upload_dir(run_id)
+        await aiofiles.os.makedirs(run_dir, exist_ok=True)
+        dest = run_dir / f"{file_id}_{safe_filename(filename)}"
+
+        delimiter = detect_delimiter(filename)
+        hasher = hashlib.sha256()
+        counter = CsvShapeCounter(delimiter=delimiter)
+
+        try:
+            async with aiofiles.open(dest, "wb") as out:
+                async for chunk in form.file_chunks():
+                    if counter.bytes_seen + len(chunk) > settings.MAX_UPLOAD_SIZE:
+                        raise UploadTooLargeError(
+                            f"File exceeds maximum upload size of {settings.MAX_UPLOAD_SIZE} bytes"
+                        )
+                    await out.write(chunk)
+                    hasher.update(chunk)
+                    counter.feed(chunk)
+            schema_template_id = self._check_template(form.fields.get("schema_template_id"))
+        except BaseException:
+            if await aiofiles.os.path.exists(dest):
+                await aiofiles.os.remove(dest)
+            raise
+
+        file_doc = {
+            "_id": file_id,
+            "run_id": ObjectId(run_id),
+            "filename": filename,
+            "s3_path": str(dest),
+            "schema_template_id": schema_template_id,
+            "created_at": datetime.utcnow(),
+            "size_bytes": counter.bytes_seen,
+            "sha256": hasher.hexdigest(),
+            "delimiter": delimiter,
+            **counter.summary(),
+        }
+        await self.record_file(file_doc, user_id)
+        return file_doc
+
+    @staticmethod
+    def _check_template(schema_template_id: Optional[str]) -> str:
+        """Return the template ID of an upload form, or raise if it is unusable."""
+        if not schema_template_id:
+            raise UploadFormError("Missing form field 'schema_template_id'")
+        if not template_exists(schema_template_id):
+            raise UnknownSchemaTemplateError(f"Schema '{schema_template_id}' not found")
+        return schema_template_id
+
+    async def record_file(self, file_doc: Dict[str, Any], user_id: Optional[str] = None) -> None:
+        """
+        Insert an uploaded_files document and attach it to its run.
+
+        A mapping saved for the same header and template is applied to the
+        file (``mapping_id``).
+
+        Args:
+            file_doc: The uploaded_files document to insert
+            user_id: User performing the upload, for the audit log
+        """
+        if self.db is None:
+            await self.initialize()
+
+        # Apply the saved mapping for this header, if there is one
+        file_doc["header_fingerprint"] = header_fingerprint(file_doc.get("columns", []))
+        saved = await MappingService(self.db).find_for_header(
+            file_doc.get("columns", []), file_doc["schema_template_id"]
+        )
+        file_doc["mapping_id"] = saved["_id"] if saved else None
+
+        await self.db[COLLECTIONS["uploaded_files"]].insert_one(file_doc)
+        await self.db[COLLECTIONS["runs"]].update_one(
+            {"_id": file_doc["run_id"]},
+            {"$push": {"files": file_doc["_id"]}}
+        )
+        await self.db[COLLECTIONS["audit_logs"]].insert_one({
+            "timestamp": datetime.utcnow(),
+            "user_id": user_id,
+            "run_id": file_doc["run_id"],
+            "action": "file_uploaded",
+            "details": {
+                "file_id": str(file_doc["_id"]),
+                "filename": file_doc["filename"],
+                "size_bytes": file_doc["size_bytes"],
+                "sha256": file_doc.get("sha256") or file_doc.get("parts_sha256"),
+                "row_count": file_doc["row_count"],
+                "column_count": file_doc["column_count"],
+                "mapping_id": str(file_doc["mapping_id"]) if file_doc["mapping_id"] else None,
+            },
+        })
+
+    def session_dir(self, run_id: str, session_id: str) -> Path:
+        """
+        Get the directory holding the parts of an upload session.
+
+        Args:
+            run_id: The run ID
+            session_id: The upload session ID
+
+        Returns:
+            Path: Directory for the session's part files
+        """
+        return self.run_upload_dir(run_id) / "sessions" / session_id
+
+    async def open_session(
+        self,
+        run_id: str,
+        filename: str,
+        schema_template_id: str,
+        total_parts: int,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Open a resumable, multi-part upload session.
+
+        Args:
+            run_id: The run ID the file belongs to
+            filename: Original filename
+            schema_template_id: Schema template chosen for the file
+            total_parts: Number of parts the client will send
+            user_id: User opening the session
+
+        Returns:
+            Dict: The inserted upload_sessions document
+        """
+        if self.db is None:
+            await self.initialize()
+
+        session_id = ObjectId()
+        session_doc = {
+            "_id": session_id,
+            "run_id": ObjectId(run_id),
+            "user_id": user_id,
+            "filename": filename,
+            "schema_template_id": schema_template_id,
+            "delimiter": detect_delimiter(filename),
+            "total_parts": total_parts,
+            "parts": {},
+            "status": "open",
+            "file_id": None,
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow(),
+        }
+        await aiofiles.os.makedirs(self.session_dir(run_id, str(session_id)), exist_ok=True)
+        await self.db[COLLECTIONS["upload_sessions"]].insert_one(session_doc)
+        return session_doc
+
+    async def get_session(self, run_id: str, session_id: str) -> Dict[str, Any]:
+        """
+        Load an upload session.
+
+        Args:
+            run_id: The run ID
+            session_id: The upload session ID
+
+        Returns:
+            Dict: The upload_sessions document
+
+        Raises:
+            UploadSessionNotFoundError: If the session does not exist
+        """
+        if self.db is None:
+            await self.initialize()
+
+        session = None
+        if ObjectId.is_valid(session_id):
+            session = await self.db[COLLECTIONS["upload_sessions"]].find_one(
+                {"_id": ObjectId(session_id), "run_id": ObjectId(run_id)}
+            )
+        if not session:
+            raise UploadSessionNotFoundError(f"Upload session '{session_id}' not found")
+        return session
+
+    async def save_part(
+        self,
+        run_id: str,
+        session_id: str,
+        part_number: int,
+        body: AsyncIterator[bytes]
+    ) -> Dict[str, Any]:
+        """
+        Stream one part of a multi-part upload to disk.
+
+        Every transfer writes a file of its own, which only becomes the
+        part once it is complete and registered with an atomic update that
+        requires the session to still be open. A transfer that finishes
+        after complete_session() or abort_session() has claimed the session
+        is discarded instead of landing under it, and an interrupted one
+        never leaves a partial part that looks finished. Re-sending a part
+        replaces it.
+
+        Args:
+            run_id: The run ID
+            session_id: The upload session ID
+            part_number: 1-based part number
+            body: Async iterator over the raw part bytes
+
+        Returns:
+            Dict: Metadata recorded for the part
+
+        Raises:
+            UploadSessionStateError: If the session is not open, or stops
+                being open during the transfer
+        """
+        session = await self.get_session(run_id, session_id)
+        if session["status"] != "open":
+            raise UploadSessionStateError(f"Upload session is {session['status']}")
+        if part_number > session["total_parts"]:
+            raise UploadSessionStateError(
+                f"Part {part_number} is out of range (total_parts={session['total_parts']})"
+            )
+
+        dest = self.session_dir(run_id, session_id) / f"part-{part_number:05d}-{uuid.uuid4().hex}"
+        hasher = hashlib.sha256()
+        counter = PartShapeCounter(delimiter=session.get("delimiter", ","))
+        try:
+            try:
+                async with aiofiles.open(dest, "wb") as out:
+                    async for chunk in body:
+                        if not chunk:
+                            continue
+                        if counter.bytes_seen + len(chunk) > settings.MAX_UPLOAD_SIZE:
+                            raise UploadTooLargeError(
+                                f"Part exceeds maximum upload size of {settings.MAX_UPLOAD_SIZE} bytes"
+                            )
+                        await out.write(chunk)
+                        hasher.update(chunk)
+                        counter.feed(chunk)
+            except FileNotFoundError:
+                # abort_session() removed the directory
+                raise UploadSessionStateError("Upload session is aborted")
+
+            part = {
+                "part_number": part_number,
+                "path": str(dest),
+                "size_bytes": counter.bytes_seen,
+                "sha256": hasher.hexdigest(),
+                **counter.part_summary(),
+            }
+            previous = await self.db[COLLECTIONS["upload_sessions"]].find_one_and_update(
+                {"_id": session["_id"], "status": "open"},
+                {"$set": {f"parts.{part_number}": part, "updated_at": datetime.utcnow()}}
+            )
+            if previous is None:
+                current = await self.get_session(run_id, session_id)
+                raise UploadSessionStateError(f"Upload session is {current['status']}")
+        except BaseException:
+            await _remove_quietly(dest)
+            raise
+
+        # The copy this one replaced; completion claims the session
+        # atomically, so it can no longer be reading it
+        replaced = previous.get("parts", {}).get(str(part_number))
+        if replaced and replaced["path"] != part["path"]:
+            await _remove_quietly(Path(replaced["path"]))
+        return part
+
+    @staticmethod
+    def missing_parts(session: Dict[str, Any]) -> List[int]:
+        """
+        List the part numbers not yet received for a session.
+
+        Args:
+            session: The upload_sessions document
+
+        Returns:
+            List[int]: Missing part numbers in ascending order
+        """
+        received = session.get("parts", {})
+        return [n for n in range(1, session["total_parts"] + 1) if str(n) not in received]
+
+    async def complete_session(self, run_id: str, session_id: str) -> Dict[str, Any]:
+        """
+        Finalize a multi-part upload into an uploaded_files record.
+
+        The parts are not concatenated on disk: the file record lists the
+        part paths in order and open_uploaded_file() reads them as a single
+        stream. The row/column counts are chained from the per-part shapes,
+        and the digest is recorded as a composite of the part digests.
+
+        Args:
+            run_id: The run ID
+            session_id: The upload session ID
+
+        Returns:
+            Dict: The inserted uploaded_files document
+        """
+        session = await self.get_session(run_id, session_id)
+        missing = self.missing_parts(session)
+        if missing:
+            raise UploadSessionStateError(f"Upload is missing parts: {missing}")
+
+        # Claim the session so concurrent finalize calls cannot both succeed
+        # and no part can be added, replaced or aborted from here on. The
+        # claimed document is the session as of the claim, so parts
+        # registered after the read above are included.
+        session = await self.db[COLLECTIONS["upload_sessions"]].find_one_and_update(
+            {"_id": session["_id"], "status": "open"},
+            {"$set": {"status": "completing", "updated_at": datetime.utcnow()}}
+        )
+        if not session:
+            current = await self.get_session(run_id, session_id)
+            raise UploadSessionStateError(f"Upload session is {current['status']}")
+
+        parts = [session["parts"][str(n)] for n in range(1, session["total_parts"] + 1)]
+        size_bytes = sum(p["size_bytes"] for p in parts)
+        file_id = ObjectId()
+        try:
+            if size_bytes > settings.MAX_UPLOAD_SIZE:
+                raise UploadTooLargeError(
+                    f"File exceeds maximum upload size of {settings.MAX_UPLOAD_SIZE} bytes"
+                )
+            columns = None
+            if not parts[0].get("header_complete", True):
+                columns = await asyncio.to_thread(
+                    read_header_columns, [p["path"] for p in parts], session.get("delimiter", ",")
+                )
+
+            composite = hashlib.sha256(b"".join(bytes.fromhex(p["sha256"]) for p in parts))
+            file_doc = {
+                "_id": file_id,
+                "run_id": session["run_id"],
+                "filename": session["filename"],
+                "s3_path": str(self.session_dir(run_id, session_id)),
+                "parts": [p["path"] for p in parts],
+                "schema_template_id": session["schema_template_id"],
+                "created_at": datetime.utcnow(),
+                "size_bytes": size_bytes,
+                "sha256": None,
+                "parts_sha256": f"{composite.hexdigest()}-{len(parts)}",
+                "delimiter": session.get("delimiter", ","),
+                **compose_part_shapes(parts, columns),
+            }
+            await self.record_file(file_doc, session.get("user_id"))
+            await self.db[COLLECTIONS["upload_sessions"]].update_one(
+                {"_id": session["_id"]},
+                {"$set": {"status": "completed", "file_id": file_id, "updated_at": datetime.utcnow()}}
+            )
+        except BaseException:
+            # Undo whatever was recorded and hand the session back, so the
+            # upload can be completed again or aborted
+            await self.db[COLLECTIONS["uploaded_files"]].delete_one({"_id": file_id})
+            await self.db[COLLECTIONS["runs"]].update_one(
+                {"_id": session["run_id"]}, {"$pull": {"files": file_id}}
+            )
+            await self.db[COLLECTIONS["upload_sessions"]].update_one(
+                {"_id": session["_id"]}, {"$set": {"status": "open", "updated_at": datetime.utcnow()}}
+            )
+            raise
+        return file_doc
+
+    async def abort_session(self, run_id: str, session_id: str) -> None:
+        """
+        Abort an open upload session and delete its parts.
+
+        Aborting an aborted session is a no-op.
+
+        Args:
+            run_id: The run ID
+            session_id: The upload session ID
+
+        Raises:
+            UploadSessionStateError: If the session is being completed or
+                is completed
+        """
+        session = await self.get_session(run_id, session_id)
+        claimed = await self.db[COLLECTIONS["upload_sessions"]].find_one_and_update(
+            {"_id": session["_id"], "status": {"$in": ["open", "aborted"]}},
+            {"$set": {"status": "aborted", "updated_at": datetime.utcnow()}}
+        )
+        if not claimed:
+            current = await self.get_session(run_id, session_id)
+            raise UploadSessionStateError(f"Upload session is {current['status']}")
+
+        part_dir = self.session_dir(run_id, session_id)
+        if await aiofiles.os.path.isdir(part_dir):
+            for name in await aiofiles.os.listdir(part_dir):
+                await _remove_quietly(part_dir / name)
+            await aiofiles.os.rmdir(part_dir)
@@ -1,11 +1,56 @@
 """
 Validation service for applying rules to harmonized data.
 """
-from typing import Dict, List, Any
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Set, Tuple
+import asyncio
+
+import numpy as np
 from bson import ObjectId
 
+from app.core.config import settings
+from app.core.hierarchy import ENTITY_TYPES, ENTITY_KEYS, PARENT_TYPES, parent_key
+from app.core.metrics import stage_timer
+from app.db.bulk import iter_batches
 from app.db.database import get_database, COLLECTIONS
-from app.models.run import ValidationError, ValidationResult
+from app.models.batches import ErrorBatch
+from app.models.run import ValidationResult
+from app.schemas.loader import list_templates, load_ruleset, ruleset_path
+from app.schemas.registry import schema_registry
+from app.services.relationships import (
+    EntityRemap, RelationshipIndex, index_path, load_relationship_index, match_entities, prune_indexes
+)
+from app.services.rules import ColumnBatch, CompiledRule, RuleSet, build_ruleset
+from app.services.validation_modes import ValidationOptions, estimate_rate, stratified_sample
+from app.services.validation_store import ValidationErrorWriter, delete_errors
+
+
+# Fields read from canonical_entities when validating
+ENTITY_PROJECTION = {"_id": 1, "file_id": 1, "row_index": 1, "data": 1, "invalid": 1}
+
+
+@lru_cache(maxsize=4)
+def _compile_rules(templates_etag: str, ruleset_id: str, ruleset_mtime_ns: int) -> RuleSet:
+    return build_ruleset(list_templates(), load_ruleset(ruleset_id))
+
+
+def load_rules() -> RuleSet:
+    """
+    Load and compile validation rules.
+    
+    Rules are derived from the schema templates' field definitions and
+    extended with the cross-field rules of the VALIDATION_RULESET file.
+    The compiled ruleset is cached until a template or the ruleset file
+    changes, so the same RuleSet object is returned until then.
+    
+    Returns:
+        RuleSet: Compiled rules organized by entity type and level
+    """
+    try:
+        mtime_ns = ruleset_path(settings.VALIDATION_RULESET).stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = 0
+    return _compile_rules(schema_registry.etag, settings.VALIDATION_RULESET, mtime_ns)
 
 
 class ValidationService:
@@ -16,164 +61,576 @@ class ValidationService:
     - Field-level: Type checks, regex patterns, enum validation
     - Row-level: Cross-field consistency
     - Table-level: Uniqueness constraints
-    - Relationship-level: Referential integrity
+    - Relationship-level: Referential integrity, checked on the run's
+      RelationshipIndex (see app.services.relationships)
+    
+    Rules are compiled once (see app.services.rules) and evaluated on
+    batches of VALIDATION_BATCH_SIZE entities at a time, one column-level
+    operation per rule rather than one call per cell.
+    
+    Re-validation after a re-harmonization is incremental: entities are
+    matched to the previous revision by content hash, field and row rules
+    only run on new or changed entities, table rules only on entity types
+    whose entities changed, and the previous result's other errors are
+    carried over to the matching entities.
     """
     
-    def __init__(self):
+    def __init__(self, rules: Optional[RuleSet] = None):
         self.db = None
-        self.rules = self._load_rules()
+        self.rules = rules if rules is not None else load_rules()
     
     async def initialize(self):
         """Initialize database connection."""
         self.db = get_database()
     
-    def _load_rules(self) -> Dict[str, Any]:
-        """
-        Load validation rules.
-        
-        Returns:
-            Dict containing all validation rules organized by type
-        """
-        # TODO: Load rules from configuration or database
-        return {
-            "field_level": [],
-            "row_level": [],
-            "table_level": [],
-            "relationship_level": []
-        }
-    
-    async def validate_run(self, run_id: str) -> ValidationResult:
+    async def validate_run(
+        self,
+        run_id: str,
+        relationships: Optional[RelationshipIndex] = None,
+        incremental: bool = True,
+        options: Optional[ValidationOptions] = None
+    ) -> ValidationResult:
         """
         Validate all entities in a run.
         
+        In full mode, when the run's last result was complete, produced with
+        the same rules and the relationship index of its revision is still
+        available, only changed entities are re-checked and the result is
+        merged with the previous one (see _validate_changes). Otherwise every
+        entity is checked.
+        
+        Fail-fast mode checks relationships first, then entities, and stops
+        after the batch in which ``max_blockers`` Blocker errors were
+        reached. Sample mode checks field and row rules on a stratified
+        sample of each entity type (see _validate_sample); its result is
+        stored but, being an estimate, neither replaces the run's current
+        result nor changes the run's status.
+        
         Args:
             run_id: The run ID to validate
+            relationships: The run's relationship index, if the caller
+                already has it (e.g. straight after harmonization);
+                otherwise the saved index is loaded or rebuilt
+            incremental: Allow merging with the previous result
+            options: Validation mode (default: full)
             
         Returns:
-            ValidationResult: Validation results with all errors
+            ValidationResult: Validation result with error counts and
+            samples; the errors are stored in validation_errors
         """
-        if not self.db:
+        if self.db is None:
             await self.initialize()
         
-        errors: List[ValidationError] = []
+        options = options or ValidationOptions()
+        run_oid = ObjectId(run_id)
+        if relationships is None:
+            relationships = await load_relationship_index(self.db, run_id)
         
-        # TODO: Implement validation logic
-        # 1. Load all canonical entities for the run
-        # 2. Apply field-level rules
-        # 3. Apply row-level rules
-        # 4. Apply table-level rules
-        # 5. Apply relationship-level rules
-        # 6. Categorize errors by severity
-        # 7. Store validation results
+        result_id = ObjectId()
+        revalidated = None
+        estimates = None
+        complete = options.complete
+        try:
+            async with ValidationErrorWriter(self.db, run_oid, result_id) as errors:
+                if options.mode == "sample":
+                    estimates = await self._validate_sample(run_oid, relationships, options, errors)
+                    await errors.add_many(await self.validate_relationships(relationships))
+                elif options.mode == "fail-fast":
+                    # Relationship checks need no entity reads, so they go first
+                    await errors.add_many(await self.validate_relationships(relationships))
+                    for entity_type in ENTITY_TYPES:
+                        if errors.severity_counts["Blocker"] >= options.max_blockers or not (
+                            await self._validate_entity_type(run_oid, entity_type, errors, options.max_blockers)
+                        ):
+                            complete = False
+                            break
+                else:
+                    merged = False
+                    if incremental:
+                        previous = await self._previous_validation(run_id, relationships)
+                        if previous is not None:
+                            revalidated = await self._validate_changes(run_oid, relationships, *previous, errors)
+                            merged = revalidated is not None
+                    if not merged:
+                        for entity_type in ENTITY_TYPES:
+                            await self._validate_entity_type(run_oid, entity_type, errors)
+                    
+                    await errors.add_many(await self.validate_relationships(relationships))
+        except Exception:
+            # Drop the partial error set of the unfinished result
+            await self.db[COLLECTIONS["validation_errors"]].delete_many({"validation_result_id": result_id})
+            raise
         
         # Count errors by severity
-        blocker_count = sum(1 for e in errors if e.severity == "Blocker")
-        warning_count = sum(1 for e in errors if e.severity == "Warning")
-        info_count = sum(1 for e in errors if e.severity == "Info")
+        blocker_count = errors.severity_counts["Blocker"]
+        warning_count = errors.severity_counts["Warning"]
+        info_count = errors.severity_counts["Info"]
         
         status = "passed" if blocker_count == 0 else "failed"
         
         result = ValidationResult(
-            run_id=ObjectId(run_id),
+            _id=result_id,
+            run_id=run_oid,
             status=status,
             blocker_count=blocker_count,
             warning_count=warning_count,
             info_count=info_count,
-            errors=errors
+            error_count=errors.error_count,
+            rule_counts=errors.rule_counts(),
+            samples=errors.samples,
+            entity_revision=relationships.revision or 0,
+            ruleset_fingerprint=self.rules.fingerprint,
+            revalidated=revalidated,
+            mode=options.mode,
+            complete=complete,
+            estimates=estimates
         )
         
-        # Store validation result
-        result_dict = result.model_dump(by_alias=True, exclude={"id"})
-        inserted = await self.db[COLLECTIONS["validation_results"]].insert_one(result_dict)
-        result.id = inserted.inserted_id
+        # Store validation result; its errors are already written
+        result_dict = result.model_dump(by_alias=True)
+        await self.db[COLLECTIONS["validation_results"]].insert_one(result_dict)
+        
+        if options.mode == "sample":
+            # Keep the run's current result (and its errors) in place
+            run = await self.db[COLLECTIONS["runs"]].find_one({"_id": run_oid}, {"validation_result_id": 1})
+            await delete_errors(self.db, run_oid, keep=[result.id, (run or {}).get("validation_result_id")])
+            return result
+        
+        # Link the result to the run; a run with blockers needs remediation
+        await self.db[COLLECTIONS["runs"]].update_one(
+            {"_id": run_oid},
+            {"$set": {
+                "validation_result_id": result.id,
+                "status": "ready" if status == "passed" else "remediation",
+            }}
+        )
+        
+        # Earlier results keep their counts and samples, but only the
+        # current result's errors are kept, and older indexes can no longer
+        # be the base of an incremental run
+        await delete_errors(self.db, run_oid, keep=[result.id])
+        await asyncio.to_thread(prune_indexes, run_id, result.entity_revision)
         
         return result
     
-    async def validate_field(self, field_name: str, value: Any, rules: List[Dict]) -> List[ValidationError]:
+    async def _previous_validation(
+        self,
+        run_id: str,
+        relationships: RelationshipIndex
+    ) -> Optional[Tuple[Dict[str, Any], RelationshipIndex]]:
         """
-        Validate a single field against field-level rules.
+        Find the run's previous result, if a new one can be merged with it.
         
         Args:
-            field_name: Name of the field
-            value: Field value
-            rules: List of rules to apply
+            run_id: The run ID
+            relationships: The current relationship index
             
         Returns:
-            List of validation errors
+            The previous result document and the relationship index of the
+            revision it validated, or None if a full validation is needed
         """
-        # TODO: Implement field validation
-        pass
+        if settings.VALIDATION_INCREMENTAL_MAX_CHANGED <= 0 or not relationships.has_hashes:
+            return None
+        
+        run = await self.db[COLLECTIONS["runs"]].find_one({"_id": ObjectId(run_id)}, {"validation_result_id": 1})
+        if not run or not run.get("validation_result_id"):
+            return None
+        previous = await self.db[COLLECTIONS["validation_results"]].find_one({"_id": run["validation_result_id"]})
+        if not previous or not previous.get("complete", True):
+            return None
+        if previous.get("ruleset_fingerprint") != self.rules.fingerprint:
+            return None
+        
+        revision = previous.get("entity_revision", 0)
+        index = await asyncio.to_thread(RelationshipIndex.load, index_path(run_id, revision), revision)
+        if index is None or not index.has_hashes:
+            return None
+        return previous, index
     
-    async def validate_row(self, row_data: Dict[str, Any], rules: List[Dict]) -> List[ValidationError]:
+    async def _validate_changes(
+        self,
+        run_oid: ObjectId,
+        current: RelationshipIndex,
+        previous_result: Dict[str, Any],
+        previous: RelationshipIndex,
+        errors: ValidationErrorWriter
+    ) -> Optional[Dict[str, int]]:
         """
-        Validate a row against row-level rules.
+        Re-validate only what changed since the previous result.
         
         Args:
-            row_data: Row data
-            rules: List of rules to apply
+            run_oid: The run ObjectId
+            current: Relationship index of the current revision
+            previous_result: The previous validation result document
+            previous: Relationship index of the revision it validated
+            errors: Receives the field, row and table errors of the whole run
             
         Returns:
-            List of validation errors
+            The number of re-checked entities per type, or None (with
+            nothing written) if so much changed that a full validation is
+            cheaper
         """
-        # TODO: Implement row validation
-        pass
+        matches = await asyncio.to_thread(match_entities, previous, current)
+        changed = matches < 0
+        if len(matches) and changed.mean() > settings.VALIDATION_INCREMENTAL_MAX_CHANGED:
+            return None
+        
+        offsets = current.offsets()
+        ids = current.flat("ids")
+        changed_ids: Dict[str, List[ObjectId]] = {}
+        retable: Set[str] = set()
+        for entity_type in ENTITY_TYPES:
+            start = offsets[entity_type]
+            type_changed = np.flatnonzero(changed[start:start + current.count(entity_type)]) + start
+            changed_ids[entity_type] = [ObjectId(oid) for oid in ids[type_changed].tolist()]
+            # Added, changed or removed entities can affect table rules
+            unchanged = current.count(entity_type) - len(type_changed)
+            if len(type_changed) or unchanged != previous.count(entity_type):
+                retable.add(entity_type)
+        
+        remap = await asyncio.to_thread(EntityRemap, previous, current, matches)
+        cursor = self.db[COLLECTIONS["validation_errors"]].find(
+            {"validation_result_id": previous_result["_id"]}, {"_id": 0, "run_id": 0, "validation_result_id": 0}
+        ).sort("_id", 1)
+        async for docs in iter_batches(cursor, settings.VALIDATION_BATCH_SIZE):
+            await errors.add_many(await asyncio.to_thread(self._carry_over, docs, remap, retable))
+        
+        for entity_type in ENTITY_TYPES:
+            await errors.add_many(await self._validate_entities(run_oid, entity_type, changed_ids[entity_type]))
+            if entity_type in retable:
+                await errors.add_many(await self._validate_table_rules(run_oid, entity_type))
+        return {entity_type: len(changed_ids[entity_type]) for entity_type in ENTITY_TYPES}
     
-    async def validate_table(self, entities: List[Dict[str, Any]], rules: List[Dict]) -> List[ValidationError]:
+    def _carry_over(
+        self,
+        previous_errors: List[Dict[str, Any]],
+        remap: EntityRemap,
+        retable: Set[str]
+    ) -> ErrorBatch:
         """
-        Validate a table against table-level rules.
+        Move errors of the previous result onto the unchanged entities.
+        
+        Errors of changed or removed entities are dropped (they are
+        re-checked or gone), as are table errors of entity types in
+        ``retable`` and relationship errors, which are always recomputed.
+        The rest are re-pointed at the matching entity's current file and
+        row.
         
         Args:
-            entities: List of entities
-            rules: List of rules to apply
+            previous_errors: A batch of the previous result's errors
+            remap: Maps previous entity locations to current ones
+            retable: Entity types whose table rules are re-run
             
         Returns:
-            List of validation errors
+            ErrorBatch: The validation errors
         """
-        # TODO: Implement table validation
-        pass
+        kept = []
+        for error in previous_errors:
+            rule = self.rules.get(error["rule_id"])
+            if rule is None or rule.level == "relationship":
+                continue
+            if rule.level == "table" and rule.entity_type in retable:
+                continue
+            kept.append(error)
+        if not kept:
+            return ErrorBatch.empty()
+        
+        targets = remap.targets([error["file_id"] for error in kept], [error["row_index"] for error in kept])
+        found = np.flatnonzero(targets >= 0)
+        carried = ErrorBatch.from_documents(kept).take(found.tolist())
+        carried.file_id = remap.file_ids[targets[found]].astype(str).tolist()
+        carried.row_index = remap.row_index[targets[found]].astype(np.int64).tolist()
+        return carried
     
-    async def validate_relationships(self, entities: List[Dict[str, Any]], rules: List[Dict]) -> List[ValidationError]:
+    async def _validate_sample(
+        self,
+        run_oid: ObjectId,
+        index: RelationshipIndex,
+        options: ValidationOptions,
+        errors: ValidationErrorWriter
+    ) -> Dict[str, Dict[str, Any]]:
         """
-        Validate relationships between entities.
+        Apply field and row rules to a random sample of each entity type.
+        
+        Rows are drawn per entity type, stratified by source file so every
+        file is represented in proportion to its size. Table rules need
+        every row and are skipped.
+        
+        Args:
+            run_oid: The run ObjectId
+            index: The run's relationship index (entity IDs and files)
+            options: Sample size and seed
+            errors: Receives the errors found in the sample
+            
+        Returns:
+            Dict mapping entity type to its population and sample size, the
+            number of sampled rows with errors and with Blockers, and
+            estimate_rate() results for both rates
+        """
+        if any((index.column(t, "ids") == "").any() for t in ENTITY_TYPES):
+            # Index saved before entity IDs were recorded
+            index = await RelationshipIndex.from_database(self.db, run_oid, index.revision)
+        
+        rng = np.random.default_rng(options.seed)
+        estimates: Dict[str, Dict[str, Any]] = {}
+        for entity_type in ENTITY_TYPES:
+            population = index.count(entity_type)
+            if population == 0:
+                continue
+            positions = stratified_sample(index.column(entity_type, "file_ids"), options.sample_size, rng)
+            ids = [ObjectId(oid) for oid in index.column(entity_type, "ids")[positions].tolist()]
+            sample_errors = await self._validate_entities(run_oid, entity_type, ids)
+            await errors.add_many(sample_errors)
+            
+            locations = list(zip(sample_errors.file_id, sample_errors.row_index))
+            rows_with_errors = set(locations)
+            rows_with_blockers = {
+                location for location, severity in zip(locations, sample_errors.severity) if severity == "Blocker"
+            }
+            estimates[entity_type] = {
+                "population": population,
+                "sampled": len(ids),
+                "rows_with_errors": len(rows_with_errors),
+                "rows_with_blockers": len(rows_with_blockers),
+                "confidence": settings.VALIDATION_SAMPLE_CONFIDENCE,
+                "error_rate": estimate_rate(len(rows_with_errors), len(ids), population),
+                "blocker_rate": estimate_rate(len(rows_with_blockers), len(ids), population),
+            }
+        return estimates
+    
+    async def _validate_entities(
+        self,
+        run_oid: ObjectId,
+        entity_type: str,
+        ids: List[ObjectId]
+    ) -> ErrorBatch:
+        """
+        Apply field and row rules to selected entities of one type.
+        
+        Args:
+            run_oid: The run ObjectId
+            entity_type: The entity type
+            ids: IDs of the entities to check
+            
+        Returns:
+            ErrorBatch: The validation errors
+        """
+        field_rules = self.rules.for_entity(entity_type, "field")
+        row_rules = self.rules.for_entity(entity_type, "row")
+        if not ids or not (field_rules or row_rules):
+            return ErrorBatch.empty()
+        
+        field_types = self.rules.field_types(entity_type)
+        errors = ErrorBatch.empty()
+        for start in range(0, len(ids), settings.VALIDATION_BATCH_SIZE):
+            docs = await self.db[COLLECTIONS["canonical_entities"]].find(
+                {"run_id": run_oid, "_id": {"$in": ids[start:start + settings.VALIDATION_BATCH_SIZE]}},
+                ENTITY_PROJECTION
+            ).to_list(length=None)
+            batch = ColumnBatch.from_documents(docs, field_types)
+            errors.extend(self.validate_field(batch, field_rules))
+            errors.extend(self.validate_row(batch, row_rules))
+        return errors
+    
+    async def _validate_table_rules(self, run_oid: ObjectId, entity_type: str) -> ErrorBatch:
+        """
+        Apply table rules to all entities of one type, reading only the
+        columns those rules need.
         
         Args:
-            entities: List of entities
-            rules: List of rules to apply
+            run_oid: The run ObjectId
+            entity_type: The entity type
             
         Returns:
-            List of validation errors
+            ErrorBatch: The validation errors
         """
-        # TODO: Implement relationship validation
-        pass
+        table_rules = self.rules.for_entity(entity_type, "table")
+        if not table_rules:
+            return ErrorBatch.empty()
+        
+        field_types = self.rules.field_types(entity_type)
+        table_columns = self.rules.columns(entity_type, "table")
+        projection = {"_id": 1, "file_id": 1, "row_index": 1}
+        for column in table_columns:
+            projection[f"data.{column}"] = 1
+            projection[f"invalid.{column}"] = 1
+        
+        cursor = self.db[COLLECTIONS["canonical_entities"]].find(
+            {"run_id": run_oid, "entity_type": entity_type}, projection
+        )
+        batches = [
+            ColumnBatch.from_documents(docs, field_types).select(table_columns)
+            async for docs in iter_batches(cursor, settings.VALIDATION_BATCH_SIZE)
+        ]
+        return self.validate_table(ColumnBatch.concat(batches, field_types), table_rules)
     
-    def _create_error(
+    async def _validate_entity_type(
         self,
-        file_id: str,
-        row_index: int,
-        column_name: str,
-        severity: str,
-        rule_id: str,
-        description: str
-    ) -> ValidationError:
+        run_oid: ObjectId,
+        entity_type: str,
+        errors: ValidationErrorWriter,
+        max_blockers: Optional[int] = None
+    ) -> bool:
         """
-        Create a validation error object.
+        Apply field, row and table rules to a run's entities of one type.
+        
+        Field and row rules run on each batch as it is read. Table rules
+        need the whole column, so only the columns they read are kept from
+        each batch and evaluated once at the end.
         
         Args:
-            file_id: File ID where error occurred
-            row_index: Row index
-            column_name: Column name
-            severity: Error severity (Blocker, Warning, Info)
-            rule_id: Rule ID that failed
-            description: Human-readable description
+            run_oid: The run ObjectId
+            entity_type: The entity type
+            errors: Receives the validation errors
+            max_blockers: Stop once ``errors`` holds this many Blockers
             
         Returns:
-            ValidationError: The validation error object
-        """
-        return ValidationError(
-            file_id=file_id,
-            row_index=row_index,
-            column_name=column_name,
-            severity=severity,
-            rule_id=rule_id,
-            description=description
-        )
\ No newline at end of file
+            bool: False if validation stopped early because of max_blockers
+        """
+        field_rules = self.rules.for_entity(entity_type, "field")
+        row_rules = self.rules.for_entity(entity_type, "row")
+        table_rules = self.rules.for_entity(entity_type, "table")
+        if not (field_rules or row_rules or table_rules):
+            return True
+        
+        field_types = self.rules.field_types(entity_type)
+        table_columns = self.rules.columns(entity_type, "table")
+        table_batches: List[ColumnBatch] = []
+        
+        cursor = self.db[COLLECTIONS["canonical_entities"]].find(
+            {"run_id": run_oid, "entity_type": entity_type}, ENTITY_PROJECTION
+        )
+        async for docs in iter_batches(cursor, settings.VALIDATION_BATCH_SIZE):
+            batch = ColumnBatch.from_documents(docs, field_types)
+            await errors.add_many(self.validate_field(batch, field_rules))
+            await errors.add_many(self.validate_row(batch, row_rules))
+            if max_blockers is not None and errors.severity_counts["Blocker"] >= max_blockers:
+                return False
+            if table_rules:
+                table_batches.append(batch.select(table_columns))
+        
+        if table_rules:
+            await errors.add_many(self.validate_table(ColumnBatch.concat(table_batches, field_types), table_rules))
+        return True
+    
+    def validate_field(self, batch: ColumnBatch, rules: List[CompiledRule]) -> ErrorBatch:
+        """
+        Validate a batch of entities against field-level rules.
+        
+        Args:
+            batch: Entity columns
+            rules: Compiled field-level rules
+            
+        Returns:
+            ErrorBatch: The validation errors
+        """
+        return self._apply_rules(batch, rules)
+    
+    def validate_row(self, batch: ColumnBatch, rules: List[CompiledRule]) -> ErrorBatch:
+        """
+        Validate a batch of entities against row-level (cross-field) rules.
+        
+        Args:
+            batch: Entity columns
+            rules: Compiled row-level rules
+            
+        Returns:
+            ErrorBatch: The validation errors
+        """
+        return self._apply_rules(batch, rules)
+    
+    def validate_table(self, batch: ColumnBatch, rules: List[CompiledRule]) -> ErrorBatch:
+        """
+        Validate all entities of a type against table-level rules.
+        
+        Args:
+            batch: Columns of every entity of the type
+            rules: Compiled table-level rules
+            
+        Returns:
+            ErrorBatch: The validation errors
+        """
+        return self._apply_rules(batch, rules)
+    
+    async def validate_relationships(self, index: RelationshipIndex) -> ErrorBatch:
+        """
+        Validate relationships between entities.
+        
+        Checks along Block -> Slide -> ROI -> Library -> Run, all Blockers:
+        duplicate natural keys ("duplicate.<Type>.<Key>"), parent keys that
+        match no parent ("dangling.<Type>.<ParentKey>") and missing parent
+        keys ("orphan.<Type>.<ParentKey>"). Missing parent keys are only
+        reported here when no required rule on that field reports them.
+        
+        Args:
+            index: The run's relationship index
+            
+        Returns:
+            ErrorBatch: The validation errors
+        """
+        with stage_timer("validate.relationship", sum(index.count(t) for t in ENTITY_TYPES)):
+            return await asyncio.to_thread(self._relationship_errors, index)
+    
+    def _relationship_errors(self, index: RelationshipIndex) -> ErrorBatch:
+        """Run the set operations of validate_relationships() and build errors."""
+        errors = ErrorBatch.empty()
+        for entity_type in ENTITY_TYPES:
+            keys = index.column(entity_type, "keys")
+            parent_keys = index.column(entity_type, "parent_keys")
+            key_field = ENTITY_KEYS[entity_type]
+            parent_field = parent_key(entity_type)
+            
+            checks = [(
+                "duplicate", key_field, index.duplicates(entity_type),
+                lambda p: f"Duplicate {key_field} '{keys[p]}'",
+            )]
+            if parent_field:
+                parent_type = PARENT_TYPES[entity_type]
+                checks.append((
+                    "dangling", parent_field, index.dangling(entity_type),
+                    lambda p: f"{parent_field} '{parent_keys[p]}' does not match any {parent_type}",
+                ))
+                required = f"required.{entity_type}.{parent_field}"
+                if not any(rule.id == required for rule in self.rules.for_entity(entity_type, "field")):
+                    checks.append((
+                        "orphan", parent_field, index.orphans(entity_type),
+                        lambda p: f"{entity_type} is not linked to a {parent_type}",
+                    ))
+            
+            file_ids = index.column(entity_type, "file_ids")
+            row_index = index.column(entity_type, "row_index")
+            for check, column, positions, describe in checks:
+                errors.extend(ErrorBatch.for_rule(
+                    f"{check}.{entity_type}.{column}", "Blocker", column,
+                    file_ids[positions], row_index[positions],
+                    [describe(position) for position in positions.tolist()],
+                ))
+        return errors
+    
+    def _apply_rules(self, batch: ColumnBatch, rules: List[CompiledRule]) -> ErrorBatch:
+        """
+        Evaluate rules on a batch and create errors for the failing rows.
+        
+        Args:
+            batch: Entity columns
+            rules: Compiled rules
+            
+        Returns:
+            ErrorBatch: The validation errors
+        """
+        errors = ErrorBatch.empty()
+        if not rules:
+            return errors
+        
+        # Callers pass the rules of one level; timed per level in the metrics
+        with stage_timer(f"validate.{rules[0].level}", len(batch)):
+            for rule in rules:
+                positions = rule.evaluate(batch)
+                if not len(positions):
+                    continue
+                errors.extend(ErrorBatch.for_rule(
+                    rule.id, rule.severity, rule.column,
+                    batch.file_ids[positions], batch.row_index[positions],
+                    [rule.message(batch, position) for position in positions.tolist()],
+                ))
+        return errors
\ No newline at end of file
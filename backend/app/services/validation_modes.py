@@ -0,0 +1,157 @@
+"""
+Validation modes for quick triage before a full validation.
+
+- ``full``: every rule on every entity (the default)
+- ``fail-fast``: stop as soon as a given number of Blocker errors is found
+- ``sample``: field and row rules on a stratified random sample of each
+  entity type, with confidence intervals for the share of rows that have
+  errors
+
+Both quick modes answer "does this run have blockers?" in a fraction of
+the time of a full pass over a large run.
+"""
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from statistics import NormalDist
+import math
+
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    # Imported in stratified_sample so the API can parse options without NumPy
+    import numpy as np
+
+
+VALIDATION_MODES = ("full", "fail-fast", "sample")
+
+
+class ValidationOptionsError(Exception):
+    """
+    Raised when a validation mode or its parameters are invalid.
+    """
+    pass
+
+
+class ValidationOptions:
+    """
+    Validated validation mode and its parameters.
+    """
+
+    def __init__(
+        self,
+        mode: str = "full",
+        max_blockers: Optional[int] = None,
+        sample_size: Optional[int] = None,
+        seed: Optional[int] = None
+    ):
+        if mode not in VALIDATION_MODES:
+            raise ValidationOptionsError(
+                f"Unknown validation mode '{mode}'; expected one of {', '.join(VALIDATION_MODES)}"
+            )
+        if max_blockers is not None and mode != "fail-fast":
+            raise ValidationOptionsError("max_blockers only applies to fail-fast validation")
+        if (sample_size is not None or seed is not None) and mode != "sample":
+            raise ValidationOptionsError("sample_size and seed only apply to sample validation")
+        if max_blockers is not None and max_blockers < 1:
+            raise ValidationOptionsError("max_blockers must be at least 1")
+        if sample_size is not None and sample_size < 1:
+            raise ValidationOptionsError("sample_size must be at least 1")
+
+        self.mode = mode
+        self.max_blockers = max_blockers or settings.VALIDATION_FAIL_FAST_BLOCKERS
+        self.sample_size = sample_size or settings.VALIDATION_SAMPLE_ROWS
+        self.seed = seed
+
+    @property
+    def complete(self) -> bool:
+        """Whether the mode checks every entity (fail-fast may still stop early)."""
+        return self.mode != "sample"
+
+    def describe(self) -> Dict[str, Any]:
+        """Mode and the parameters that apply to it, as stored with jobs."""
+        if self.mode == "fail-fast":
+            return {"mode": self.mode, "max_blockers": self.max_blockers}
+        if self.mode == "sample":
+            return {"mode": self.mode, "sample_size": self.sample_size, "seed": self.seed}
+        return {"mode": self.mode}
+
+
+def stratified_sample(strata: "np.ndarray", size: int, rng: "np.random.Generator") -> "np.ndarray":
+    """
+    Draw a random sample allocated proportionally across strata.
+
+    Each stratum (e.g. source file) gets a share of ``size`` proportional
+    to its number of rows, rounded by largest remainder, and at least one
+    row when there are no more strata than ``size`` (rows for the minimum
+    are taken back from the most over-allocated strata, so exactly ``size``
+    rows are drawn).
+
+    Args:
+        strata: Stratum label of each row
+        size: Total number of rows to draw
+        rng: Random generator
+
+    Returns:
+        np.ndarray: Sorted positions of the sampled rows
+    """
+    import numpy as np
+
+    population = len(strata)
+    if size >= population:
+        return np.arange(population)
+
+    labels, inverse, counts = np.unique(strata, return_inverse=True, return_counts=True)
+    quotas = counts * size / population
+    allocation = np.floor(quotas).astype(np.int64)
+    if size >= len(labels):
+        allocation = np.maximum(allocation, 1)
+        excess = allocation.sum() - size
+        while excess > 0:
+            # The one-row minimum overshot size; take rows back from the
+            # strata allocated furthest above their quota that can spare one
+            spare = np.flatnonzero(allocation > 1)
+            over = spare[np.argsort(quotas[spare] - allocation[spare], kind="stable")][:excess]
+            allocation[over] -= 1
+            excess -= len(over)
+    remainder = size - allocation.sum()
+    if remainder > 0:
+        allocation[np.argsort(allocation - quotas, kind="stable")[:remainder]] += 1
+    allocation = np.minimum(allocation, counts)
+
+    positions: List["np.ndarray"] = []
+    for label in range(len(labels)):
+        members = np.flatnonzero(inverse == label)
+        positions.append(rng.choice(members, size=allocation[label], replace=False))
+    return np.sort(np.concatenate(positions))
+
+
+def estimate_rate(hits: int, sampled: int, population: int, confidence: Optional[float] = None) -> Dict[str, float]:
+    """
+    Estimate the share of a population that has a property from a sample.
+
+    Uses the Wilson score interval with a finite population correction,
+    which stays within [0, 1] and behaves when no hits were found.
+
+    Args:
+        hits: Sampled rows with the property
+        sampled: Sampled rows
+        population: Rows in the population
+        confidence: Confidence level (default VALIDATION_SAMPLE_CONFIDENCE)
+
+    Returns:
+        Dict with the point estimate ``rate`` and the interval ``lower`` /
+        ``upper`` bounds
+    """
+    if sampled == 0:
+        return {"rate": 0.0, "lower": 0.0, "upper": 1.0}
+    confidence = confidence or settings.VALIDATION_SAMPLE_CONFIDENCE
+    rate = hits / sampled
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    fpc = (population - sampled) / (population - 1) if population > 1 else 0.0
+    z2 = z * z * fpc
+    centre = (rate + z2 / (2 * sampled)) / (1 + z2 / sampled)
+    margin = z / (1 + z2 / sampled) * math.sqrt(fpc * (rate * (1 - rate) / sampled + z2 / (4 * sampled * sampled)))
+    return {
+        "rate": rate,
+        "lower": max(0.0, centre - margin),
+        "upper": min(1.0, centre + margin),
+    }
@@ -0,0 +1,174 @@
+"""
+Storage of validation errors outside the validation result document.
+
+A dirty file can produce millions of errors, far beyond MongoDB's 16MB
+document limit, so each error is its own document in validation_errors,
+written in bulk. The validation_results document only keeps counts per
+rule, severity and column and a capped sample of errors per rule, which is
+all the UI needs to render a summary; the full list is read a page at a
+time with list_errors().
+"""
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+
+from app.core.config import settings
+from app.db.bulk import BulkWriter
+from app.db.database import COLLECTIONS
+from app.models.batches import ErrorBatch
+from app.models.run import ValidationError, ValidationRuleCount
+
+
+# Query parameters list_errors() can filter on
+ERROR_FILTERS = ("severity", "rule_id", "column_name", "file_id")
+
+
+class ValidationErrorWriter:
+    """
+    Writes a validation result's errors and tallies them as they pass.
+
+    Usage:
+        async with ValidationErrorWriter(db, run_oid, result_id) as errors:
+            await errors.add_many(error_batch)
+        errors.rule_counts()
+    """
+
+    def __init__(
+        self,
+        db,
+        run_oid: ObjectId,
+        result_id: ObjectId,
+        sample_size: Optional[int] = None
+    ):
+        self.run_oid = run_oid
+        self.result_id = result_id
+        self.sample_size = settings.VALIDATION_SAMPLE_SIZE if sample_size is None else sample_size
+        self.counts: Dict[Tuple[str, str, str], int] = {}
+        self.severity_counts: Dict[str, int] = {"Blocker": 0, "Warning": 0, "Info": 0}
+        self.samples: Dict[str, List[ValidationError]] = {}
+        self._writer = BulkWriter(db[COLLECTIONS["validation_errors"]])
+
+    async def __aenter__(self) -> "ValidationErrorWriter":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self._writer.__aexit__(exc_type, exc, tb)
+
+    @property
+    def error_count(self) -> int:
+        """Number of errors added so far."""
+        return sum(self.counts.values())
+
+    async def add_many(self, errors: ErrorBatch) -> None:
+        """
+        Count, sample and queue errors for writing.
+
+        Counting works on whole columns; only sampled errors become
+        ValidationError models.
+
+        Args:
+            errors: Validation errors
+        """
+        if not len(errors):
+            return
+        for key, count in Counter(zip(errors.rule_id, errors.severity, errors.column_name)).items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        for severity, count in Counter(errors.severity).items():
+            self.severity_counts[severity] = self.severity_counts.get(severity, 0) + count
+
+        open_rules = {
+            rule_id for rule_id in dict.fromkeys(errors.rule_id)
+            if len(self.samples.get(rule_id, ())) < self.sample_size
+        }
+        for position, rule_id in enumerate(errors.rule_id):
+            if not open_rules:
+                break
+            if rule_id not in open_rules:
+                continue
+            sample = self.samples.setdefault(rule_id, [])
+            sample.append(errors.model(position))
+            if len(sample) >= self.sample_size:
+                open_rules.discard(rule_id)
+
+        await self._writer.add_many(errors.documents(run_id=self.run_oid, validation_result_id=self.result_id))
+
+    def rule_counts(self) -> List[ValidationRuleCount]:
+        """Error counts per rule, severity and column, most frequent first."""
+        return [
+            ValidationRuleCount(rule_id=rule_id, severity=severity, column_name=column_name, count=count)
+            for (rule_id, severity, column_name), count in sorted(
+                self.counts.items(), key=lambda item: (-item[1], item[0])
+            )
+        ]
+
+
+def error_query(result_id: ObjectId, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Build the validation_errors query for a result and optional filters.
+
+    Args:
+        result_id: The validation result ID
+        filters: Values for any of ERROR_FILTERS; None values are ignored
+
+    Returns:
+        Dict: MongoDB filter
+    """
+    query: Dict[str, Any] = {"validation_result_id": result_id}
+    for name, value in (filters or {}).items():
+        if name in ERROR_FILTERS and value is not None:
+            query[name] = value
+    return query
+
+
+async def list_errors(
+    db,
+    result_id: ObjectId,
+    filters: Optional[Dict[str, Any]] = None,
+    limit: int = 100,
+    after: Optional[ObjectId] = None
+) -> Tuple[List[Dict[str, Any]], Optional[ObjectId]]:
+    """
+    Read one page of a result's errors in insertion order.
+
+    Pages are keyed on _id rather than skip/offset, so every page is an
+    index range scan no matter how deep into the list it is.
+
+    Args:
+        db: The database
+        result_id: The validation result ID
+        filters: Values for any of ERROR_FILTERS
+        limit: Maximum errors per page
+        after: _id of the last error of the previous page
+
+    Returns:
+        The error documents and the _id to pass as ``after`` for the next
+        page (None on the last page)
+    """
+    query = error_query(result_id, filters)
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    docs = await db[COLLECTIONS["validation_errors"]].find(query).sort("_id", 1).limit(limit + 1).to_list(length=None)
+    more = len(docs) > limit
+    docs = docs[:limit]
+    return docs, (docs[-1]["_id"] if more else None)
+
+
+async def delete_errors(db, run_oid: ObjectId, keep: Iterable[ObjectId] = ()) -> int:
+    """
+    Delete a run's stored errors, except those of some results.
+
+    Args:
+        db: The database
+        run_oid: The run ObjectId
+        keep: Validation results whose errors are kept
+
+    Returns:
+        int: Number of errors deleted
+    """
+    query: Dict[str, Any] = {"run_id": run_oid}
+    keep = [result_id for result_id in keep if result_id is not None]
+    if keep:
+        query["validation_result_id"] = {"$nin": keep}
+    deleted = await db[COLLECTIONS["validation_errors"]].delete_many(query)
+    return deleted.deleted_count
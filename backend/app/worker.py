@@ -0,0 +1,132 @@
+"""
+Standalone worker processes for the MongoDB-backed job queue.
+
+Run alongside the API with JOB_BACKEND=mongo:
+
+    python -m app.worker --processes 4
+
+Each process claims queued jobs from the ``jobs`` collection and runs up to
+JOB_CONCURRENCY of them at a time. With ``--metrics-port`` (or
+WORKER_METRICS_PORT) each process serves its metrics for Prometheus on its
+own port, counting up from the one given.
+"""
+from typing import List, Optional, Set
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+
+from app.core.config import configure_logging, settings
+from app.core.metrics import serve_metrics
+from app.core.startup import startup_report
+from app.db.database import connect_to_mongo, close_mongo_connection
+from app.services.container import services
+from app.services.jobs import job_manager
+from app.services.scheduler import shutdown_process_pool
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(metrics_port: int = 0) -> None:
+    """
+    Claim and execute jobs until the process is stopped.
+
+    Args:
+        metrics_port: Port to serve this process's metrics on; 0 disables
+    """
+    with startup_report.phase("mongo.connect"):
+        await connect_to_mongo()
+    metrics_server = await serve_metrics(metrics_port) if metrics_port else None
+    if settings.STARTUP_WARMUP != "off":
+        # Already warm in processes forked by main()
+        await services.start()
+    with startup_report.phase("jobs.start"):
+        await job_manager.start()
+    startup_report.mark_ready()
+    logger.info(startup_report.format())
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    slots = asyncio.Semaphore(max(settings.JOB_CONCURRENCY, 1))
+    running: Set[asyncio.Task] = set()
+    if metrics_server is not None:
+        logger.info("Worker %s serving metrics on port %d", job_manager.worker_id, metrics_port)
+    logger.info("Worker %s polling for jobs...", job_manager.worker_id)
+    try:
+        while not stop.is_set():
+            await slots.acquire()
+            job = await job_manager.claim_next()
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(stop.wait(), settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logger.info("Worker %s running %s job %s", job_manager.worker_id, job["kind"], job["_id"])
+            task = asyncio.create_task(job_manager.execute(job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+    finally:
+        # Let claimed jobs finish before exiting
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        if metrics_server is not None:
+            metrics_server.close()
+        shutdown_process_pool()
+        await close_mongo_connection()
+
+
+def _worker_process(metrics_port: int = 0) -> None:
+    """Entry point for one worker process."""
+    startup_report.restart()
+    configure_logging()
+    asyncio.run(run_worker(metrics_port))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Start one or more worker processes.
+
+    Args:
+        argv: Command-line arguments
+    """
+    parser = argparse.ArgumentParser(description="MDO background job worker")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes")
+    parser.add_argument(
+        "--metrics-port", type=int, default=settings.WORKER_METRICS_PORT,
+        help="Serve metrics on this port, and the following ones for further processes (0 disables)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.processes <= 1:
+        _worker_process(args.metrics_port)
+        return
+
+    if settings.STARTUP_WARMUP != "off":
+        # Load the engines once here; forked workers share them copy-on-write
+        services.warm()
+    processes = [
+        multiprocessing.Process(target=_worker_process, args=(args.metrics_port + i if args.metrics_port else 0,))
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
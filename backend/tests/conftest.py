@@ -0,0 +1,55 @@
+"""
+Shared fixtures.
+
+Tests run against an in-memory MongoDB (mongomock-motor) and a temporary
+UPLOAD_DIR; the API is called in process through httpx without running
+the app's lifespan, so no MongoDB server or job runner is needed.
+"""
+from typing import AsyncIterator
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from app.core.config import settings
+from app.db import database
+from app.services.container import services
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    """A fresh UPLOAD_DIR for every test."""
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    return tmp_path / "uploads"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """An empty in-memory database, used as both the main and analytics database."""
+    client = AsyncMongoMockClient()
+    mock_db = client["test"]
+    monkeypatch.setattr(database.db, "client", client)
+    monkeypatch.setattr(database.db, "db", mock_db)
+    monkeypatch.setattr(database.db, "analytics_db", mock_db)
+    # The shared services hold on to the database they were first given
+    for name in ("_storage", "_mappings", "_export", "_harmonization"):
+        monkeypatch.setattr(services, name, None)
+    return mock_db
+
+
+@pytest.fixture
+async def client(db) -> AsyncIterator[httpx.AsyncClient]:
+    """An HTTP client for the API, backed by the in-memory database."""
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        yield http
+
+
+@pytest.fixture
+async def run_id(client) -> str:
+    """A new, empty run."""
+    response = await client.post("/api/v1/runs/", json={"user_id": "tester"})
+    assert response.status_code == 201, response.text
+    return response.json()["_id"]
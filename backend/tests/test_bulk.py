@@ -0,0 +1,133 @@
+"""
+Tests for BulkWriter batching, retries and failure reporting.
+"""
+from typing import Any, Dict, List
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from app.db.bulk import BulkWriteFailed, BulkWriter
+
+
+class FakeCollection:
+    """
+    Records insert_many calls; each scripted outcome is either None
+    (success), an exception, or a function of the batch returning one.
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls: List[List[Dict[str, Any]]] = []
+        self.stored: List[Dict[str, Any]] = []
+
+    async def insert_many(self, docs, ordered=True):
+        self.calls.append(list(docs))
+        outcome = self.outcomes.pop(0) if self.outcomes else None
+        if callable(outcome):
+            outcome = outcome(docs)
+        if outcome is None:
+            self.stored.extend(docs)
+            return
+        raise outcome
+
+
+def write_errors(*errors):
+    """A BulkWriteError for (index, code) pairs; the other documents are stored."""
+    def outcome(docs):
+        return BulkWriteError({"writeErrors": [
+            {"index": index, "code": code, "errmsg": f"code {code}", "op": docs[index]}
+            for index, code in errors
+        ]})
+    return outcome
+
+
+def docs(n):
+    return [{"_id": i} for i in range(n)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    async def sleep(_):
+        pass
+    monkeypatch.setattr("app.db.bulk.asyncio.sleep", sleep)
+
+
+async def test_documents_are_written_in_batches():
+    collection = FakeCollection()
+    batches = []
+
+    async def on_batch(rows):
+        batches.append(rows)
+
+    async with BulkWriter(collection, batch_size=4, max_in_flight=2, on_batch=on_batch) as writer:
+        await writer.add_many(docs(10))
+
+    assert [len(call) for call in collection.calls] == [4, 4, 2]
+    assert sorted(batches) == [2, 4, 4]
+    assert writer.stats()["docs_written"] == 10
+    assert writer.stats()["failed"] == 0
+
+
+async def test_transient_write_errors_are_retried_alone():
+    collection = FakeCollection(write_errors((1, 189), (3, 91)))
+
+    async with BulkWriter(collection, batch_size=4) as writer:
+        await writer.add_many(docs(4))
+
+    assert collection.calls[1] == [{"_id": 1}, {"_id": 3}]
+    assert writer.docs_written == 4
+    assert writer.retries == 1
+
+
+async def test_duplicates_count_as_written():
+    collection = FakeCollection(write_errors((0, 11000), (2, 11000)))
+
+    async with BulkWriter(collection, batch_size=3) as writer:
+        await writer.add_many(docs(3))
+
+    assert len(collection.calls) == 1
+    assert writer.docs_written == 3
+
+
+async def test_permanent_write_errors_fail_without_retry():
+    collection = FakeCollection(write_errors((0, 121), (2, 189)))
+    writer = BulkWriter(collection, batch_size=3)
+
+    with pytest.raises(BulkWriteFailed) as raised:
+        async with writer:
+            await writer.add_many(docs(3))
+
+    assert raised.value.failed == [{"_id": 0}]
+    assert collection.calls[1] == [{"_id": 2}]
+    assert "121" in str(raised.value)
+    assert writer.docs_written == 2
+    assert writer.stats()["failed"] == 1
+
+
+async def test_exhausted_retries_are_reported():
+    collection = FakeCollection(*[AutoReconnect("down")] * 10)
+    writer = BulkWriter(collection, batch_size=2, max_retries=2)
+
+    with pytest.raises(BulkWriteFailed) as raised:
+        async with writer:
+            await writer.add_many(docs(2))
+
+    assert len(collection.calls) == 3
+    assert raised.value.failed == docs(2)
+    assert writer.stats()["failed"] == 2
+    assert writer.retries == 2
+
+
+async def test_failing_on_batch_does_not_fail_written_documents(caplog):
+    collection = FakeCollection()
+
+    async def on_batch(rows):
+        raise RuntimeError("progress update failed")
+
+    async with BulkWriter(collection, batch_size=2, on_batch=on_batch) as writer:
+        await writer.add_many(docs(4))
+
+    assert len(collection.stored) == 4
+    assert writer.docs_written == 4
+    assert writer.stats()["failed"] == 0
+    assert "on_batch callback failed" in caplog.text
@@ -0,0 +1,119 @@
+"""
+Tests for the columnar harmonization engine.
+"""
+import io
+
+import numpy as np
+import pytest
+
+from app.services.columnar import (
+    ColumnTable,
+    coerce_column,
+    harmonize_table,
+    lookup_keys,
+    read_csv_columns,
+    row_hashes,
+)
+
+
+TEMPLATE = {
+    "entity_type": "Slide",
+    "fields": [
+        {"name": "Slide_ID", "type": "string"},
+        {"name": "Block_ID", "type": "string"},
+        {"name": "Thickness", "type": "float"},
+        {"name": "Section", "type": "integer"},
+        {"name": "Stained", "type": "boolean"},
+    ],
+}
+
+CSV = (
+    b"slide,block,thickness,section,stained,extra\n"
+    b" s1 ,b1,4.5,1,yes,x\n"
+    b"s2,B1,,2,no\n"
+    b's3,"b2",thin,x,maybe,y\n'
+)
+
+
+def read(data: bytes = CSV, **kwargs) -> ColumnTable:
+    return read_csv_columns(io.BytesIO(data), **kwargs)
+
+
+def test_read_csv_columns_pads_short_rows():
+    table = read()
+
+    assert table.column_names == ["slide", "block", "thickness", "section", "stained", "extra"]
+    assert table.column("extra").tolist() == ["x", "", "y"]
+    assert table.row_index.tolist() == [0, 1, 2]
+
+
+def test_read_csv_columns_keeps_only_usecols():
+    table = read(usecols=[1, 0])
+
+    assert table.column_names == ["slide", "block"]
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 100])
+def test_read_csv_columns_batches_agree(batch_size):
+    table = read(batch_size=batch_size)
+
+    assert table.column("slide").tolist() == [" s1 ", "s2", "s3"]
+
+
+def test_coerce_column_marks_invalid_and_null_cells():
+    values, nulls, invalid = coerce_column(np.array(["1", " -2 ", "", "x", "+3"]), "integer")
+
+    assert values[[0, 1, 4]].tolist() == [1, -2, 3]
+    assert nulls.tolist() == [False, False, True, True, False]
+    assert invalid.tolist() == [False, False, False, True, False]
+
+
+def test_harmonize_table_renames_coerces_and_normalises_ids():
+    mapping = {"Slide_ID": "slide", "Block_ID": "block", "Thickness": "thickness",
+               "Section": "section", "Stained": "stained"}
+
+    table = harmonize_table(read(), TEMPLATE, mapping)
+
+    assert table.column_names == ["Slide_ID", "Block_ID", "Thickness", "Section", "Stained"]
+    assert table.column("Slide_ID").tolist() == ["S1", "S2", "S3"]
+    assert table.column("Block_ID").tolist() == ["B1", "B1", "B2"]
+    assert table.null_mask("Thickness").tolist() == [False, True, True]
+    assert table.stats["invalid_cells"] == {"Thickness": 1, "Section": 1, "Stained": 1}
+    assert table.invalid["Thickness"].tolist() == ["", "", "thin"]
+
+
+def test_harmonize_table_reports_missing_fields():
+    table = harmonize_table(read(), TEMPLATE, {"Slide_ID": "slide"})
+
+    assert table.stats["missing_fields"] == ["Block_ID", "Thickness", "Section", "Stained"]
+    assert table.null_mask("Block_ID").all()
+
+
+def test_lookup_keys_finds_positions_and_misses():
+    candidates = np.array(["B3", "B1", "B2"])
+
+    positions = lookup_keys(np.array(["B1", "B9", "B3", "B1"]), candidates)
+
+    assert positions.tolist() == [1, -1, 0, 1]
+
+
+def test_lookup_keys_with_no_candidates():
+    assert lookup_keys(np.array(["B1"]), np.array([], dtype=str)).tolist() == [-1]
+
+
+def test_row_hashes_follow_content_not_position():
+    table = ColumnTable({"a": np.array(["x", "y", "x"]), "b": np.array(["1", "2", "1"])})
+
+    hashes = row_hashes(table)
+
+    assert hashes[0] == hashes[2]
+    assert hashes[0] != hashes[1]
+    assert row_hashes(table.take(np.array([2, 1]))).tolist() == hashes[[2, 1]].tolist()
+
+
+def test_row_hashes_distinguish_null_from_empty():
+    table = ColumnTable({"a": np.array(["", ""])}, {"a": np.array([True, False])})
+
+    hashes = row_hashes(table)
+
+    assert hashes[0] != hashes[1]
@@ -0,0 +1,151 @@
+"""
+Tests for schema detection: head parsing, template ranking, suggested
+mappings and the detection endpoint.
+"""
+from app.core.config import settings
+from app.schemas.registry import SchemaTemplate
+from app.services.detection import DetectionIndex, parse_head
+
+
+BLOCK = {"id": "block_t", "name": "Block", "version": "1", "entity_type": "Block", "fields": [
+    {"name": "Block_ID", "type": "string", "required": True},
+    {"name": "Thickness", "type": "float", "min": 1, "max": 20},
+    {"name": "Fixation", "type": "string", "enum": ["FFPE", "Fresh Frozen"]},
+]}
+SLIDE = {"id": "slide_t", "name": "Slide", "version": "1", "entity_type": "Slide", "fields": [
+    {"name": "Slide_ID", "type": "string", "required": True},
+    {"name": "Block_ID", "type": "string", "required": True},
+    {"name": "Stain", "type": "string"},
+]}
+
+BOUNDARY = "testboundary"
+
+
+def index() -> DetectionIndex:
+    return DetectionIndex([SchemaTemplate(data, b"") for data in (BLOCK, SLIDE)])
+
+
+def multipart_body(parts) -> bytes:
+    """Encode (name, filename or None, content) tuples as multipart/form-data."""
+    body = b""
+    for name, filename, content in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def multipart_headers() -> dict:
+    return {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+
+
+def test_parse_head_drops_the_partial_last_line_of_a_full_read():
+    data = b"Block_ID,Thickness\nB1,4\nB2,5\nB3,"
+
+    header, rows = parse_head(data, max_bytes=len(data))
+
+    assert header == ["Block_ID", "Thickness"]
+    assert rows == [["B1", "4"], ["B2", "5"]]
+
+
+def test_parse_head_pads_cuts_and_skips_blank_rows():
+    data = b" Block_ID ;Thickness\nB1\n;\nB2;5;extra\nB3;6\n"
+
+    header, rows = parse_head(data, ";", max_bytes=1024, max_rows=2)
+
+    assert header == ["Block_ID", "Thickness"]
+    assert rows == [["B1", ""], ["B2", "5"]]
+
+
+def test_parse_head_of_empty_data():
+    assert parse_head(b"", max_bytes=1024) == ([], [])
+
+
+def test_detect_ranks_the_template_matching_most_columns_first():
+    header = ["block id", "thickness_um", "Fixation"]
+    rows = [["B1", "4.5", "FFPE"], ["B2", "5", "Fresh Frozen"]]
+
+    result = index().detect(header, rows)
+
+    assert [c["id"] for c in result["candidates"]] == ["block_t", "slide_t"]
+    assert result["candidates"][0]["confidence"] > result["candidates"][1]["confidence"]
+    assert "missing Slide_ID" in result["candidates"][1]["rationale"]
+    assert result["schema_template_id"] == "block_t"
+    assert result["sampled_rows"] == 2
+
+
+def test_detect_maps_columns_one_to_one():
+    header = ["block id", "thickness_um", "Fixation"]
+    rows = [["B1", "4.5", "FFPE"], ["B2", "5", "Fresh Frozen"]]
+
+    mappings = index().detect(header, rows)["mappings"]
+
+    assert [(m["target_field"], m["source_field"], m["mapped"], m["required"]) for m in mappings] == [
+        ("Block_ID", "block id", True, True),
+        ("Thickness", "thickness_um", True, False),
+        ("Fixation", "Fixation", True, False),
+    ]
+    assert all(0 < m["confidence"] <= 1 for m in mappings)
+
+
+def test_detect_maps_the_requested_template():
+    result = index().detect(["Block_ID", "Stain"], [["B1", "HE"]], schema_template_id="slide_t")
+
+    assert result["schema_template_id"] == "slide_t"
+    assert [(m["target_field"], m["source_field"], m["mapped"]) for m in result["mappings"]] == [
+        ("Slide_ID", "", False), ("Block_ID", "Block_ID", True), ("Stain", "Stain", True),
+    ]
+
+
+def test_detect_with_an_empty_header():
+    result = index().detect([], [])
+
+    assert result["candidates"] == []
+    assert result["schema_template_id"] is None
+    assert result["mappings"] == []
+
+
+def test_detect_with_an_unknown_template_suggests_no_mapping():
+    result = index().detect(["Block_ID"], [["B1"]], schema_template_id="no_such_template")
+
+    assert result["candidates"][0]["id"] == "block_t"
+    assert result["schema_template_id"] == "no_such_template"
+    assert result["mappings"] == []
+
+
+async def test_detect_endpoint_suggests_a_template(client):
+    csv = b"Block_ID,Tissue_Type,Fixation\nB1,Lung,FFPE\nB2,Liver,Fresh Frozen\n"
+    body = multipart_body([("file", "blocks.csv", csv)])
+
+    response = await client.post("/api/v1/schemas/detect", content=body, headers=multipart_headers())
+
+    assert response.status_code == 200
+    assert response.json()["candidates"][0]["id"] == "block_v1"
+    assert response.json()["sampledRows"] == 2
+
+
+async def test_detect_endpoint_rejects_an_unknown_template(client):
+    body = multipart_body([("schema_template_id", None, b"no_such_template"), ("file", "a.csv", b"Block_ID\nB1\n")])
+
+    response = await client.post("/api/v1/schemas/detect", content=body, headers=multipart_headers())
+
+    assert response.status_code == 404
+
+
+async def test_detect_endpoint_stops_reading_after_the_sample(client, monkeypatch):
+    monkeypatch.setattr(settings, "SCHEMA_DETECTION_SAMPLE_BYTES", 64)
+    chunks_read = []
+
+    async def body():
+        yield f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="b.csv"\r\n\r\n'.encode()
+        yield b"Block_ID,Fixation\n"
+        for i in range(1000):
+            chunks_read.append(i)
+            yield f"B{i},FFPE\n".encode()
+
+    response = await client.post("/api/v1/schemas/detect", content=body(), headers=multipart_headers())
+
+    assert response.status_code == 200
+    assert response.json()["columns"] == ["Block_ID", "Fixation"]
+    assert len(chunks_read) < 20
@@ -0,0 +1,80 @@
+"""
+Tests for export bundle contents.
+"""
+import io
+import json
+import zipfile
+
+import pytest
+from bson import ObjectId
+
+from app.db.database import COLLECTIONS
+from app.services.export import ExportService
+
+
+async def bundle_member(client, run_id, name):
+    response = await client.get(f"/api/v1/runs/{run_id}/export")
+    assert response.status_code == 200
+    return json.loads(zipfile.ZipFile(io.BytesIO(response.content)).read(name))
+
+
+async def test_report_is_the_runs_result_not_a_later_sample(client, db, run_id):
+    current, sample = ObjectId(), ObjectId()
+    results = db[COLLECTIONS["validation_results"]]
+    await results.insert_one({"_id": current, "run_id": ObjectId(run_id), "mode": "full", "blocker_count": 3})
+    await results.insert_one({"_id": sample, "run_id": ObjectId(run_id), "mode": "sample", "blocker_count": 1})
+    await db[COLLECTIONS["runs"]].update_one({"_id": ObjectId(run_id)}, {"$set": {"validation_result_id": current}})
+
+    report = await bundle_member(client, run_id, "validation_report.json")
+
+    assert report["_id"] == str(current)
+    assert report["blocker_count"] == 3
+
+
+async def test_report_of_unvalidated_run(client, db, run_id):
+    await db[COLLECTIONS["validation_results"]].insert_one({"_id": ObjectId(), "run_id": ObjectId(run_id), "mode": "sample"})
+
+    report = await bundle_member(client, run_id, "validation_report.json")
+
+    assert report["status"] == "no_validation"
+
+
+async def test_fields_with_conflicting_types_are_exported_as_strings(db, run_id, monkeypatch):
+    templates = {
+        "block_a": {"entity_type": "Block", "fields": [{"name": "Block_ID"}, {"name": "Section", "type": "integer"}]},
+        "block_b": {"entity_type": "Block", "fields": [{"name": "Section", "type": "string"}, {"name": "Stain"}]},
+    }
+    monkeypatch.setattr("app.services.export.load_template", templates.get)
+    for template_id in templates:
+        await db[COLLECTIONS["uploaded_files"]].insert_one({"run_id": ObjectId(run_id), "schema_template_id": template_id})
+    service = ExportService()
+    await service.initialize()
+
+    fields = (await service._entity_fields(ObjectId(run_id)))["Block"]
+
+    assert [(f["name"], f.get("type", "string")) for f in fields] == [
+        ("Block_ID", "string"), ("Section", "string"), ("Stain", "string"),
+    ]
+    assert templates["block_a"]["fields"][1]["type"] == "integer"
+
+
+async def test_columnar_export_of_conflicting_types(client, db, run_id, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    templates = {
+        "block_a": {"entity_type": "Block", "fields": [{"name": "Section", "type": "integer"}]},
+        "block_b": {"entity_type": "Block", "fields": [{"name": "Section", "type": "string"}]},
+    }
+    monkeypatch.setattr("app.services.export.load_template", templates.get)
+    run_oid = ObjectId(run_id)
+    for template_id in templates:
+        await db[COLLECTIONS["uploaded_files"]].insert_one({"run_id": run_oid, "schema_template_id": template_id})
+    await db[COLLECTIONS["canonical_entities"]].insert_many([
+        {"run_id": run_oid, "entity_type": "Block", "row_index": 0, "data": {"Section": 3}},
+        {"run_id": run_oid, "entity_type": "Block", "row_index": 1, "data": {"Section": "3b"}},
+    ])
+
+    response = await client.get(f"/api/v1/runs/{run_id}/export", params={"format": "parquet"})
+
+    assert response.status_code == 200
+    member = zipfile.ZipFile(io.BytesIO(response.content)).read("entities/Block.parquet")
+    assert sorted(pq.read_table(io.BytesIO(member)).column("Section").to_pylist()) == ["3", "3b"]
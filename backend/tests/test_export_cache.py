@@ -0,0 +1,133 @@
+"""
+Tests for cached export downloads: ETag, If-None-Match, Range and If-Range.
+"""
+import io
+import zipfile
+
+import pytest
+from bson import ObjectId
+
+from app.services.export_cache import ExportCache
+
+
+async def test_built_bundle_has_no_etag_and_cached_one_does(client, run_id):
+    built = await client.get(f"/api/v1/runs/{run_id}/export")
+    cached = await client.get(f"/api/v1/runs/{run_id}/export")
+
+    assert built.status_code == 200
+    assert "etag" not in built.headers
+    assert "accept-ranges" not in built.headers
+    assert zipfile.ZipFile(io.BytesIO(built.content)).namelist()
+    assert cached.status_code == 200
+    assert cached.headers["etag"].startswith('"')
+    assert cached.headers["accept-ranges"] == "bytes"
+    assert int(cached.headers["content-length"]) == len(cached.content)
+
+
+@pytest.fixture
+async def cached_bundle(client, run_id):
+    await client.get(f"/api/v1/runs/{run_id}/export")
+    response = await client.get(f"/api/v1/runs/{run_id}/export")
+    return response.headers["etag"], response.content
+
+
+async def test_if_none_match_returns_304(client, run_id, cached_bundle):
+    etag, _ = cached_bundle
+
+    response = await client.get(f"/api/v1/runs/{run_id}/export", headers={"If-None-Match": f"W/{etag}"})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+async def test_range_returns_206(client, run_id, cached_bundle):
+    etag, content = cached_bundle
+
+    response = await client.get(f"/api/v1/runs/{run_id}/export", headers={"Range": "bytes=10-19", "If-Range": etag})
+    suffix = await client.get(f"/api/v1/runs/{run_id}/export", headers={"Range": "bytes=-5"})
+
+    assert response.status_code == 206
+    assert response.content == content[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(content)}"
+    assert suffix.content == content[-5:]
+
+
+async def test_if_range_for_another_build_returns_the_whole_bundle(client, run_id, cached_bundle):
+    _, content = cached_bundle
+
+    response = await client.get(
+        f"/api/v1/runs/{run_id}/export", headers={"Range": "bytes=10-19", "If-Range": '"other"'}
+    )
+
+    assert response.status_code == 200
+    assert response.content == content
+
+
+async def test_unsatisfiable_range_returns_416(client, run_id, cached_bundle):
+    _, content = cached_bundle
+
+    response = await client.get(f"/api/v1/runs/{run_id}/export", headers={"Range": f"bytes={len(content)}-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(content)}"
+
+
+async def test_reharmonized_run_is_not_served_from_the_cache(client, run_id, db, cached_bundle):
+    etag, _ = cached_bundle
+    await db.runs.update_one({"_id": ObjectId(run_id)}, {"$inc": {"entity_revision": 1}})
+
+    response = await client.get(f"/api/v1/runs/{run_id}/export", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def committed():
+    return True
+
+
+async def test_second_build_of_a_key_does_not_replace_the_first(upload_dir):
+    cache = ExportCache(max_bytes=1 << 20)
+    run_id, key = "65f000000000000000000000", "k" * 64
+
+    first = [chunk async for chunk in cache.store(run_id, key, stream(b"first"), committed)]
+    entry = await cache.lookup(run_id, key)
+    second = [chunk async for chunk in cache.store(run_id, key, stream(b"second"), committed)]
+
+    assert first == [b"first"] and second == [b"second"]
+    assert await cache.lookup(run_id, key) == entry
+    assert entry.read_bytes() == b"first"
+    assert [path.name for path in cache.run_dir(run_id).iterdir()] == [entry.name]
+    assert ExportCache.etag(entry).startswith(f'"{key}.')
+
+
+async def test_stale_or_interrupted_build_leaves_nothing(upload_dir):
+    cache = ExportCache(max_bytes=1 << 20)
+    run_id, key = "65f000000000000000000000", "k" * 64
+
+    async def stale():
+        return False
+
+    [chunk async for chunk in cache.store(run_id, key, stream(b"data"), stale)]
+    interrupted = cache.store(run_id, key, stream(b"a", b"b"), committed)
+    await interrupted.__anext__()
+    await interrupted.aclose()
+
+    assert await cache.lookup(run_id, key) is None
+    assert list(cache.run_dir(run_id).iterdir()) == []
+
+
+async def test_invalidate_drops_the_runs_bundles(upload_dir):
+    cache = ExportCache(max_bytes=1 << 20)
+    run_id, key = "65f000000000000000000000", "k" * 64
+    [chunk async for chunk in cache.store(run_id, key, stream(b"data"), committed)]
+
+    await cache.invalidate(run_id)
+
+    assert await cache.lookup(run_id, key) is None
+    assert not cache.run_dir(run_id).exists()
@@ -0,0 +1,67 @@
+"""
+Tests for export options and the per-entity-type writers.
+"""
+import gzip
+import io
+import json
+
+import pytest
+from bson import ObjectId
+
+from app.services.export_formats import (
+    EntityWriter,
+    ExportFormatError,
+    ExportOptions,
+    open_entity_writer,
+)
+
+
+FIELDS = [{"name": "Block_ID", "type": "string"}, {"name": "Section", "type": "integer"}]
+
+DOCS = [
+    {"_id": ObjectId(), "row_index": 0, "data": {"Block_ID": "B1", "Section": 1}},
+    {"_id": ObjectId(), "row_index": 1, "data": {"Block_ID": "B2", "Section": None}},
+]
+
+
+def dumps(doc) -> bytes:
+    return json.dumps(doc, default=str).encode()
+
+
+def test_entity_writer_is_abstract():
+    with pytest.raises(TypeError):
+        EntityWriter(io.BytesIO())
+
+
+@pytest.mark.parametrize("format, codec, level, message", [
+    ("xml", None, None, "Unknown export format"),
+    ("ndjson", "lz4", None, "not supported"),
+    ("ndjson", "gzip", 42, "between"),
+])
+def test_invalid_options_are_refused(format, codec, level, message):
+    with pytest.raises(ExportFormatError, match=message):
+        ExportOptions(format, codec, level)
+
+
+def test_gzip_ndjson_round_trip():
+    sink = io.BytesIO()
+    writer = open_entity_writer(ExportOptions("ndjson", "gzip"), sink, FIELDS, dumps)
+    writer.write_batch(DOCS[:1])
+    writer.write_batch(DOCS[1:])
+    writer.close()
+
+    lines = gzip.decompress(sink.getvalue()).splitlines()
+    assert [json.loads(line)["data"]["Block_ID"] for line in lines] == ["B1", "B2"]
+
+
+def test_parquet_round_trip():
+    pq = pytest.importorskip("pyarrow.parquet")
+    sink = io.BytesIO()
+    writer = open_entity_writer(ExportOptions("parquet"), sink, FIELDS, dumps)
+    writer.write_batch(DOCS)
+    writer.close()
+
+    table = pq.read_table(io.BytesIO(sink.getvalue()))
+    assert table.column("Block_ID").to_pylist() == ["B1", "B2"]
+    assert table.column("Section").to_pylist() == [1, None]
+    assert table.column("_id").to_pylist() == [str(doc["_id"]) for doc in DOCS]
@@ -0,0 +1,92 @@
+"""
+Tests for entity ID assignment and parent linking.
+"""
+import threading
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from app.db.database import COLLECTIONS
+from app.services.columnar import ColumnTable
+from app.services.harmonization import HarmonizationService, link_to_parents, new_object_ids
+from app.services.relationships import RelationshipIndex
+
+
+def table(columns, nulls=None) -> ColumnTable:
+    return ColumnTable({name: np.array(values) for name, values in columns.items()},
+                       {name: np.array(mask) for name, mask in (nulls or {}).items()})
+
+
+def test_new_object_ids_are_distinct_and_ascending():
+    ids = new_object_ids(1000)
+
+    assert len(set(ids.tolist())) == 1000
+    assert ids.tolist() == sorted(ids.tolist())
+    assert len({oid.binary[:9] for oid in ids}) == 1
+
+
+def test_new_object_ids_of_separate_calls_differ():
+    assert not set(new_object_ids(10).tolist()) & set(new_object_ids(10).tolist())
+
+
+def test_new_object_ids_empty():
+    assert new_object_ids(0).tolist() == []
+
+
+def test_link_to_parents_across_parent_files():
+    blocks_a = table({"Block_ID": ["B1", "B2"]})
+    blocks_b = table({"Block_ID": ["B3"]})
+    for blocks in (blocks_a, blocks_b):
+        blocks.ids = new_object_ids(blocks.num_rows)
+    slides = table({"Slide_ID": ["S1", "S2", "S3", "S4"], "Block_ID": ["B3", "B1", "B9", ""]},
+                   {"Block_ID": [False, False, False, True]})
+
+    linked = link_to_parents(slides, "Slide", [blocks_a, blocks_b])
+
+    assert linked.tolist() == [blocks_b.ids[0], blocks_a.ids[0], None, None]
+
+
+def test_link_to_parents_of_root_type():
+    blocks = table({"Block_ID": ["B1"]})
+
+    assert link_to_parents(blocks, "Block", []).tolist() == [None]
+
+
+async def test_link_runs_off_the_event_loop():
+    service = HarmonizationService()
+    blocks = table({"Block_ID": ["B1"]})
+    slides = table({"Slide_ID": ["S1", "S2"], "Block_ID": ["B1", "B2"]})
+    threads = []
+    link_type = service.link_type
+
+    def recording_link_type(*args):
+        threads.append(threading.get_ident())
+        return link_type(*args)
+
+    service.link_type = recording_link_type
+    block_tables, _ = await service._link_task("Block")({"parse:blocks": blocks})
+    _, orphans = await service._link_task("Slide")({"parse:slides": slides, "link:Block": (block_tables, 0)})
+
+    assert orphans == 1
+    assert slides.parent_ids.tolist() == [blocks.ids[0], None]
+    assert threading.get_ident() not in threads
+
+
+async def test_failure_after_storing_entities_sets_the_run_to_error(db, monkeypatch):
+    run_oid = ObjectId()
+    await db[COLLECTIONS["runs"]].insert_one({"_id": run_oid, "status": "created", "entity_revision": 0})
+
+    def broken_save(self, path):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(RelationshipIndex, "save", broken_save)
+    service = HarmonizationService()
+    service.db = db
+
+    with pytest.raises(OSError):
+        await service.harmonize_run(str(run_oid))
+
+    run = await db[COLLECTIONS["runs"]].find_one({"_id": run_oid})
+    assert run["status"] == "error"
+    assert run["entity_revision"] == 1
@@ -0,0 +1,216 @@
+"""
+Tests for the job manager: exclusive run jobs and progress listeners.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.core.config import settings
+from app.db.database import COLLECTIONS
+from app.db.indexes import INDEXES
+from app.services import jobs
+from app.services.jobs import EXPORTABLE_STATUSES, JobConflictError, JobContext, JobManager, prune_export_bundles
+
+
+@pytest.fixture
+def manager(db, monkeypatch) -> JobManager:
+    # Queue only; nothing runs in the test process
+    monkeypatch.setattr(settings, "JOB_BACKEND", "mongo")
+    manager = JobManager()
+    manager.db = db
+    return manager
+
+
+@pytest.mark.parametrize("second", ["harmonize", "validate"])
+async def test_second_harmonize_or_validate_job_is_refused(manager, second):
+    run_id = str(ObjectId())
+    await manager.enqueue("harmonize", run_id)
+
+    with pytest.raises(JobConflictError):
+        await manager.enqueue(second, run_id)
+
+
+async def test_exports_and_other_runs_are_not_exclusive(manager):
+    run_id = str(ObjectId())
+    await manager.enqueue("validate", run_id)
+
+    await manager.enqueue("export", run_id)
+    await manager.enqueue("export", run_id)
+    await manager.enqueue("validate", str(ObjectId()))
+
+
+async def test_finished_job_releases_the_run(manager):
+    run_id = str(ObjectId())
+    job = await manager.enqueue("harmonize", run_id)
+
+    await manager.update_job(job["_id"], {"status": "completed", "finished_at": datetime.utcnow()})
+
+    await manager.enqueue("validate", run_id)
+    stored = await manager.db[COLLECTIONS["jobs"]].find_one({"_id": job["_id"]})
+    assert "exclusive_run_id" not in stored
+
+
+async def test_job_with_expired_lease_is_failed_and_replaced(manager):
+    run_id = str(ObjectId())
+    job = await manager.enqueue("harmonize", run_id)
+    stale = datetime.utcnow() - timedelta(seconds=settings.JOB_LEASE_SECONDS + 1)
+    await manager.db[COLLECTIONS["jobs"]].update_one(
+        {"_id": job["_id"]}, {"$set": {"status": "running", "heartbeat_at": stale}}
+    )
+
+    await manager.enqueue("harmonize", run_id)
+
+    stored = await manager.db[COLLECTIONS["jobs"]].find_one({"_id": job["_id"]})
+    assert stored["status"] == "failed"
+    assert stored["error"] == "Job lease expired"
+
+
+async def test_unique_index_refuses_a_racing_enqueue(manager, monkeypatch):
+    await manager.db[COLLECTIONS["jobs"]].create_indexes(INDEXES[COLLECTIONS["jobs"]])
+    run_id = str(ObjectId())
+    await manager.enqueue("harmonize", run_id)
+
+    async def no_check(run_id):
+        pass
+
+    # As if both requests passed the check before either inserted
+    monkeypatch.setattr(manager, "_check_exclusive", no_check)
+    with pytest.raises(JobConflictError):
+        await manager.enqueue("validate", run_id)
+
+
+async def test_harmonize_endpoint_returns_409(client, run_id, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_BACKEND", "mongo")
+    first = await client.post(f"/api/v1/runs/{run_id}/harmonize")
+    second = await client.post(f"/api/v1/runs/{run_id}/validate")
+
+    assert first.status_code == 202
+    assert second.status_code == 409
+
+
+async def test_listener_events_are_dropped_after_the_last_wait(manager):
+    job_id = str(ObjectId())
+    waits = [asyncio.create_task(manager.wait_for_update(job_id, 5)) for _ in range(2)]
+    await asyncio.sleep(0)
+    assert list(manager._events) == [job_id]
+
+    await manager.update_job(ObjectId(job_id), {"progress": {"stage": "parsing"}})
+    await asyncio.wait_for(asyncio.gather(*waits), 1)
+
+    assert manager._events == {}
+    assert manager._listeners == {}
+
+
+async def test_timed_out_wait_leaves_nothing_behind(manager):
+    await manager.wait_for_update(str(ObjectId()), 0.01)
+
+    assert manager._events == {}
+
+
+@pytest.fixture
+def local_manager(db, monkeypatch) -> JobManager:
+    # Jobs run in this process, but every JOB_CONCURRENCY slot is taken
+    monkeypatch.setattr(settings, "JOB_BACKEND", "inprocess")
+    manager = JobManager()
+    manager.db = db
+    manager._semaphore = asyncio.Semaphore(0)
+    return manager
+
+
+async def test_stop_fails_jobs_still_waiting_for_a_slot(local_manager):
+    run_id = str(ObjectId())
+    job = await local_manager.enqueue("harmonize", run_id)
+    await asyncio.sleep(0)
+
+    await local_manager.stop()
+
+    stored = await local_manager.db[COLLECTIONS["jobs"]].find_one({"_id": job["_id"]})
+    assert stored["status"] == "failed"
+    assert "exclusive_run_id" not in stored
+    await local_manager.enqueue("validate", run_id)
+    await local_manager.stop()
+
+
+async def stale_local_job(db, run_id):
+    stale = datetime.utcnow() - timedelta(seconds=settings.JOB_LEASE_SECONDS + 1)
+    job = {"_id": ObjectId(), "run_id": ObjectId(run_id), "kind": "harmonize", "status": "queued",
+           "exclusive_run_id": ObjectId(run_id), "queued_by": "gone:1", "heartbeat_at": stale,
+           "created_at": stale}
+    await db[COLLECTIONS["jobs"]].insert_one(job)
+    return job
+
+
+async def test_queued_job_of_a_dead_process_is_failed_and_replaced(manager):
+    run_id = str(ObjectId())
+    job = await stale_local_job(manager.db, run_id)
+
+    await manager.enqueue("harmonize", run_id)
+
+    stored = await manager.db[COLLECTIONS["jobs"]].find_one({"_id": job["_id"]})
+    assert stored["status"] == "failed"
+
+
+async def test_queued_worker_job_is_not_expired(manager):
+    run_id = str(ObjectId())
+    job = await manager.enqueue("harmonize", run_id)
+    stale = datetime.utcnow() - timedelta(seconds=settings.JOB_LEASE_SECONDS + 1)
+    await manager.db[COLLECTIONS["jobs"]].update_one({"_id": job["_id"]}, {"$set": {"created_at": stale}})
+
+    with pytest.raises(JobConflictError):
+        await manager.enqueue("harmonize", run_id)
+
+
+async def test_start_fails_queued_jobs_of_a_dead_process(local_manager):
+    job = await stale_local_job(local_manager.db, str(ObjectId()))
+
+    await local_manager.start()
+
+    stored = await local_manager.db[COLLECTIONS["jobs"]].find_one({"_id": job["_id"]})
+    assert stored["status"] == "failed"
+    assert "exclusive_run_id" not in stored
+
+
+async def failing(ctx):
+    raise RuntimeError("disk full")
+
+
+@pytest.mark.parametrize("kind, run_status", [("export", "ready"), ("validate", "error")])
+async def test_only_failed_harmonize_or_validate_jobs_set_the_run_to_error(manager, monkeypatch, kind, run_status):
+    monkeypatch.setitem(jobs.JOB_HANDLERS, kind, failing)
+    run_oid = ObjectId()
+    await manager.db[COLLECTIONS["runs"]].insert_one({"_id": run_oid, "status": "ready"})
+    job = await manager.enqueue(kind, str(run_oid))
+
+    await manager.execute(job)
+
+    assert (await manager.db[COLLECTIONS["runs"]].find_one({"_id": run_oid}))["status"] == run_status
+    assert (await manager.get_job(str(job["_id"])))["error"] == "disk full"
+
+
+@pytest.mark.parametrize("current, expected", [("harmonizing", "harmonizing"), ("remediation", "exported")])
+async def test_export_status_does_not_replace_a_job_in_progress(manager, current, expected):
+    run_oid = ObjectId()
+    await manager.db[COLLECTIONS["runs"]].insert_one({"_id": run_oid, "status": current})
+    ctx = JobContext({"_id": ObjectId(), "run_id": run_oid}, manager)
+
+    await ctx.set_run_status("exported", only_from=EXPORTABLE_STATUSES)
+
+    assert (await manager.db[COLLECTIONS["runs"]].find_one({"_id": run_oid}))["status"] == expected
+
+
+def test_prune_export_bundles_deletes_old_bundles(upload_dir):
+    run_dir = upload_dir / "exports" / str(ObjectId())
+    run_dir.mkdir(parents=True)
+    old, new = run_dir / "old.zip", run_dir / "new.zip"
+    old.write_bytes(b"zip")
+    new.write_bytes(b"zip")
+    an_hour_ago = time.time() - 3600
+    os.utime(old, (an_hour_ago, an_hour_ago))
+
+    assert prune_export_bundles(1800) == 1
+    assert not old.exists()
+    assert new.exists()
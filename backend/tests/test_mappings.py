@@ -0,0 +1,84 @@
+"""
+Tests for header fingerprints, compiled mappings and the mapping library.
+"""
+import pytest
+
+from app.services.mappings import (
+    MappingError, MappingService, check_mapping, compile_mapping, compiled_mapping, header_fingerprint
+)
+
+
+TEMPLATE = {"id": "block_v1", "fields": [
+    {"name": "Block_ID"}, {"name": "Fixation"}, {"name": "Thickness"}, {"name": "Stain"},
+]}
+
+
+def test_header_fingerprint_ignores_order_case_and_punctuation():
+    assert header_fingerprint(["Block ID", "Fixation"]) == header_fingerprint(["fixation", "block_id"])
+    assert header_fingerprint(["Block ID", "Fixation"]) == header_fingerprint(["BLOCK-ID", "Fixation", "fixation"])
+
+
+def test_header_fingerprint_changes_with_the_columns():
+    assert header_fingerprint(["Block_ID"]) != header_fingerprint(["Block_ID", "Fixation"])
+    # Joined names must not collide with a single longer name
+    assert header_fingerprint(["a", "b"]) != header_fingerprint(["ab"])
+
+
+def test_compile_mapping_resolves_sources_to_header_positions():
+    columns = ["thickness_um", "Block_ID", "fixative", "Notes"]
+
+    compiled = compile_mapping(TEMPLATE, {"Fixation": "fixative", "Thickness": "thickness_um"}, columns)
+
+    assert compiled.sources == (1, 2, 0, -1)
+    assert compiled.source_indices == [0, 1, 2]
+    assert compiled.renames == {"Block_ID": "Block_ID", "Fixation": "fixative", "Thickness": "thickness_um"}
+    assert compiled.missing == ["Stain"]
+
+
+def test_compile_mapping_matches_mapped_sources_by_normalised_name():
+    # Same fingerprint as the header the mapping was saved for
+    compiled = compile_mapping(TEMPLATE, {"Fixation": "Fixative"}, ["block_id", "FIXATIVE"])
+
+    assert compiled.renames == {"Fixation": "FIXATIVE"}
+    assert compiled.missing == ["Block_ID", "Thickness", "Stain"]
+
+
+def test_compile_mapping_uses_the_first_of_repeated_columns():
+    compiled = compile_mapping(TEMPLATE, None, ["Stain", "Block_ID", "Stain"])
+
+    assert compiled.renames == {"Block_ID": "Block_ID", "Stain": "Stain"}
+    assert compiled.sources[3] == 0
+
+
+def test_compiled_mapping_is_cached_per_mapping_and_header():
+    first = compiled_mapping("block_v1", {"Fixation": "fixative"}, ["Block_ID", "fixative"])
+
+    assert compiled_mapping("block_v1", {"Fixation": "fixative"}, ["Block_ID", "fixative"]) is first
+    assert compiled_mapping("block_v1", {}, ["Block_ID", "fixative"]) is not first
+    assert first.renames["Block_ID"] == "Block_ID"
+
+
+def test_compiled_mapping_of_unknown_template_or_header():
+    assert compiled_mapping("no_such_template", {}, ["Block_ID"]) is None
+    assert compiled_mapping("block_v1", {}, []) is None
+
+
+def test_check_mapping_rejects_unknown_fields_and_absent_columns():
+    check_mapping(TEMPLATE, {"Fixation": "fixative"}, ["fixative"])
+
+    with pytest.raises(MappingError, match="Unknown fields"):
+        check_mapping(TEMPLATE, {"Color": "fixative"}, ["fixative"])
+    with pytest.raises(MappingError, match="not in the file header"):
+        check_mapping(TEMPLATE, {"Fixation": "fixative"}, ["Fixation"])
+
+
+async def test_saved_mapping_is_found_for_an_equivalent_header(db):
+    service = MappingService(db)
+    await service.save("lab A", "block_v1", {"Fixation": "fixative"}, ["Block ID", "fixative"], user_id="tester")
+    saved = await service.save("lab A v2", "block_v1", {"Fixation": "Fixative"}, ["block_id", "Fixative"])
+
+    found = await service.find_for_header(["FIXATIVE", "block-id"], "block_v1")
+
+    assert found["_id"] == saved["_id"]
+    assert found["name"] == "lab A v2"
+    assert await service.find_for_header(["FIXATIVE", "block-id"], "slide_v1") is None
@@ -0,0 +1,77 @@
+"""
+Tests for the in-process Prometheus metrics.
+"""
+import pytest
+
+from app.core.metrics import Metric, MetricsRegistry
+
+
+def test_metric_requires_a_child_type():
+    with pytest.raises(TypeError):
+        Metric("mdo_test", "Test")
+
+
+def test_counter_and_gauge_render_per_label_values():
+    registry = MetricsRegistry()
+    requests = registry.counter("mdo_requests_total", "Requests", ("route",))
+    depth = registry.gauge("mdo_queue_depth", "Queue depth")
+    requests.labels("/runs").inc()
+    requests.labels("/runs").inc(2)
+    requests.labels('/say "hi"').inc()
+    depth.set(4.5)
+
+    assert registry.render().splitlines() == [
+        "# HELP mdo_requests_total Requests",
+        "# TYPE mdo_requests_total counter",
+        'mdo_requests_total{route="/runs"} 3',
+        'mdo_requests_total{route="/say \\"hi\\""} 1',
+        "# HELP mdo_queue_depth Queue depth",
+        "# TYPE mdo_queue_depth gauge",
+        "mdo_queue_depth 4.5",
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("mdo_latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+
+    assert registry.render().splitlines()[2:] == [
+        'mdo_latency_seconds_bucket{le="0.1"} 2',
+        'mdo_latency_seconds_bucket{le="1"} 3',
+        'mdo_latency_seconds_bucket{le="+Inf"} 4',
+        "mdo_latency_seconds_sum 3.65",
+        "mdo_latency_seconds_count 4",
+    ]
+
+
+def test_labels_must_match_label_names():
+    counter = MetricsRegistry().counter("mdo_errors_total", "Errors", ("kind",))
+
+    with pytest.raises(ValueError):
+        counter.labels("a", "b")
+
+
+def test_registry_rejects_duplicate_names():
+    registry = MetricsRegistry()
+    registry.counter("mdo_total", "Total")
+
+    with pytest.raises(ValueError):
+        registry.gauge("mdo_total", "Total")
+
+
+def test_failing_collector_does_not_hide_other_metrics():
+    registry = MetricsRegistry()
+
+    def broken():
+        raise RuntimeError("pool gone")
+
+    registry.gauge("mdo_pool_size", "Pool size", collect=broken)
+    registry.gauge("mdo_open", "Open", ("pool",), collect=lambda: {("main",): 2})
+
+    assert registry.render().splitlines() == [
+        "# HELP mdo_open Open",
+        "# TYPE mdo_open gauge",
+        'mdo_open{pool="main"} 2',
+    ]
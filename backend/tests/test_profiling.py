@@ -0,0 +1,103 @@
+"""
+Tests for admin-only profiling of jobs and export downloads.
+"""
+import asyncio
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+
+from app.core.config import settings
+from app.db.database import COLLECTIONS
+from app.services import jobs
+from app.services.jobs import JobManager
+
+
+@pytest.fixture
+def admin_token(db, monkeypatch) -> str:
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "s3cret")
+    # Queue only, into this test's database
+    monkeypatch.setattr(settings, "JOB_BACKEND", "mongo")
+    monkeypatch.setattr(jobs.job_manager, "db", db)
+    return "s3cret"
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Admin-Token": "wrong"}, {"X-Admin-Token": ""}])
+async def test_profile_is_refused_without_the_admin_token(client, db, run_id, admin_token, headers):
+    response = await client.post(f"/api/v1/runs/{run_id}/harmonize", params={"profile": "true"}, headers=headers)
+
+    assert response.status_code == 403
+    assert await db[COLLECTIONS["jobs"]].count_documents({}) == 0
+
+
+async def test_profile_is_refused_when_no_admin_token_is_configured(client, run_id, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "")
+
+    response = await client.get(f"/api/v1/runs/{run_id}/export", params={"profile": "true"},
+                                headers={"X-Admin-Token": ""})
+
+    assert response.status_code == 403
+
+
+async def test_profile_with_the_admin_token_is_passed_to_the_job(client, db, run_id, admin_token):
+    response = await client.post(f"/api/v1/runs/{run_id}/harmonize", params={"profile": "true"},
+                                 headers={"X-Admin-Token": admin_token})
+
+    assert response.status_code == 202
+    job = await db[COLLECTIONS["jobs"]].find_one({"run_id": ObjectId(run_id)})
+    assert job["params"] == {"profile": True}
+
+
+async def test_token_without_profile_is_not_profiled(client, db, run_id, admin_token):
+    response = await client.post(f"/api/v1/runs/{run_id}/harmonize", headers={"X-Admin-Token": admin_token})
+
+    assert response.status_code == 202
+    assert (await db[COLLECTIONS["jobs"]].find_one({"run_id": ObjectId(run_id)}))["params"] == {}
+
+
+async def busy(ctx):
+    await asyncio.sleep(0.05)
+    return {"rows": 1}
+
+
+async def test_profiled_job_saves_the_profile_and_an_audit_entry(db, upload_dir, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_BACKEND", "mongo")
+    monkeypatch.setattr(settings, "PROFILE_INTERVAL_MS", 5)
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "validate", busy)
+    manager = JobManager()
+    manager.db = db
+    run_oid = ObjectId()
+    await db[COLLECTIONS["runs"]].insert_one({"_id": run_oid, "status": "ready"})
+    job = await manager.enqueue("validate", str(run_oid), params={"profile": True})
+
+    await manager.execute(job)
+
+    stored = await manager.get_job(str(job["_id"]))
+    assert stored["status"] == "completed"
+    path = Path(stored["result"]["profile_path"])
+    assert stored["result"]["rows"] == 1
+    assert path.parent == upload_dir / str(run_oid) / "profiles"
+    entry = await db[COLLECTIONS["audit_logs"]].find_one({"run_id": run_oid, "action": "profile_recorded"})
+    assert path.name == f"job.validate-{entry['_id']}.folded"
+    assert entry["details"]["job_id"] == str(job["_id"])
+    assert entry["details"]["target"] == "job.validate"
+    assert entry["details"]["path"] == str(path)
+    assert entry["details"]["samples"] > 0
+    for line in path.read_text().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack and int(count) > 0
+
+
+async def test_unprofiled_job_saves_no_profile(db, upload_dir, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_BACKEND", "mongo")
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "validate", busy)
+    manager = JobManager()
+    manager.db = db
+    run_oid = ObjectId()
+    job = await manager.enqueue("validate", str(run_oid))
+
+    await manager.execute(job)
+
+    assert "profile_path" not in (await manager.get_job(str(job["_id"])))["result"]
+    assert not (upload_dir / str(run_oid) / "profiles").exists()
+    assert await db[COLLECTIONS["audit_logs"]].count_documents({"action": "profile_recorded"}) == 0
@@ -0,0 +1,68 @@
+"""
+Tests for the in-memory schema registry and its hot reload.
+"""
+import json
+import os
+
+import pytest
+
+from app.schemas.registry import SchemaRegistry
+
+
+def write_template(directory, schema_id, fields, mtime_ns=None):
+    path = directory / f"{schema_id}.json"
+    path.write_text(json.dumps({"id": schema_id, "entity_type": "Block", "fields": fields}))
+    if mtime_ns is not None:
+        # Filesystem timestamps can be coarse; make each edit visible
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+@pytest.fixture
+def registry(tmp_path):
+    write_template(tmp_path, "block_a", [{"name": "Block_ID", "required": True}], mtime_ns=10**18)
+    write_template(tmp_path, "block_b", [{"name": "Stain"}], mtime_ns=10**18)
+    return SchemaRegistry(tmp_path)
+
+
+def test_refresh_picks_up_a_modified_file(registry, tmp_path):
+    etag = registry.etag
+    write_template(tmp_path, "block_a", [{"name": "Block_ID"}, {"name": "Thickness", "type": "float"}],
+                   mtime_ns=2 * 10**18)
+
+    assert registry.refresh() is True
+    assert [f["name"] for f in registry.get("block_a").fields] == ["Block_ID", "Thickness"]
+    assert registry.etag != etag
+    assert registry.refresh() is False
+
+
+def test_refresh_keeps_the_last_good_version_of_an_invalid_file(registry, tmp_path, caplog):
+    loaded = registry.get("block_a")
+    etag = registry.etag
+    write_template(tmp_path, "block_a", [{"name": "Block_ID", "type": "uuid"}], mtime_ns=2 * 10**18)
+
+    assert registry.refresh() is False
+    assert registry.get("block_a") is loaded
+    assert registry.etag == etag
+    assert "unknown type 'uuid'" in registry.errors["block_a"]
+    assert "Error loading schema" in caplog.text
+
+
+def test_fixing_an_invalid_file_clears_its_error(registry, tmp_path):
+    registry.templates
+    write_template(tmp_path, "block_a", "not a list", mtime_ns=2 * 10**18)
+    registry.refresh()
+    write_template(tmp_path, "block_a", [{"name": "Section", "type": "integer"}], mtime_ns=3 * 10**18)
+
+    assert registry.refresh() is True
+    assert registry.errors == {}
+    assert [f["name"] for f in registry.get("block_a").fields] == ["Section"]
+
+
+def test_refresh_removes_a_deleted_file(registry, tmp_path):
+    assert [t.id for t in registry.list()] == ["block_a", "block_b"]
+    (tmp_path / "block_b.json").unlink()
+
+    assert registry.refresh() is True
+    assert registry.get("block_b") is None
+    assert [t.id for t in registry.list()] == ["block_a"]
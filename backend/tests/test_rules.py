@@ -0,0 +1,173 @@
+"""
+Tests for compiled validation rules.
+"""
+from bson import ObjectId
+import pytest
+
+from app.services.rules import ColumnBatch, RuleError, build_ruleset, compile_rule
+
+
+FIELD_TYPES = {"Block_ID": "string", "Thickness": "float", "Count": "integer", "Cut_Date": "date",
+               "Stain": "string", "Fixed": "boolean"}
+
+
+def batch(rows, invalid=None) -> ColumnBatch:
+    invalid = invalid or {}
+    docs = [
+        {"_id": ObjectId(), "file_id": "f1", "row_index": i, "data": row, "invalid": invalid.get(i)}
+        for i, row in enumerate(rows)
+    ]
+    return ColumnBatch.from_documents(docs, FIELD_TYPES)
+
+
+def rule(check, column, **params):
+    spec = {"id": f"{check}.{column}", "level": "field", "entity_type": "Block", "check": check,
+            "column": column, "severity": "Warning", "description": f"{column} {check}", **params}
+    return compile_rule(spec, FIELD_TYPES)
+
+
+def test_required_skips_values_that_failed_coercion():
+    rows = [{"Thickness": 1.0}, {"Thickness": None}, {}]
+
+    failing = rule("required", "Thickness").evaluate(batch(rows, invalid={2: {"Thickness": "thick"}}))
+
+    assert failing.tolist() == [1]
+
+
+def test_type_flags_non_integers_and_coercion_failures():
+    rows = [{"Count": 3}, {"Count": 2.5}, {"Count": None}, {"Count": "x"}, {}]
+
+    failing = rule("type", "Count", type="integer").evaluate(batch(rows, invalid={4: {"Count": "many"}}))
+
+    assert failing.tolist() == [1, 3, 4]
+
+
+def test_type_of_dates_and_booleans():
+    rows = [{"Cut_Date": "2024-01-31", "Fixed": True}, {"Cut_Date": "not a date", "Fixed": "yes"}]
+    data = batch(rows)
+
+    assert rule("type", "Cut_Date", type="date").evaluate(data).tolist() == [1]
+    assert rule("type", "Fixed", type="boolean").evaluate(data).tolist() == [1]
+
+
+def test_pattern_enum_and_range():
+    rows = [{"Block_ID": "B1", "Stain": "he", "Thickness": 4.0},
+            {"Block_ID": "X-1", "Stain": "IHC", "Thickness": 12.0},
+            {"Block_ID": None, "Stain": "Trichrome", "Thickness": None}]
+    data = batch(rows)
+
+    assert rule("pattern", "Block_ID", pattern=r"B\d+").evaluate(data).tolist() == [1]
+    assert rule("enum", "Stain", values=["HE", "IHC"]).evaluate(data).tolist() == [2]
+    assert rule("enum", "Stain", values=["HE", "IHC"], ignore_case=False).evaluate(data).tolist() == [0, 2]
+    assert rule("range", "Thickness", min=1, max=10).evaluate(data).tolist() == [1]
+
+
+def test_compare_and_required_with():
+    rows = [{"Thickness": 5.0, "Count": 3}, {"Thickness": 2.0, "Count": 3}, {"Thickness": 1.0}]
+    data = batch(rows)
+
+    assert rule("compare", "Thickness", op=">=", field="Count").evaluate(data).tolist() == [1]
+    assert rule("compare", "Thickness", op="<", value=5).evaluate(data).tolist() == [0]
+    assert rule("required_with", "Thickness", fields=["Count"]).evaluate(data).tolist() == [2]
+
+
+def test_unique_flags_later_occurrences_only():
+    rows = [{"Block_ID": "B1"}, {"Block_ID": "B2"}, {"Block_ID": "B1"}, {}, {}, {"Block_ID": "B1"}]
+
+    assert rule("unique", "Block_ID").evaluate(batch(rows)).tolist() == [2, 5]
+
+
+def test_evaluate_empty_batch():
+    assert rule("required", "Thickness").evaluate(batch([])).tolist() == []
+
+
+def test_message_shows_the_source_value_of_an_invalid_cell():
+    data = batch([{"Count": 2.5}, {}, {"Count": None}], invalid={1: {"Count": "many"}})
+    count_type = rule("type", "Count", type="integer")
+
+    assert count_type.message(data, 0) == "Count type (value: 2.5)"
+    assert count_type.message(data, 1) == "Count type (value: 'many')"
+    assert count_type.message(data, 2) == "Count type"
+
+
+def test_select_and_concat_keep_only_the_selected_columns():
+    first = batch([{"Block_ID": "B1", "Stain": "HE"}]).select(["Block_ID"])
+    second = batch([{"Block_ID": "B1", "Stain": "IHC"}]).select(["Block_ID"])
+
+    joined = ColumnBatch.concat([first, second], FIELD_TYPES)
+
+    assert len(joined) == 2
+    assert rule("unique", "Block_ID").evaluate(joined).tolist() == [1]
+
+
+@pytest.mark.parametrize("change, message", [
+    ({"check": "unknown"}, "unknown check"),
+    ({"severity": "Fatal"}, "unknown severity"),
+    ({"level": "cell"}, "unknown level"),
+    ({"column": "Missing"}, "unknown fields"),
+    ({"check": "pattern", "pattern": "("}, "invalid pattern"),
+    ({"check": "compare", "op": "~", "value": 1}, "unknown operator"),
+])
+def test_compile_rule_rejects_invalid_definitions(change, message):
+    spec = {"id": "r", "level": "field", "entity_type": "Block", "check": "required",
+            "column": "Thickness", "severity": "Warning", "description": "d", **change}
+
+    with pytest.raises(RuleError, match=message):
+        compile_rule(spec, FIELD_TYPES)
+
+
+def test_compile_rule_requires_all_keys():
+    with pytest.raises(RuleError, match="missing 'severity'"):
+        compile_rule({"id": "r", "level": "field", "entity_type": "Block", "check": "required",
+                      "column": "Thickness", "description": "d"}, FIELD_TYPES)
+
+
+TEMPLATES = [
+    {"entity_type": "Block", "fields": [
+        {"name": "Block_ID", "type": "string", "required": True, "pattern": r"B\d+"},
+        {"name": "Thickness", "type": "float", "min": 1, "max": 10},
+    ]},
+    {"entity_type": "Block", "fields": [
+        {"name": "Block_ID", "type": "string", "required": True},
+        {"name": "Stain", "enum": ["HE", "IHC"]},
+    ]},
+    {"entity_type": "NotAnEntity", "fields": [{"name": "X", "required": True}]},
+]
+
+
+def test_build_ruleset_merges_templates_of_an_entity_type():
+    rules = build_ruleset(TEMPLATES)
+
+    assert sorted(r.id for r in rules.for_entity("Block", "field")) == [
+        "enum.Block.Stain", "pattern.Block.Block_ID", "range.Block.Thickness",
+        "required.Block.Block_ID", "type.Block.Thickness",
+    ]
+    assert rules.field_types("Block") == {"Block_ID": "string", "Thickness": "float", "Stain": "string"}
+    assert rules.for_entity("Block", "row") == []
+    assert rules.field_types("NotAnEntity") == {}
+
+
+def test_build_ruleset_adds_ruleset_rules():
+    ruleset = {"version": "2", "rules": [
+        {"id": "THICK_STAINED", "level": "row", "entity_type": "Block", "check": "required_with",
+         "column": "Stain", "fields": ["Thickness"], "severity": "Info", "description": "d"},
+    ]}
+
+    rules = build_ruleset(TEMPLATES, ruleset)
+
+    assert rules.version == "2"
+    assert [r.id for r in rules.for_entity("Block", "row")] == ["THICK_STAINED"]
+    assert rules.columns("Block", "row") == {"Stain", "Thickness"}
+    assert rules.get("THICK_STAINED").severity == "Info"
+
+
+def test_build_ruleset_rejects_duplicate_ids():
+    ruleset = {"rules": [{"id": "required.Block.Block_ID"}]}
+
+    with pytest.raises(RuleError, match="Duplicate"):
+        build_ruleset(TEMPLATES, ruleset)
+
+
+def test_ruleset_fingerprint_follows_the_rules():
+    assert build_ruleset(TEMPLATES).fingerprint == build_ruleset(list(reversed(TEMPLATES))).fingerprint
+    assert build_ruleset(TEMPLATES).fingerprint != build_ruleset(TEMPLATES[:1]).fingerprint
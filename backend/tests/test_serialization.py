@@ -0,0 +1,56 @@
+"""
+Tests for the JSON encoders.
+"""
+from datetime import datetime
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from app.core.serialization import SerializationError, _orjson_encoder, _select_encoder, _stdlib_encoder
+
+
+DOCUMENT = {
+    "_id": ObjectId("65a000000000000000000001"),
+    "created_at": datetime(2024, 1, 2, 3, 4, 5),
+    "count": np.int64(3),
+    "values": np.array([1.5, 2.5]),
+    "name": "Blocé",
+    "nested": [{"ok": True, "none": None}],
+}
+
+
+def test_stdlib_encoder_writes_compact_and_pretty_json():
+    dumps = _stdlib_encoder()
+
+    assert dumps({"a": [1, 2]}, False) == b'{"a":[1,2]}'
+    assert dumps({"a": 1}, True) == b'{\n  "a": 1\n}'
+
+
+def test_stdlib_encoder_writes_non_finite_floats_as_null():
+    dumps = _stdlib_encoder()
+    value = {"nan": float("nan"), "inf": [float("inf"), -float("inf")], "np": np.float64("nan"),
+             "array": np.array([1.0, np.nan]), "ok": 1.5}
+
+    assert dumps(value, False) == b'{"nan":null,"inf":[null,null],"np":null,"array":[1.0,null],"ok":1.5}'
+
+
+@pytest.mark.parametrize("value", [
+    DOCUMENT,
+    {"nan": float("nan"), "inf": (float("inf"),), "np": np.float32("inf"), "array": np.array([np.nan])},
+])
+def test_encoders_agree(value):
+    pytest.importorskip("orjson")
+
+    assert _stdlib_encoder()(value, False) == _orjson_encoder()(value, False)
+
+
+def test_stdlib_encoder_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        _stdlib_encoder()({"value": object()}, False)
+
+
+def test_select_encoder():
+    assert _select_encoder("json")[0] == "json"
+    with pytest.raises(SerializationError):
+        _select_encoder("simplejson")
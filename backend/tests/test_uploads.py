@@ -0,0 +1,243 @@
+"""
+Tests for streamed uploads: shape counting, the multipart upload endpoint
+and resumable upload sessions.
+"""
+from pathlib import Path
+import hashlib
+
+import pytest
+from bson import ObjectId
+
+from app.core.config import settings
+from app.db.database import COLLECTIONS
+from app.services.storage import (
+    CsvShapeCounter,
+    StorageService,
+    UploadSessionStateError,
+    open_uploaded_file,
+)
+
+
+CSV = b'block_id,description\nB1,"two\nlines"\nB2,plain\n'
+
+BOUNDARY = "testboundary"
+
+
+def multipart_body(parts) -> bytes:
+    """Encode (name, filename or None, content) tuples as multipart/form-data."""
+    body = b""
+    for name, filename, content in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def multipart_headers() -> dict:
+    return {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, len(CSV)])
+def test_shape_counter_ignores_quoted_newlines_across_chunks(chunk_size):
+    counter = CsvShapeCounter()
+    for start in range(0, len(CSV), chunk_size):
+        counter.feed(CSV[start:start + chunk_size])
+
+    assert counter.summary() == {
+        "row_count": 2,
+        "column_count": 2,
+        "columns": ["block_id", "description"],
+    }
+
+
+def test_shape_counter_counts_last_line_without_newline():
+    counter = CsvShapeCounter(delimiter="\t")
+    counter.feed(b"a\tb\tc\n1\t2\t3\n4\t5\t6")
+
+    assert counter.summary()["row_count"] == 2
+    assert counter.summary()["column_count"] == 3
+
+
+@pytest.mark.parametrize("template_first", [True, False])
+async def test_upload_file(client, run_id, template_first):
+    fields = [("schema_template_id", None, b"block_v1")]
+    file = [("file", "blocks.csv", CSV)]
+    body = multipart_body(fields + file if template_first else file + fields)
+
+    response = await client.post(f"/api/v1/runs/{run_id}/files", content=body, headers=multipart_headers())
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["filename"] == "blocks.csv"
+    assert data["schema_template_id"] == "block_v1"
+    assert data["size_bytes"] == len(CSV)
+    assert data["sha256"] == hashlib.sha256(CSV).hexdigest()
+    assert (data["row_count"], data["column_count"]) == (2, 2)
+
+
+async def test_upload_file_unknown_template_leaves_no_file(client, run_id, upload_dir):
+    body = multipart_body([("file", "blocks.csv", CSV), ("schema_template_id", None, b"nope_v1")])
+
+    response = await client.post(f"/api/v1/runs/{run_id}/files", content=body, headers=multipart_headers())
+
+    assert response.status_code == 404
+    assert not any(path.is_file() for path in upload_dir.rglob("*"))
+
+
+async def test_upload_file_without_template_is_rejected(client, run_id):
+    body = multipart_body([("file", "blocks.csv", CSV)])
+
+    response = await client.post(f"/api/v1/runs/{run_id}/files", content=body, headers=multipart_headers())
+
+    assert response.status_code == 400
+
+
+async def test_oversized_upload_is_refused_before_the_body_is_read(client, run_id, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE", 1024)
+    head = multipart_body([("schema_template_id", None, b"block_v1")])[:-len(f"--{BOUNDARY}--\r\n")]
+    head += f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="big.csv"\r\n\r\n'.encode()
+    sent = []
+
+    async def body():
+        yield head
+        for _ in range(1000):
+            sent.append(1)
+            yield b"x" * 1024
+
+    response = await client.post(f"/api/v1/runs/{run_id}/files", content=body(), headers=multipart_headers())
+
+    assert response.status_code == 413
+    assert len(sent) < 10
+
+
+async def test_declared_oversized_upload_is_refused_up_front(client, run_id, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE", 1024)
+    body = multipart_body([("schema_template_id", None, b"block_v1"), ("file", "big.csv", b"x" * 4 * 1024 * 1024)])
+
+    response = await client.post(f"/api/v1/runs/{run_id}/files", content=body, headers=multipart_headers())
+
+    assert response.status_code == 413
+
+
+async def chunks(data: bytes, size: int = 4):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def open_session(storage, run_id: str, total_parts: int):
+    session = await storage.open_session(run_id, "blocks.csv", "block_v1", total_parts)
+    return str(session["_id"])
+
+
+@pytest.mark.parametrize("cuts", [(5,), (25,), (21, 30), (1, 2, 3)])
+async def test_session_parts_compose_to_the_whole_file(db, run_id, cuts):
+    storage = StorageService()
+    bounds = [0, *cuts, len(CSV)]
+    pieces = [CSV[a:b] for a, b in zip(bounds, bounds[1:])]
+    session_id = await open_session(storage, run_id, len(pieces))
+
+    # In reverse order, as parallel clients may
+    for number in reversed(range(1, len(pieces) + 1)):
+        await storage.save_part(run_id, session_id, number, chunks(pieces[number - 1]))
+    file_doc = await storage.complete_session(run_id, session_id)
+
+    assert (file_doc["row_count"], file_doc["column_count"]) == (2, 2)
+    assert file_doc["columns"] == ["block_id", "description"]
+    assert file_doc["size_bytes"] == len(CSV)
+    with open_uploaded_file(file_doc) as stream:
+        assert stream.read() == CSV
+
+
+async def test_complete_with_missing_parts_is_refused(db, run_id):
+    storage = StorageService()
+    session_id = await open_session(storage, run_id, 2)
+    await storage.save_part(run_id, session_id, 1, chunks(CSV))
+
+    with pytest.raises(UploadSessionStateError, match=r"missing parts: \[2\]"):
+        await storage.complete_session(run_id, session_id)
+
+
+async def test_resent_part_replaces_the_previous_copy(db, run_id):
+    storage = StorageService()
+    session_id = await open_session(storage, run_id, 1)
+    first = await storage.save_part(run_id, session_id, 1, chunks(b"stale"))
+    second = await storage.save_part(run_id, session_id, 1, chunks(CSV))
+
+    file_doc = await storage.complete_session(run_id, session_id)
+
+    assert file_doc["parts"] == [second["path"]]
+    assert not Path(first["path"]).exists()
+
+
+async def test_part_finishing_after_completion_claimed_the_session_is_discarded(db, run_id):
+    storage = StorageService()
+    session_id = await open_session(storage, run_id, 1)
+    await storage.save_part(run_id, session_id, 1, chunks(CSV))
+    completed = None
+
+    async def late_part():
+        nonlocal completed
+        yield b"late"
+        completed = await storage.complete_session(run_id, session_id)
+        yield b" data"
+
+    with pytest.raises(UploadSessionStateError, match="completed"):
+        await storage.save_part(run_id, session_id, 1, late_part())
+
+    with open_uploaded_file(completed) as stream:
+        assert stream.read() == CSV
+    assert [path.name for path in storage.session_dir(run_id, session_id).iterdir()] == [
+        Path(completed["parts"][0]).name
+    ]
+
+
+async def test_abort_deletes_parts_and_refuses_later_parts(db, run_id):
+    storage = StorageService()
+    session_id = await open_session(storage, run_id, 2)
+    await storage.save_part(run_id, session_id, 1, chunks(CSV))
+
+    await storage.abort_session(run_id, session_id)
+    await storage.abort_session(run_id, session_id)
+
+    assert not storage.session_dir(run_id, session_id).exists()
+    with pytest.raises(UploadSessionStateError, match="aborted"):
+        await storage.save_part(run_id, session_id, 2, chunks(CSV))
+
+
+async def test_abort_is_refused_while_completing(db, run_id):
+    storage = StorageService()
+    session_id = await open_session(storage, run_id, 1)
+    await storage.save_part(run_id, session_id, 1, chunks(CSV))
+    await db[COLLECTIONS["upload_sessions"]].update_one(
+        {"_id": ObjectId(session_id)}, {"$set": {"status": "completing"}}
+    )
+
+    with pytest.raises(UploadSessionStateError, match="completing"):
+        await storage.abort_session(run_id, session_id)
+    assert storage.session_dir(run_id, session_id).exists()
+
+
+async def test_failed_complete_reopens_the_session(db, run_id, monkeypatch):
+    storage = StorageService()
+    session_id = await open_session(storage, run_id, 1)
+    await storage.save_part(run_id, session_id, 1, chunks(CSV))
+    record_file = storage.record_file
+    failures = [ConnectionError("primary stepped down")]
+
+    async def failing_record_file(file_doc, user_id=None):
+        await record_file(file_doc, user_id)
+        if failures:
+            raise failures.pop()
+
+    monkeypatch.setattr(storage, "record_file", failing_record_file)
+    with pytest.raises(ConnectionError):
+        await storage.complete_session(run_id, session_id)
+
+    assert (await storage.get_session(run_id, session_id))["status"] == "open"
+    assert await db[COLLECTIONS["uploaded_files"]].count_documents({}) == 0
+    assert (await db[COLLECTIONS["runs"]].find_one({"_id": ObjectId(run_id)})).get("files", []) == []
+
+    file_doc = await storage.complete_session(run_id, session_id)
+    assert (await storage.get_session(run_id, session_id))["status"] == "completed"
+    assert await db[COLLECTIONS["uploaded_files"]].count_documents({"_id": file_doc["_id"]}) == 1
@@ -0,0 +1,71 @@
+"""
+Tests for incremental re-validation: matching entities across revisions
+and carrying the previous result's errors over.
+"""
+import numpy as np
+
+from app.services.relationships import EntityRemap, RelationshipIndex, match_entities
+from app.services.rules import build_ruleset
+from app.services.validation import ValidationService
+
+
+TEMPLATES = [{"entity_type": "Block", "fields": [
+    {"name": "Block_ID", "type": "string", "required": True},
+    {"name": "Thickness", "type": "float"},
+]}]
+RULESET = {"rules": [
+    {"id": "BLOCK_UNIQUE", "level": "table", "entity_type": "Block", "check": "unique",
+     "column": "Block_ID", "severity": "Blocker", "description": "Duplicate block"},
+]}
+
+
+def index(file_id, hashes, revision) -> RelationshipIndex:
+    result = RelationshipIndex(revision)
+    result.add("Block", np.array([f"B{i}" for i in range(len(hashes))]), np.full(len(hashes), file_id),
+               np.arange(len(hashes)), hashes=np.array(hashes))
+    return result
+
+
+def error(rule_id, file_id, row_index):
+    return {"file_id": file_id, "row_index": row_index, "column_name": "Block_ID", "severity": "Blocker",
+            "rule_id": rule_id, "description": rule_id}
+
+
+def test_match_entities_pairs_identical_content_one_to_one():
+    previous = index("f1", ["h1", "h2", "h1", "h3"], 1)
+    current = index("f2", ["h1", "h1", "h1", "h4", "h2"], 2)
+
+    assert match_entities(previous, current).tolist() == [0, 2, -1, -1, 1]
+
+
+def test_carry_over_moves_errors_of_unchanged_entities():
+    service = ValidationService(build_ruleset(TEMPLATES, RULESET))
+    previous = index("f1", ["h1", "h2", "h3"], 1)
+    # Rows reordered in a re-uploaded file; the entity hashed h2 changed
+    current = index("f2", ["h3", "hX", "h1"], 2)
+    remap = EntityRemap(previous, current, match_entities(previous, current))
+    errors = [
+        error("required.Block.Block_ID", "f1", 0),
+        error("required.Block.Block_ID", "f1", 1),
+        error("type.Block.Thickness", "f1", 2),
+        error("BLOCK_UNIQUE", "f1", 2),
+        error("retired.rule", "f1", 0),
+    ]
+
+    carried = service._carry_over(errors, remap, retable=set())
+
+    assert list(zip(carried.rule_id, carried.file_id, carried.row_index)) == [
+        ("required.Block.Block_ID", "f2", 2),
+        ("type.Block.Thickness", "f2", 0),
+        ("BLOCK_UNIQUE", "f2", 0),
+    ]
+
+
+def test_carry_over_drops_table_errors_of_retabled_types():
+    service = ValidationService(build_ruleset(TEMPLATES, RULESET))
+    previous = index("f1", ["h1"], 1)
+    remap = EntityRemap(previous, previous, match_entities(previous, previous))
+
+    carried = service._carry_over([error("BLOCK_UNIQUE", "f1", 0)], remap, retable={"Block"})
+
+    assert len(carried.rule_id) == 0
@@ -0,0 +1,98 @@
+"""
+Tests for stored validation errors and the paged error list.
+"""
+from bson import ObjectId
+
+from app.db.database import COLLECTIONS
+from app.models.batches import ErrorBatch
+from app.services.validation_store import ValidationErrorWriter, list_errors
+
+
+async def store_errors(db, run_oid, result_id, count, sample_size=2):
+    batch = ErrorBatch(
+        ["f1"] * count,
+        list(range(count)),
+        ["Block_ID"] * count,
+        ["Blocker" if i % 3 == 0 else "Warning" for i in range(count)],
+        ["required.Block.Block_ID" if i % 3 == 0 else "pattern.Block.Block_ID" for i in range(count)],
+        [f"error {i}" for i in range(count)],
+    )
+    async with ValidationErrorWriter(db, run_oid, result_id, sample_size=sample_size) as errors:
+        await errors.add_many(batch)
+    return errors
+
+
+async def test_writer_counts_and_samples_errors(db):
+    errors = await store_errors(db, ObjectId(), ObjectId(), 10)
+
+    assert errors.error_count == 10
+    assert errors.severity_counts == {"Blocker": 4, "Warning": 6, "Info": 0}
+    assert [(c.rule_id, c.count) for c in errors.rule_counts()] == [
+        ("pattern.Block.Block_ID", 6), ("required.Block.Block_ID", 4),
+    ]
+    assert {rule: len(sample) for rule, sample in errors.samples.items()} == {
+        "required.Block.Block_ID": 2, "pattern.Block.Block_ID": 2,
+    }
+    assert await db[COLLECTIONS["validation_errors"]].count_documents({}) == 10
+
+
+async def test_list_errors_pages_through_all_errors_in_order(db):
+    result_id = ObjectId()
+    await store_errors(db, ObjectId(), result_id, 7)
+    await store_errors(db, ObjectId(), ObjectId(), 5)
+
+    rows, after = [], None
+    while True:
+        docs, after = await list_errors(db, result_id, limit=3, after=after)
+        rows.extend(doc["row_index"] for doc in docs)
+        if after is None:
+            break
+
+    assert rows == list(range(7))
+
+
+async def test_list_errors_filters(db):
+    result_id = ObjectId()
+    await store_errors(db, ObjectId(), result_id, 7)
+
+    docs, after = await list_errors(db, result_id, {"severity": "Blocker", "file_id": None}, limit=10)
+
+    assert [doc["row_index"] for doc in docs] == [0, 3, 6]
+    assert after is None
+
+
+async def validated_run(db, run_id, count):
+    result_id = ObjectId()
+    await db[COLLECTIONS["validation_results"]].insert_one({"_id": result_id, "run_id": ObjectId(run_id)})
+    await db[COLLECTIONS["runs"]].update_one({"_id": ObjectId(run_id)}, {"$set": {"validation_result_id": result_id}})
+    await store_errors(db, ObjectId(run_id), result_id, count)
+    return result_id
+
+
+async def test_error_endpoint_follows_the_cursor(client, db, run_id):
+    await validated_run(db, run_id, 5)
+    url = f"/api/v1/runs/{run_id}/validation/errors"
+
+    first = (await client.get(url, params={"limit": 3})).json()
+    second = (await client.get(url, params={"limit": 3, "cursor": first["next_cursor"]})).json()
+
+    assert [e["row_index"] for e in first["errors"]] == [0, 1, 2]
+    assert [e["row_index"] for e in second["errors"]] == [3, 4]
+    assert second["next_cursor"] is None
+
+
+async def test_error_endpoint_rejects_stale_and_invalid_cursors(client, db, run_id):
+    await validated_run(db, run_id, 5)
+    url = f"/api/v1/runs/{run_id}/validation/errors"
+    cursor = (await client.get(url, params={"limit": 2})).json()["next_cursor"]
+    # Re-validation replaces the result the cursor belongs to
+    await validated_run(db, run_id, 5)
+
+    assert (await client.get(url, params={"cursor": cursor})).status_code == 410
+    assert (await client.get(url, params={"cursor": "not-a-cursor"})).status_code == 400
+
+
+async def test_error_endpoint_of_unvalidated_run(client, run_id):
+    response = await client.get(f"/api/v1/runs/{run_id}/validation/errors")
+
+    assert response.status_code == 404
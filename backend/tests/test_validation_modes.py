@@ -0,0 +1,99 @@
+"""
+Tests for validation mode options, stratified sampling and rate estimates.
+"""
+import numpy as np
+import pytest
+
+from app.services.validation_modes import (
+    ValidationOptions, ValidationOptionsError, estimate_rate, stratified_sample
+)
+
+
+def sample(counts, size, seed=0):
+    strata = np.repeat([f"file{i}" for i in range(len(counts))], counts)
+    positions = stratified_sample(strata, size, np.random.default_rng(seed))
+    labels, drawn = np.unique(strata[positions], return_counts=True)
+    return positions, dict(zip(labels.tolist(), drawn.tolist()))
+
+
+def test_stratified_sample_is_proportional():
+    positions, drawn = sample([600, 300, 100], 100)
+
+    assert drawn == {"file0": 60, "file1": 30, "file2": 10}
+    assert len(set(positions.tolist())) == 100
+    assert positions.tolist() == sorted(positions.tolist())
+
+
+def test_stratified_sample_gives_every_stratum_a_row_without_exceeding_size():
+    # Quotas are 9.8, 0.1 and 0.1; the small files' rows come out of the large one's
+    positions, drawn = sample([980, 10, 10], 10)
+
+    assert len(positions) == 10
+    assert drawn == {"file0": 8, "file1": 1, "file2": 1}
+
+
+@pytest.mark.parametrize("counts, size", [([1000] + [1] * 30, 40), ([50] * 7 + [1] * 20, 30), ([5, 5, 1, 1, 1], 5)])
+def test_stratified_sample_draws_exactly_size_rows(counts, size):
+    positions, drawn = sample(counts, size)
+
+    assert len(positions) == size
+    assert len(drawn) == len(counts)
+
+
+def test_stratified_sample_with_more_strata_than_size():
+    positions, drawn = sample([1] * 20, 5)
+
+    assert len(positions) == 5
+
+
+def test_stratified_sample_takes_everything_when_size_covers_population():
+    positions, _ = sample([3, 2], 10)
+
+    assert positions.tolist() == [0, 1, 2, 3, 4]
+
+
+def test_stratified_sample_is_reproducible_with_a_seed():
+    assert sample([500, 500], 50, seed=7)[0].tolist() == sample([500, 500], 50, seed=7)[0].tolist()
+
+
+def test_estimate_rate_interval_contains_the_rate():
+    estimate = estimate_rate(20, 200, 10000, confidence=0.95)
+
+    assert estimate["rate"] == pytest.approx(0.1)
+    assert 0.06 < estimate["lower"] < 0.1 < estimate["upper"] < 0.15
+
+
+def test_estimate_rate_without_hits_stays_in_bounds():
+    estimate = estimate_rate(0, 100, 10000, confidence=0.95)
+
+    assert estimate["rate"] == 0.0
+    assert estimate["lower"] == 0.0
+    assert 0.0 < estimate["upper"] < 0.05
+
+
+def test_estimate_rate_of_whole_population_is_exact():
+    assert estimate_rate(5, 50, 50, confidence=0.95) == {"rate": 0.1, "lower": 0.1, "upper": 0.1}
+
+
+def test_estimate_rate_of_empty_sample():
+    assert estimate_rate(0, 0, 100) == {"rate": 0.0, "lower": 0.0, "upper": 1.0}
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"mode": "quick"},
+    {"mode": "full", "max_blockers": 5},
+    {"mode": "fail-fast", "sample_size": 10},
+    {"mode": "fail-fast", "max_blockers": 0},
+    {"mode": "sample", "sample_size": 0},
+])
+def test_validation_options_rejects_invalid_parameters(kwargs):
+    with pytest.raises(ValidationOptionsError):
+        ValidationOptions(**kwargs)
+
+
+def test_validation_options_describe():
+    assert ValidationOptions("sample", sample_size=10, seed=1).describe() == {
+        "mode": "sample", "sample_size": 10, "seed": 1,
+    }
+    assert not ValidationOptions("sample").complete
+    assert ValidationOptions("fail-fast", max_blockers=3).describe() == {"mode": "fail-fast", "max_blockers": 3}